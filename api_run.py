@@ -1,31 +1,48 @@
-import time
-import threading
-from source.api import app
-import schedule
-from dotenv import load_dotenv
+import argparse
+import os
 
-from source.job import cleanup_old_screenshots
+from source.api import app
+from source.job import MaintenanceScheduler
 from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings, reload_settings
 
 # 配置日志
 logger = setup_logger(__name__)
 
-# 设置定时任务，每天凌晨1点执行
-schedule.every().day.at("01:00").do(cleanup_old_screenshots)
 
-# 启动定时任务
-def run_scheduler():
-    while True:
-        schedule.run_pending()
-        time.sleep(1)
-        logger.info("定时任务启动成功")
+def parse_args(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='SmartDigger 弹窗诊断接口服务')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=settings.api_workers,
+                        help='工作进程数，大于 1 时以多进程预派生模式启动（仅 Linux / macOS）')
+    return parser.parse_args(argv)
+
+
+def run_prefork(host, port, workers):
+    """多进程模式：模版库通过内存映射的打包文件在工作进程间共享，新学到的模版广播给其他进程"""
+    from source.api.prefork import PreforkServer
+    from source.api.utils.template_pack import TemplatePack, pack_path_for
+
+    os.environ['TEMPLATE_PACK'] = 'True'
+    settings = reload_settings()
+    # 启动时从模版目录重建打包文件，包含手工放入目录的模版
+    template_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), settings.template_dir)
+    os.makedirs(template_dir, exist_ok=True)
+    TemplatePack.build(pack_path_for(template_dir), template_dir)
+    # 定时维护任务只在主进程中运行一份
+    PreforkServer(app, host, port, workers).serve(on_started=MaintenanceScheduler().start)
 
-load_dotenv()
 
 if __name__ == '__main__':
-    # 启动接口
-    app.run(host='0.0.0.0', port=5000, debug=True)
-    # 启动定时任务线程
-    scheduler_thread = threading.Thread(target=run_scheduler)
-    scheduler_thread.daemon = True
-    scheduler_thread.start()
\ No newline at end of file
+    args = parse_args()
+    if args.workers > 1:
+        run_prefork(args.host, args.port, args.workers)
+    else:
+        debug = get_settings().api_debug
+        # 调试模式下 reloader 会再启动一个子进程运行应用，只在实际服务的进程中启动定时维护任务
+        if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            MaintenanceScheduler().start()
+        # 启动接口（阻塞）
+        app.run(host=args.host, port=args.port, debug=debug)
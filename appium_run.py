@@ -5,27 +5,26 @@
 - 程序启动
 - 日志配置
 - 设备信息获取
-- 主流程控制
+- 主流程控制（多轮诊断复用会话池中的同一个 Appium 会话）
 """
+import argparse
 import io
+import time
 
 from PIL import Image
 from lxml import etree
 
-from source import AppiumInspector, capture_and_mark_elements, diagnose_and_handle
+from source import capture_and_mark_elements, diagnose_and_handle
 from source.api.services import lvm_analysis
 from source.services import ElementManager, click_element_close
 from source.tools import AdbHelper
-from dotenv import load_dotenv
 
 from source.services.recorder import Recorder
+from source.session_pool import get_session_pool
 from source.utils.log_config import setup_logger
 
 logger = setup_logger(__name__)
 
-# 加载环境变量
-load_dotenv()
-
 
 def run_appium_inspector(device_name, app_package, app_activity, device_resolution):
     """运行 Appium Inspector 进行应用界面分析
@@ -44,76 +43,86 @@ def run_appium_inspector(device_name, app_package, app_activity, device_resoluti
         raise ValueError("device_name、app_package 和 app_activity 必须为非空字符串。")
 
     try:
-        # 初始化 Appium Inspector
-        driver = AppiumInspector(device_name, app_package, app_activity, device_resolution).init_driver()
+        # 从会话池取得 Appium 会话（首轮创建，之后复用）
+        with get_session_pool().acquire(device_name, app_package, app_activity, device_resolution) as driver:
+            _inspect(driver, device_name, app_package)
+        logger.info(f"运行结束")
+    except Exception as e:
+        logger.error(f"运行 Appium Inspector 时发生错误: {e}")
+        raise
 
-        # 获取截图
-        screenshot = driver.get_screenshot_as_png()
-        xml_page_struct = driver.page_source
 
-        recorder = Recorder()
-        element_manager = ElementManager(recorder)
+def _inspect(driver, device_name, app_package):
+    # 获取截图
+    screenshot = driver.get_screenshot_as_png()
+    xml_page_struct = driver.page_source
+
+    recorder = Recorder()
+    element_manager = ElementManager(recorder)
+
+    screenshot_image = Image.open(io.BytesIO(screenshot))
+
+    try:
+        xml_page_bytes = xml_page_struct.encode('utf-8')
+        xml_root = etree.fromstring(xml_page_bytes)
+        clickable_elements = xml_root.xpath(".//*[@clickable='true']")
+    except Exception as e:
+        logger.error(f"XML 格式错误: {str(e)}")
+        raise e
 
-        screenshot_image = Image.open(io.BytesIO(screenshot))
+    # 进行元素定位
+    screenshot_id, is_more_clickable_elements, marked_screenshot_image, non_clickable_area_image, labels = \
+        capture_and_mark_elements(screenshot_image, device_name, app_package, clickable_elements)
 
-        try:
-            xml_page_bytes = xml_page_struct.encode('utf-8')
-            xml_root = etree.fromstring(xml_page_bytes)
-            clickable_elements = xml_root.xpath(".//*[@clickable='true']")
-        except Exception as e:
-            logger.error(f"XML 格式错误: {str(e)}")
-            raise e
+    # 进行弹窗识别
+    if not is_more_clickable_elements:
 
-        # 进行元素定位
-        screenshot_id, is_more_clickable_elements, marked_screenshot_image, non_clickable_area_image = capture_and_mark_elements(
-            screenshot_image, device_name, app_package, clickable_elements)
+        if not isinstance(marked_screenshot_image, Image.Image):
+            raise ValueError("输入必须是 PIL.Image.Image 对象")
+            # 如果图像是 RGBA 模式，转换为 RGB 模式
+        if marked_screenshot_image.mode == 'RGBA':
+            marked_screenshot_image = marked_screenshot_image.convert('RGB')
 
         # 进行弹窗识别
-        if not is_more_clickable_elements:
-
-            if not isinstance(marked_screenshot_image, Image.Image):
-                raise ValueError("输入必须是 PIL.Image.Image 对象")
-                # 如果图像是 RGBA 模式，转换为 RGB 模式
-            if marked_screenshot_image.mode == 'RGBA':
-                marked_screenshot_image = marked_screenshot_image.convert('RGB')
-
-            # 进行弹窗识别
-            popup_id = diagnose_and_handle(marked_screenshot_image)
-            logger.info(f"弹窗标识为: {popup_id}")
-            # 获取弹窗中心点
-            if popup_id is not None and popup_id > 0:
-                center_x, center_y = element_manager.element_center(popup_id, screenshot_id)
-                # 点击弹窗
-                logger.info(f"检测到弹窗，弹窗标识为: {popup_id}，正在关闭...")
-
-                click_element_close(driver, center_x, center_y)
-                logger.info(f"坐标为: {center_x},{center_y}")
-            logger.info(f"弹窗关闭成功")
-            driver.quit()
-            recorder.close()
-        logger.info(f"运行结束")
-    except Exception as e:
-        logger.error(f"运行 Appium Inspector 时发生错误: {e}")
-        raise
+        popup_id = diagnose_and_handle(marked_screenshot_image, labels=labels)
+        logger.info(f"弹窗标识为: {popup_id}")
+        # 获取弹窗中心点
+        if popup_id is not None and popup_id > 0:
+            center_x, center_y = element_manager.element_center(popup_id, screenshot_id)
+            # 点击弹窗
+            logger.info(f"检测到弹窗，弹窗标识为: {popup_id}，正在关闭...")
+
+            click_element_close(driver, center_x, center_y)
+            logger.info(f"坐标为: {center_x},{center_y}")
+        logger.info(f"弹窗关闭成功")
+    recorder.close()
 
 
 def run_appium_inspector_by_lvm(device_name, app_package, app_activity, device_resolution):
-    driver = AppiumInspector(device_name, app_package, app_activity, device_resolution).init_driver()
+    # 从会话池取得 Appium 会话（首轮创建，之后复用）
+    with get_session_pool().acquire(device_name, app_package, app_activity, device_resolution) as driver:
+        # 获取截图
+        screenshot = driver.get_screenshot_as_png()
+
+        center_x, center_y, _ = lvm_analysis(screenshot_bytes=screenshot, screen_resolution=device_resolution,
+                                             device_name=device_name)
+        if center_x is not None and center_y is not None:
+            logger.info(f"坐标为: {center_x},{center_y}")
+            click_element_close(driver, center_x, center_y)
+        else:
+            logger.info(f"没有找到弹窗")
 
-    # 获取截图
-    screenshot = driver.get_screenshot_as_png()
 
-    center_x, center_y = lvm_analysis(screenshot_bytes=screenshot, screen_resolution=device_resolution,
-                                      device_name=device_name)
-    if center_x is not None and center_y is not None:
-        logger.info(f"坐标为: {center_x},{center_y}")
-        click_element_close(driver, center_x, center_y)
-    else:
-        logger.info(f"没有找到弹窗")
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartDigger 设备端弹窗诊断')
+    parser.add_argument('--cycles', type=int, default=1, help='诊断轮数，各轮复用同一个 Appium 会话')
+    parser.add_argument('--interval', type=float, default=5, help='两轮诊断之间的间隔秒数')
+    return parser.parse_args(argv)
 
 
-def main():
+def main(argv=None):
     """主函数，获取设备信息并运行 Appium Inspector"""
+    args = parse_args(argv)
     try:
         # 获取设备信息
         adb = AdbHelper()
@@ -131,8 +140,15 @@ def main():
             return
 
         # 启动界面分析
-        # run_appium_inspector(device_name, app_package, app_activity, device_resolution)
-        run_appium_inspector_by_lvm(device_name, app_package, app_activity, device_resolution)
+        for cycle in range(args.cycles):
+            if cycle:
+                time.sleep(args.interval)
+            try:
+                # run_appium_inspector(device_name, app_package, app_activity, device_resolution)
+                run_appium_inspector_by_lvm(device_name, app_package, app_activity, device_resolution)
+            except Exception as e:
+                logger.error(f"第 {cycle + 1} 轮诊断失败: {e}")
+        logger.info(f"Appium 会话统计: {get_session_pool().stats()}")
     except Exception as e:
         logger.error(f"发生意外错误: {e}")
 
@@ -0,0 +1,47 @@
+import argparse
+import asyncio
+import json
+
+from source.fleet import FleetRunner
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+# 配置日志
+logger = setup_logger(__name__)
+
+
+def parse_args(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='SmartDigger 多设备弹窗巡检')
+    parser.add_argument('--mode', choices=['api', 'local'], default=settings.fleet_mode,
+                        help='api 调用诊断接口，local 进程内诊断')
+    parser.add_argument('--api-url', default=settings.fleet_api_url)
+    parser.add_argument('--interval', type=float, default=settings.fleet_interval_seconds, help='每台设备的巡检间隔（秒）')
+    parser.add_argument('--capture-concurrency', type=int, default=settings.fleet_capture_concurrency)
+    parser.add_argument('--diagnose-concurrency', type=int, default=settings.fleet_diagnose_concurrency)
+    parser.add_argument('--devices', default=None, help='逗号分隔的设备序列号，默认巡检全部已连接设备')
+    parser.add_argument('--duration', type=float, default=None, help='巡检时长（秒），默认一直运行')
+    parser.add_argument('--report-interval', type=float, default=60, help='输出各设备巡检耗时的间隔（秒）')
+    parser.add_argument('--dry-run', action='store_true', help='只诊断不点击')
+    parser.add_argument('--output', default=None, help='结束时将各设备统计写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    runner = FleetRunner(mode=args.mode, api_url=args.api_url, interval=args.interval,
+                         capture_concurrency=args.capture_concurrency,
+                         diagnose_concurrency=args.diagnose_concurrency,
+                         devices=args.devices.split(',') if args.devices else None, dry_run=args.dry_run)
+    try:
+        report = asyncio.run(runner.run(duration=args.duration, report_interval=args.report_interval))
+    except KeyboardInterrupt:
+        report = runner.report()
+    runner.log_report()
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import json
+
+from source.services.cost_ledger import CostLedger
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+# 配置日志
+logger = setup_logger(__name__)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartDigger 视觉模型调用账本报告')
+    parser.add_argument('--window', type=float, default=86400, help='统计最近多少秒，默认 1 天')
+    parser.add_argument('--db-path', default=None, help='账本所在数据库，默认为 DB_PATH')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    return parser.parse_args(argv)
+
+
+def format_report(report):
+    lines = [
+        f"最近 {report['window_seconds']:.0f} 秒: 诊断 {report.get('diagnoses', 0)} 次，"
+        f"模型调用 {report['calls']} 次，结果缓存命中 {report['cache_hits']} 次",
+        f"token: prompt {report['prompt_tokens']}（图片约 {report['image_tokens']}），"
+        f"completion {report['completion_tokens']}，合计 {report['total_tokens']}，"
+        f"{report['tokens_per_second']} token/s（其中 {report['estimated_calls']} 次为估算）",
+        f"花费: {report['cost']:.4f} 元，每次诊断 {report.get('cost_per_diagnosis', 0):.6f} 元，"
+        f"每次诊断调用模型 {report.get('calls_per_diagnosis', 0)} 次，"
+        f"调用了模型的诊断 {report.get('model_diagnoses', 0)} 次，"
+        f"每次 {report.get('cost_per_model_diagnosis', 0):.6f} 元",
+        f"诊断结果来源: {json.dumps(report['by_outcome'], ensure_ascii=False)}",
+        '按模型:',
+    ]
+    for model, item in report['by_model'].items():
+        lines.append(f"  {model}: 调用 {item['calls']} 次，token {item['total_tokens']}，"
+                     f"平均耗时 {item['avg_latency_ms']}ms，花费 {item['cost']:.4f} 元")
+    lines.append('按应用:')
+    for app, item in report['by_app'].items():
+        lines.append(f"  {app}: 诊断 {item.get('diagnoses', 0)} 次，调用 {item['calls']} 次，"
+                     f"token {item['total_tokens']}，花费 {item['cost']:.4f} 元，"
+                     f"每次诊断 {item.get('cost_per_diagnosis', 0):.6f} 元")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    ledger = CostLedger(args.db_path or get_settings().db_path)
+    report = ledger.summary(args.window)
+    print(json.dumps(report, indent=2, ensure_ascii=False) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
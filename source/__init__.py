@@ -1,7 +1,23 @@
-from .appium_Inspector import AppiumInspector, capture_and_mark_elements, diagnose_and_handle
+# appium_Inspector 会加载 Appium / Selenium，接口服务并不需要，按需导入以加快启动
+_LAZY_ATTRIBUTES = {
+    "AppiumInspector": "source.appium_Inspector",
+    "capture_and_mark_elements": "source.appium_Inspector",
+    "diagnose_and_handle": "source.appium_Inspector",
+}
 
 __all__ = [
     "AppiumInspector"
     , "capture_and_mark_elements"
     , "diagnose_and_handle"
 ]
+
+
+def __getattr__(name):
+    module_name = _LAZY_ATTRIBUTES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
@@ -1,16 +1,30 @@
+import os
+import time
 import uuid
 from flask import Flask, request, jsonify, g
 from .services import vision_analysis, lvm_analysis
-from dotenv import load_dotenv
 import base64
+from source.api.utils.frame_cache import get_frame_cache, frame_fingerprint
+from source.api.utils.xml_fingerprint import get_xml_fingerprint_cache
+from source.services.cost_ledger import diagnosis_answer, get_ledger, ledger_context
+from source.services.hedging import hedge_stats
+from source.services.provider_pool import pool_status
+from source.utils import trace
 from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.profiler import RequestProfiler
+from source.utils.settings import get_settings
 
 logger = setup_logger(__name__)
-load_dotenv()
 
 app = Flask(__name__)
 __all__ = ['app']
 
+# 请求采样性能分析器（PROFILE_SAMPLE_RATE 为 0 时关闭）
+request_profiler = RequestProfiler.from_env()
+# 是否在请求结束时输出 span 耗时树
+trace_log_spans = get_settings().trace_log_spans
+
 # 定义接口的必填参数
 # REQUIRED_PARAMS = ['screenshot', 'xml_file','resolution']
 REQUIRED_PARAMS = ['screenshot', 'devices_name']
@@ -27,6 +41,28 @@ def set_content_type(response):
 def before_request():
     """为每个请求生成唯一的 trace_id"""
     g.trace_id = str(uuid.uuid4())
+    g.request_start = time.perf_counter()
+    _, g.trace_token = trace.start_trace(g.trace_id, f"{request.method} {request.path}")
+    g.profile_session = request_profiler.start(g.trace_id)
+
+
+@app.teardown_request
+def teardown_request(exc):
+    """结束请求追踪，输出 span 耗时树，并对慢请求保存性能分析结果"""
+    if 'trace_token' not in g:
+        return
+    duration_ms = (time.perf_counter() - g.request_start) * 1000
+    metrics.observe('http_request_ms', duration_ms, path=request.path)
+    profile_session = g.get('profile_session')
+    if profile_session is not None:
+        request_profiler.finish(profile_session, duration_ms)
+    trace.end_trace(g.trace_token, on_complete=_log_span_tree if trace_log_spans else None)
+
+
+def _log_span_tree(request_trace):
+    """请求及其子线程全部结束后输出 span 树，可能在子线程中调用"""
+    logger.info(f"请求耗时 {request_trace.root.duration_ms:.1f}ms，span 明细:\n{request_trace.render()}",
+                extra={'trace_id': request_trace.trace_id})
 
 
 @app.route('/api/v1/diagnose', methods=['POST'])
@@ -37,6 +73,7 @@ def diagnose():
     - screenshot: Base64 编码的手机屏幕截图 (必填)
     - xml_file: XML层级结构文本 (必填)
     - devices_name: 设备名称 (必填)
+    - app_package: 应用包名 (可选，调用账本按应用统计花费)
     返回结果:
     - 诊断分析结果JSON
     """
@@ -68,41 +105,41 @@ def diagnose():
 
         # 调用诊断服务
         try:
-            if 'resolution' in data and data['resolution'] != "" and data['resolution'] is not None:
-                center_x, center_y, template_file_name = lvm_analysis(
-                    # todo 将screenshot_bytes 转为灰度图像，并且存储到本地
-                    # todo 分辨率的传输
-                    screenshot_bytes, data['resolution'], data['devices_name']
-                )
-
-            elif 'xml_file' in data and data['xml_file'] != "" and data['xml_file'] is not None:
-
-                center_x, center_y, template_file_name = vision_analysis(
-                    screenshot_bytes, data['xml_file'], data['devices_name']
-                )
+            if data.get('resolution'):
+                mode = 'resolution'
+            elif data.get('xml_file'):
+                mode = 'xml'
             else:
                 raise Exception("xml_file 或者 resolution 其中一个必填")
+            device_name = data['devices_name']
+            frame_cache = None if data.get('force') else get_frame_cache()
+            if frame_cache is not None:
+                with trace.span('frame_cache'):
+                    size, fingerprint = frame_fingerprint(screenshot_bytes)
+                    cached = frame_cache.lookup(device_name, mode, size, fingerprint)
+                metrics.increment('frame_cache', outcome='hit' if cached is not None else 'miss')
+                if cached is not None:
+                    _record_diagnosis('frame_cache', data)
+                    return _diagnose_response(device_name, *cached, cached=True)
+
+            # 调用账本按应用（app_package，可选）与设备统计
+            # 记录实际给出结果的路径（规则、模版、图标库、模型等），只有真正调用了模型的诊断记为 model
+            with ledger_context(app=data.get('app_package') or 'unknown', device=device_name), \
+                    diagnosis_answer() as answer:
+                if mode == 'resolution':
+                    # todo 将screenshot_bytes 转为灰度图像，并且存储到本地
+                    result = lvm_analysis(screenshot_bytes, data['resolution'], device_name)
+                else:
+                    result = vision_analysis(screenshot_bytes, data['xml_file'], device_name)
+            _record_diagnosis(answer.outcome(), data)
 
-            if center_x is None or center_y is None:
-                logger.info("系统诊断为非弹窗，麻烦人工排查")
-                return jsonify({"msg": "系统诊断为非弹窗，麻烦人工排查"}), 500
-
-            logger.info(f"视觉诊断结果: ({center_x}, {center_y})")
-
-            if template_file_name:
-                return jsonify({
-                    "msg": f"弹窗模版相似度匹配成功，跳过的坐标为: ({center_x}, {center_y})",
-                    "script": adb_tap_code(data['devices_name'], center_x, center_y).strip(),
-                    "template_file_name": template_file_name
-                }), 200
-            else:
-                return jsonify({
-                    "msg": f"视觉诊断为弹窗，跳过的坐标为: ({center_x}, {center_y})",
-                    "script": adb_tap_code(data['devices_name'], center_x, center_y).strip(),
-                }), 200
+            if frame_cache is not None:
+                frame_cache.store(device_name, mode, size, fingerprint, result)
+            return _diagnose_response(device_name, *result)
 
         except Exception as e:
             logger.error(f"诊断服务调用失败: {str(e)}")
+            _record_diagnosis('error', data)
             return jsonify({"msg": "诊断服务调用失败，请稍后重试"}), 500
 
     except Exception as e:
@@ -110,5 +147,83 @@ def diagnose():
         return jsonify({"msg": f"系统异常: {str(e)}"}), 500
 
 
+def _record_diagnosis(outcome, data):
+    """在调用账本中记录一次诊断的结果来源"""
+    ledger = get_ledger()
+    if ledger is not None:
+        with ledger_context(app=data.get('app_package') or 'unknown', device=data.get('devices_name', '')):
+            ledger.record_diagnosis(outcome, (time.perf_counter() - g.request_start) * 1000)
+
+
+def _diagnose_response(device_name, center_x, center_y, template_file_name, cached=False):
+    """诊断结果转换为接口响应，cached 表示画面未变化、复用了上次的诊断结果"""
+    if center_x is None or center_y is None:
+        logger.info("系统诊断为非弹窗，麻烦人工排查")
+        return jsonify({"msg": "系统诊断为非弹窗，麻烦人工排查", "cached": cached}), 500
+
+    logger.info(f"视觉诊断结果: ({center_x}, {center_y})")
+    body = {
+        "msg": f"视觉诊断为弹窗，跳过的坐标为: ({center_x}, {center_y})",
+        "script": adb_tap_code(device_name, center_x, center_y).strip(),
+        "center": [center_x, center_y],
+        "cached": cached,
+    }
+    if template_file_name:
+        body["msg"] = f"弹窗模版相似度匹配成功，跳过的坐标为: ({center_x}, {center_y})"
+        body["template_file_name"] = template_file_name
+    return jsonify(body), 200
+
+
+@app.route('/api/v1/feedback', methods=['POST'])
+def feedback():
+    """
+    诊断结果反馈接口：调用方执行了返回的点击（或画面已被其他操作改变）后调用，使该设备的画面缓存失效
+    请求参数 (JSON):
+    - devices_name: 设备名称 (必填)
+    - executed: 是否已执行点击（默认 true）
+    - success: 点击是否生效（默认 true），为 false 时同时删除该设备最近使用的界面结构指纹记录
+    """
+    data = request.json or {}
+    device_name = data.get('devices_name')
+    if not device_name:
+        return jsonify({"msg": "必填参数缺失: devices_name"}), 400
+    frame_cache = get_frame_cache()
+    invalidated = frame_cache.invalidate(device_name) if frame_cache is not None else False
+    fingerprint_invalidated = False
+    if data.get('success', True) is False:
+        fingerprint_cache = get_xml_fingerprint_cache()
+        if fingerprint_cache is not None:
+            fingerprint_invalidated = fingerprint_cache.invalidate(device_name)
+    logger.info(f"设备 {device_name} 反馈点击已执行: {data.get('executed', True)}，生效: {data.get('success', True)}，"
+                f"画面缓存已失效: {invalidated}，结构指纹已失效: {fingerprint_invalidated}")
+    return jsonify({"msg": "ok", "invalidated": invalidated, "fingerprint_invalidated": fingerprint_invalidated}), 200
+
+
+@app.route('/api/v1/metrics', methods=['GET'])
+def get_metrics():
+    """
+    运行指标接口：请求耗时、各模型耗时与分级路由结果等（当前进程内统计）
+    """
+    return jsonify({"pid": os.getpid(), "hedge": hedge_stats(), "providers": pool_status(),
+                    **metrics.snapshot()}), 200
+
+
+@app.route('/api/v1/ledger', methods=['GET'])
+def get_ledger_summary():
+    """
+    视觉模型调用账本汇总接口（所有工作进程写入同一个账本，各进程最多缓存 5 秒后写入）
+    请求参数 (query):
+    - window: 统计最近多少秒，默认 3600
+    """
+    ledger = get_ledger()
+    if ledger is None:
+        return jsonify({"msg": "调用账本未开启或未配置 DB_PATH"}), 404
+    try:
+        window = float(request.args.get('window', 3600))
+    except ValueError:
+        return jsonify({"msg": "window 必须为数字"}), 400
+    return jsonify(ledger.summary(window)), 200
+
+
 def adb_tap_code(device_name, x, y) -> str:
     return f"""import subprocess;subprocess.run( ['adb', '-s', {device_name}, 'shell', 'input', 'tap', str({x}), str({y})],check=True) """
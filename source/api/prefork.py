@@ -0,0 +1,115 @@
+"""
+多进程预派生（pre-fork）服务模块
+
+模块职责：
+- 主进程创建监听端口后 fork 出 N 个工作进程，工作进程共享同一个监听 socket 并各自处理请求，
+  掩码、模版相关度计算与 JPEG 编码不再受单进程 GIL 限制
+- 工作进程异常退出后自动重启，主进程收到 SIGTERM / SIGINT 时通知所有工作进程退出
+- 依赖 os.fork，仅支持 Linux / macOS；Windows 请使用单进程模式
+"""
+import os
+import signal
+import socket
+import time
+
+from werkzeug.serving import make_server
+
+from source.utils.log_config import setup_logger, reinit_after_fork
+
+logger = setup_logger(__name__)
+
+__all__ = ['PreforkServer', 'prefork_supported']
+
+
+def prefork_supported():
+    return hasattr(os, 'fork')
+
+
+class PreforkServer:
+    """预派生多进程 WSGI 服务"""
+
+    # 工作进程频繁退出时，重启前等待的秒数
+    RESTART_DELAY = 1.0
+
+    def __init__(self, app, host, port, workers, backlog=128):
+        if not prefork_supported():
+            raise ValueError("当前系统不支持 fork，无法以多进程模式启动")
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.backlog = backlog
+        self.children = {}
+        self.socket = None
+        self._stopping = False
+
+    def bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(self.backlog)
+        sock.set_inheritable(True)
+        self.socket = sock
+        # 端口为 0 时由系统分配
+        self.port = sock.getsockname()[1]
+        return self
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                reinit_after_fork(f'worker{index}')
+                server = make_server(self.host, self.port, self.app, threaded=True, fd=self.socket.fileno())
+                logger.info(f"工作进程 {index} 启动，pid={os.getpid()}")
+                server.serve_forever()
+            except BaseException as e:
+                logger.error(f"工作进程 {index} 异常退出: {e}")
+                code = 1
+            finally:
+                # 不执行主进程注册的清理逻辑
+                os._exit(code)
+        self.children[pid] = index
+        return pid
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve(self, on_started=None):
+        """启动工作进程并阻塞监控，直到收到退出信号
+
+        参数:
+            on_started: 全部工作进程启动后在主进程中调用（如启动定时维护任务）
+        """
+        if self.socket is None:
+            self.bind()
+        for index in range(self.workers):
+            self._spawn(index)
+        logger.info(f"多进程服务已启动: http://{self.host}:{self.port}，工作进程 {self.workers} 个")
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        if on_started is not None:
+            on_started()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            index = self.children.pop(pid, None)
+            if index is None or self._stopping:
+                continue
+            logger.warning(f"工作进程 {index} 已退出（pid={pid}，状态 {status}），{self.RESTART_DELAY}s 后重启")
+            time.sleep(self.RESTART_DELAY)
+            if not self._stopping:
+                self._spawn(index)
+        self.socket.close()
+        logger.info("多进程服务已停止")
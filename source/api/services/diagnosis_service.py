@@ -3,15 +3,26 @@ import io
 import os
 
 from PIL import Image
-from lxml import etree
 
-from source import capture_and_mark_elements, diagnose_and_handle
+from source.api.utils.icon_locator import get_icon_locator
+from source.api.utils.popup_detector import detect_popup
 from source.api.utils.template_matcher import TemplateMatcher
-from source.appium_Inspector import diagnose_and_handle_lvm
+from source.api.utils.xml_fingerprint import (element_action, get_xml_fingerprint_cache, resolve_action,
+                                              structural_fingerprint)
+from source.api.utils.xml_rules import get_rule_engine
+from source.appium_Inspector import capture_and_mark_elements, diagnose_and_handle, diagnose_and_handle_lvm
 from source.services import ElementManager
+from source.services.artifact_store import get_artifact_store
+from source.services.cost_ledger import mark_answer
+from source.services.image_artifact import ImageArtifact
 from source.services.image_processor import ImageProcessor
+from source.services.model_router import parse_screen_resolution
+from source.services.popup_classifier import classify_screenshot, record_outcome
 from source.services.recorder import Recorder
+from source.utils import trace
 from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
 
 logger = setup_logger(__name__)
 __all__ = ['vision_analysis', 'lvm_analysis']
@@ -35,25 +46,64 @@ def vision_analysis(screenshot_bytes, xml_page_struct, device_name, ):
     # 解析XML并获取元素边界信息
     # todo 优化xml解析性能优化
 
-    screenshot_image = Image.open(io.BytesIO(screenshot_bytes))
-
     try:
         # 将XML字符串转换为字节类型
-        xml_page_bytes = xml_page_struct.encode('utf-8')
-        xml_root = etree.fromstring(xml_page_bytes)
-        clickable_elements = xml_root.xpath(".//*[@clickable='true']")
+        with trace.span('parse_xml'):
+            # lxml 只在 XML 方案中使用，首次调用时再导入
+            from lxml import etree
+
+            xml_page_bytes = xml_page_struct.encode('utf-8')
+            xml_root = etree.fromstring(xml_page_bytes)
+            clickable_elements = xml_root.xpath(".//*[@clickable='true']")
     except Exception as e:
         logger.error(f"XML 格式错误: {str(e)}")
         raise e
 
-    screenshot_id, is_more_clickable_elements, marked_screenshot_image, non_clickable_area_image = capture_and_mark_elements(
-        screenshot_image, device_name, app_package, clickable_elements)
+    # 规则在界面层级上确定关闭按钮时直接返回，不绘制标记也不调用视觉模型
+    rule_engine = get_rule_engine()
+    if rule_engine is not None:
+        with trace.span('xml_rules'):
+            rule_match = rule_engine.match(xml_root)
+        metrics.increment('xml_rules', outcome='hit' if rule_match is not None else 'miss')
+        if rule_match is not None:
+            mark_answer('xml_rules')
+            return rule_match.x, rule_match.y, None
+
+    # 结构相同的界面（同一个弹窗）直接按上次的点击动作返回，不做任何图像处理
+    fingerprint_cache = get_xml_fingerprint_cache()
+    if fingerprint_cache is not None:
+        with trace.span('xml_fingerprint'):
+            fingerprint = structural_fingerprint(xml_root)
+            action = fingerprint_cache.lookup(fingerprint, device_name)
+        metrics.increment('xml_fingerprint', outcome='hit' if action is not None else 'miss')
+        if action is not None:
+            center_x, center_y = resolve_action(xml_root, action)
+            logger.info(f"界面结构指纹命中，点击坐标为: {center_x},{center_y}")
+            mark_answer('xml_fingerprint')
+            return center_x, center_y, None
+
+    center_x, center_y, template_file = _marked_analysis(screenshot_bytes, clickable_elements, device_name,
+                                                         app_package)
+    if fingerprint_cache is not None and center_x is not None and center_y is not None:
+        fingerprint_cache.store(fingerprint, element_action(xml_root, center_x, center_y), device_name)
+    return center_x, center_y, template_file
+
+
+def _marked_analysis(screenshot_bytes, clickable_elements, device_name, app_package):
+    """在截图上标记可点击元素后进行模版匹配，未命中时调用视觉模型"""
+    with trace.span('decode_image'):
+        screenshot_image = Image.open(io.BytesIO(screenshot_bytes))
+
+    with trace.span('capture_and_mark', clickable=len(clickable_elements)):
+        screenshot_id, is_more_clickable_elements, marked_screenshot_image, non_clickable_area_image, labels = \
+            capture_and_mark_elements(screenshot_image, device_name, app_package, clickable_elements)
 
     try:
         logger.info('开始进行模板匹配...')
         # 1. 先进行模板匹配
         template_matcher = TemplateMatcher()
-        is_template_match, template_file = template_matcher.match_known_popups(non_clickable_area_image)
+        with trace.span('template_match'):
+            is_template_match, template_file = template_matcher.match_known_popups(non_clickable_area_image)
         # logger.info(f'模板匹配结果: {is_template_match}, 模板文件: {template_file}')
     except Exception as e:
         logger.error(f"模板匹配时发生错误: {e}")
@@ -66,15 +116,16 @@ def vision_analysis(screenshot_bytes, xml_page_struct, device_name, ):
             if center_x is not None or center_y is not None:
                 recorder.close()
                 logger.info("模版匹配成功，查询模版匹配坐标为：" + str(center_x) + "," + str(center_y))
+                mark_answer('template')
                 return center_x, center_y, template_file
             logger.info("模版匹配成功，查询模版匹配坐标数据不存在")
             # 异常情况-备用路线
             return popup_analysis(recorder, is_more_clickable_elements,
-                                  marked_screenshot_image, non_clickable_area_image, screenshot_id)
+                                  marked_screenshot_image, non_clickable_area_image, screenshot_id, labels=labels)
         else:
             # 去调用视觉API判断模版对应的内容
             return popup_analysis(recorder, is_more_clickable_elements,
-                                  marked_screenshot_image, non_clickable_area_image, screenshot_id)
+                                  marked_screenshot_image, non_clickable_area_image, screenshot_id, labels=labels)
 
     except Exception as e:
         raise e
@@ -87,15 +138,17 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(c
 
 
 def lvm_analysis(screenshot_bytes, screen_resolution, device_name):
-    screenshot_image = Image.open(io.BytesIO(screenshot_bytes))
-    image_processor = ImageProcessor()
-    grayscale_image = image_processor.convert_to_grayscale(screenshot_image)
-    grayscale_copy = grayscale_image.copy()
+    with trace.span('decode_image'):
+        screenshot_image = Image.open(io.BytesIO(screenshot_bytes))
+        image_processor = ImageProcessor()
+        grayscale_image = image_processor.convert_to_grayscale(screenshot_image)
+        grayscale_copy = grayscale_image.copy()
 
     # 取出前景图像（示例：使用简单的阈值分割）
     # 假设使用一个固定的阈值来提取前景
     threshold = 128
-    foreground_image = grayscale_copy.point(lambda p: p > threshold and 255)
+    with trace.span('foreground'):
+        foreground_image = grayscale_copy.point(lambda p: p > threshold and 255)
 
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     device_name = device_name.replace(':', '_')
@@ -106,7 +159,8 @@ def lvm_analysis(screenshot_bytes, screen_resolution, device_name):
         logger.info('开始进行模板匹配...')
         # 1. 先进行模板匹配
         template_matcher = TemplateMatcher()
-        is_template_match, template_file = template_matcher.match_known_popups(foreground_image)
+        with trace.span('template_match'):
+            is_template_match, template_file = template_matcher.match_known_popups(foreground_image)
         # logger.info(f'模板匹配结果: {is_template_match}, 模板文件: {template_file}')
     except Exception as e:
         logger.error(f"模板匹配过程发生错误: {e}")
@@ -117,15 +171,51 @@ def lvm_analysis(screenshot_bytes, screen_resolution, device_name):
             if center_x is not None or center_y is not None:
                 recorder.close()
                 logger.info("模版匹配成功，查询模版匹配坐标为：" + str(center_x) + "," + str(center_y))
+                mark_answer('template')
                 return center_x, center_y, template_file
             else:
                 recorder.close()
         else:
             recorder.close()
-            center_x, center_y = diagnose_and_handle_lvm(grayscale_image, screen_resolution)
+            # 本地检测确定没有弹窗时直接返回，不调用视觉模型
+            with trace.span('popup_detector'):
+                detection = detect_popup(grayscale_image)
+            if detection is not None:
+                metrics.increment('popup_detector', verdict=detection.verdict)
+                if detection.verdict == 'no_popup':
+                    logger.info("本地检测确定没有弹窗，跳过视觉模型")
+                    mark_answer('popup_detector')
+                    return None, None, None
+            popup_detection = detection if detection is not None and detection.verdict == 'popup' else None
+            # 本地分类器高置信度判定为无弹窗时直接返回（POPUP_CLASSIFIER_MODE=on），影子模式只记录
+            with trace.span('popup_classifier'):
+                verdict = classify_screenshot(grayscale_image)
+            if verdict is not None and verdict.skip:
+                mark_answer('popup_classifier')
+                return None, None, None
+            # 图标库中的关闭按钮命中时直接返回，不调用视觉模型；只在检测到弹窗边界框时搜索其角落，
+            # 检测器不确定时整屏搜索误报率与耗时都过高，直接交给视觉模型
+            icon_locator = get_icon_locator() if popup_detection is not None else None
+            if icon_locator is not None:
+                with trace.span('icon_locator'):
+                    match = icon_locator.locate(grayscale_image, popup_detection.box)
+                metrics.increment('icon_locator', outcome='hit' if match is not None else 'miss')
+                if match is not None:
+                    center_x, center_y = _image_to_screen(match.x, match.y, grayscale_image.size, screen_resolution)
+                    logger.info(f"关闭按钮图标匹配成功，坐标为: {center_x},{center_y}")
+                    mark_answer('icon_locator')
+                    return center_x, center_y, None
+            # 发送给模型的 JPEG 编码结果在保存灰度截图时复用
+            grayscale_artifact = ImageArtifact(grayscale_image)
+            mark_answer('model')
+            with trace.span('vision_model'):
+                center_x, center_y = diagnose_and_handle_lvm(grayscale_artifact, screen_resolution,
+                                                             popup_detection=popup_detection)
+            record_outcome(verdict, center_x is not None and center_y is not None)
         if center_x is not None and center_y is not None:
             # 保存灰度图和前景图像
-            save_images_async_gray(grayscale_image, foreground_image, device_name, screenshot_id, center_x, center_y)
+            save_images_async_gray(grayscale_artifact, foreground_image, device_name, screenshot_id, center_x, center_y,
+                                   screen_resolution=screen_resolution)
             return center_x, center_y, None
         else:
             return None, None, None
@@ -133,36 +223,63 @@ def lvm_analysis(screenshot_bytes, screen_resolution, device_name):
         raise e
 
 
-def save_images_async_gray(grayscale_image, foreground_image, device_name, screenshot_id, center_x, center_y):
-    """异步保存图像的线程函数"""
+def _image_to_screen(x, y, image_size, screen_resolution):
+    """截图坐标换算为屏幕分辨率坐标（截图可能经过缩放），无法解析分辨率时原样返回"""
+    screen_size = parse_screen_resolution(screen_resolution)
+    if screen_size is None:
+        return x, y
+    return round(x * screen_size[0] / image_size[0]), round(y * screen_size[1] / image_size[1])
+
+
+def save_images_async_gray(grayscale_artifact, foreground_image, device_name, screenshot_id, center_x, center_y,
+                           screen_resolution=None):
+    """异步保存图像的线程函数，同时把点击位置的按钮图标加入关闭按钮图标库
+
+    grayscale_artifact 为发送给模型的灰度截图（ImageArtifact），直接写入其 JPEG 编码结果
+    """
+    grayscale_image = grayscale_artifact.image
 
     def save():
+        icon_locator = get_icon_locator()
+        if icon_locator is not None:
+            screen_size = parse_screen_resolution(screen_resolution) or grayscale_image.size
+            width, height = grayscale_image.size
+            try:
+                icon_locator.library.add(grayscale_image, center_x * width / screen_size[0],
+                                         center_y * height / screen_size[1], screenshot_id)
+            except Exception as e:
+                logger.warning(f"关闭按钮图标保存失败: {e}")
         # 保存灰度图
         recorder = Recorder()
-        directory_path = os.path.join(project_root, os.getenv('SCREENSHOT_DIR'), device_name)
-        template_path = os.path.join(project_root, os.getenv('TEMPLATE_DIR'))
-        save_screenshot(grayscale_image, directory_path, screenshot_id + '_grayscale_image', format='JPEG')
-        save_screenshot(foreground_image, template_path, screenshot_id, format='JPEG')
+        settings = get_settings()
+        directory_path = os.path.join(project_root, settings.screenshot_dir, device_name)
+        template_path = os.path.join(project_root, settings.template_dir)
+        store_screenshot(grayscale_artifact, directory_path, screenshot_id + '_grayscale_image')
+        saved_path = save_screenshot(foreground_image, template_path, screenshot_id, format='JPEG')
         recorder.save_template(screenshot_id, center_x, center_y)
         recorder.close()
+        TemplateMatcher(template_dir=template_path).add_template(saved_path)
 
-    # 启动线程
-    thread = threading.Thread(target=save)
-    thread.start()
+    # 启动线程（沿用请求的 trace 上下文）
+    trace.start_thread(save, name='save_images_gray')
 
 
 def popup_analysis(recorder, is_more_clickable_elements, marked_screenshot_image, non_clickable_area_image,
-                   screenshot_id):
+                   screenshot_id, labels=None):
     try:
         if not isinstance(marked_screenshot_image, Image.Image):
             raise ValueError("输入必须是 PIL.Image.Image 对象")
             # 如果图像是 RGBA 模式，转换为 RGB 模式
         if marked_screenshot_image.mode == 'RGBA':
             marked_screenshot_image = marked_screenshot_image.convert('RGB')
+        # 发送给模型的 JPEG 编码结果在保存标记截图时复用
+        marked_artifact = ImageArtifact(marked_screenshot_image)
         center_x, center_y = None, None
         if not is_more_clickable_elements:
             # 进行弹窗识别
-            popup_id = diagnose_and_handle(marked_screenshot_image)
+            mark_answer('model')
+            with trace.span('vision_model'):
+                popup_id = diagnose_and_handle(marked_artifact, labels=labels)
             if popup_id is not None and popup_id > 0:
                 logger.info(f"视觉模型检测到弹窗，弹窗标识为: {popup_id}，正在关闭...")
                 # 获取弹窗中心点
@@ -172,12 +289,13 @@ def popup_analysis(recorder, is_more_clickable_elements, marked_screenshot_image
 
         # 保存图像
         device_name = screenshot_id.split('_')[0]
-        directory_path = os.path.join(project_root, os.getenv('SCREENSHOT_DIR'), device_name)
-        template_dir = os.path.join(project_root, os.getenv('TEMPLATE_DIR'))
+        settings = get_settings()
+        directory_path = os.path.join(project_root, settings.screenshot_dir, device_name)
+        template_dir = os.path.join(project_root, settings.template_dir)
 
         # 异步保存图像
         if center_x is not None and center_y is not None:
-            save_images_async(marked_screenshot_image, non_clickable_area_image, directory_path, template_dir,
+            save_images_async(marked_artifact, non_clickable_area_image, directory_path, template_dir,
                               screenshot_id, center_x, center_y)
         return center_x, center_y, None
     except Exception as e:
@@ -188,34 +306,43 @@ def popup_analysis(recorder, is_more_clickable_elements, marked_screenshot_image
         recorder.close()
 
 
-import threading
-
-
-def save_images_async(marked_screenshot_image, non_clickable_area_image, directory_path, template_dir, screenshot_id,
+def save_images_async(marked_artifact, non_clickable_area_image, directory_path, template_dir, screenshot_id,
                       center_x, center_y):
-    """异步保存图像的线程函数"""
+    """异步保存图像的线程函数，marked_artifact 为发送给模型的标记截图（ImageArtifact）"""
 
     def save():
         # 保存标记后的截图
         recorder = Recorder()
         # safe_screenshot_id = screenshot_id.replace(':', '_')
 
-        save_screenshot(marked_screenshot_image, directory_path, screenshot_id + '_marked_screenshot', format='JPEG')
+        store_screenshot(marked_artifact, directory_path, screenshot_id + '_marked_screenshot')
 
         # 保存模板信息
         if center_x is not None and center_y is not None:
             # 保存不可点击区域的截图
-            save_screenshot(non_clickable_area_image, template_dir, screenshot_id, format='JPEG')
+            saved_path = save_screenshot(non_clickable_area_image, template_dir, screenshot_id, format='JPEG')
             recorder.save_template(screenshot_id, center_x, center_y)
+            TemplateMatcher(template_dir=template_dir).add_template(saved_path)
         recorder.close()
 
-    # 启动线程
-    thread = threading.Thread(target=save)
-    thread.start()
+    # 启动线程（沿用请求的 trace 上下文）
+    trace.start_thread(save, name='save_images')
+
+
+def store_screenshot(image, directory_path, name):
+    """保存诊断截图：启用内容寻址存储时按内容哈希保存并去重，否则按截图名保存到 directory_path"""
+    store = get_artifact_store()
+    if store is None:
+        return save_screenshot(image, directory_path, name, format='JPEG')
+    try:
+        return store.put_image(name, image)
+    except Exception as e:
+        logger.error(f"保存截图失败: {str(e)}")
+        raise e
 
 
 def save_screenshot(image, directory_path, screenshot_id, format='JPEG'):
-    """保存截图到指定路径"""
+    """保存截图到指定路径，image 为 ImageArtifact 时直接写入已有的 JPEG 编码结果"""
     # 替换设备名称中的非法字符
     screenshot_path = os.path.join(directory_path, f'{screenshot_id}.{format.lower()}')
     logger.info(f"保存截图到: {screenshot_path}")
@@ -223,7 +350,10 @@ def save_screenshot(image, directory_path, screenshot_id, format='JPEG'):
         # 确保目录存在
         os.makedirs(directory_path, exist_ok=True)
         # 保存图像
-        image.save(screenshot_path, format=format, quality=85)
+        if isinstance(image, ImageArtifact):
+            image.save(screenshot_path)
+        else:
+            image.save(screenshot_path, format=format, quality=85)
     except Exception as e:
         logger.error(f"保存截图失败: {str(e)}")
         raise e
@@ -0,0 +1,122 @@
+"""
+设备画面变化检测缓存
+
+模块职责：
+- 按设备记录上一帧截图的缩略指纹与诊断结果；新截图与上一帧几乎相同时直接返回上次的诊断结果，
+  省掉解码、模版扫描与视觉模型调用
+- 指纹为固定尺寸的灰度缩略图，JPEG 截图借助 draft 以 1/8 尺寸解码，差异用 numpy 向量化计算
+- 失效规则：超过 TTL、同一结果被复用次数达到上限（说明点击没有生效）、调用方反馈已执行点击、
+  截图分辨率或诊断方案变化
+- 状态保存在进程内，多进程模式下各工作进程分别维护
+"""
+import io
+import threading
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['FrameCache', 'frame_fingerprint', 'frame_difference', 'get_frame_cache']
+
+# 缩略指纹尺寸（宽, 高）
+FINGERPRINT_SIZE = (36, 64)
+
+
+def frame_fingerprint(screenshot_bytes):
+    """返回 (原图尺寸, 灰度缩略图 numpy 数组)"""
+    import numpy as np
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(screenshot_bytes))
+    size = image.size
+    # 只对 JPEG 生效：按 DCT 缩放解码，不解码全尺寸像素
+    image.draft('L', (size[0] // 8, size[1] // 8))
+    thumbnail = image.convert('L').resize(FINGERPRINT_SIZE, Image.BILINEAR)
+    return size, np.asarray(thumbnail, dtype=np.int16)
+
+
+def frame_difference(previous, current, pixel_delta=16):
+    """两个缩略指纹中变化超过 pixel_delta 灰度级的像素比例（0~1）"""
+    import numpy as np
+
+    return float(np.count_nonzero(np.abs(previous - current) > pixel_delta)) / previous.size
+
+
+class _Entry:
+    __slots__ = ('mode', 'size', 'fingerprint', 'result', 'created_at', 'hits')
+
+    def __init__(self, mode, size, fingerprint, result):
+        self.mode = mode
+        self.size = size
+        self.fingerprint = fingerprint
+        self.result = result
+        self.created_at = time.monotonic()
+        self.hits = 0
+
+
+class FrameCache:
+    """每台设备只保留最近一帧的指纹与诊断结果"""
+
+    def __init__(self, threshold=None, ttl_seconds=None, max_hits=None, max_devices=1024):
+        settings = get_settings()
+        self.threshold = threshold if threshold is not None else settings.frame_change_threshold
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.frame_cache_ttl_seconds
+        self.max_hits = max_hits if max_hits is not None else settings.frame_cache_max_hits
+        self.max_devices = max_devices
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, device_name, mode, size, fingerprint):
+        """画面未变化时返回上次的诊断结果，否则返回 None"""
+        with self._lock:
+            entry = self._entries.get(device_name)
+            if entry is None:
+                return None
+            if entry.mode != mode or entry.size != size:
+                return None
+            if self.ttl_seconds and time.monotonic() - entry.created_at > self.ttl_seconds:
+                del self._entries[device_name]
+                return None
+            difference = frame_difference(entry.fingerprint, fingerprint)
+            if difference > self.threshold:
+                return None
+            entry.hits += 1
+            result = entry.result
+            if self.max_hits and entry.hits >= self.max_hits:
+                # 同一画面反复诊断，说明返回的点击没有生效，下次重新诊断
+                del self._entries[device_name]
+        logger.info(f"设备 {device_name} 画面未变化（差异 {difference:.4f}），复用上次诊断结果")
+        return result
+
+    def store(self, device_name, mode, size, fingerprint, result):
+        with self._lock:
+            if device_name not in self._entries and len(self._entries) >= self.max_devices:
+                # 设备数超过上限时淘汰最早写入的设备
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[device_name] = _Entry(mode, size, fingerprint, result)
+
+    def invalidate(self, device_name):
+        """调用方已执行点击等改变画面的操作后调用，返回是否存在缓存"""
+        with self._lock:
+            return self._entries.pop(device_name, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_frame_cache = None
+_frame_cache_lock = threading.Lock()
+
+
+def get_frame_cache():
+    """进程内共享的画面缓存，FRAME_CACHE_ENABLED 为 False 时返回 None"""
+    global _frame_cache
+    if not get_settings().frame_cache_enabled:
+        return None
+    with _frame_cache_lock:
+        if _frame_cache is None:
+            _frame_cache = FrameCache()
+    return _frame_cache
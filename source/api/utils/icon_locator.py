@@ -0,0 +1,250 @@
+"""
+关闭按钮图标定位模块（分辨率方案调用视觉模型之前的快速定位）
+
+模块职责：
+- 图标库：以往诊断成功时点击位置附近的灰度小图（“X”、“跳过”等），统一缩放到参考宽度下的尺寸保存在 ICON_DIR；
+  首次使用时从 template 表记录的点击坐标与对应的灰度截图中补充，之后每次模型诊断成功都会追加
+- 多尺度匹配：有弹窗边界框时只在其左上角、右上角与下方中部搜索，没有时搜索整屏，每个图标按多个比例匹配
+- 最高相似度达到 ICON_MATCH_THRESHOLD 时直接返回按钮坐标与置信度，否则交给视觉模型
+"""
+import os
+import threading
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['IconMatch', 'IconLibrary', 'IconLocator', 'get_icon_locator']
+
+# 获取当前脚本的绝对路径
+current_file_path = os.path.abspath(__file__)
+# 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(current_file_path))))
+
+# 匹配在缩放到该宽度的截图上进行，图标也按该宽度保存
+REFERENCE_WIDTH = 720
+# 图标边长（参考宽度下的像素），以及截取图标时的边长占截图宽度的比例
+ICON_SIZE = 48
+ICON_FRACTION = ICON_SIZE / REFERENCE_WIDTH
+# 多尺度匹配的比例
+SCALES = (0.8, 0.9, 1.0, 1.12, 1.25)
+# 灰度标准差低于该值的图标（纯色区域）没有辨识度，不加入图标库
+MIN_ICON_STD = 12
+# 与已有图标相似度达到该值视为重复
+DUPLICATE_SCORE = 0.92
+
+
+class IconMatch:
+    """定位结果：x, y 为原图坐标"""
+
+    __slots__ = ('x', 'y', 'confidence', 'icon', 'elapsed_ms')
+
+    def __init__(self, x, y, confidence, icon, elapsed_ms):
+        self.x = x
+        self.y = y
+        self.confidence = confidence
+        self.icon = icon
+        self.elapsed_ms = elapsed_ms
+
+    def __repr__(self):
+        return f"IconMatch(({self.x}, {self.y}), confidence={self.confidence:.2f}, icon={self.icon})"
+
+
+def _to_array(image):
+    import numpy as np
+
+    if isinstance(image, np.ndarray):
+        return image
+    return np.asarray(image.convert('L'))
+
+
+class IconLibrary:
+    """关闭按钮图标库，图标为 ICON_DIR 下的灰度 PNG，按修改时间淘汰最旧的图标"""
+
+    def __init__(self, icon_dir=None, max_icons=None):
+        settings = get_settings()
+        self.icon_dir = icon_dir or os.path.join(project_root, settings.icon_dir)
+        self.max_icons = max_icons if max_icons is not None else settings.icon_max_count
+        self._icons = None
+        self._lock = threading.Lock()
+
+    def icons(self):
+        """返回 [(图标名, 灰度数组)]，其他进程追加的图标在目录变化后重新加载"""
+        import cv2
+
+        with self._lock:
+            mtime = os.stat(self.icon_dir).st_mtime_ns if os.path.isdir(self.icon_dir) else None
+            if self._icons is None or self._icons[0] != mtime:
+                icons = []
+                for name in sorted(os.listdir(self.icon_dir)) if mtime is not None else []:
+                    icon = cv2.imread(os.path.join(self.icon_dir, name), cv2.IMREAD_GRAYSCALE)
+                    if icon is not None:
+                        icons.append((name, icon))
+                self._icons = (mtime, icons)
+            return self._icons[1]
+
+    def add(self, image, x, y, name):
+        """从截图 (x, y) 处截取图标加入图标库，纯色或与已有图标重复时返回 False"""
+        import cv2
+
+        image = _to_array(image)
+        height, width = image.shape[:2]
+        half = max(4, round(width * ICON_FRACTION / 2))
+        x, y = int(x), int(y)
+        if not (half <= x < width - half and half <= y < height - half):
+            return False
+        icon = cv2.resize(image[y - half:y + half, x - half:x + half], (ICON_SIZE, ICON_SIZE),
+                          interpolation=cv2.INTER_AREA)
+        if icon.std() < MIN_ICON_STD:
+            return False
+        for _, existing in self.icons():
+            if cv2.minMaxLoc(cv2.matchTemplate(icon, existing, cv2.TM_CCOEFF_NORMED))[1] >= DUPLICATE_SCORE:
+                return False
+        os.makedirs(self.icon_dir, exist_ok=True)
+        cv2.imwrite(os.path.join(self.icon_dir, f'{name}.png'), icon)
+        self._evict()
+        logger.info(f"关闭按钮图标库新增图标: {name}")
+        return True
+
+    def _evict(self):
+        names = [name for name in os.listdir(self.icon_dir) if name.endswith('.png')]
+        if len(names) <= self.max_icons:
+            return
+        paths = sorted((os.path.join(self.icon_dir, name) for name in names), key=os.path.getmtime)
+        for path in paths[:len(names) - self.max_icons]:
+            os.remove(path)
+
+    def seed(self, screenshot_dir=None):
+        """从 template 表记录的点击坐标与对应的灰度截图补充图标，返回新增数量"""
+        from PIL import Image
+
+        from source.services.artifact_store import resolve_screenshot
+        from source.services.recorder import Recorder
+
+        settings = get_settings()
+        screenshot_dir = screenshot_dir or os.path.join(project_root, settings.screenshot_dir)
+        recorder = Recorder()
+        try:
+            rows = recorder.cursor.execute('SELECT template_id, skip_center_x, skip_center_y FROM template '
+                                           'ORDER BY created_at DESC LIMIT ?', (self.max_icons * 4,)).fetchall()
+        finally:
+            recorder.close()
+        added = 0
+        for template_id, x, y in rows:
+            if x is None or y is None:
+                continue
+            # 截图 ID 为 {设备名}_{日期}_{时间}，分辨率方案保存的灰度截图与点击坐标在同一坐标系
+            device_name = template_id.rsplit('_', 2)[0]
+            path = resolve_screenshot(screenshot_dir, device_name, f'{template_id}_grayscale_image')
+            if path is None:
+                continue
+            with Image.open(path) as image:
+                added += self.add(image, x, y, template_id)
+        logger.info(f"从 {len(rows)} 条模版记录中补充了 {added} 个关闭按钮图标")
+        return added
+
+
+class IconLocator:
+    """在弹窗四角与下方多尺度匹配关闭按钮图标"""
+
+    def __init__(self, library, threshold=None):
+        self.library = library
+        self.threshold = threshold if threshold is not None else get_settings().icon_match_threshold
+
+    @staticmethod
+    def search_windows(region, size):
+        """弹窗左上角、右上角与下方中部的搜索窗口 (x0, y0, x1, y1)"""
+        width, height = size
+        x0, y0, x1, y1 = region
+        w, h = x1 - x0, y1 - y0
+        center = (x0 + x1) / 2
+        windows = (
+            (x0 - 0.1 * w, y0 - 0.15 * h, x0 + 0.35 * w, y0 + 0.3 * h),
+            (x1 - 0.35 * w, y0 - 0.15 * h, x1 + 0.1 * w, y0 + 0.3 * h),
+            (center - 0.25 * w, y1 - 0.1 * h, center + 0.25 * w, y1 + 0.35 * h),
+        )
+        return [(max(0, int(a)), max(0, int(b)), min(width, int(c)), min(height, int(d))) for a, b, c, d in windows]
+
+    def locate(self, image, region=None):
+        """返回置信度达到阈值的 IconMatch，否则返回 None；region 为原图坐标的弹窗边界框
+
+        先在半分辨率上对所有图标与比例粗匹配，再在参考分辨率上只对最佳候选的邻域精匹配。
+        """
+        import cv2
+
+        start = time.perf_counter()
+        icons = self.library.icons()
+        if not icons:
+            return None
+        image = _to_array(image)
+        height, width = image.shape[:2]
+        factor = REFERENCE_WIDTH / width
+        small = cv2.resize(image, (REFERENCE_WIDTH, round(height * factor)), interpolation=cv2.INTER_AREA)
+        coarse = cv2.resize(small, (REFERENCE_WIDTH // 2, small.shape[0] // 2), interpolation=cv2.INTER_AREA)
+        if region is not None:
+            windows = self.search_windows([v * factor / 2 for v in region], (coarse.shape[1], coarse.shape[0]))
+        else:
+            windows = [(0, 0, coarse.shape[1], coarse.shape[0])]
+
+        best_score, best = -1.0, None
+        for wx0, wy0, wx1, wy1 in windows:
+            window = coarse[wy0:wy1, wx0:wx1]
+            for name, icon in icons:
+                for scale in SCALES:
+                    side = round(ICON_SIZE * scale / 2)
+                    if window.shape[0] < side or window.shape[1] < side:
+                        continue
+                    result = cv2.matchTemplate(window, cv2.resize(icon, (side, side), interpolation=cv2.INTER_AREA),
+                                               cv2.TM_CCOEFF_NORMED)
+                    _, score, _, (lx, ly) = cv2.minMaxLoc(result)
+                    if score > best_score:
+                        best_score, best = score, (name, icon, scale, (wx0 + lx) * 2, (wy0 + ly) * 2)
+
+        match = self._refine(small, best, cv2) if best is not None else None
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if match is None or match[0] < self.threshold:
+            logger.info(f"未定位到关闭按钮图标，最高相似度 {max(best_score, match[0] if match else -1):.2f}，"
+                        f"耗时 {elapsed_ms:.1f}ms")
+            return None
+        score, name, (cx, cy) = match
+        result = IconMatch(round(cx / factor), round(cy / factor), score, name, elapsed_ms)
+        logger.info(f"定位到关闭按钮图标: {result}，耗时 {elapsed_ms:.1f}ms")
+        return result
+
+    @staticmethod
+    def _refine(small, candidate, cv2):
+        """在参考分辨率上对粗匹配位置的邻域精匹配，返回 (相似度, 图标名, 中心点)"""
+        name, icon, scale, x, y = candidate
+        side = round(ICON_SIZE * scale)
+        icon = cv2.resize(icon, (side, side), interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+        x0, y0 = max(0, x - side // 4), max(0, y - side // 4)
+        window = small[y0:y + side + side // 4, x0:x + side + side // 4]
+        if window.shape[0] < side or window.shape[1] < side:
+            return None
+        _, score, _, (lx, ly) = cv2.minMaxLoc(cv2.matchTemplate(window, icon, cv2.TM_CCOEFF_NORMED))
+        return score, name, (x0 + lx + side / 2, y0 + ly + side / 2)
+
+
+_locator = None
+_locator_lock = threading.Lock()
+
+
+def get_icon_locator():
+    """进程内共享的定位器，关闭（ICON_LOCATOR_ENABLED=False）时返回 None；图标目录不存在时先从历史模版补充"""
+    global _locator
+    settings = get_settings()
+    if not settings.icon_locator_enabled:
+        return None
+    with _locator_lock:
+        if _locator is None or _locator.library.icon_dir != os.path.join(project_root, settings.icon_dir):
+            library = IconLibrary()
+            if not os.path.isdir(library.icon_dir):
+                os.makedirs(library.icon_dir, exist_ok=True)
+                try:
+                    library.seed()
+                except Exception as e:
+                    logger.warning(f"从历史模版补充关闭按钮图标失败: {e}")
+            _locator = IconLocator(library)
+    return _locator
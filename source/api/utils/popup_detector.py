@@ -0,0 +1,143 @@
+"""
+本地弹窗检测模块（分辨率方案调用视觉模型之前的快速判断）
+
+模块职责：
+- 在缩小的灰度图上寻找典型的弹窗特征：压暗的遮罩（scrim）包围着一块明亮的矩形卡片
+- 卡片候选由 Otsu 阈值分割后的轮廓得到，要求接近矩形、面积与宽度在弹窗的常见范围内；
+  卡片外区域的亮部（p90）明显暗于卡片时判定为弹窗，并给出弹窗在原图中的边界框
+- 没有找到弹窗卡片、且屏幕四周大部分区域仍有接近纯白的像素（遮罩会把整屏压暗，纯白不会出现在遮罩下）时，
+  判定为“确定没有弹窗”，不再调用视觉模型
+- 其他情况（深色模式、卡片被大图填满等）返回 uncertain，仍交给视觉模型判断
+
+整个检测在约 180 像素宽的缩略图上进行，单张截图耗时为毫秒级。
+"""
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['PopupDetection', 'PopupDetector', 'detect_popup']
+
+
+class PopupDetection:
+    """检测结果：verdict 为 popup / no_popup / uncertain，box 为原图坐标 (x0, y0, x1, y1) 或 None"""
+
+    __slots__ = ('verdict', 'confidence', 'box', 'image_size', 'elapsed_ms')
+
+    def __init__(self, verdict, confidence, box, image_size, elapsed_ms):
+        self.verdict = verdict
+        self.confidence = confidence
+        self.box = box
+        self.image_size = image_size
+        self.elapsed_ms = elapsed_ms
+
+    def scaled_box(self, screen_size):
+        """把边界框换算到屏幕分辨率坐标（截图可能经过缩放）"""
+        if self.box is None or screen_size is None:
+            return self.box
+        sx, sy = screen_size[0] / self.image_size[0], screen_size[1] / self.image_size[1]
+        x0, y0, x1, y1 = self.box
+        return round(x0 * sx), round(y0 * sy), round(x1 * sx), round(y1 * sy)
+
+    def __repr__(self):
+        return f"PopupDetection({self.verdict}, confidence={self.confidence:.2f}, box={self.box})"
+
+
+class PopupDetector:
+    """遮罩 + 明亮卡片的弹窗检测器，阈值均为经验值"""
+
+    # 检测使用的缩略图宽度
+    WORK_WIDTH = 180
+    # 卡片面积占屏幕的比例范围，以及最小宽度占比
+    MIN_CARD_AREA, MAX_CARD_AREA = 0.04, 0.8
+    MIN_CARD_WIDTH = 0.4
+    # 卡片外接矩形内亮像素的最小占比（卡片上的文字、按钮会降低占比）
+    MIN_FILL = 0.7
+    # 卡片外亮部相对卡片亮度的压暗程度：达到 POPUP_SCORE 判定为弹窗，低于 NO_POPUP_SCORE 才可能判定为没有弹窗
+    POPUP_SCORE = 0.15
+    NO_POPUP_SCORE = 0.08
+    # 4x4 网格中外圈 12 个格子的最亮部分（p99）达到 WHITE_LEVEL 的比例，达到 MIN_WHITE_RING 说明屏幕没有被遮罩压暗
+    WHITE_LEVEL = 245
+    MIN_WHITE_RING = 0.75
+
+    def detect(self, image):
+        """检测一张截图，image 为 PIL Image 或灰度 numpy 数组"""
+        # OpenCV 导入较慢，首次检测时再导入
+        import cv2
+        import numpy as np
+
+        start = time.perf_counter()
+        if not isinstance(image, np.ndarray):
+            image = np.asarray(image.convert('L'))
+        height, width = image.shape[:2]
+        scale = self.WORK_WIDTH / width
+        small = cv2.resize(image, (self.WORK_WIDTH, max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        small = cv2.GaussianBlur(small, (3, 3), 0)
+
+        card, score = self._find_card(small, cv2, np)
+        if card is not None and score >= self.POPUP_SCORE:
+            x, y, w, h = card
+            box = (round(x / scale), round(y / scale), round((x + w) / scale), round((y + h) / scale))
+            return self._result('popup', min(1.0, score / (2 * self.POPUP_SCORE)), box, (width, height), start)
+
+        white_ring = self._white_ring_ratio(image, np)
+        if score < self.NO_POPUP_SCORE and white_ring >= self.MIN_WHITE_RING:
+            return self._result('no_popup', white_ring, None, (width, height), start)
+        return self._result('uncertain', 0.0, None, (width, height), start)
+
+    def _find_card(self, small, cv2, np):
+        """返回 (最像弹窗卡片的外接矩形, 压暗得分)，没有候选时返回 (None, 0)"""
+        _, mask = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        screen_h, screen_w = small.shape
+        screen_area = screen_h * screen_w
+        best, best_score = None, 0.0
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            area = w * h
+            if not (self.MIN_CARD_AREA <= area / screen_area <= self.MAX_CARD_AREA) or w < self.MIN_CARD_WIDTH * screen_w:
+                continue
+            if np.count_nonzero(mask[y:y + h, x:x + w]) / area < self.MIN_FILL:
+                continue
+            outside = np.ones_like(mask, dtype=bool)
+            outside[y:y + h, x:x + w] = False
+            card_level = float(np.median(small[y:y + h, x:x + w]))
+            outside_level = float(np.percentile(small[outside], 90)) if outside.any() else card_level
+            score = (card_level - outside_level) / max(card_level, 1.0)
+            if score > best_score:
+                best, best_score = (x, y, w, h), score
+        return best, best_score
+
+    def _white_ring_ratio(self, image, np):
+        """4x4 网格外圈格子中最亮部分达到 WHITE_LEVEL 的比例（在原图上隔行隔列采样，缩略图会抹掉细小的白色文字）"""
+        image = image[::4, ::4]
+        height, width = image.shape
+        rows, cols = np.linspace(0, height, 5, dtype=int), np.linspace(0, width, 5, dtype=int)
+        bright = total = 0
+        for i in range(4):
+            for j in range(4):
+                if 0 < i < 3 and 0 < j < 3:
+                    continue
+                cell = image[rows[i]:rows[i + 1], cols[j]:cols[j + 1]]
+                total += 1
+                bright += cell.size > 0 and np.percentile(cell, 99) >= self.WHITE_LEVEL
+        return bright / total
+
+    @staticmethod
+    def _result(verdict, confidence, box, image_size, start):
+        return PopupDetection(verdict, confidence, box, image_size, (time.perf_counter() - start) * 1000)
+
+
+_detector = PopupDetector()
+
+
+def detect_popup(image):
+    """使用共享的检测器检测截图，关闭检测（POPUP_DETECTOR_ENABLED=False）时返回 None"""
+    if not get_settings().popup_detector_enabled:
+        return None
+    detection = _detector.detect(image)
+    logger.info(f"本地弹窗检测: {detection}，耗时 {detection.elapsed_ms:.1f}ms")
+    return detection
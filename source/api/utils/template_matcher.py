@@ -1,15 +1,10 @@
-import cv2
 import os
 
-import numpy as np
-
 from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
 
 logger = setup_logger(__name__)
 
-from dotenv import load_dotenv
-
-load_dotenv()
 # 获取当前脚本的绝对路径
 current_file_path = os.path.abspath(__file__)
 # 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
@@ -17,29 +12,81 @@ project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(c
 
 
 class TemplateMatcher:
-    def __init__(self):
-        self.template_dir = os.path.join(project_root, os.getenv('TEMPLATE_DIR'))
+    def __init__(self, threshold=None, template_dir=None):
+        settings = get_settings()
+        self.template_dir = template_dir or os.path.join(project_root, settings.template_dir)
         os.makedirs(self.template_dir, exist_ok=True)
-        # 初始化日志记录器
+        # 匹配阈值，TM_CCOEFF_NORMED 相似度超过该值视为命中
+        self.threshold = threshold if threshold is not None else settings.template_match_threshold
+        # 启用打包文件时从共享内存映射读取已解码的模版，不再逐个读取图片
+        self.use_pack = settings.template_pack
 
     def match_known_popups(self, non_clickable_area_image):
         """匹配已知弹窗模板"""
 
         # non_clickable_area_image.save( os.path.join(project_root, os.getenv('TEMPLATE_DIR'), 'non_clickable_area_image.png'))
-        non_clickable_area_image = np.array(non_clickable_area_image)
-        for template_file_item in os.listdir(self.template_dir):
+        for template_file_item, max_val in self.iter_match_scores(non_clickable_area_image):
+            if max_val > self.threshold:  # 匹配阈值
+                logger.info(f"匹配到弹窗模板: {template_file_item}, 匹配值: {max_val}")
+                return True, template_file_item
+        logger.info("未匹配到任何弹窗模板")
+        return False, None
+
+    def iter_match_scores(self, image, template_files=None):
+        """依次计算图像与模版库中每个模版的最大相似度
+
+        参数:
+            image: 灰度 PIL Image 或 numpy 数组
+            template_files: 模版文件名列表，默认遍历整个模版库（打包文件顺序或 os.listdir 顺序）
+
+        返回:
+            (模版文件名, 相似度) 的迭代器，无法读取或尺寸大于图像的模版会被跳过
+        """
+        # OpenCV 导入较慢，首次匹配时再导入
+        import cv2
+        import numpy as np
+
+        image = np.array(image)
+        for template_file_item, template in self._iter_templates(template_files):
+            if template.shape[0] > image.shape[0] or template.shape[1] > image.shape[1]:
+                # 其他分辨率设备保存的模版，cv2.matchTemplate 要求模版不大于图像
+                continue
+            ret = cv2.matchTemplate(image, template, cv2.TM_CCOEFF_NORMED)
+            _, max_val, _, max_loc = cv2.minMaxLoc(ret)
+            yield template_file_item, max_val
+
+    def _iter_templates(self, template_files):
+        """依次返回 (模版文件名, 灰度模版)"""
+        if template_files is None and self.use_pack:
+            from source.api.utils.template_pack import get_template_pack
+
+            yield from get_template_pack(self.template_dir).refresh()
+            return
+
+        import cv2
+
+        if template_files is None:
+            template_files = os.listdir(self.template_dir)
+        for template_file_item in template_files:
             template_path = os.path.join(self.template_dir, template_file_item)
             template = cv2.imread(template_path, 0)
             if template is None:
                 logger.error(f"无法读取模板文件: {template_path}")
                 continue
-            ret = cv2.matchTemplate(non_clickable_area_image, template, cv2.TM_CCOEFF_NORMED)
-            _, max_val, _, max_loc = cv2.minMaxLoc(ret)
-            if max_val > 0.8:  # 匹配阈值
-                logger.info(f"匹配到弹窗模板: {template_file_item}, 匹配值: {max_val}")
-                return True, template_file_item
-        logger.info("未匹配到任何弹窗模板")
-        return False, None
+            yield template_file_item, template
+
+    def add_template(self, template_path):
+        """新模版保存后调用，启用打包文件时追加并通知其他工作进程"""
+        if not self.use_pack:
+            return
+        import cv2
+        from source.api.utils.template_pack import get_template_pack
+
+        template = cv2.imread(template_path, 0)
+        if template is None:
+            logger.error(f"无法读取模板文件: {template_path}")
+            return
+        get_template_pack(self.template_dir).append(os.path.basename(template_path), template)
 
 # if __name__ == '__main__':
 #     template_matcher = TemplateMatcher()
@@ -0,0 +1,197 @@
+"""
+模版库打包文件（内存映射，多进程共享）
+
+模块职责：
+- 将模版目录中的灰度模版解码后写入一个打包文件，各工作进程以只读 mmap 共享，不再逐次 cv2.imread
+- 新模版由学到它的进程追加到打包文件并递增头部的代数（generation），其他进程在下一次匹配时发现代数变化后增量加载
+- 模版被清理后整体重建打包文件（原子替换），其他进程通过文件 inode 变化重新映射
+
+文件格式（小端）:
+- 头部: 魔数 b'SDTP'、版本 u32、代数 u64
+- 记录依次追加: 名称长度 u16、高 u32、宽 u32、名称 utf-8、灰度像素 高*宽 字节
+"""
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+from source.utils.log_config import setup_logger
+
+logger = setup_logger(__name__)
+
+__all__ = ['TemplatePack', 'get_template_pack', 'pack_path_for']
+
+MAGIC = b'SDTP'
+VERSION = 1
+HEADER = struct.Struct('<4sIQ')
+RECORD = struct.Struct('<HII')
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png')
+
+_packs = {}
+_packs_lock = threading.Lock()
+
+
+def pack_path_for(template_dir):
+    """模版目录对应的打包文件路径（放在目录旁边，避免被当作模版遍历）"""
+    return os.path.normpath(template_dir) + '.pack'
+
+
+@contextmanager
+def _file_lock(path):
+    """跨进程互斥锁（锁文件），保护追加与重建"""
+    with open(path + '.lock', 'a+b') as f:
+        try:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        except ImportError:  # Windows
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _encode_record(name, gray):
+    name_bytes = name.encode('utf-8')
+    height, width = gray.shape
+    return RECORD.pack(len(name_bytes), height, width) + name_bytes + gray.tobytes()
+
+
+class TemplatePack:
+    """单个打包文件的读写，进程内通过 get_template_pack 共享同一实例"""
+
+    def __init__(self, path):
+        self.path = path
+        self.generation = -1
+        self.entries = []
+        self._mmap = None
+        self._inode = None
+        self._offset = HEADER.size
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, path, template_dir):
+        """从模版目录重建打包文件（按修改时间从旧到新），返回写入的模版数量"""
+        import cv2
+
+        names = [name for name in os.listdir(template_dir) if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+        names.sort(key=lambda name: (os.path.getmtime(os.path.join(template_dir, name)), name))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        count = 0
+        with _file_lock(path):
+            generation = cls._read_generation(path) + 1
+            with open(tmp_path, 'wb') as f:
+                f.write(HEADER.pack(MAGIC, VERSION, generation))
+                for name in names:
+                    gray = cv2.imread(os.path.join(template_dir, name), 0)
+                    if gray is None:
+                        logger.error(f"无法读取模板文件: {name}")
+                        continue
+                    f.write(_encode_record(name, gray))
+                    count += 1
+            os.replace(tmp_path, path)
+        logger.info(f"模版打包文件已重建: {path}，共 {count} 个模版，代数 {generation}")
+        return count
+
+    @staticmethod
+    def _read_generation(path):
+        try:
+            with open(path, 'rb') as f:
+                magic, _, generation = HEADER.unpack(f.read(HEADER.size))
+            return generation if magic == MAGIC else 0
+        except (FileNotFoundError, struct.error):
+            return 0
+
+    def append(self, name, gray):
+        """追加一个模版并递增代数，其他进程下一次匹配时即可看到"""
+        with _file_lock(self.path):
+            if not os.path.exists(self.path):
+                with open(self.path, 'wb') as f:
+                    f.write(HEADER.pack(MAGIC, VERSION, 1))
+            with open(self.path, 'r+b') as f:
+                magic, version, generation = HEADER.unpack(f.read(HEADER.size))
+                f.seek(0, os.SEEK_END)
+                f.write(_encode_record(name, gray))
+                f.flush()
+                # 先写记录再更新代数，读取方看到新代数时记录已完整
+                f.seek(0)
+                f.write(HEADER.pack(magic, version, generation + 1))
+
+    def refresh(self):
+        """检查代数并按需加载新模版，返回 [(模版文件名, 灰度 numpy 数组), ...]"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return []
+        with open(self.path, 'rb') as f:
+            magic, _, generation = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"模版打包文件格式错误: {self.path}")
+        if stat.st_ino == self._inode and generation == self.generation:
+            return self.entries
+        with self._lock:
+            if stat.st_ino != self._inode or generation != self.generation:
+                # 代数变化（追加）或打包文件被重建时都重新映射整个文件
+                self._inode = stat.st_ino
+                self._load(generation)
+        return self.entries
+
+    def _load(self, generation):
+        """重新映射整个文件，所有模版（包括之前已加载的）都指向新的映射，并关闭被替代的映射
+
+        只解析记录头，像素仍直接引用映射内存，重新指向的开销与模版数量成正比但不复制像素。
+        """
+        import numpy as np
+
+        with open(self.path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        entries = []
+        offset = HEADER.size
+        while offset + RECORD.size <= len(mapped):
+            name_length, height, width = RECORD.unpack_from(mapped, offset)
+            data_offset = offset + RECORD.size + name_length
+            end = data_offset + height * width
+            if end > len(mapped):
+                # 其他进程正在追加，下次再加载
+                break
+            name = bytes(mapped[offset + RECORD.size:data_offset]).decode('utf-8')
+            # 直接引用映射内存，不复制像素
+            gray = np.frombuffer(mapped, dtype=np.uint8, count=height * width, offset=data_offset)
+            entries.append((name, gray.reshape(height, width)))
+            offset = end
+        superseded = self._mmap
+        self._mmap, self._offset, self.entries, self.generation = mapped, offset, entries, generation
+        self._close(superseded)
+
+    @staticmethod
+    def _close(mapped):
+        """关闭被替代的映射；正在进行的匹配仍持有旧数组时无法关闭，由垃圾回收在其释放后回收"""
+        if mapped is None:
+            return
+        try:
+            mapped.close()
+        except BufferError:
+            pass
+
+
+def get_template_pack(template_dir):
+    """获取模版目录对应的打包文件，打包文件不存在时从目录构建"""
+    path = pack_path_for(template_dir)
+    with _packs_lock:
+        pack = _packs.get(path)
+        if pack is None:
+            if not os.path.exists(path):
+                os.makedirs(template_dir, exist_ok=True)
+                TemplatePack.build(path, template_dir)
+            pack = _packs[path] = TemplatePack(path)
+    return pack
@@ -0,0 +1,243 @@
+"""
+XML 结构指纹缓存模块（XML 方案在任何图像处理之前的查表）
+
+模块职责：
+- 由 uiautomator XML 计算结构指纹：节点类名、resource-id、文案（数字归一化为 #）、可点击属性、
+  层级关系以及节点在父节点中的大致位置（3x3 九宫格）；忽略 bounds 的具体数值、计数与时间等易变内容
+- 界面存在多个窗口时只对最上层窗口计算指纹，背景页面的内容变化不影响弹窗的指纹
+- 指纹 → 点击动作（被点击元素在层级中的路径，以及相对坐标作为后备）保存在 DB_PATH 数据库中，
+  多个工作进程共享；按最近使用时间淘汰超过条数上限的记录
+- 失效规则：调用方反馈点击没有生效、同一设备连续命中同一指纹的次数达到上限（说明点击没有生效）；
+  只统计紧接着的重复：设备期间出现过其他界面，或距上次命中超过 STREAK_SECONDS 时重新计数，
+  反复出现但每次都被成功关闭的弹窗不会被删除
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from source.api.utils.xml_rules import parse_bounds
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['XmlFingerprintCache', 'structural_fingerprint', 'element_action', 'resolve_action',
+           'get_xml_fingerprint_cache']
+
+_DIGITS = re.compile(r'\d+')
+
+
+def _scope(root):
+    """多个窗口时返回最上层窗口，否则返回根节点"""
+    windows = [child for child in root if child.get('bounds')]
+    return windows[-1] if len(windows) > 1 else root
+
+
+def _screen_size(root):
+    width, height = root.get('width'), root.get('height')
+    if width and height and width.isdigit() and height.isdigit():
+        return int(width), int(height)
+    for node in root.iter():
+        bounds = parse_bounds(node.get('bounds'))
+        if bounds is not None:
+            return max(1, bounds[2]), max(1, bounds[3])
+    return 1, 1
+
+
+def _cell(bounds, parent_bounds):
+    """节点中心位于父节点九宫格中的哪一格，例如 '02' 为右上角"""
+    if bounds is None or parent_bounds is None:
+        return ''
+    cell = ''
+    for axis in (1, 0):
+        low, high = parent_bounds[axis], parent_bounds[axis + 2]
+        center = (bounds[axis] + bounds[axis + 2]) / 2
+        cell += str(min(2, max(0, int(3 * (center - low) / max(1, high - low)))))
+    return cell
+
+
+def _canonical(node, parent_bounds, parts):
+    bounds = parse_bounds(node.get('bounds'))
+    parts.append('|'.join((
+        node.get('class') or node.tag,
+        node.get('resource-id', ''),
+        _DIGITS.sub('#', node.get('text', '')),
+        _DIGITS.sub('#', node.get('content-desc', '')),
+        node.get('clickable', ''),
+        _cell(bounds, parent_bounds),
+    )))
+    parts.append('(')
+    for child in node:
+        _canonical(child, bounds or parent_bounds, parts)
+    parts.append(')')
+
+
+def structural_fingerprint(root):
+    """返回 XML 根节点（lxml）的结构指纹"""
+    width, height = _screen_size(root)
+    parts = []
+    _canonical(_scope(root), (0, 0, width, height), parts)
+    return hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def element_action(root, x, y):
+    """把点击坐标转换为点击动作：包含该点的最小可点击元素在层级中的路径，以及相对坐标"""
+    width, height = _screen_size(root)
+    scope = _scope(root)
+    best_path, best_area = None, None
+    stack = [(scope, [])]
+    while stack:
+        node, path = stack.pop()
+        bounds = parse_bounds(node.get('bounds'))
+        if node.get('clickable') == 'true' and bounds is not None \
+                and bounds[0] <= x <= bounds[2] and bounds[1] <= y <= bounds[3]:
+            area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+            if best_area is None or area < best_area:
+                best_path, best_area = path, area
+        stack.extend((child, path + [index]) for index, child in enumerate(node))
+    return {'path': best_path, 'x': x / width, 'y': y / height}
+
+
+def resolve_action(root, action):
+    """在当前 XML 中还原点击坐标：按路径找到元素时取其中心，否则按相对坐标换算"""
+    node = _scope(root)
+    for index in action.get('path') or ():
+        node = node[index] if index < len(node) else None
+        if node is None:
+            break
+    bounds = parse_bounds(node.get('bounds')) if node is not None and action.get('path') is not None else None
+    if bounds is not None:
+        return (bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2
+    width, height = _screen_size(root)
+    return round(action['x'] * width), round(action['y'] * height)
+
+
+class XmlFingerprintCache:
+    """跨进程共享的结构指纹 → 点击动作映射，每个线程使用自己的数据库连接"""
+
+    # 每写入多少条检查一次容量
+    PURGE_EVERY = 100
+    # 距上次命中超过该秒数时不再视为连续命中（点击没有生效时，调用方通常在几秒内再次诊断）
+    STREAK_SECONDS = 60
+
+    def __init__(self, db_path=None, max_entries=None, max_hits=None):
+        settings = get_settings()
+        self.db_path = db_path or settings.db_path
+        self.max_entries = max_entries if max_entries is not None else settings.xml_fingerprint_cache_max_entries
+        self.max_hits = max_hits if max_hits is not None else settings.xml_fingerprint_cache_max_hits
+        self._local = threading.local()
+        self._puts = 0
+
+    @property
+    def conn(self):
+        # 连接不能跨线程与 fork 后的子进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS xml_fingerprint_cache (
+                    fingerprint TEXT PRIMARY KEY,
+                    action TEXT NOT NULL,
+                    device TEXT,
+                    streak INTEGER NOT NULL DEFAULT 0,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_xml_fingerprint_last_used ON xml_fingerprint_cache (last_used)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_xml_fingerprint_device ON xml_fingerprint_cache (device)')
+            # 每台设备最近一次诊断的界面指纹（命中与未命中都记录），用于判断是否连续命中
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS xml_fingerprint_device (
+                    device TEXT PRIMARY KEY,
+                    fingerprint TEXT NOT NULL,
+                    seen_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def lookup(self, fingerprint, device_name):
+        """返回指纹对应的点击动作，没有记录时返回 None"""
+        now = time.time()
+        conn = self.conn
+        previous = conn.execute('SELECT fingerprint FROM xml_fingerprint_device WHERE device = ?',
+                                (device_name,)).fetchone()
+        self._seen(device_name, fingerprint, now)
+        row = conn.execute('SELECT action, device, streak, last_used FROM xml_fingerprint_cache WHERE fingerprint = ?',
+                           (fingerprint,)).fetchone()
+        if row is None:
+            conn.commit()
+            return None
+        action, last_device, streak, last_used = row
+        # 只有同一设备紧接着再次出现同一界面才累加，中间出现过其他界面或间隔过久时重新计数
+        back_to_back = last_device == device_name and previous is not None and previous[0] == fingerprint \
+            and now - last_used <= self.STREAK_SECONDS
+        streak = streak + 1 if back_to_back else 1
+        if self.max_hits and streak >= self.max_hits:
+            # 同一设备反复出现同一界面，说明点击没有生效，下次重新诊断
+            conn.execute('DELETE FROM xml_fingerprint_cache WHERE fingerprint = ?', (fingerprint,))
+        else:
+            conn.execute('UPDATE xml_fingerprint_cache SET device = ?, streak = ?, hits = hits + 1, last_used = ? '
+                         'WHERE fingerprint = ?', (device_name, streak, now, fingerprint))
+        conn.commit()
+        return json.loads(action)
+
+    def _seen(self, device_name, fingerprint, now):
+        self.conn.execute('INSERT OR REPLACE INTO xml_fingerprint_device (device, fingerprint, seen_at) '
+                          'VALUES (?, ?, ?)', (device_name, fingerprint, now))
+
+    def store(self, fingerprint, action, device_name):
+        now = time.time()
+        conn = self.conn
+        conn.execute('INSERT OR REPLACE INTO xml_fingerprint_cache (fingerprint, action, device, streak, hits, '
+                     'created_at, last_used) VALUES (?, ?, ?, 1, 0, ?, ?)',
+                     (fingerprint, json.dumps(action), device_name, now, now))
+        self._seen(device_name, fingerprint, now)
+        conn.commit()
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def invalidate(self, device_name):
+        """删除该设备最近使用的记录（调用方反馈点击没有生效），返回是否存在记录"""
+        conn = self.conn
+        deleted = conn.execute('DELETE FROM xml_fingerprint_cache WHERE fingerprint = (SELECT fingerprint FROM '
+                               'xml_fingerprint_cache WHERE device = ? ORDER BY last_used DESC LIMIT 1)',
+                               (device_name,)).rowcount
+        conn.commit()
+        return deleted > 0
+
+    def purge(self):
+        """按最近使用时间淘汰超过条数上限的记录，返回删除的条数"""
+        if not self.max_entries:
+            return 0
+        conn = self.conn
+        deleted = conn.execute('DELETE FROM xml_fingerprint_cache WHERE fingerprint IN (SELECT fingerprint FROM '
+                               'xml_fingerprint_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)',
+                               (self.max_entries,)).rowcount
+        conn.commit()
+        return deleted
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_xml_fingerprint_cache():
+    """进程内按数据库路径共享的缓存，关闭（XML_FINGERPRINT_CACHE_ENABLED=False）或未配置 DB_PATH 时返回 None"""
+    settings = get_settings()
+    if not settings.xml_fingerprint_cache_enabled or not settings.db_path:
+        return None
+    with _caches_lock:
+        cache = _caches.get(settings.db_path)
+        if cache is None:
+            cache = _caches[settings.db_path] = XmlFingerprintCache(settings.db_path)
+    return cache
@@ -0,0 +1,211 @@
+"""
+XML 规则引擎模块（XML 方案调用视觉模型之前的快速判断）
+
+模块职责：
+- 在解析好的界面层级上按规则寻找关闭按钮，置信度达到 XML_RULE_MIN_CONFIDENCE 时直接返回点击坐标
+- 规则：
+  1. resource-id 中以 close / cancel / skip 等关键词开头的片段（iv_close、btn_skip、closeBtn）
+  2. text 或 content-desc 完全等于“关闭”、“取消”、“跳过”、“以后再说”等文案
+  3. 位于弹窗卡片角落的小尺寸 ImageView / ImageButton（单独命中时置信度不足，只作为佐证）
+- 界面存在多个窗口时，只在最上层窗口（最后一个窗口节点，通常是对话框）中寻找，并提高置信度
+- 规则 1、2 只在弹窗上下文中生效：存在多个窗口，或节点位于对话框大小的卡片中；
+  普通页面上的“取消”（如搜索栏）、关闭图标等置信度低于阈值，交给后续流程判断
+- 关键词与文案在创建引擎时预编译为正则与集合，单次评估只遍历一遍节点，耗时在亚毫秒级
+"""
+import re
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['RuleMatch', 'XmlRuleEngine', 'get_rule_engine', 'parse_bounds']
+
+_BOUNDS_PATTERN = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+
+# 各规则单独命中时的置信度
+ID_CONFIDENCE = 0.9
+TEXT_CONFIDENCE = 0.95
+CORNER_CONFIDENCE = 0.6
+# 不在弹窗上下文中时，resource-id 与文案规则的置信度上限（低于默认阈值，不直接返回）
+NO_CONTEXT_CONFIDENCE = 0.5
+# 同一节点命中多条规则、或位于最上层的对话框窗口中时增加的置信度
+EXTRA_RULE_BONUS = 0.05
+TOP_WINDOW_BONUS = 0.05
+# 角落小图标：面积占屏幕比例上限、宽高比范围，以及距卡片左右边缘的距离占卡片宽度的比例上限
+MAX_ICON_AREA = 0.02
+ICON_ASPECT = (0.5, 2.0)
+CORNER_MARGIN = 0.2
+# 对话框卡片的面积占屏幕比例下限（搜索栏、标题栏等横条容器达不到）
+DIALOG_MIN_AREA = 0.1
+
+
+def parse_bounds(bounds):
+    """'[x1,y1][x2,y2]' → (x1, y1, x2, y2)，格式不正确时返回 None"""
+    match = _BOUNDS_PATTERN.match(bounds or '')
+    return tuple(int(value) for value in match.groups()) if match else None
+
+
+class RuleMatch:
+    """规则命中结果：x, y 为按钮中心的屏幕坐标"""
+
+    __slots__ = ('x', 'y', 'confidence', 'rules', 'bounds', 'resource_id')
+
+    def __init__(self, x, y, confidence, rules, bounds, resource_id):
+        self.x = x
+        self.y = y
+        self.confidence = confidence
+        self.rules = rules
+        self.bounds = bounds
+        self.resource_id = resource_id
+
+    def __repr__(self):
+        return (f"RuleMatch(({self.x}, {self.y}), confidence={self.confidence:.2f}, rules={self.rules}, "
+                f"resource_id={self.resource_id})")
+
+
+class XmlRuleEngine:
+    """预编译的关闭按钮规则"""
+
+    def __init__(self, id_keywords=None, texts=None, min_confidence=None):
+        settings = get_settings()
+        id_keywords = settings.xml_rule_id_keywords if id_keywords is None else id_keywords
+        texts = settings.xml_rule_texts if texts is None else texts
+        self.min_confidence = settings.xml_rule_min_confidence if min_confidence is None else min_confidence
+        # 关键词须位于 id 开头、下划线之后或小写字母与大写字母的交界处（closeBtn、iv_close），避免匹配 enclosed
+        keywords = '|'.join(re.escape(keyword) for keyword in id_keywords if keyword)
+        self._id_pattern = re.compile(rf'(?:^|_)(?:{keywords})|(?<=[a-z])(?:{keywords.title()})') \
+            if keywords else None
+        self._texts = frozenset(text.strip().lower() for text in texts if text.strip())
+
+    def match(self, root):
+        """在界面层级（lxml 根节点）上评估规则，返回置信度最高且达到阈值的 RuleMatch，否则返回 None"""
+        windows = [child for child in root if child.get('bounds')]
+        # 多个窗口时最后一个是最上层窗口
+        top_window = len(windows) > 1
+        scope = windows[-1] if windows else root
+        screen_area = self._screen_area(root, windows)
+
+        best = None
+        for node in scope.iter():
+            rules, confidence = self._node_rules(node, screen_area, top_window)
+            if not rules:
+                continue
+            bounds = parse_bounds(node.get('bounds'))
+            if bounds is None or bounds[2] <= bounds[0] or bounds[3] <= bounds[1]:
+                continue
+            if not self._clickable(node):
+                continue
+            confidence += EXTRA_RULE_BONUS * (len(rules) - 1) + (TOP_WINDOW_BONUS if top_window else 0)
+            if best is None or confidence > best.confidence:
+                best = RuleMatch((bounds[0] + bounds[2]) // 2, (bounds[1] + bounds[3]) // 2, min(1.0, confidence),
+                                 rules, bounds, node.get('resource-id', ''))
+        if best is None or best.confidence < self.min_confidence:
+            logger.info(f"XML 规则未命中关闭按钮，最佳候选: {best}")
+            return None
+        logger.info(f"XML 规则命中关闭按钮: {best}")
+        return best
+
+    @staticmethod
+    def _screen_area(root, windows):
+        """屏幕面积取 hierarchy 的 width / height，旧版本 dump 没有该属性时取第一个窗口的边界"""
+        width, height = root.get('width'), root.get('height')
+        if width and height and width.isdigit() and height.isdigit():
+            return int(width) * int(height)
+        screen = parse_bounds(windows[0].get('bounds')) if windows else None
+        return (screen[2] - screen[0]) * (screen[3] - screen[1]) if screen else 0
+
+    def _node_rules(self, node, screen_area, top_window=False):
+        """返回节点命中的规则名列表与其中最高的置信度
+
+        resource-id 与文案规则只在弹窗上下文（多窗口的最上层窗口，或位于对话框大小的卡片中）中取完整置信度。
+        """
+        rules, confidence = [], 0.0
+        resource_id = node.get('resource-id')
+        if resource_id and self._id_pattern is not None \
+                and self._id_pattern.search(resource_id.rpartition('/')[2]):
+            rules.append('resource_id')
+            confidence = ID_CONFIDENCE
+        for attribute in ('text', 'content-desc'):
+            value = node.get(attribute)
+            if value and value.strip().lower() in self._texts:
+                rules.append(attribute)
+                confidence = max(confidence, TEXT_CONFIDENCE)
+                break
+        if rules and not top_window and not self._in_dialog(node, screen_area):
+            confidence = min(confidence, NO_CONTEXT_CONFIDENCE)
+        if screen_area and node.get('class', '').endswith(('ImageView', 'ImageButton')) \
+                and self._at_card_corner(node, screen_area):
+            rules.append('corner_icon')
+            confidence = max(confidence, CORNER_CONFIDENCE)
+        return rules, confidence
+
+    @staticmethod
+    def _card(node, bounds, screen_area):
+        """节点所在卡片：面积至少为节点 10 倍、小于整屏的最近祖先的边界，没有时返回 None"""
+        area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+        parent = node.getparent()
+        while parent is not None:
+            card = parse_bounds(parent.get('bounds'))
+            if card is not None:
+                card_area = (card[2] - card[0]) * (card[3] - card[1])
+                if card_area >= screen_area * 0.95:
+                    return None
+                if card_area >= 10 * area:
+                    return card
+            parent = parent.getparent()
+        return None
+
+    def _in_dialog(self, node, screen_area):
+        """节点位于对话框大小的卡片中（卡片面积至少为屏幕的 DIALOG_MIN_AREA）"""
+        bounds = parse_bounds(node.get('bounds'))
+        if not screen_area or bounds is None or bounds[2] <= bounds[0] or bounds[3] <= bounds[1]:
+            return False
+        card = self._card(node, bounds, screen_area)
+        return card is not None and (card[2] - card[0]) * (card[3] - card[1]) >= DIALOG_MIN_AREA * screen_area
+
+    def _at_card_corner(self, node, screen_area):
+        """小尺寸图标位于所在卡片（面积至少为图标 10 倍、小于整屏的最近祖先）的上方两角或正下方"""
+        bounds = parse_bounds(node.get('bounds'))
+        if bounds is None:
+            return False
+        width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+        if width <= 0 or height <= 0 or width * height > MAX_ICON_AREA * screen_area \
+                or not ICON_ASPECT[0] <= width / height <= ICON_ASPECT[1]:
+            return False
+        card = self._card(node, bounds, screen_area)
+        if card is None:
+            return False
+        center_x, center_y = (bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2
+        card_width, card_height = card[2] - card[0], card[3] - card[1]
+        near_side = min(center_x - card[0], card[2] - center_x) <= CORNER_MARGIN * card_width
+        near_top = center_y - card[1] <= 0.25 * card_height
+        below_center = center_y >= card[3] - 0.15 * card_height \
+            and abs(center_x - (card[0] + card[2]) / 2) <= CORNER_MARGIN * card_width
+        return (near_side and near_top) or below_center
+
+    @staticmethod
+    def _clickable(node):
+        """节点本身或其最近的 3 层祖先可点击（部分应用把点击事件挂在图标的父容器上）"""
+        for _ in range(4):
+            if node is None:
+                return False
+            if node.get('clickable') == 'true':
+                return True
+            node = node.getparent()
+        return False
+
+
+_engine = None
+_engine_settings = None
+
+
+def get_rule_engine():
+    """进程内共享的规则引擎，配置重新加载后重建，关闭（XML_RULES_ENABLED=False）时返回 None"""
+    global _engine, _engine_settings
+    settings = get_settings()
+    if not settings.xml_rules_enabled:
+        return None
+    if _engine is None or _engine_settings is not settings:
+        _engine, _engine_settings = XmlRuleEngine(), settings
+    return _engine
@@ -1,17 +1,15 @@
 from typing import Any
 
-from appium import webdriver
 from PIL import Image
-import os
 import datetime
-from appium.options.android import UiAutomator2Options
 from .services.image_processor import ImageProcessor
+from .services.model_router import validate_coordinates, validate_label
+from .services.popup_region import find_popup_region
 from .services.vision_model import VisionModelService
-from dotenv import load_dotenv
 from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
 
 logger = setup_logger(__name__)
-load_dotenv()
 
 __all__ = ['AppiumInspector', 'capture_and_mark_elements', 'diagnose_and_handle']
 
@@ -25,30 +23,37 @@ class AppiumInspector:
 
     def init_driver(self):
         """初始化Appium驱动"""
+        # Appium 只在设备端流程使用，延迟导入避免拖慢接口服务启动
+        from appium import webdriver
+        from appium.options.android import UiAutomator2Options
+
+        settings = get_settings()
         capabilities = {
-            'platformName': os.getenv('PLATFORM_NAME'),
-            'platformVersion': os.getenv('PLATFORM_VERSION'),
+            'platformName': settings.platform_name,
+            'platformVersion': settings.platform_version,
             'appPackage': self.app_package,
             'appActivity': self.app_activity,
             "deviceName": self.device_name,
-            "automationName": os.getenv('AUTOMATION_NAME'),
-            "appWaitActivity": os.getenv('APP_WAIT_ACTIVITY'),
-            "appWaitDuration": int(os.getenv('APP_WAIT_DURATION')),
-            "language": os.getenv('LANGUAGE'),
-            "uiautomator2ServerInstallTimeout": int(os.getenv('UIAUTOMATOR2_SERVER_INSTALL_TIMEOUT')),
+            "automationName": settings.automation_name,
+            "appWaitActivity": settings.app_wait_activity,
+            "appWaitDuration": settings.app_wait_duration,
+            "language": settings.language,
+            "uiautomator2ServerInstallTimeout": settings.uiautomator2_server_install_timeout,
             # "skipServerInstallation": os.getenv('SKIP_SERVER_INSTALLATION') == 'True',
-            "noReset": os.getenv('NO_RESET') == 'True',
+            "noReset": settings.no_reset,
+            # 会话由会话池复用，服务端不能在两轮诊断之间因空闲结束会话
+            "newCommandTimeout": int(settings.appium_session_idle_seconds) + 60,
             "disableWindowAnimation": True
         }
-        return webdriver.Remote(os.getenv('APPIUM_SERVER_URL'),
+        return webdriver.Remote(settings.appium_server_url,
                                 options=UiAutomator2Options().load_capabilities(capabilities))
 
 
 def capture_and_mark_elements(screenshot_image, device_name, app_package, clickable_elements) -> tuple[
-                                                                                                     str, bool, None, None] | \
+                                                                                                     str, bool, None, None, None] | \
                                                                                                  tuple[
-                                                                                                     str, bool, Image, Image]:
-    # """捕获并标记元素"""
+                                                                                                     str, bool, Image, Image, frozenset]:
+    # """捕获并标记元素，最后一个返回值为实际标注在截图上的数字标记集合（裁剪后只包含弹窗子树中的元素）"""
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     device_name = device_name.replace(':', '_')
     # 兼容特殊情况
@@ -66,31 +71,49 @@ def capture_and_mark_elements(screenshot_image, device_name, app_package, clicka
                                       if elements.get('bounds')]
 
     clickable_elements_limit = 12
+    offset = (0, 0)
     if len(clickable_elements) > clickable_elements_limit:
-        logger.info(f"界面可点击元素数量超过{clickable_elements_limit}个，跳过处理")
-        return screenshot_id, True, None, None
+        # 只保留最上层弹窗子树中的可点击元素，并只把弹窗区域发送给视觉模型（元素编号保持不变）
+        region = find_popup_region(clickable_elements, grayscale_image, clickable_elements_limit)
+        if region is None:
+            logger.info(f"界面可点击元素数量超过{clickable_elements_limit}个且未找到弹窗区域，跳过处理")
+            return screenshot_id, True, None, None, None
+        kept = {id(element) for element in region.elements}
+        clickable_elements_bounds_list = [(elements.get('bounds'), i) for i, elements in enumerate(clickable_elements)
+                                          if id(elements) in kept]
+        grayscale_image = grayscale_image.crop(region.box)
+        offset = region.box[:2]
 
     # 绘制元素边框
     # logger.info(f"调用多次？")
     marked_screenshot_image, non_clickable_area_image = image_processor.draw_element_borders(
         grayscale_image,  # 直接使用灰度图像
         clickable_elements_bounds_list,
-        screenshot_id
+        screenshot_id,
+        offset=offset
     )
     # logger.info(f"截图已保存至: {os.path.abspath(marked_screenshot_path)}")
+    # 数字标记为元素编号 + 1，边界相同的元素只标注第一个
+    labels, seen_bounds = set(), set()
+    for bounds, element_id in clickable_elements_bounds_list:
+        if bounds not in seen_bounds:
+            seen_bounds.add(bounds)
+            labels.add(element_id + 1)
 
-    return screenshot_id, False, marked_screenshot_image, non_clickable_area_image
+    return screenshot_id, False, marked_screenshot_image, non_clickable_area_image, frozenset(labels)
 
 
-def diagnose_and_handle_lvm(grayscale_image, screen_resolution):
+def diagnose_and_handle_lvm(grayscale_image, screen_resolution, popup_detection=None):
     """
 
+    :param popup_detection: 本地检测到的弹窗，模型给出的坐标远离弹窗时视为无效回答
     :rtype: object
     """
     try:
         vision_model_service = VisionModelService(screen_resolution=screen_resolution)
+        # 坐标超出屏幕（或远离本地检测到的弹窗）时升级到更大的模型
         analysis_result = vision_model_service.analyze_screenshot(
-            grayscale_image)
+            grayscale_image, validate=validate_coordinates(screen_resolution, popup_detection))
         if analysis_result.get('popup_exists', False):
             button_coordinates = analysis_result.get('button_coordinates')
             x = button_coordinates.get('x')
@@ -104,12 +127,14 @@ def diagnose_and_handle_lvm(grayscale_image, screen_resolution):
         raise e
 
 
-def diagnose_and_handle(marked_screenshot_image, ):
+def diagnose_and_handle(marked_screenshot_image, labels=None):
+    """labels 为截图上实际标注的数字标记集合"""
     try:
         vision_model_service = VisionModelService()
 
+        # 数字标记不对应任何已标注的可点击元素时升级到更大的模型
         analysis_result = vision_model_service.analyze_screenshot(
-            marked_screenshot_image)
+            marked_screenshot_image, validate=validate_label(labels) if labels else None)
         logger.info(f'视觉分析结果:{analysis_result}')
         if analysis_result.get('popup_exists', False):
             popup_id = analysis_result.get('popup_cancel_button')
@@ -0,0 +1,5 @@
+"""
+性能基准测试与压测工具
+
+运行方式: python -m source.benchmark --help
+"""
@@ -0,0 +1,4 @@
+from source.benchmark.run import main
+
+if __name__ == '__main__':
+    main()
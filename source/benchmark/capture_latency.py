@@ -0,0 +1,106 @@
+"""
+设备采集耗时基准
+
+模块职责：
+- 对真机或模拟器，依次用各采集后端截图与 dump XML，统计每个后端的耗时中位数、p95 与数据大小
+- legacy 为改造前的方式（adb shell screencap -p、dump 到 /sdcard 后 adb pull），作为对照
+
+用法:
+    python -m source.benchmark.capture_latency --device emulator-5554 --backends legacy,adb,adb-cli,uiautomator2
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import tempfile
+import time
+
+from source.benchmark.loadgen import percentile
+from source.tools.capture import get_capture_backend
+from source.tools.adb import AdbHelper
+
+__all__ = ['measure_backend', 'main']
+
+
+def _legacy_screenshot(device_name):
+    return subprocess.run(['adb', '-s', device_name, 'shell', 'screencap', '-p'],
+                          stdout=subprocess.PIPE, check=True).stdout
+
+
+def _legacy_dump_xml(device_name):
+    subprocess.run(['adb', '-s', device_name, 'shell', 'uiautomator', 'dump', '/sdcard/ui_tree.xml'],
+                   stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        local_path = os.path.join(tmp_dir, 'ui_tree.xml')
+        subprocess.run(['adb', '-s', device_name, 'pull', '/sdcard/ui_tree.xml', local_path],
+                       stdout=subprocess.PIPE, check=True)
+        with open(local_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+
+def _operations(name):
+    if name == 'legacy':
+        return {'screenshot': _legacy_screenshot, 'dump_xml': _legacy_dump_xml}
+    backend = get_capture_backend(name)
+    operations = {'screenshot_png': backend.screenshot_png, 'dump_xml': backend.dump_xml}
+    if name in ('adb', 'adb-cli'):
+        # 原始帧缓冲只传输不编码，单独统计
+        operations['screenshot_raw'] = lambda device_name: backend.exec_out(device_name, 'screencap')
+    return operations
+
+
+def measure_backend(name, device_name, repeat):
+    """返回 {操作: {median_ms, p95_ms, bytes}}，失败的操作记录错误信息"""
+    results = {}
+    for operation, func in _operations(name).items():
+        samples, size = [], 0
+        try:
+            func(device_name)  # 预热（建立连接、启动设备端服务）
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = func(device_name)
+                samples.append((time.perf_counter() - start) * 1000)
+                size = len(output)
+        except Exception as e:
+            results[operation] = {'error': str(e)}
+            continue
+        ordered = sorted(samples)
+        results[operation] = {
+            'median_ms': round(statistics.median(ordered), 1),
+            'p95_ms': round(percentile(ordered, 95), 1),
+            'bytes': size,
+        }
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='设备截图与 XML 采集耗时基准')
+    parser.add_argument('--device', default=None, help='设备序列号，默认取 adb devices 的第一个')
+    parser.add_argument('--backends', default='legacy,adb,adb-cli,uiautomator2', help='逗号分隔的采集后端')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--output', default=None, help='将结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    device_name = args.device or AdbHelper.get_device_name()
+    results = {}
+    for name in args.backends.split(','):
+        results[name] = measure_backend(name, device_name, args.repeat)
+        for operation, stats in results[name].items():
+            if 'error' in stats:
+                print(f"{name:<14}{operation:<16}失败: {stats['error']}")
+            else:
+                print(f"{name:<14}{operation:<16}median {stats['median_ms']:>8.1f}ms  p95 {stats['p95_ms']:>8.1f}ms  "
+                      f"{stats['bytes'] / 1024:>8.0f}KB")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'device': device_name, 'repeat': args.repeat, 'results': results}, f, indent=2,
+                      ensure_ascii=False)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+"""
+启动导入耗时基准
+
+模块职责：
+- 以 python -X importtime 在新进程中导入指定模块（默认 api_run），统计启动与新工作进程的导入开销
+- 按顶层包汇总自身耗时，列出最慢的包
+- 检查接口服务启动时是否误加载了重量级依赖（Appium、Selenium、OpenCV、lxml 等）
+
+用法:
+    python -m source.benchmark.import_time --targets api_run --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# 推导项目根目录（当前脚本的曾祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+__all__ = ['parse_importtime', 'summarize_imports', 'HEAVY_PACKAGES', 'main']
+
+# 接口服务启动时不应加载的包（首次使用时再导入）
+HEAVY_PACKAGES = ('appium', 'selenium', 'cv2', 'lxml', 'numpy', 'requests')
+
+
+def parse_importtime(stderr_text):
+    """解析 -X importtime 的输出
+
+    返回:
+        [(模块名, 自身耗时 us, 累计耗时 us, 嵌套深度), ...]
+    """
+    rows = []
+    for line in stderr_text.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            # 表头行
+            continue
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(parts[0]), int(parts[1]), depth))
+    return rows
+
+
+def summarize_imports(rows, top=15):
+    """按顶层包汇总自身耗时（毫秒），并返回加载到的重量级包"""
+    by_package = {}
+    for name, self_us, _, _ in rows:
+        package = name.split('.')[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    loaded = {name.split('.')[0] for name, _, _, _ in rows}
+    return {
+        'modules': len(rows),
+        'total_ms': round(total_us / 1000, 1),
+        'top_packages': [(package, round(us / 1000, 1))
+                         for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]],
+        'heavy_loaded': [package for package in HEAVY_PACKAGES if package in loaded],
+    }
+
+
+def measure(target, repeat):
+    """在新进程中导入目标模块，返回 (进程耗时列表 ms, 最后一次的 importtime 输出)"""
+    wall_ms, stderr_text = [], ''
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {target}'], cwd=project_root,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, encoding='utf-8')
+        wall_ms.append((time.perf_counter() - start) * 1000)
+        if result.returncode != 0:
+            raise ValueError(f"导入 {target} 失败: {result.stderr.strip().splitlines()[-1]}")
+        stderr_text = result.stderr
+    return wall_ms, stderr_text
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='启动导入耗时基准（-X importtime）')
+    parser.add_argument('--targets', default='api_run,source.api.services', help='逗号分隔的导入目标')
+    parser.add_argument('--repeat', type=int, default=5, help='每个目标的启动次数')
+    parser.add_argument('--top', type=int, default=15, help='列出自身耗时最高的包数量')
+    parser.add_argument('--output', default=None, help='将结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {}
+    for target in args.targets.split(','):
+        wall_ms, stderr_text = measure(target, args.repeat)
+        summary = summarize_imports(parse_importtime(stderr_text), top=args.top)
+        summary['process_median_ms'] = round(statistics.median(wall_ms), 1)
+        results[target] = summary
+        print(f"{target}: 进程启动+导入 median {summary['process_median_ms']}ms，"
+              f"导入 {summary['modules']} 个模块共 {summary['total_ms']}ms")
+        for package, ms in summary['top_packages']:
+            print(f"  {package:<28}{ms:>8.1f}ms")
+        if summary['heavy_loaded']:
+            print(f"  警告：启动时加载了重量级依赖 {summary['heavy_loaded']}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+    return results
+
+
+if __name__ == '__main__':
+    main()
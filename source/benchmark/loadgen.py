@@ -0,0 +1,213 @@
+"""
+诊断接口压测工具
+
+模块职责：
+- 以目标 RPS 开环压测 /api/v1/diagnose（发送时间不受响应快慢影响）
+- 按比例混合模版命中截图与未命中截图
+- 统计吞吐、p50/p95/p99 延迟与错误率
+
+用法:
+    python -m source.benchmark.loadgen --url http://127.0.0.1:5000/api/v1/diagnose --rps 5 --duration 60
+"""
+import argparse
+import base64
+import io
+import json
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from source.benchmark.synthetic import parse_resolution, make_screen, add_popup_overlay, make_hierarchy_xml
+
+__all__ = ['percentile', 'LoadGenerator', 'main']
+
+
+def percentile(ordered, q):
+    """已排序样本的百分位数（最近秩）"""
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def _encode(image):
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return base64.b64encode(buffer.getvalue()).decode('utf-8')
+
+
+class LoadGenerator:
+    """开环压测：按固定间隔发送请求，在途请求数受 max_in_flight 限制"""
+
+    def __init__(self, url, rps, duration, mode='resolution', resolution=(1080, 1920), hit_ratio=0.5,
+                 hit_screens=5, max_in_flight=64, timeout=60, warmup_attempts=10, seed=0):
+        self.url = url
+        self.rps = rps
+        self.duration = duration
+        self.mode = mode
+        self.width, self.height = resolution
+        self.hit_ratio = hit_ratio
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self.warmup_attempts = warmup_attempts
+        self.random = random.Random(seed)
+        # requests.Session 不是线程安全的，每个发送线程使用自己的会话
+        self._local = threading.local()
+        self.hit_payloads = [self._payload(seed=i) for i in range(hit_screens)]
+        self.miss_payloads = []
+        self.records = []
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    @property
+    def session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _payload(self, seed):
+        screen, popup = add_popup_overlay(make_screen(self.width, self.height, seed=seed), seed=seed)
+        # 同一截图会被反复发送，跳过画面未变化缓存，压测的是完整诊断流程
+        payload = {'screenshot': _encode(screen), 'devices_name': f'loadgen:{seed % 8}', 'force': True}
+        if self.mode == 'xml':
+            payload['xml_file'] = make_hierarchy_xml(self.width, self.height, node_count=30, clickable_count=4,
+                                                     popup=popup, seed=seed)
+        else:
+            payload['resolution'] = f'({self.width}, {self.height})'
+        return payload
+
+    def prepare(self):
+        """预生成未命中截图（每个只发送一次），并预热命中截图使其进入模版库
+
+        只有诊断为弹窗（200）时截图才会写入模版库，模型桩按比例返回非弹窗，因此每张截图重试到 200 为止。
+        """
+        total = int(self.rps * self.duration)
+        # 多预留一些，避免随机波动导致未命中截图不够用
+        miss_count = int(total * (1 - self.hit_ratio) * 1.2) + 5
+        print(f"预生成 {miss_count} 张未命中截图...")
+        self.miss_payloads = [self._payload(seed=10 ** 6 + i) for i in range(miss_count)]
+        print(f"预热 {len(self.hit_payloads)} 张模版命中截图...")
+        for index, payload in enumerate(self.hit_payloads):
+            for _ in range(self.warmup_attempts):
+                if self._send(payload, 'warmup') == '200':
+                    break
+            else:
+                print(f"警告：第 {index + 1} 张命中截图预热 {self.warmup_attempts} 次均未诊断为弹窗，"
+                      f"其请求将按未命中处理")
+        # 等待异步保存线程把模版写入模版库
+        time.sleep(1)
+        with self.lock:
+            self.records.clear()
+
+    def _send(self, payload, kind):
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            status = str(response.status_code)
+            # 诊断为非弹窗也返回 500，单独区分出来
+            if response.status_code == 500 and '非弹窗' in response.text:
+                status = 'no_popup'
+        except requests.Timeout:
+            status = 'timeout'
+        except requests.RequestException:
+            status = 'connection_error'
+        elapsed = (time.perf_counter() - start) * 1000
+        with self.lock:
+            self.records.append((kind, status, elapsed))
+        return status
+
+    def run(self):
+        in_flight = threading.BoundedSemaphore(self.max_in_flight)
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        interval = 1 / self.rps
+        total = int(self.rps * self.duration)
+        misses = iter(self.miss_payloads)
+        start = time.perf_counter()
+        for i in range(total):
+            # 开环：按计划时间发送，不等待上一个请求完成
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            if self.random.random() < self.hit_ratio:
+                kind, payload = 'hit', self.random.choice(self.hit_payloads)
+            else:
+                kind, payload = 'miss', next(misses, None)
+                if payload is None:
+                    kind, payload = 'hit', self.random.choice(self.hit_payloads)
+            if not in_flight.acquire(blocking=False):
+                # 在途请求已满，记为丢弃，说明服务已无法承载目标 RPS
+                self.dropped += 1
+                continue
+
+            def task(p=payload, k=kind):
+                try:
+                    self._send(p, k)
+                finally:
+                    in_flight.release()
+
+            executor.submit(task)
+        executor.shutdown(wait=True)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, elapsed):
+        records = list(self.records)
+        result = {
+            'target_rps': self.rps,
+            'duration_s': round(elapsed, 3),
+            'sent': len(records),
+            'dropped': self.dropped,
+            'throughput_rps': round(len(records) / elapsed, 3) if elapsed else 0,
+            'status': dict(Counter(status for _, status, _ in records)),
+        }
+        ok = [r for r in records if r[1] in ('200', 'no_popup')]
+        result['error_rate'] = round(1 - len(ok) / len(records), 4) if records else 0
+        for kind in ('all', 'hit', 'miss'):
+            latencies = sorted(r[2] for r in records if kind == 'all' or r[0] == kind)
+            result[f'latency_{kind}_ms'] = {
+                'count': len(latencies),
+                'p50': round(percentile(latencies, 50), 2) if latencies else None,
+                'p95': round(percentile(latencies, 95), 2) if latencies else None,
+                'p99': round(percentile(latencies, 99), 2) if latencies else None,
+            }
+        return result
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='诊断接口压测工具')
+    parser.add_argument('--url', default='http://127.0.0.1:5000/api/v1/diagnose')
+    parser.add_argument('--rps', type=float, default=2, help='目标每秒请求数')
+    parser.add_argument('--duration', type=float, default=30, help='压测时长（秒）')
+    parser.add_argument('--mode', choices=['resolution', 'xml'], default='resolution', help='诊断方案')
+    parser.add_argument('--resolution', default='1080x1920')
+    parser.add_argument('--hit-ratio', type=float, default=0.5, help='模版命中截图的比例')
+    parser.add_argument('--hit-screens', type=int, default=5, help='参与命中的截图数量')
+    parser.add_argument('--max-in-flight', type=int, default=64, help='最大在途请求数')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--warmup-attempts', type=int, default=10, help='每张命中截图预热的最大尝试次数')
+    parser.add_argument('--output', default=None, help='将结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    generator = LoadGenerator(args.url, args.rps, args.duration, mode=args.mode,
+                              resolution=parse_resolution(args.resolution), hit_ratio=args.hit_ratio,
+                              hit_screens=args.hit_screens, max_in_flight=args.max_in_flight, timeout=args.timeout,
+                              warmup_attempts=args.warmup_attempts)
+    generator.prepare()
+    result = generator.run()
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    return result
+
+
+if __name__ == '__main__':
+    main()
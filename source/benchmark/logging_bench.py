@@ -0,0 +1,125 @@
+"""
+日志开销基准测试
+
+模块职责：
+- 模拟一次诊断请求的日志调用（若干条流程日志 + 一次模型响应日志）
+- 对比同步文件/终端处理器 + 每次缩进打印完整响应（改造前）
+  与队列异步写入 + 采样打印响应（改造后）在请求线程上的耗时
+- 终端输出重定向到空设备，文件写入临时目录
+
+用法:
+    python -m source.benchmark.logging_bench --requests 2000
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from source.benchmark.run import summarize
+from source.utils.settings import reload_settings
+
+__all__ = ['run_variant', 'main']
+
+# 一次诊断请求中的流程日志条数（模版匹配、保存截图、坐标等）
+FLOW_MESSAGES = [
+    '开始进行模板匹配...',
+    '未匹配到任何弹窗模板',
+    '视觉模型检测到弹窗，弹窗标识为: 3，正在关闭...',
+    '坐标为: 540,1620',
+    '保存截图到: screenshots/emulator-5554/emulator-5554_20250101_120000_api_marked_screenshot.jpeg',
+    '保存截图到: template/emulator-5554_20250101_120000_api.jpeg',
+    '成功插入模版数据，id: emulator-5554_20250101_120000_api',
+    '请求结束，耗时: 3120.5ms',
+]
+
+
+def _response_json():
+    """与硅基流动接口结构一致的模型响应"""
+    content = json.dumps({'popup_exists': True, 'popup_cancel_button': 3}, ensure_ascii=False, indent=2)
+    return {
+        'id': '0195c2f7c1a8e1f2b0f4a2c3d4e5f6a7',
+        'object': 'chat.completion',
+        'created': 1735700000,
+        'model': 'Pro/Qwen/Qwen2.5-VL-7B-Instruct',
+        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+        'usage': {'prompt_tokens': 1950, 'completion_tokens': 130, 'total_tokens': 2080},
+        'system_fingerprint': '',
+    }
+
+
+def run_variant(name, log_dir, requests_count, async_logging, sample_rate):
+    """执行一组请求的日志调用，返回每个请求在调用线程上的耗时（毫秒）及后台写完的耗时"""
+    from source.utils.log_config import setup_logger, stop_log_listeners
+
+    os.environ['LOG_ASYNC'] = 'True' if async_logging else 'False'
+    reload_settings()
+    logger = setup_logger(f'logging_bench.{name}', log_dir=log_dir, log_file=f'{name}.log')
+    response_json = _response_json()
+    rng = random.Random(0)
+    samples = []
+    for _ in range(requests_count):
+        start = time.perf_counter()
+        for message in FLOW_MESSAGES:
+            logger.info(message)
+        if sample_rate >= 1:
+            # 改造前：每次都缩进打印完整响应
+            logger.info(f"收到视觉模型API响应:{json.dumps(response_json, indent=2, ensure_ascii=False)}")
+        else:
+            logger.info(f"收到视觉模型API响应: 状态码 200, tokens {response_json['usage']['total_tokens']}")
+            if logger.isEnabledFor(logging.INFO) and rng.random() < sample_rate:
+                logger.info(f"视觉模型API响应内容: {json.dumps(response_json, ensure_ascii=False)}")
+        samples.append((time.perf_counter() - start) * 1000)
+    drain_start = time.perf_counter()
+    stop_log_listeners()
+    drain_ms = (time.perf_counter() - drain_start) * 1000
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+    return samples, drain_ms
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='日志开销基准测试（改造前后对比）')
+    parser.add_argument('--requests', type=int, default=2000, help='模拟的请求数')
+    parser.add_argument('--sample-rate', type=float, default=0.1, help='改造后完整响应的采样比例')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    log_dir = tempfile.mkdtemp(prefix='smartdigger_logbench_')
+    original = os.environ.get('LOG_ASYNC')
+    variants = [
+        ('before', '同步写入 + 完整响应', False, 1.0),
+        ('after', '异步队列 + 采样响应', True, args.sample_rate),
+    ]
+    results = {}
+    try:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stderr(devnull):
+            for name, label, async_logging, sample_rate in variants:
+                samples, drain_ms = run_variant(name, log_dir, args.requests, async_logging, sample_rate)
+                results[name] = {'label': label, 'per_request': summarize(samples), 'drain_ms': round(drain_ms, 1),
+                                 'log_bytes': os.path.getsize(os.path.join(log_dir, f'{name}.log'))}
+    finally:
+        if original is None:
+            os.environ.pop('LOG_ASYNC', None)
+        else:
+            os.environ['LOG_ASYNC'] = original
+        reload_settings()
+        shutil.rmtree(log_dir, ignore_errors=True)
+
+    print(f"每个请求 {len(FLOW_MESSAGES) + 1} 条以上日志，共 {args.requests} 个请求（请求线程耗时，毫秒）：")
+    for name, result in results.items():
+        stats = result['per_request']
+        print(f"  {result['label']:<16} median {stats['median_ms']:.3f}  p95 {stats['p95_ms']:.3f}  "
+              f"max {stats['max_ms']:.3f}  后台写完 {result['drain_ms']}ms  日志 {result['log_bytes']} 字节")
+    return results
+
+
+if __name__ == '__main__':
+    main()
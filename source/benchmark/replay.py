@@ -0,0 +1,338 @@
+"""
+离线回放工具
+
+模块职责：
+- 在进程内对已保存的线上截图（及同名 XML）重放完整诊断流程，视觉模型使用桩或缓存
+- 统计各阶段耗时（复用请求链路追踪的 span）与诊断结果分布
+- 以模版库前 N 个模版、不同匹配阈值统计模版命中率，用于上线前调整阈值与模版策略
+- 记录内存峰值（ru_maxrss，可选 tracemalloc 单张峰值）
+
+语料约定：
+- 目录下的 jpeg/jpg/png 截图，存在同名 .xml 时按 XML 方案回放，否则按分辨率方案回放（分辨率取截图尺寸）
+- 线上保存的 <截图ID>_marked_screenshot / <截图ID>_grayscale_image 会还原出截图 ID，
+  回放时排除该截图自身生成的模版，避免自己匹配自己
+
+用法:
+    python -m source.benchmark.replay --corpus screenshots/<设备名> --thresholds 0.7,0.8,0.9 --library-sizes 50,200
+    python -m source.benchmark.replay --corpus <目录> --vision cache --vision-cache benchmarks/vision_cache.json --live
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from source.benchmark.run import summarize, wait_background_threads, git_commit, prepare_environment
+from source.utils.settings import get_settings
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块
+    resource = None
+
+# 推导项目根目录（当前脚本的曾祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+__all__ = ['corpus_entries', 'screen_id_of', 'sweep_hit_rates', 'ReplayRunner', 'main']
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png')
+SAVED_SUFFIXES = ('_marked_screenshot', '_grayscale_image')
+
+
+def screen_id_of(file_name):
+    """由保存的截图文件名还原截图 ID（即其生成的模版文件名，不含扩展名）"""
+    stem = os.path.splitext(os.path.basename(file_name))[0]
+    for suffix in SAVED_SUFFIXES:
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+def corpus_entries(corpus_dir):
+    """递归收集语料，按修改时间排序以还原线上流量顺序
+
+    返回:
+        [{'image': 截图路径, 'xml': XML 路径或 None, 'screen_id': 截图 ID}, ...]
+    """
+    entries = []
+    for dir_path, _, file_names in os.walk(corpus_dir):
+        for file_name in file_names:
+            stem, ext = os.path.splitext(file_name)
+            if ext.lower() not in IMAGE_EXTENSIONS:
+                continue
+            image_path = os.path.join(dir_path, file_name)
+            xml_path = os.path.join(dir_path, stem + '.xml')
+            entries.append({'image': image_path, 'xml': xml_path if os.path.exists(xml_path) else None,
+                            'screen_id': screen_id_of(file_name)})
+    entries.sort(key=lambda entry: (os.path.getmtime(entry['image']), entry['image']))
+    return entries
+
+
+def library_files(template_dir):
+    """模版库文件列表，按修改时间从旧到新排列，前 N 个即模版库规模为 N 时的状态"""
+    files = [name for name in os.listdir(template_dir) if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS]
+    files.sort(key=lambda name: (os.path.getmtime(os.path.join(template_dir, name)), name))
+    return files
+
+
+def sweep_hit_rates(score_rows, thresholds, library_sizes):
+    """按阈值与模版库规模统计命中率
+
+    参数:
+        score_rows: 每张截图一个列表，依模版库顺序给出每个模版的相似度（无法参与匹配的模版为 None）
+        thresholds: 匹配阈值列表，相似度大于阈值视为命中（与 TemplateMatcher 一致）
+        library_sizes: 模版库规模列表，None 表示整个模版库
+
+    返回:
+        [{'library_size': N, 'threshold': t, 'hits': 命中数, 'hit_rate': 命中率}, ...]
+    """
+    rows = []
+    total = len(score_rows)
+    for size in library_sizes:
+        best_scores = []
+        for scores in score_rows:
+            candidates = [score for score in (scores if size is None else scores[:size]) if score is not None]
+            best_scores.append(max(candidates) if candidates else None)
+        for threshold in thresholds:
+            hits = sum(1 for best in best_scores if best is not None and best > threshold)
+            rows.append({'library_size': size if size is not None else 'all', 'threshold': threshold,
+                         'hits': hits, 'hit_rate': round(hits / total, 4) if total else 0.0})
+    return rows
+
+
+class ReplayRunner:
+    """在临时工作目录中逐张回放语料"""
+
+    def __init__(self, work_dir, template_dir, db_path=None, trace_memory=False):
+        self.work_dir = work_dir
+        self.source_template_dir = template_dir
+        self.source_db_path = db_path
+        self.trace_memory = trace_memory
+        self.stage_samples = {}
+        self.outcomes = {}
+        self.errors = []
+        self.memory_peaks = []
+        self.match_inputs = []
+
+    def prepare(self, entries):
+        """复制模版库与数据库到工作目录，回放过程中新生成的模版不会写回线上目录"""
+        prepare_environment(self.work_dir)
+        template_dir = os.environ['TEMPLATE_DIR']
+        os.makedirs(template_dir, exist_ok=True)
+        os.makedirs(os.environ['TMP_DIR'], exist_ok=True)
+        corpus_ids = {entry['screen_id'] for entry in entries}
+        for name in library_files(self.source_template_dir):
+            if os.path.splitext(name)[0] not in corpus_ids:
+                shutil.copy2(os.path.join(self.source_template_dir, name), template_dir)
+        if self.source_db_path and os.path.exists(self.source_db_path):
+            shutil.copy2(self.source_db_path, os.environ['DB_PATH'])
+
+    def _collect(self, request_trace):
+        def walk(node):
+            for child in list(node.children):
+                self.stage_samples.setdefault(child.name, []).append(child.duration_ms)
+                walk(child)
+
+        self.stage_samples.setdefault('total', []).append(request_trace.root.duration_ms)
+        walk(request_trace.root)
+
+    def replay(self, entries):
+        from source.api.services import vision_analysis, lvm_analysis
+        from source.api.utils.template_matcher import TemplateMatcher
+        from source.utils import trace
+
+        original_match = TemplateMatcher.match_known_popups
+
+        def match_known_popups(matcher, image):
+            # 记录流水线实际用于匹配的图像，供阈值与模版库规模扫描使用
+            if image is not None:
+                self.match_inputs.append((current['entry'], image.copy()))
+            return original_match(matcher, image)
+
+        current = {}
+        TemplateMatcher.match_known_popups = match_known_popups
+        if self.trace_memory:
+            tracemalloc.start()
+        try:
+            for index, entry in enumerate(entries):
+                current['entry'] = entry
+                with open(entry['image'], 'rb') as f:
+                    screenshot_bytes = f.read()
+                # 截图 ID 只精确到秒，每张截图使用不同的设备名避免互相覆盖
+                device_name = f'replay{index}'
+                if self.trace_memory:
+                    tracemalloc.reset_peak()
+                _, token = trace.start_trace(entry['screen_id'], 'replay')
+                mode = 'xml' if entry['xml'] else 'resolution'
+                try:
+                    if entry['xml']:
+                        with open(entry['xml'], 'r', encoding='utf-8') as f:
+                            xml = f.read()
+                        result = vision_analysis(screenshot_bytes, xml, device_name)
+                    else:
+                        from PIL import Image
+
+                        with Image.open(entry['image']) as image:
+                            resolution = f'({image.width}, {image.height})'
+                        result = lvm_analysis(screenshot_bytes, resolution, device_name)
+                    outcome = self._outcome(result)
+                except Exception as e:
+                    outcome = 'error'
+                    self.errors.append({'image': entry['image'], 'error': str(e)})
+                finally:
+                    trace.end_trace(token, on_complete=self._collect)
+                key = f'{mode}:{outcome}'
+                self.outcomes[key] = self.outcomes.get(key, 0) + 1
+                # 等待异步保存完成，使新模版参与下一张截图的匹配，与线上顺序一致
+                wait_background_threads()
+                if self.trace_memory:
+                    self.memory_peaks.append(tracemalloc.get_traced_memory()[1] / 1024 / 1024)
+        finally:
+            TemplateMatcher.match_known_popups = original_match
+            if self.trace_memory:
+                tracemalloc.stop()
+
+    @staticmethod
+    def _outcome(result):
+        center_x, center_y, template_file = result
+        if template_file is not None:
+            return 'template'
+        if center_x is not None and center_y is not None:
+            return 'vision_popup'
+        return 'no_popup'
+
+    def sweep(self, thresholds, library_sizes):
+        """对线上模版库（不含回放生成的模版）计算每张截图与各模版的相似度，再按阈值与规模统计"""
+        from source.api.utils.template_matcher import TemplateMatcher
+
+        files = library_files(self.source_template_dir)
+        matcher = TemplateMatcher(template_dir=self.source_template_dir)
+        score_rows = []
+        for entry, image in self.match_inputs:
+            scores = dict(matcher.iter_match_scores(image, [name for name in files
+                                                            if os.path.splitext(name)[0] != entry['screen_id']]))
+            score_rows.append([scores.get(name) for name in files])
+        return sweep_hit_rates(score_rows, thresholds, library_sizes)
+
+    def report(self, hit_rates, vision_calls):
+        max_rss_mb = None
+        if resource is not None:
+            # Linux 下 ru_maxrss 单位为 KB，macOS 为字节
+            divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+            max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / divisor, 1)
+        memory = {'max_rss_mb': max_rss_mb}
+        if self.memory_peaks:
+            peaks = sorted(self.memory_peaks)
+            memory['tracemalloc_peak_mb'] = {'median': round(peaks[len(peaks) // 2], 2), 'max': round(peaks[-1], 2)}
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0],
+            },
+            'screens': sum(self.outcomes.values()),
+            'outcomes': self.outcomes,
+            'vision_calls': vision_calls,
+            'stages': {name: summarize(samples) for name, samples in sorted(self.stage_samples.items())},
+            'hit_rates': hit_rates,
+            'memory': memory,
+            'errors': self.errors[:20],
+        }
+
+
+def _vision_context(args):
+    from source.benchmark.stubs import stub_vision_model, cached_vision_model
+
+    if args.vision == 'cache':
+        return cached_vision_model(args.vision_cache, live=args.live)
+    return stub_vision_model(args.vision_latency_ms, popup_exists=args.stub_popup, button_id=args.stub_button_id)
+
+
+def print_report(result):
+    print(f"回放截图 {result['screens']} 张，诊断结果: {result['outcomes']}，模型调用: {result['vision_calls']}")
+    print(f"{'阶段':<24}{'次数':>6}{'中位数ms':>12}{'p95 ms':>12}{'最大ms':>12}")
+    for name, stats in result['stages'].items():
+        print(f"{name:<24}{stats['count']:>6}{stats['median_ms']:>12.1f}{stats['p95_ms']:>12.1f}{stats['max_ms']:>12.1f}")
+    print('模版命中率（模版库规模 × 阈值）:')
+    for row in result['hit_rates']:
+        print(f"  N={row['library_size']:<6} 阈值={row['threshold']:<5} 命中 {row['hits']} ({row['hit_rate']:.1%})")
+    print(f"内存: {result['memory']}")
+    if result['errors']:
+        print(f"失败 {len(result['errors'])} 张，示例: {result['errors'][0]}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartDigger 离线回放：对已保存的截图重放诊断流程')
+    parser.add_argument('--corpus', required=True, help='截图（及同名 XML）所在目录，递归查找')
+    parser.add_argument('--template-dir', default=None, help='线上模版库目录，默认为 TEMPLATE_DIR，只读')
+    parser.add_argument('--db', default=None, help='线上数据库，默认为 DB_PATH，只读（复制到工作目录使用）')
+    parser.add_argument('--limit', type=int, default=0, help='最多回放的截图数量，0 为不限制')
+    parser.add_argument('--thresholds', default='0.6,0.7,0.8,0.9', help='逗号分隔的匹配阈值')
+    parser.add_argument('--library-sizes', default='10,50,all', help='逗号分隔的模版库规模，all 为整个模版库')
+    parser.add_argument('--vision', choices=['stub', 'cache'], default='stub', help='视觉模型替换方式')
+    parser.add_argument('--vision-cache', default=os.path.join('benchmarks', 'vision_cache.json'),
+                        help='缓存文件路径（--vision cache）')
+    parser.add_argument('--live', action='store_true', help='缓存未命中时调用真实视觉模型并写入缓存')
+    parser.add_argument('--vision-latency-ms', type=float, default=0.0, help='桩模拟的模型耗时')
+    parser.add_argument('--stub-popup', action='store_true', help='桩返回存在弹窗（默认返回无弹窗）')
+    parser.add_argument('--stub-button-id', type=int, default=1, help='桩在 XML 方案返回的数字标记')
+    parser.add_argument('--trace-memory', action='store_true', help='使用 tracemalloc 统计单张峰值（会拖慢耗时）')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径，默认写入 benchmarks/ 目录')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时工作目录')
+    parser.add_argument('--verbose', action='store_true', help='输出业务模块的 INFO 日志')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # 绘制标记时使用相对路径加载字体，需要在项目根目录下运行
+    os.chdir(project_root)
+    settings = get_settings()
+    template_dir = os.path.abspath(args.template_dir or settings.template_dir)
+    db_path = os.path.abspath(args.db or settings.db_path)
+    thresholds = [float(item) for item in args.thresholds.split(',')]
+    library_sizes = [None if item == 'all' else int(item) for item in args.library_sizes.split(',')]
+    entries = corpus_entries(args.corpus)
+    if args.limit:
+        entries = entries[:args.limit]
+    if not entries:
+        raise ValueError(f"语料目录中没有截图: {args.corpus}")
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    work_dir = tempfile.mkdtemp(prefix='smartdigger_replay_')
+    try:
+        runner = ReplayRunner(work_dir, template_dir, db_path, trace_memory=args.trace_memory)
+        runner.prepare(entries)
+        start = time.perf_counter()
+        with _vision_context(args) as vision_calls:
+            runner.replay(entries)
+        print(f"回放耗时 {time.perf_counter() - start:.1f}s，开始扫描匹配阈值...")
+        result = runner.report(runner.sweep(thresholds, library_sizes), vision_calls)
+        result['meta']['args'] = vars(args)
+    finally:
+        logging.disable(logging.NOTSET)
+        if args.keep_workdir:
+            print(f"临时工作目录已保留: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print_report(result)
+    output = args.output
+    if output is None:
+        output_dir = os.path.join(project_root, 'benchmarks')
+        os.makedirs(output_dir, exist_ok=True)
+        output = os.path.join(output_dir, f"replay_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_"
+                                          f"{result['meta']['commit']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    print(f"回放结果已保存: {output}")
+    return result
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+"""
+性能基准测试入口
+
+模块职责：
+- 使用合成截图、弹窗与 XML 对诊断流程的各阶段计时
+- 进程内执行完整诊断（视觉模型使用桩替换）
+- 将结果写入 JSON 文件，并支持与历史结果对比
+
+用法:
+    python -m source.benchmark --resolutions 720x1280,1080x2400 --repeat 5
+    python -m source.benchmark --quick --compare benchmarks/<旧结果>.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from source.benchmark.synthetic import (parse_resolution, make_screen, add_popup_overlay, make_hierarchy_xml,
+                                        make_template_library)
+from source.utils.settings import reload_settings
+
+# 推导项目根目录（当前脚本的曾祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+__all__ = ['BenchmarkSuite', 'summarize', 'compare_results', 'main']
+
+
+def summarize(samples_ms):
+    """计算耗时样本的统计值（毫秒）"""
+    ordered = sorted(samples_ms)
+    p95_index = min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))
+    return {
+        'count': len(ordered),
+        'min_ms': round(ordered[0], 3),
+        'median_ms': round(statistics.median(ordered), 3),
+        'mean_ms': round(statistics.fmean(ordered), 3),
+        'p95_ms': round(ordered[p95_index], 3),
+        'max_ms': round(ordered[-1], 3),
+    }
+
+
+def wait_background_threads(timeout=30):
+    """等待诊断流程启动的异步保存线程结束，避免影响下一次计时"""
+    for thread in threading.enumerate():
+        if thread is not threading.main_thread() and not thread.daemon:
+            thread.join(timeout)
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=project_root,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+        return result.stdout.strip()
+    except Exception:
+        return 'unknown'
+
+
+class BenchmarkSuite:
+    """诊断流程基准测试集合，所有数据都写在临时工作目录中"""
+
+    def __init__(self, work_dir, repeat=5, warmup=1, vision_latency_ms=0.0):
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.warmup = warmup
+        self.vision_latency_ms = vision_latency_ms
+        self.results = []
+        self._device_counter = 0
+
+    def _device_name(self, prefix):
+        """每次诊断使用不同的设备名，截图 ID 只精确到秒，相同设备名会互相覆盖"""
+        self._device_counter += 1
+        return f'{prefix}{self._device_counter}:bench'
+
+    def measure(self, stage, params, func, repeat=None, warmup=None, setup=None):
+        """对 func 计时，setup 在每次计时前执行且不计入耗时"""
+        repeat = self.repeat if repeat is None else repeat
+        warmup = self.warmup if warmup is None else warmup
+        samples = []
+        for i in range(warmup + repeat):
+            if setup is not None:
+                setup()
+            start = time.perf_counter()
+            func()
+            elapsed = (time.perf_counter() - start) * 1000
+            wait_background_threads()
+            if i >= warmup:
+                samples.append(elapsed)
+        result = {'stage': stage, 'params': params, **summarize(samples)}
+        self.results.append(result)
+        print(f"{stage:<28} {json.dumps(params, ensure_ascii=False):<48} "
+              f"median={result['median_ms']:.2f}ms p95={result['p95_ms']:.2f}ms")
+        return result
+
+    def _template_dir(self, name):
+        path = os.path.join(self.work_dir, 'templates', name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def bench_draw_element_borders(self, resolution, clickable_counts):
+        from source.services.image_processor import ImageProcessor
+
+        width, height = resolution
+        screen, popup = add_popup_overlay(make_screen(width, height, seed=1), seed=1)
+        grayscale = screen.convert('L')
+        processor = ImageProcessor()
+        for clickable_count in clickable_counts:
+            xml = make_hierarchy_xml(width, height, node_count=max(40, clickable_count * 2),
+                                     clickable_count=clickable_count)
+            bounds_list = self._clickable_bounds(xml)
+            counter = iter(range(10 ** 9))
+            self.measure('draw_element_borders', {'resolution': f'{width}x{height}', 'clickable': len(bounds_list)},
+                         lambda: processor.draw_element_borders(grayscale, bounds_list,
+                                                                f'bench_draw_{next(counter)}'))
+        processor.recorder.close()
+
+    @staticmethod
+    def _clickable_bounds(xml):
+        from lxml import etree
+
+        root = etree.fromstring(xml.encode('utf-8'))
+        elements = root.xpath(".//*[@clickable='true']")
+        return [(element.get('bounds'), i) for i, element in enumerate(elements) if element.get('bounds')]
+
+    def bench_match_known_popups(self, resolution, template_counts):
+        from source.api.utils.template_matcher import TemplateMatcher
+
+        width, height = resolution
+        # 未命中时需要扫描完整模版库，是模版匹配的最坏情况
+        screen = make_screen(width, height, seed=10 ** 6)
+        foreground = screen.convert('L').point(lambda p: p > 128 and 255)
+        for count in template_counts:
+            template_dir = self._template_dir(f'match_{width}x{height}_{count}')
+            make_template_library(template_dir, count, width=width, height=height)
+            matcher = TemplateMatcher()
+            matcher.template_dir = template_dir
+            self.measure('match_known_popups', {'resolution': f'{width}x{height}', 'templates': count},
+                         lambda: matcher.match_known_popups(foreground))
+
+    def bench_recorder_writes(self, rows_per_screen=(12,)):
+        from source.services.recorder import Recorder
+
+        recorder = Recorder()
+        counter = iter(range(10 ** 9))
+        for rows in rows_per_screen:
+            def write_screen():
+                screenshot_id = f'bench_recorder_{next(counter)}'
+                for element_id in range(rows):
+                    bounds = f'[{element_id},{element_id}][{element_id + 100},{element_id + 50}]'
+                    if not recorder.is_record_exist(bounds, screenshot_id):
+                        recorder.save_bound(bounds, screenshot_id, element_id + 1)
+                recorder.save_template(screenshot_id, 1, 1)
+
+            self.measure('recorder_writes', {'rows': rows}, write_screen)
+        recorder.close()
+
+    def bench_convert_image_to_base64(self, resolution):
+        """模型请求的 base64 编码，以及单次诊断中发送给模型与保存截图的编码总耗时（分别编码 / ImageArtifact 只编码一次）"""
+        from io import BytesIO
+
+        from source.services.image_artifact import ImageArtifact
+        from source.services.vision_model import VisionModelService
+
+        width, height = resolution
+        screen, _ = add_popup_overlay(make_screen(width, height, seed=2), seed=2)
+        for mode, image in (('RGB', screen), ('L', screen.convert('L'))):
+            params = {'resolution': f'{width}x{height}', 'mode': mode}
+            self.measure('convert_image_to_base64', params,
+                         lambda: VisionModelService.convert_image_to_base64(image))
+
+            def separate():
+                VisionModelService.convert_image_to_base64(image)
+                image.save(BytesIO(), format='JPEG', quality=85)
+
+            def once():
+                artifact = ImageArtifact(image)
+                VisionModelService.convert_image_to_base64(artifact)
+                artifact.jpeg()
+
+            self.measure('encode_per_request', {**params, 'strategy': 'separate'}, separate)
+            self.measure('encode_per_request', {**params, 'strategy': 'once'}, once)
+
+    def bench_diagnosis(self, resolution, clickable_count=6):
+        """完整诊断：XML 方案与分辨率方案，分别测量模版未命中（调用模型）与命中两种路径，以及 XML 结构指纹与规则命中的路径"""
+        from source.benchmark.stubs import stub_vision_model
+        from source.api.services import vision_analysis, lvm_analysis
+
+        width, height = resolution
+        screen, popup = add_popup_overlay(make_screen(width, height, seed=3), seed=3)
+        screenshot_bytes = self._jpeg_bytes(screen)
+        xml = make_hierarchy_xml(width, height, node_count=40, clickable_count=clickable_count - 2, popup=popup)
+        resolution_text = f'({width}, {height})'
+        params = {'resolution': f'{width}x{height}'}
+        template_dir = self._template_dir(f'diagnose_{width}x{height}')
+        original_env = {name: os.environ.get(name)
+                        for name in ('TEMPLATE_DIR', 'XML_RULES_ENABLED', 'XML_FINGERPRINT_CACHE_ENABLED')}
+        os.environ['TEMPLATE_DIR'] = template_dir
+        # 合成弹窗的关闭按钮带有 iv_close 与“关闭”，开启规则时 XML 方案不会走到模型与模版；
+        # 结构指纹缓存在第一次有弹窗的诊断后即命中，同样先关闭
+        os.environ['XML_RULES_ENABLED'] = 'False'
+        os.environ['XML_FINGERPRINT_CACHE_ENABLED'] = 'False'
+        reload_settings()
+
+        def diagnose_xml():
+            vision_analysis(screenshot_bytes, xml, self._device_name('xml'))
+
+        def diagnose_resolution():
+            lvm_analysis(screenshot_bytes, resolution_text, self._device_name('lvm'))
+
+        try:
+            # 模版未命中 + 模型判断无弹窗：不会写入模版，可重复测量
+            with stub_vision_model(self.vision_latency_ms, popup_exists=False):
+                self.measure('diagnose_xml', {**params, 'path': 'vision'}, diagnose_xml)
+                self.measure('diagnose_resolution', {**params, 'path': 'vision'}, diagnose_resolution)
+
+            # 先以有弹窗的结果诊断一次写入模版，之后的诊断都会命中模版
+            with stub_vision_model(self.vision_latency_ms, popup_exists=True, button_id=clickable_count):
+                diagnose_xml()
+                wait_background_threads()
+                diagnose_resolution()
+                wait_background_threads()
+                self.measure('diagnose_xml', {**params, 'path': 'template'}, diagnose_xml)
+                self.measure('diagnose_resolution', {**params, 'path': 'template'}, diagnose_resolution)
+
+                os.environ['XML_FINGERPRINT_CACHE_ENABLED'] = 'True'
+                reload_settings()
+                diagnose_xml()
+                wait_background_threads()
+                self.measure('diagnose_xml', {**params, 'path': 'fingerprint'}, diagnose_xml)
+
+            os.environ['XML_RULES_ENABLED'] = 'True'
+            reload_settings()
+            self.measure('diagnose_xml', {**params, 'path': 'rule'}, diagnose_xml)
+        finally:
+            for name, value in original_env.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+            reload_settings()
+
+    def bench_icon_locator(self, resolution, seeds=3, samples=20):
+        """关闭按钮图标定位：用少量合成弹窗建立图标库，统计新弹窗的命中率、无弹窗截图的误报率与定位耗时"""
+        from source.api.utils.icon_locator import IconLibrary, IconLocator
+        from source.api.utils.popup_detector import PopupDetector
+
+        width, height = resolution
+        library = IconLibrary(icon_dir=os.path.join(self.work_dir, f'icons_{width}x{height}'))
+        for seed in range(seeds):
+            screen, popup = add_popup_overlay(make_screen(width, height, seed=seed), seed=seed)
+            library.add(screen.convert('L'), *popup['close_button'], f'bench_icon_{seed}')
+        locator = IconLocator(library)
+        detector = PopupDetector()
+
+        popups = []
+        for seed in range(100, 100 + samples):
+            screen, popup = add_popup_overlay(make_screen(width, height, seed=seed), seed=seed)
+            grayscale = screen.convert('L')
+            popups.append((grayscale, detector.detect(grayscale).box, popup['close_bounds']))
+        plain = [make_screen(width, height, seed=seed).convert('L') for seed in range(200, 200 + samples)]
+
+        hits = 0
+        for grayscale, box, (x0, y0, x1, y1) in popups:
+            match = locator.locate(grayscale, box)
+            hits += match is not None and x0 <= match.x <= x1 and y0 <= match.y <= y1
+        false_positives = sum(locator.locate(grayscale) is not None for grayscale in plain)
+
+        params = {'resolution': f'{width}x{height}', 'icons': len(library.icons())}
+        grayscale, box, _ = popups[0]
+        result = self.measure('icon_locator', params, lambda: locator.locate(grayscale, box))
+        result.update({'hit_rate': round(hits / samples, 3), 'false_positive_rate': round(false_positives / samples, 3)})
+        print(f"{'':<28} hit_rate={result['hit_rate']:.2f} false_positive_rate={result['false_positive_rate']:.2f}")
+
+    @staticmethod
+    def _jpeg_bytes(image):
+        import io
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+    def to_dict(self, args=None):
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': sys.version.split()[0],
+                'platform': platform.platform(),
+                'args': args or {},
+            },
+            'results': self.results,
+        }
+
+
+def _result_key(result):
+    return result['stage'], json.dumps(result['params'], sort_keys=True, ensure_ascii=False)
+
+
+def compare_results(current, baseline, metric='median_ms'):
+    """对比两次基准结果，返回 (stage, params, 旧值, 新值, 比例) 列表"""
+    baseline_map = {_result_key(item): item for item in baseline['results']}
+    rows = []
+    for item in current['results']:
+        old = baseline_map.get(_result_key(item))
+        if old is None:
+            continue
+        ratio = item[metric] / old[metric] if old[metric] else float('inf')
+        rows.append((item['stage'], item['params'], old[metric], item[metric], ratio))
+    return rows
+
+
+def prepare_environment(work_dir):
+    """将数据库、截图与模版目录指向临时工作目录，必须在导入业务模块前调用"""
+    os.environ['DB_PATH'] = os.path.join(work_dir, 'elements.db')
+    os.environ['MD_FILE_PATH'] = os.path.join(work_dir, 'elements.md')
+    os.environ['SCREENSHOT_DIR'] = os.path.join(work_dir, 'screenshots')
+    os.environ['TEMPLATE_DIR'] = os.path.join(work_dir, 'templates', 'default')
+    os.environ['TMP_DIR'] = os.path.join(work_dir, 'tmp')
+    os.environ['ICON_DIR'] = os.path.join(work_dir, 'icons')
+    os.environ['ARTIFACT_DIR'] = os.path.join(work_dir, 'artifacts')
+    os.environ.setdefault('VISION_MODEL_API_URL', 'http://127.0.0.1:9/v1/chat/completions')
+    os.environ.setdefault('VISION_MODEL_API_KEY', 'benchmark')
+    reload_settings()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='SmartDigger 诊断流程性能基准测试')
+    parser.add_argument('--resolutions', default='720x1280', help='逗号分隔的分辨率列表')
+    parser.add_argument('--clickable', default='4,12', help='draw_element_borders 的可点击元素数量列表')
+    parser.add_argument('--templates', default='10,50', help='模版库规模列表')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数')
+    parser.add_argument('--warmup', type=int, default=1, help='每项预热次数')
+    parser.add_argument('--vision-latency-ms', type=float, default=0.0, help='模拟视觉模型耗时')
+    parser.add_argument('--stages', default='draw,match,recorder,base64,diagnose,icon', help='需要执行的阶段')
+    parser.add_argument('--quick', action='store_true', help='小分辨率、少量重复的快速模式')
+    parser.add_argument('--output', default=None, help='结果 JSON 路径，默认写入 benchmarks/ 目录')
+    parser.add_argument('--compare', default=None, help='与指定的历史结果 JSON 对比')
+    parser.add_argument('--keep-workdir', action='store_true', help='保留临时工作目录（数据库、截图与模版）')
+    parser.add_argument('--verbose', action='store_true', help='输出业务模块的 INFO 日志')
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.resolutions, args.clickable, args.templates = '360x640', '4', '10'
+        args.repeat, args.warmup = 2, 0
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # 绘制标记时使用相对路径加载字体，需要在项目根目录下运行
+    os.chdir(project_root)
+    if not args.verbose:
+        # 业务模块每次诊断都会写多条 INFO 日志，基准测试期间屏蔽，避免写满项目日志并影响计时
+        logging.disable(logging.INFO)
+    work_dir = tempfile.mkdtemp(prefix='smartdigger_bench_')
+    try:
+        return run_suite(args, work_dir)
+    finally:
+        logging.disable(logging.NOTSET)
+        if args.keep_workdir:
+            print(f"临时工作目录已保留: {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def run_suite(args, work_dir):
+    prepare_environment(work_dir)
+
+    resolutions = [parse_resolution(item) for item in args.resolutions.split(',')]
+    clickable_counts = [int(item) for item in args.clickable.split(',')]
+    template_counts = [int(item) for item in args.templates.split(',')]
+    stages = set(args.stages.split(','))
+
+    suite = BenchmarkSuite(work_dir, repeat=args.repeat, warmup=args.warmup,
+                           vision_latency_ms=args.vision_latency_ms)
+    for resolution in resolutions:
+        if 'draw' in stages:
+            suite.bench_draw_element_borders(resolution, clickable_counts)
+        if 'match' in stages:
+            suite.bench_match_known_popups(resolution, template_counts)
+        if 'base64' in stages:
+            suite.bench_convert_image_to_base64(resolution)
+        if 'diagnose' in stages:
+            suite.bench_diagnosis(resolution)
+        if 'icon' in stages:
+            suite.bench_icon_locator(resolution)
+    if 'recorder' in stages:
+        suite.bench_recorder_writes()
+
+    data = suite.to_dict(vars(args))
+    output = args.output
+    if output is None:
+        output_dir = os.path.join(project_root, 'benchmarks')
+        os.makedirs(output_dir, exist_ok=True)
+        output = os.path.join(output_dir,
+                              f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}_{data['meta']['commit']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    print(f"基准结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"与 {baseline['meta'].get('commit')} 对比（median）：")
+        for stage, params, old, new, ratio in compare_results(data, baseline):
+            flag = '变慢' if ratio > 1.1 else ('变快' if ratio < 0.9 else '持平')
+            print(f"  {stage:<28} {json.dumps(params, ensure_ascii=False):<48} "
+                  f"{old:.2f}ms -> {new:.2f}ms  x{ratio:.2f} {flag}")
+    return data
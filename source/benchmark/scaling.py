@@ -0,0 +1,176 @@
+"""
+多进程扩展性基准
+
+模块职责：
+- 依次以 1、2、4 ... 个工作进程启动接口服务（api_run.py --workers N），视觉模型使用本地桩服务
+- 命中截图预热进入模版库后以闭环方式（每个客户端线程收到响应后立即发下一个请求）压测
+- 输出各工作进程数下的吞吐、延迟与相对单进程的加速比；加速比上限受 CPU 核数限制
+
+用法:
+    python -m source.benchmark.scaling --workers 1,2,4 --duration 20 --clients 8
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from source.benchmark.loadgen import LoadGenerator, percentile
+from source.benchmark.synthetic import parse_resolution
+
+# 推导项目根目录（当前脚本的曾祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+__all__ = ['free_port', 'wait_port', 'closed_loop', 'main']
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_port(port, timeout=30):
+    """等待端口可连接"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise ValueError(f"等待端口 {port} 超时")
+
+
+def closed_loop(url, payloads, clients, duration, timeout=60, seed=0):
+    """闭环压测：clients 个线程各自循环发送，返回 [(状态, 耗时 ms), ...] 与实际时长"""
+    records = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        rng = random.Random(seed + index)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                status = str(session.post(url, json=rng.choice(payloads), timeout=timeout).status_code)
+            except requests.RequestException:
+                status = 'error'
+            with lock:
+                records.append((status, (time.perf_counter() - start) * 1000))
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+
+def _server_env(work_dir, stub_port):
+    env = dict(os.environ)
+    env.update({
+        'DB_PATH': os.path.join(work_dir, 'db.sqlite'),
+        'SCREENSHOT_DIR': os.path.join(work_dir, 'screenshots'),
+        'TEMPLATE_DIR': os.path.join(work_dir, 'templates'),
+        'TMP_DIR': os.path.join(work_dir, 'tmp'),
+        'ARTIFACT_DIR': os.path.join(work_dir, 'artifacts'),
+        'VISION_MODEL_API_URL': f'http://127.0.0.1:{stub_port}/v1/chat/completions',
+        'VISION_MODEL_API_KEY': 'bench',
+        'API_DEBUG': 'False',
+        'TRACE_LOG_SPANS': 'False',
+        'PROFILE_SAMPLE_RATE': '0',
+    })
+    return env
+
+
+def _stop(process):
+    process.terminate()
+    try:
+        process.wait(timeout=15)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def measure_workers(workers, args, stub_port):
+    """以指定工作进程数启动接口服务并压测，返回统计结果"""
+    with tempfile.TemporaryDirectory(prefix='smartdigger_scaling_') as work_dir:
+        env = _server_env(work_dir, stub_port)
+        port = free_port()
+        server = subprocess.Popen([sys.executable, 'api_run.py', '--host', '127.0.0.1', '--port', str(port),
+                                   '--workers', str(workers)], cwd=project_root, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_port(port)
+            url = f'http://127.0.0.1:{port}/api/v1/diagnose'
+            generator = LoadGenerator(url, rps=1, duration=0, resolution=args.resolution,
+                                      hit_screens=args.hit_screens, timeout=args.timeout)
+            generator.prepare()
+            records, elapsed = closed_loop(url, generator.hit_payloads, args.clients, args.duration, args.timeout)
+        finally:
+            _stop(server)
+    latencies = sorted(ms for _, ms in records)
+    return {
+        'workers': workers,
+        'requests': len(records),
+        'duration_s': round(elapsed, 3),
+        'throughput_rps': round(len(records) / elapsed, 3) if elapsed else 0,
+        'status': dict(Counter(status for status, _ in records)),
+        'p50_ms': round(percentile(latencies, 50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 2) if latencies else None,
+    }
+
+
+def parse_args(argv=None):
+    cpu = os.cpu_count() or 1
+    default_workers = sorted({1, 2, 4, cpu})
+    parser = argparse.ArgumentParser(description='多进程扩展性基准（api_run.py --workers N）')
+    parser.add_argument('--workers', default=','.join(map(str, default_workers)), help='逗号分隔的工作进程数')
+    parser.add_argument('--clients', type=int, default=max(4, 2 * cpu), help='闭环压测的客户端线程数')
+    parser.add_argument('--duration', type=float, default=20, help='每组压测时长（秒）')
+    parser.add_argument('--resolution', type=parse_resolution, default=(1080, 1920))
+    parser.add_argument('--hit-screens', type=int, default=8, help='参与压测的命中截图数量（即模版库大小）')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', default=None, help='将结果写入 JSON 文件')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stub_port = free_port()
+    # 模型桩总是返回弹窗且不延迟，压测只衡量服务自身的 CPU 开销
+    stub = subprocess.Popen([sys.executable, '-m', 'source.benchmark.vision_stub', '--port', str(stub_port),
+                             '--popup-rate', '1', '--latency-ms', '0'], cwd=project_root,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    try:
+        wait_port(stub_port)
+        for workers in [int(w) for w in args.workers.split(',')]:
+            result = measure_workers(workers, args, stub_port)
+            results.append(result)
+            baseline = results[0]['throughput_rps']
+            result['speedup'] = round(result['throughput_rps'] / baseline, 2) if baseline else None
+            print(f"workers={workers:<3} 吞吐 {result['throughput_rps']:>8.2f} req/s  加速比 {result['speedup']}  "
+                  f"p50 {result['p50_ms']}ms  p95 {result['p95_ms']}ms  状态 {result['status']}")
+    finally:
+        _stop(stub)
+    report = {'cpu_count': os.cpu_count(), 'clients': args.clients, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+
+if __name__ == '__main__':
+    main()
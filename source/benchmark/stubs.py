@@ -0,0 +1,94 @@
+"""
+视觉模型桩模块
+
+模块职责：
+- 在进程内替换 VisionModelService.analyze_screenshot，避免基准测试访问网络
+- 可模拟固定的模型耗时
+- 按截图内容缓存真实模型的回答，便于离线回放时重复使用
+"""
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+__all__ = ['stub_vision_model', 'cached_vision_model']
+
+
+@contextmanager
+def stub_vision_model(latency_ms=0.0, popup_exists=True, button_id=1, coordinates=(100, 200)):
+    """在上下文中替换视觉模型调用
+
+    参数:
+        latency_ms: 模拟的模型耗时（毫秒）
+        popup_exists: 模拟结果中是否存在弹窗
+        button_id: XML 方案返回的按钮数字标记
+        coordinates: 分辨率方案返回的按钮坐标
+    """
+    from source.services.vision_model import VisionModelService
+
+    original = VisionModelService.analyze_screenshot
+    calls = {'count': 0}
+
+    def analyze_screenshot(self, marked_screenshot_image, validate=None):
+        calls['count'] += 1
+        # 与真实调用一致，计入编码耗时
+        self.convert_image_to_base64(marked_screenshot_image)
+        if latency_ms:
+            time.sleep(latency_ms / 1000)
+        if not popup_exists:
+            return {'popup_exists': False, 'popup_cancel_button': None, 'button_coordinates': None}
+        if self.screen_resolution:
+            return {'popup_exists': True, 'button_coordinates': {'x': coordinates[0], 'y': coordinates[1]}}
+        return {'popup_exists': True, 'popup_cancel_button': button_id}
+
+    VisionModelService.analyze_screenshot = analyze_screenshot
+    try:
+        yield calls
+    finally:
+        VisionModelService.analyze_screenshot = original
+
+
+@contextmanager
+def cached_vision_model(cache_path, live=False):
+    """在上下文中以缓存替换视觉模型调用
+
+    缓存键为发送给模型的 base64 图片与分辨率的 SHA-1，与方案无关的同一张截图只需真实调用一次。
+
+    参数:
+        cache_path: 缓存 JSON 文件路径，退出上下文时写回
+        live: 缓存未命中时是否调用真实模型；否则按无弹窗处理
+    """
+    from source.services.vision_model import VisionModelService
+
+    original = VisionModelService.analyze_screenshot
+    cache = {}
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    calls = {'count': 0, 'hit': 0, 'miss': 0, 'live': 0}
+
+    def analyze_screenshot(self, marked_screenshot_image, validate=None):
+        calls['count'] += 1
+        base64_image = self.convert_image_to_base64(marked_screenshot_image)
+        key = hashlib.sha1(f'{self.screen_resolution}|{base64_image}'.encode('utf-8')).hexdigest()
+        if key in cache:
+            calls['hit'] += 1
+            return cache[key]
+        calls['miss'] += 1
+        if not live:
+            return {'popup_exists': False, 'popup_cancel_button': None, 'button_coordinates': None}
+        calls['live'] += 1
+        result = original(self, marked_screenshot_image, validate)
+        cache[key] = result
+        return result
+
+    VisionModelService.analyze_screenshot = analyze_screenshot
+    try:
+        yield calls
+    finally:
+        VisionModelService.analyze_screenshot = original
+        if calls['live']:
+            os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(cache, f, ensure_ascii=False)
@@ -0,0 +1,177 @@
+"""
+合成测试数据模块
+
+模块职责：
+- 生成常见分辨率的模拟手机截图
+- 在截图上叠加弹窗（暗色蒙层 + 亮色卡片 + 关闭按钮）
+- 生成不同规模、不同可点击元素数量的 uiautomator XML
+- 生成指定数量的弹窗模版库
+"""
+import os
+import random
+
+from PIL import Image, ImageDraw
+
+__all__ = ['COMMON_RESOLUTIONS', 'parse_resolution', 'make_screen', 'add_popup_overlay', 'make_hierarchy_xml',
+           'make_template_library']
+
+# 常见手机分辨率（宽 x 高）
+COMMON_RESOLUTIONS = [(720, 1280), (1080, 1920), (1080, 2400), (1440, 3120)]
+
+
+def parse_resolution(text):
+    """解析 '1080x1920' 形式的分辨率"""
+    width, height = text.lower().split('x')
+    return int(width), int(height)
+
+
+def make_screen(width, height, seed=0):
+    """生成一张模拟的应用页面截图（RGB）
+
+    页面由状态栏、若干卡片和文字行组成，保证不同 seed 之间内容有差异。
+    """
+    rng = random.Random(seed)
+    image = Image.new('RGB', (width, height), (245, 245, 245))
+    draw = ImageDraw.Draw(image)
+    # 状态栏与标题栏
+    draw.rectangle([0, 0, width, height // 30], fill=(30, 30, 30))
+    draw.rectangle([0, height // 30, width, height // 12], fill=(rng.randint(0, 255), 120, 200))
+
+    y = height // 12 + 20
+    while y < height - 120:
+        card_height = rng.randint(height // 16, height // 6)
+        color = tuple(rng.randint(200, 255) for _ in range(3))
+        draw.rectangle([20, y, width - 20, y + card_height], fill=color, outline=(210, 210, 210), width=2)
+        # 卡片中的文字行
+        line_y = y + 15
+        while line_y < y + card_height - 20:
+            line_width = rng.randint(width // 4, width - 80)
+            draw.rectangle([40, line_y, 40 + line_width, line_y + 12], fill=(90, 90, 90))
+            line_y += 30
+        y += card_height + 20
+
+    # 底部导航栏
+    draw.rectangle([0, height - 100, width, height], fill=(255, 255, 255), outline=(200, 200, 200))
+    return image
+
+
+def add_popup_overlay(image, seed=0, scrim_alpha=140):
+    """在截图上叠加一个弹窗
+
+    返回:
+        (带弹窗的新图像, 弹窗信息)，弹窗信息包含 card（x1, y1, x2, y2）与 close_button（x, y）
+    """
+    rng = random.Random(seed)
+    width, height = image.size
+    base = image.convert('RGBA')
+    scrim = Image.new('RGBA', (width, height), (0, 0, 0, scrim_alpha))
+    composed = Image.alpha_composite(base, scrim)
+    draw = ImageDraw.Draw(composed)
+
+    card_width = int(width * rng.uniform(0.6, 0.85))
+    card_height = int(height * rng.uniform(0.25, 0.45))
+    x1 = (width - card_width) // 2
+    y1 = (height - card_height) // 2
+    x2, y2 = x1 + card_width, y1 + card_height
+    draw.rounded_rectangle([x1, y1, x2, y2], radius=max(8, width // 40), fill=(255, 255, 255, 255))
+
+    # 卡片内的标题与正文
+    draw.rectangle([x1 + 40, y1 + 40, x2 - 120, y1 + 70], fill=(40, 40, 40, 255))
+    for i in range(3):
+        line_y = y1 + 110 + i * 40
+        if line_y < y2 - 140:
+            draw.rectangle([x1 + 40, line_y, x2 - 40 - rng.randint(0, 80), line_y + 16], fill=(110, 110, 110, 255))
+
+    # 主按钮
+    draw.rounded_rectangle([x1 + 40, y2 - 110, x2 - 40, y2 - 40], radius=30, fill=(255, 90, 60, 255))
+
+    # 右上角关闭按钮 "X"
+    size = max(24, width // 25)
+    cx, cy = x2 - size - 10, y1 + size + 10
+    draw.ellipse([cx - size, cy - size, cx + size, cy + size], fill=(220, 220, 220, 255))
+    offset = size // 2
+    draw.line([cx - offset, cy - offset, cx + offset, cy + offset], fill=(80, 80, 80, 255), width=4)
+    draw.line([cx - offset, cy + offset, cx + offset, cy - offset], fill=(80, 80, 80, 255), width=4)
+
+    info = {
+        'card': (x1, y1, x2, y2),
+        'close_button': (cx, cy),
+        'close_bounds': (cx - size, cy - size, cx + size, cy + size),
+        'primary_bounds': (x1 + 40, y2 - 110, x2 - 40, y2 - 40),
+    }
+    return composed.convert('RGB'), info
+
+
+def _bounds(x1, y1, x2, y2):
+    return f"[{int(x1)},{int(y1)}][{int(x2)},{int(y2)}]"
+
+
+def make_hierarchy_xml(width, height, node_count=60, clickable_count=8, popup=None, seed=0,
+                       package='com.example.app'):
+    """生成 uiautomator dump 格式的 XML
+
+    参数:
+        node_count: 页面节点总数（不含弹窗节点）
+        clickable_count: 页面中可点击元素数量
+        popup: add_popup_overlay 返回的弹窗信息，传入时在末尾追加弹窗子树
+    """
+    rng = random.Random(seed)
+    clickable_ids = set(rng.sample(range(node_count), min(clickable_count, node_count)))
+    lines = ["<?xml version='1.0' encoding='UTF-8' standalone='yes' ?>",
+             f'<hierarchy index="0" class="hierarchy" rotation="0" width="{width}" height="{height}">',
+             f'<node index="0" text="" resource-id="" class="android.widget.FrameLayout" package="{package}" '
+             f'content-desc="" clickable="false" bounds="{_bounds(0, 0, width, height)}">']
+    # 节点较多时按行高循环排布，保证每个节点都有可绘制的边框
+    row_height = max(40, (height - 200) // max(1, node_count))
+    rows = max(1, (height - 200) // row_height)
+    for i in range(node_count):
+        y1 = 100 + (i % rows) * row_height
+        x1 = 20 + (i % 3) * 10
+        clickable = 'true' if i in clickable_ids else 'false'
+        node_class = 'android.widget.Button' if i in clickable_ids else 'android.widget.TextView'
+        lines.append(
+            f'<node index="{i}" text="item {i}" resource-id="{package}:id/item_{i}" class="{node_class}" '
+            f'package="{package}" content-desc="" clickable="{clickable}" '
+            f'bounds="{_bounds(x1, y1, width - x1, y1 + row_height - 2)}" />')
+    lines.append('</node>')
+
+    if popup is not None:
+        x1, y1, x2, y2 = popup['card']
+        lines.append(
+            f'<node index="1" text="" resource-id="" class="android.widget.FrameLayout" package="{package}" '
+            f'content-desc="" clickable="false" bounds="{_bounds(0, 0, width, height)}">')
+        lines.append(
+            f'<node index="0" text="" resource-id="{package}:id/dialog_root" class="android.widget.LinearLayout" '
+            f'package="{package}" content-desc="" clickable="false" bounds="{_bounds(x1, y1, x2, y2)}">')
+        lines.append(
+            f'<node index="0" text="限时福利" resource-id="{package}:id/dialog_title" class="android.widget.TextView" '
+            f'package="{package}" content-desc="" clickable="false" bounds="{_bounds(x1 + 40, y1 + 40, x2 - 120, y1 + 70)}" />')
+        lines.append(
+            f'<node index="1" text="立即领取" resource-id="{package}:id/dialog_confirm" class="android.widget.Button" '
+            f'package="{package}" content-desc="" clickable="true" bounds="{_bounds(*popup["primary_bounds"])}" />')
+        lines.append(
+            f'<node index="2" text="" resource-id="{package}:id/iv_close" class="android.widget.ImageView" '
+            f'package="{package}" content-desc="关闭" clickable="true" bounds="{_bounds(*popup["close_bounds"])}" />')
+        lines.append('</node>')
+        lines.append('</node>')
+    lines.append('</hierarchy>')
+    return '\n'.join(lines)
+
+
+def make_template_library(template_dir, count, width=1080, height=1920, seed=0):
+    """生成 count 个前景图模版（与 lvm_analysis 中的阈值前景图一致的二值图像）
+
+    返回:
+        生成的模版文件名列表
+    """
+    os.makedirs(template_dir, exist_ok=True)
+    names = []
+    for i in range(count):
+        screen, _ = add_popup_overlay(make_screen(width, height, seed=seed + i), seed=seed + i)
+        foreground = screen.convert('L').point(lambda p: p > 128 and 255)
+        # 模版取弹窗所在的中间区域，尺寸小于截图
+        crop = foreground.crop((width // 8, height // 4, width * 7 // 8, height * 3 // 4))
+        name = f'bench_template_{i:04d}.jpeg'
+        crop.save(os.path.join(template_dir, name), format='JPEG', quality=85)
+        names.append(name)
+    return names
@@ -0,0 +1,205 @@
+"""
+本地视觉模型桩服务（兼容 OpenAI chat-completions 接口）
+
+模块职责：
+- 模拟硅基流动 /v1/chat/completions 接口，返回弹窗 / 非弹窗 JSON
+- 按对数正态分布模拟模型耗时
+- 按比例返回 20012、50505 与速率限制错误，或按 RPM 真实限流
+- 请求 stream=true 时以 SSE 分段返回回答，每段间隔 stream_chunk_ms
+
+用法:
+    python -m source.benchmark.vision_stub --port 8001 --popup-rate 0.7 --latency-ms 2500
+    然后将 VISION_MODEL_API_URL 设置为 http://127.0.0.1:8001/v1/chat/completions
+"""
+import argparse
+import json
+import math
+import random
+import re
+import threading
+import time
+import uuid
+
+from flask import Flask, Response, request, jsonify
+
+__all__ = ['StubConfig', 'create_app', 'main']
+
+
+class StubConfig:
+    """桩服务的行为配置"""
+
+    def __init__(self, popup_rate=0.7, latency_ms=2500.0, latency_sigma=0.5, error_20012_rate=0.0,
+                 error_50505_rate=0.0, rate_limit_rate=0.0, rate_limit_rpm=0, fenced=False, button_ids=(1,),
+                 stream_chunk_ms=0.0, seed=None):
+        self.popup_rate = popup_rate
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_20012_rate = error_20012_rate
+        self.error_50505_rate = error_50505_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.rate_limit_rpm = rate_limit_rpm
+        self.fenced = fenced
+        # XML 方案中可作为关闭按钮返回的数字标记，需与截图上实际绘制的标记一致
+        self.button_ids = list(button_ids)
+        self.stream_chunk_ms = stream_chunk_ms
+        self.random = random.Random(seed)
+
+
+class _RpmLimiter:
+    """滑动一分钟窗口的请求数限制，模拟服务端的真实限流"""
+
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self.timestamps = []
+        self.lock = threading.Lock()
+
+    def allow(self):
+        if self.rpm <= 0:
+            return True
+        now = time.monotonic()
+        with self.lock:
+            self.timestamps = [t for t in self.timestamps if now - t < 60]
+            if len(self.timestamps) >= self.rpm:
+                return False
+            self.timestamps.append(now)
+            return True
+
+
+def _sample_latency(config):
+    """对数正态分布的耗时（秒），中位数为 latency_ms"""
+    if config.latency_ms <= 0:
+        return 0.0
+    mu = math.log(config.latency_ms / 1000)
+    return config.random.lognormvariate(mu, config.latency_sigma)
+
+
+def _prompt_and_image(payload):
+    text, image_chars = '', 0
+    for message in payload.get('messages', []):
+        content = message.get('content')
+        if isinstance(content, str):
+            text += content
+            continue
+        for part in content or []:
+            if part.get('type') == 'text':
+                text += part.get('text', '')
+            elif part.get('type') == 'image_url':
+                image_chars += len(part.get('image_url', {}).get('url', ''))
+    return text, image_chars
+
+
+def build_answer(config, prompt_text):
+    """根据提示词的方案（XML 数字标记 / 分辨率坐标）生成模型回答"""
+    popup = config.random.random() < config.popup_rate
+    if 'button_coordinates' in prompt_text:
+        width, height = 1080, 1920
+        match = re.search(r'分辨率为\s*\(?\s*(\d+)\s*,\s*(\d+)', prompt_text)
+        if match:
+            width, height = int(match.group(1)), int(match.group(2))
+        if popup:
+            answer = {'popup_exists': True,
+                      'button_coordinates': {'x': config.random.randint(width // 10, width * 9 // 10),
+                                             'y': config.random.randint(height // 10, height * 9 // 10)}}
+        else:
+            answer = {'popup_exists': False, 'button_coordinates': None}
+    else:
+        button_id = config.random.choice(config.button_ids) if popup else None
+        answer = {'popup_exists': popup, 'popup_cancel_button': button_id}
+    content = json.dumps(answer, ensure_ascii=False, indent=2)
+    if config.fenced:
+        content = f"```json\n{content}\n```\n以上为分析结果。"
+    return content
+
+
+def _stream_answer(config, completion_id, model, content, usage):
+    """按 SSE 分段输出回答，每段若干字符，最后输出用量与 [DONE]"""
+    def event(delta, finish_reason=None, **extra):
+        chunk = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                 'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}], **extra}
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+
+    yield event({'role': 'assistant', 'content': ''})
+    for start in range(0, len(content), 8):
+        if config.stream_chunk_ms > 0:
+            time.sleep(config.stream_chunk_ms / 1000)
+        yield event({'content': content[start:start + 8]})
+    yield event({}, 'stop', usage=usage)
+    yield "data: [DONE]\n\n"
+
+
+def create_app(config):
+    app = Flask(__name__)
+    limiter = _RpmLimiter(config.rate_limit_rpm)
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        payload = request.get_json(force=True, silent=True) or {}
+        time.sleep(_sample_latency(config))
+
+        roll = config.random.random()
+        if roll < config.error_20012_rate:
+            return jsonify({'code': 20012, 'message': 'Model does not exist. Please check it carefully.',
+                            'data': None}), 400
+        roll -= config.error_20012_rate
+        if roll < config.error_50505_rate:
+            return jsonify({'code': 50505, 'message': 'Model service overloaded. Please try again later.',
+                            'data': None}), 503
+        roll -= config.error_50505_rate
+        if roll < config.rate_limit_rate or not limiter.allow():
+            return jsonify({'code': 50603, 'message': 'Request was rejected due to rate limiting.',
+                            'data': None}), 429
+
+        prompt_text, image_chars = _prompt_and_image(payload)
+        content = build_answer(config, prompt_text)
+        # 粗略估算：base64 图片约 1000 字符计 1 个 token，另加文本长度
+        prompt_tokens = image_chars // 1000 + len(prompt_text) // 2
+        completion_tokens = max(1, len(content) // 2)
+        usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                 'total_tokens': prompt_tokens + completion_tokens}
+        if payload.get('stream'):
+            return Response(_stream_answer(config, uuid.uuid4().hex, payload.get('model', 'stub'), content, usage),
+                            mimetype='text/event-stream')
+        return jsonify({
+            'id': uuid.uuid4().hex,
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'stub'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                         'finish_reason': 'stop'}],
+            'usage': usage,
+        })
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='本地视觉模型桩服务（OpenAI chat-completions 兼容）')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--popup-rate', type=float, default=0.7, help='返回存在弹窗的比例')
+    parser.add_argument('--latency-ms', type=float, default=2500, help='模型耗时中位数（毫秒），0 为不延迟')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='对数正态分布的 sigma，越大长尾越明显')
+    parser.add_argument('--error-20012-rate', type=float, default=0.0, help='返回 20012 错误的比例')
+    parser.add_argument('--error-50505-rate', type=float, default=0.0, help='返回 50505 服务过载的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='随机返回速率限制错误的比例')
+    parser.add_argument('--rate-limit-rpm', type=int, default=0, help='每分钟请求上限，超过后返回速率限制错误')
+    parser.add_argument('--button-ids', default='1',
+                        help='XML 方案返回的数字标记候选（逗号分隔），应为截图上存在的标记')
+    parser.add_argument('--fenced', action='store_true', help='用 ```json 代码块包裹回答并追加多余文本')
+    parser.add_argument('--stream-chunk-ms', type=float, default=0.0, help='流式返回时每段（8 个字符）的间隔（毫秒）')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = StubConfig(popup_rate=args.popup_rate, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+                        error_20012_rate=args.error_20012_rate, error_50505_rate=args.error_50505_rate,
+                        rate_limit_rate=args.rate_limit_rate, rate_limit_rpm=args.rate_limit_rpm,
+                        fenced=args.fenced, button_ids=[int(item) for item in args.button_ids.split(',')],
+                        stream_chunk_ms=args.stream_chunk_ms, seed=args.seed)
+    create_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,239 @@
+"""
+多设备巡检模块
+
+模块职责：
+- 通过 adb server 发现所有已连接的设备，设备上下线时自动增减巡检任务
+- 每台设备一个 asyncio 协程：定时截图 → 诊断（进程内或调用诊断接口）→ 点击关闭按钮
+- 截图与诊断分别用信号量限制并发（asyncio.Semaphore 按等待先后放行，设备之间公平轮转），
+  设备数量增加不会增加线程数；诊断与图片编码在固定大小的线程池中执行
+- 连续失败的设备按指数退避，不影响其他设备
+- 定期输出每台设备的巡检周期耗时（采集、诊断、整轮）
+"""
+import asyncio
+import base64
+import io
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from source.tools.capture import AsyncAdbClient, parse_raw_screencap
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['DeviceStats', 'FleetRunner']
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))], 1)
+
+
+class DeviceStats:
+    """单台设备的巡检统计，耗时只保留最近 window 轮"""
+
+    def __init__(self, window=200):
+        self.loops = 0
+        self.taps = 0
+        self.errors = 0
+        self.last_error = None
+        self.capture_ms = deque(maxlen=window)
+        self.diagnose_ms = deque(maxlen=window)
+        self.loop_ms = deque(maxlen=window)
+
+    def summary(self):
+        return {
+            'loops': self.loops,
+            'taps': self.taps,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'capture_p50_ms': _percentile(self.capture_ms, 50),
+            'diagnose_p50_ms': _percentile(self.diagnose_ms, 50),
+            'loop_p50_ms': _percentile(self.loop_ms, 50),
+            'loop_p95_ms': _percentile(self.loop_ms, 95),
+        }
+
+
+class FleetRunner:
+    """多设备并发巡检
+
+    参数:
+        mode: local 为进程内调用 lvm_analysis，api 为调用诊断接口
+        interval: 每台设备两轮巡检开始之间的最小间隔（秒）
+        capture_concurrency: 同时截图的设备数上限
+        diagnose_concurrency: 同时诊断的设备数上限（也是线程池大小的主要部分）
+        devices: 只巡检指定的设备，默认巡检全部已连接设备
+        dry_run: 只诊断不点击
+    """
+
+    # 连续失败时的最大退避（秒）
+    MAX_BACKOFF = 60
+    # 重新发现设备的间隔（秒）
+    DISCOVER_INTERVAL = 30
+
+    def __init__(self, mode=None, api_url=None, interval=None, capture_concurrency=None, diagnose_concurrency=None,
+                 devices=None, dry_run=False, client=None):
+        settings = get_settings()
+        self.mode = mode or settings.fleet_mode
+        if self.mode not in ('local', 'api'):
+            raise ValueError(f"未知的诊断方式: {self.mode}，可选 local / api")
+        self.api_url = api_url or settings.fleet_api_url
+        self.interval = interval if interval is not None else settings.fleet_interval_seconds
+        self.capture_concurrency = capture_concurrency or settings.fleet_capture_concurrency
+        self.diagnose_concurrency = diagnose_concurrency or settings.fleet_diagnose_concurrency
+        self.devices = devices
+        self.dry_run = dry_run
+        self.client = client or AsyncAdbClient()
+        self.stats = {}
+        self._tasks = {}
+        self._local = threading.local()
+        self._executor = None
+        self._capture_slots = None
+        self._diagnose_slots = None
+
+    async def run(self, duration=None, report_interval=60):
+        """巡检直到 duration 秒后（None 为一直运行），返回各设备统计"""
+        self._executor = ThreadPoolExecutor(max_workers=self.capture_concurrency + self.diagnose_concurrency,
+                                            thread_name_prefix='fleet')
+        self._capture_slots = asyncio.Semaphore(self.capture_concurrency)
+        self._diagnose_slots = asyncio.Semaphore(self.diagnose_concurrency)
+        deadline = None if duration is None else time.monotonic() + duration
+        next_report = time.monotonic() + report_interval
+        try:
+            while deadline is None or time.monotonic() < deadline:
+                await self._discover()
+                wait = self.DISCOVER_INTERVAL if deadline is None else min(self.DISCOVER_INTERVAL,
+                                                                           deadline - time.monotonic())
+                await asyncio.sleep(max(0.0, wait))
+                if time.monotonic() >= next_report:
+                    self.log_report()
+                    next_report = time.monotonic() + report_interval
+        finally:
+            for task in self._tasks.values():
+                task.cancel()
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+            self._tasks.clear()
+            self._executor.shutdown(wait=True)
+        return self.report()
+
+    async def _discover(self):
+        try:
+            attached = await self.client.devices()
+        except Exception as e:
+            logger.error(f"获取设备列表失败: {e}")
+            return
+        if self.devices:
+            attached = [serial for serial in attached if serial in self.devices]
+        for serial in attached:
+            task = self._tasks.get(serial)
+            if task is None or task.done():
+                logger.info(f"开始巡检设备 {serial}")
+                self.stats.setdefault(serial, DeviceStats())
+                self._tasks[serial] = asyncio.create_task(self._device_loop(serial), name=f'fleet:{serial}')
+        for serial in list(self._tasks):
+            if serial not in attached:
+                logger.info(f"设备 {serial} 已断开，停止巡检")
+                self._tasks.pop(serial).cancel()
+
+    async def _device_loop(self, serial):
+        stats = self.stats[serial]
+        failures = 0
+        # 错开各设备的首轮，避免同时截图
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            start = time.perf_counter()
+            try:
+                await self.inspect_once(serial, stats)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                stats.errors += 1
+                stats.last_error = str(e)
+                logger.error(f"设备 {serial} 巡检失败（连续 {failures} 次）: {e}")
+            elapsed = time.perf_counter() - start
+            stats.loops += 1
+            stats.loop_ms.append(elapsed * 1000)
+            delay = self.interval - elapsed
+            if failures:
+                delay = max(delay, min(self.MAX_BACKOFF, self.interval * 2 ** failures))
+            await asyncio.sleep(max(0.0, delay))
+
+    async def inspect_once(self, serial, stats):
+        """一轮巡检：截图、诊断，诊断为弹窗时点击关闭"""
+        loop = asyncio.get_running_loop()
+        async with self._capture_slots:
+            start = time.perf_counter()
+            data, width, height = await self.client.screenshot(serial)
+            jpeg = await loop.run_in_executor(self._executor, self._encode, data)
+            stats.capture_ms.append((time.perf_counter() - start) * 1000)
+        async with self._diagnose_slots:
+            start = time.perf_counter()
+            center = await loop.run_in_executor(self._executor, self.diagnose, serial, jpeg, f'({width}, {height})')
+            stats.diagnose_ms.append((time.perf_counter() - start) * 1000)
+        if center is None:
+            return None
+        x, y = center
+        logger.info(f"设备 {serial} 检测到弹窗，点击坐标 ({x}, {y})")
+        if not self.dry_run:
+            await self.client.tap(serial, x, y)
+            if self.mode == 'api':
+                # 通知接口画面已变化，使该设备的画面缓存失效
+                await loop.run_in_executor(self._executor, self.feedback, serial)
+        stats.taps += 1
+        return center
+
+    @staticmethod
+    def _encode(data):
+        buffer = io.BytesIO()
+        parse_raw_screencap(data).save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+    def diagnose(self, serial, screenshot_bytes, resolution):
+        """在线程池中执行，返回关闭按钮坐标 (x, y)，非弹窗返回 None"""
+        if self.mode == 'local':
+            from source.api.services import lvm_analysis
+
+            center_x, center_y, _ = lvm_analysis(screenshot_bytes, resolution, serial)
+            return None if center_x is None or center_y is None else (center_x, center_y)
+        response = self._session().post(self.api_url, json={
+            'screenshot': base64.b64encode(screenshot_bytes).decode('utf-8'),
+            'resolution': resolution,
+            'devices_name': serial,
+        }, timeout=120)
+        if response.status_code == 500 and '非弹窗' in response.text:
+            return None
+        if response.status_code != 200:
+            raise Exception(f"诊断接口返回 {response.status_code}: {response.text[:200]}")
+        return tuple(response.json()['center'])
+
+    def _session(self):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            import requests
+
+            session = self._local.session = requests.Session()
+        return session
+
+    def feedback(self, serial):
+        """点击执行后调用诊断接口的反馈接口，失败不影响巡检"""
+        url = self.api_url.rsplit('/', 1)[0] + '/feedback'
+        try:
+            self._session().post(url, json={'devices_name': serial, 'executed': True}, timeout=10)
+        except Exception as e:
+            logger.warning(f"设备 {serial} 点击反馈失败: {e}")
+
+    def report(self):
+        return {serial: stats.summary() for serial, stats in sorted(self.stats.items())}
+
+    def log_report(self):
+        for serial, summary in self.report().items():
+            logger.info(f"设备 {serial}: 巡检 {summary['loops']} 轮，点击 {summary['taps']} 次，失败 {summary['errors']} 次，"
+                        f"采集 p50 {summary['capture_p50_ms']}ms，诊断 p50 {summary['diagnose_p50_ms']}ms，"
+                        f"整轮 p50 {summary['loop_p50_ms']}ms / p95 {summary['loop_p95_ms']}ms")
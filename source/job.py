@@ -1,17 +1,105 @@
-# 定义清理旧截图的任务
+"""
+数据保留与维护模块
+
+模块职责：
+- 按保留天数与总大小配额清理截图、临时文件与模版目录（基于 os.scandir）
+- 模版文件被清理时同步删除对应的模版记录
+- 内容寻址的截图存储（ARTIFACT_DIR）按索引清理，不遍历目录
+- 分批删除过期的 elements 记录，定期 ANALYZE / VACUUM 数据库
+- 在进程内按计划执行上述任务（MaintenanceScheduler）
+"""
 import os
+import threading
 import time
 
-from dotenv import load_dotenv
+import schedule
 
 from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
 
 logger = setup_logger(__name__)
 # 获取当前脚本的绝对路径
 current_file_path = os.path.abspath(__file__)
 # 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
 project_root = os.path.dirname(os.path.dirname(current_file_path))
-load_dotenv()
+
+__all__ = ['iter_files', 'prune_directory', 'clean_old_screenshots', 'cleanup_old_screenshots', 'run_maintenance',
+           'MaintenanceScheduler']
+
+
+def iter_files(directory_path):
+    """递归遍历目录下的文件，返回 (路径, stat) 迭代器
+
+    使用 os.scandir，目录项类型无需额外系统调用，Windows 下 stat 结果也直接来自目录项。
+    """
+    stack = [directory_path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file(follow_symlinks=False):
+                            yield entry.path, entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        # 遍历过程中文件被其他线程删除
+                        continue
+        except FileNotFoundError:
+            continue
+
+
+def prune_directory(directory_path, max_age_days=0, max_total_mb=0):
+    """按保留天数与总大小配额清理目录
+
+    先删除超过保留天数的文件，若剩余文件总大小仍超过配额，再从最旧的文件开始删除。
+
+    参数:
+        directory_path: 需要清理的目录
+        max_age_days: 保留天数，0 表示不按时间清理
+        max_total_mb: 目录总大小上限（MB），0 表示不限制
+
+    返回:
+        (已删除的文件路径列表, 释放的字节数)
+    """
+    if not os.path.isdir(directory_path):
+        return [], 0
+    now = time.time()
+    kept, deleted, freed = [], [], 0
+
+    def remove(path, size):
+        nonlocal freed
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            logger.error(f"删除文件失败: {path}, {e}")
+            return
+        deleted.append(path)
+        freed += size
+
+    for path, stat in iter_files(directory_path):
+        if max_age_days and now - stat.st_mtime > max_age_days * 86400:  # 86400秒 = 1天
+            remove(path, stat.st_size)
+        else:
+            kept.append((stat.st_mtime, stat.st_size, path))
+
+    if max_total_mb:
+        limit = max_total_mb * 1024 * 1024
+        total = sum(size for _, size, _ in kept)
+        if total > limit:
+            kept.sort()
+            for _, size, path in kept:
+                if total <= limit:
+                    break
+                remove(path, size)
+                total -= size
+
+    if deleted:
+        logger.info(f"清理目录 {directory_path}: 删除 {len(deleted)} 个文件，释放 {freed / 1024 / 1024:.1f}MB")
+    return deleted, freed
 
 
 def clean_old_screenshots(directory_path, days=3, do=False):
@@ -20,35 +108,139 @@ def clean_old_screenshots(directory_path, days=3, do=False):
     参数:
         directory_path: 截图保存路径
         days: 保留的天数，默认为3天
+        do: 为 True 时不论时间全部删除
     """
     try:
-        now = time.time()
-        for root, dirs, files in os.walk(directory_path):
-            for filename in files:
-                file_path = os.path.join(root, filename)
-                if os.path.isfile(file_path):
-                    # 获取文件的最后修改时间
-                    file_mtime = os.path.getmtime(file_path)
-                    # 如果文件超过指定天数，则删除
-                    if do:
-                        os.remove(file_path)
-                        logger.info(f"删除旧截图: {file_path}")
-                    elif do is False and now - file_mtime > days * 86400:  # 86400秒 = 1天
-                        os.remove(file_path)
-                        logger.info(f"删除旧截图: {file_path}")
+        if do:
+            for path, _ in list(iter_files(directory_path)):
+                os.remove(path)
+            logger.info(f"已清空目录: {directory_path}")
+        else:
+            prune_directory(directory_path, max_age_days=days)
     except Exception as e:
         logger.error(f"清理旧截图时发生错误: {str(e)}")
 
 
 def cleanup_old_screenshots():
-    tmp_dir = os.getenv('TMP_DIR')  # 截图保存路径
+    settings = get_settings()
+    tmp_dir = settings.tmp_dir  # 截图保存路径
     clean_old_screenshots(os.path.join(project_root, tmp_dir))
-    screenshot_dir = os.getenv('SCREENSHOT_DIR')  # 截图保存路径
+    screenshot_dir = settings.screenshot_dir  # 截图保存路径
     clean_old_screenshots(os.path.join(project_root, screenshot_dir))
 
 
+def _retention_policies():
+    """读取各目录的保留策略：(名称, 目录, 保留天数, 总大小上限 MB)"""
+    settings = get_settings()
+    return [
+        ('tmp', settings.tmp_dir, settings.tmp_retention_days, settings.tmp_max_mb),
+        ('screenshot', settings.screenshot_dir, settings.screenshot_retention_days, settings.screenshot_max_mb),
+        ('template', settings.template_dir, settings.template_retention_days, settings.template_max_mb),
+    ]
+
+
+def run_maintenance(vacuum=False):
+    """执行一次数据保留与数据库维护
+
+    参数:
+        vacuum: 是否整理数据库文件（耗时较长，建议在低峰期执行）
+    """
+    from source.services.recorder import Recorder
+
+    settings = get_settings()
+    start = time.perf_counter()
+    removed_templates = []
+    for name, directory, max_age_days, max_total_mb in _retention_policies():
+        if not directory:
+            continue
+        try:
+            deleted, _ = prune_directory(os.path.join(project_root, directory), max_age_days, max_total_mb)
+        except Exception as e:
+            logger.error(f"清理 {name} 目录时发生错误: {e}")
+            continue
+        if name == 'template':
+            removed_templates = [os.path.splitext(os.path.basename(path))[0] for path in deleted]
+
+    # 内容寻址的截图存储按索引清理，不遍历目录
+    from source.services.artifact_store import get_artifact_store
+
+    store = get_artifact_store()
+    if store is not None:
+        try:
+            store.prune(settings.screenshot_retention_days, settings.screenshot_max_mb)
+        except Exception as e:
+            logger.error(f"清理截图存储时发生错误: {e}")
+
+    recorder = Recorder()
+    try:
+        if removed_templates:
+            # 模版文件已删除，对应的坐标记录不会再被命中
+            recorder.delete_templates(removed_templates)
+            if settings.template_pack:
+                # 重建共享的模版打包文件，各工作进程下一次匹配时重新映射
+                from source.api.utils.template_pack import TemplatePack, pack_path_for
+
+                template_dir = os.path.join(project_root, settings.template_dir)
+                TemplatePack.build(pack_path_for(template_dir), template_dir)
+        retention_hours = settings.elements_retention_hours
+        deleted_rows = recorder.delete_stale_elements(int(retention_hours * 3600))
+        if settings.vision_cache_enabled:
+            from source.services.vision_cache import VisionCache
+
+            deleted_rows += VisionCache.shared().purge()
+        recorder.optimize(vacuum=vacuum)
+        logger.info(f"数据维护完成: 删除模版记录 {len(removed_templates)} 条，过期元素与缓存记录 {deleted_rows} 条，"
+                    f"{'已整理数据库，' if vacuum else ''}耗时 {(time.perf_counter() - start) * 1000:.0f}ms")
+    except Exception as e:
+        logger.error(f"数据库维护时发生错误: {e}")
+    finally:
+        recorder.close()
+
+
+class MaintenanceScheduler:
+    """进程内维护任务调度器
+
+    按 MAINTENANCE_INTERVAL_MINUTES 定期清理，并在每天 DB_VACUUM_AT 整理数据库。
+    启动后立即执行一次清理。
+    """
+
+    def __init__(self, interval_minutes=None, vacuum_at=None):
+        settings = get_settings()
+        self.interval_minutes = interval_minutes or settings.maintenance_interval_minutes
+        self.vacuum_at = vacuum_at or settings.db_vacuum_at
+        self.scheduler = schedule.Scheduler()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _safe_run(vacuum=False):
+        # 任务异常不能终止调度线程
+        try:
+            run_maintenance(vacuum=vacuum)
+        except Exception as e:
+            logger.error(f"维护任务执行失败: {e}")
+
+    def start(self):
+        if self._thread is not None:
+            return self
+        self.scheduler.every(self.interval_minutes).minutes.do(self._safe_run)
+        self.scheduler.every().day.at(self.vacuum_at).do(self._safe_run, vacuum=True)
+        self._thread = threading.Thread(target=self._run, name='maintenance', daemon=True)
+        self._thread.start()
+        logger.info(f"定时维护任务启动成功，每 {self.interval_minutes} 分钟清理一次，每天 {self.vacuum_at} 整理数据库")
+        return self
+
+    def _run(self):
+        self._safe_run()
+        while not self._stop.wait(1):
+            self.scheduler.run_pending()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
 if __name__ == '__main__':
-    tmp_dir_1 = os.getenv('TMP_DIR')  # 截图保存路径
-    clean_old_screenshots(os.path.join(project_root, tmp_dir_1), do=False)
-    screenshot_dir_1 = os.getenv('SCREENSHOT_DIR')  # 截图保存路径
-    clean_old_screenshots(os.path.join(project_root, screenshot_dir_1), do=False)
+    run_maintenance()
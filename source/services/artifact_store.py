@@ -0,0 +1,200 @@
+"""
+内容寻址的截图存储模块（替代按截图 ID 逐个写入 SCREENSHOT_DIR/<设备名> 的 JPEG 文件）
+
+模块职责：
+- 文件以内容的 SHA-1 命名，按哈希前两级分散到子目录（ARTIFACT_DIR/ab/cd/abcd….jpeg），单个目录的文件数有上限
+- 写入前检查同一内容是否已存在，相同画面只保存一份，已存在时不再写盘
+- DB_PATH 数据库的 artifact_index 表记录截图名（如 {截图ID}_marked_screenshot）→ 文件哈希
+- 清理按索引进行，不遍历目录：删除过期与超出总大小的索引记录，只删除不再被任何记录引用的文件
+- ARTIFACT_STORE_FORMAT=webp 时重新编码为 WebP 保存（体积更小，但需要额外一次编码）
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from io import BytesIO
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['ArtifactStore', 'get_artifact_store', 'resolve_screenshot']
+
+# 获取当前脚本的绝对路径
+current_file_path = os.path.abspath(__file__)
+# 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path)))
+
+
+class ArtifactStore:
+    """按内容哈希保存的截图文件与截图名索引，每个线程使用自己的数据库连接"""
+
+    def __init__(self, root_dir=None, db_path=None, image_format=None):
+        settings = get_settings()
+        self.root_dir = root_dir or os.path.join(project_root, settings.artifact_dir)
+        self.db_path = db_path or settings.db_path
+        self.image_format = (image_format or settings.artifact_store_format).lower()
+        self._local = threading.local()
+
+    @property
+    def conn(self):
+        # 连接不能跨线程与 fork 后的子进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS artifact_index (
+                    name TEXT PRIMARY KEY,
+                    digest TEXT NOT NULL,
+                    ext TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_artifact_index_digest ON artifact_index (digest)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_artifact_index_created_at ON artifact_index (created_at)')
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def blob_path(self, digest, ext):
+        return os.path.join(self.root_dir, digest[:2], digest[2:4], f'{digest}.{ext}')
+
+    def put(self, name, data, ext):
+        """保存文件内容并把截图名指向该内容，返回文件路径；相同内容已存在时不再写盘
+
+        先提交索引记录再写文件：清理只删除不再被引用的文件，记录提交后并发的清理不会再删除该内容；
+        写入后再检查一次文件，覆盖记录提交前已开始的清理恰好删除了该文件的情况。
+        """
+        digest = hashlib.sha1(data).hexdigest()
+        path = self.blob_path(digest, ext)
+        conn = self.conn
+        previous = conn.execute('SELECT digest, ext FROM artifact_index WHERE name = ?', (name,)).fetchone()
+        conn.execute('INSERT OR REPLACE INTO artifact_index (name, digest, ext, size, created_at) '
+                     'VALUES (?, ?, ?, ?, ?)', (name, digest, ext, len(data), time.time()))
+        conn.commit()
+        if os.path.exists(path):
+            metrics.increment('artifact_store', outcome='deduplicated')
+        else:
+            self._write(path, data)
+            metrics.increment('artifact_store', outcome='written')
+        if not os.path.exists(path):
+            logger.warning(f"截图文件在写入时被并发清理删除，重新写入: {path}")
+            self._write(path, data)
+        if previous is not None and previous[0] != digest:
+            # 同名截图被覆盖，原内容不再被引用时删除
+            self._remove_unreferenced({previous})
+        return path
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再改名，并发写入同一内容时读者不会看到写了一半的文件
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def put_image(self, name, image):
+        """保存截图，image 为 ImageArtifact 时直接使用其 JPEG 编码结果（WebP 格式除外）"""
+        from source.services.image_artifact import ImageArtifact
+
+        if self.image_format == 'webp':
+            source = image.image if isinstance(image, ImageArtifact) else image
+            byte_stream = BytesIO()
+            source.save(byte_stream, format='WEBP', quality=get_settings().image_jpeg_quality, method=0)
+            return self.put(name, byte_stream.getvalue(), 'webp')
+        if not isinstance(image, ImageArtifact):
+            image = ImageArtifact(image)
+        return self.put(name, image.jpeg(), 'jpeg')
+
+    def resolve(self, name):
+        """截图名对应的文件路径，没有记录或文件已被删除时返回 None"""
+        row = self.conn.execute('SELECT digest, ext FROM artifact_index WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            return None
+        path = self.blob_path(*row)
+        return path if os.path.exists(path) else None
+
+    def prune(self, max_age_days=0, max_total_mb=0):
+        """按保留天数与总大小配额清理，返回 (删除的文件数, 释放的字节数)
+
+        先删除超过保留天数的索引记录；文件总大小仍超过配额时，从最近一次引用最早的内容开始删除其全部记录。
+        只有不再被任何记录引用的文件才会被删除。
+        """
+        conn = self.conn
+        candidates = set()
+        if max_age_days:
+            cutoff = time.time() - max_age_days * 86400
+            candidates.update(conn.execute('SELECT DISTINCT digest, ext FROM artifact_index WHERE created_at < ?',
+                                           (cutoff,)).fetchall())
+            conn.execute('DELETE FROM artifact_index WHERE created_at < ?', (cutoff,))
+        if max_total_mb:
+            limit = max_total_mb * 1024 * 1024
+            blobs = conn.execute('SELECT digest, ext, MAX(size), MAX(created_at) FROM artifact_index '
+                                 'GROUP BY digest, ext ORDER BY MAX(created_at)').fetchall()
+            total = sum(size for _, _, size, _ in blobs)
+            for digest, ext, size, _ in blobs:
+                if total <= limit:
+                    break
+                conn.execute('DELETE FROM artifact_index WHERE digest = ?', (digest,))
+                candidates.add((digest, ext))
+                total -= size
+        conn.commit()
+
+        deleted, freed = self._remove_unreferenced(candidates)
+        if deleted:
+            logger.info(f"清理截图存储 {self.root_dir}: 删除 {deleted} 个文件，释放 {freed / 1024 / 1024:.1f}MB")
+        return deleted, freed
+
+    def _remove_unreferenced(self, candidates):
+        """删除不再被任何索引记录引用的文件，返回 (删除的文件数, 释放的字节数)"""
+        conn = self.conn
+        deleted, freed = 0, 0
+        for digest, ext in candidates:
+            if conn.execute('SELECT 1 FROM artifact_index WHERE digest = ? LIMIT 1', (digest,)).fetchone():
+                continue
+            path = self.blob_path(digest, ext)
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                logger.error(f"删除文件失败: {path}, {e}")
+                continue
+            deleted += 1
+            freed += size
+        return deleted, freed
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_artifact_store():
+    """进程内共享的截图存储，关闭（ARTIFACT_STORE_ENABLED=False）或未配置 DB_PATH 时返回 None"""
+    settings = get_settings()
+    if not settings.artifact_store_enabled or not settings.db_path or not settings.artifact_dir:
+        return None
+    key = (settings.db_path, settings.artifact_dir, settings.artifact_store_format)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ArtifactStore()
+    return store
+
+
+def resolve_screenshot(screenshot_dir, device_name, name):
+    """按截图名查找已保存的截图：先查内容寻址存储的索引，再查旧版本保存在 SCREENSHOT_DIR/<设备名> 下的 JPEG 文件"""
+    store = get_artifact_store()
+    if store is not None:
+        path = store.resolve(name)
+        if path is not None:
+            return path
+    path = os.path.join(screenshot_dir, device_name, f'{name}.jpeg') if screenshot_dir else None
+    return path if path is not None and os.path.exists(path) else None
@@ -0,0 +1,311 @@
+"""
+视觉模型调用账本模块
+
+模块职责：
+- 每次模型调用（含缓存命中）记录一行：模型、提示词方案、prompt / completion / 图片 token、耗时与结果
+- 每次诊断记录一行实际给出结果的路径（画面缓存 / XML 规则 / 模版 / 图标库 / 模型 / 失败等），
+  用于计算每次诊断的调用数与花费；只有真正调用了模型的诊断计入“每次模型诊断花费”
+- 记录先缓存在内存中，批量追加写入 DB_PATH 数据库的 vision_ledger 表（只追加，按保留天数清理）
+- summary 汇总最近一段时间的 token 速率、花费、每次诊断花费，以及按模型、按应用的明细
+
+说明：流式响应在回答完整后即关闭连接，拿不到服务商返回的 usage，此时按图片尺寸与文本长度估算，
+该行记为 estimated。图片 token 按 Qwen2.5-VL 每 28x28 像素 1 个 token 估算。
+"""
+import atexit
+import contextvars
+import math
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from source.utils import trace
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['CostLedger', 'get_ledger', 'ledger_context', 'estimate_image_tokens', 'diagnosis_answer',
+           'mark_answer', 'mark_model_call']
+
+_context = contextvars.ContextVar('smartdigger_ledger_context', default={})
+_answer = contextvars.ContextVar('smartdigger_diagnosis_answer', default=None)
+
+_COLUMNS = ('ts', 'kind', 'trace_id', 'app', 'device', 'model', 'prompt_variant', 'prompt_tokens',
+            'completion_tokens', 'image_tokens', 'latency_ms', 'outcome', 'estimated')
+_INSERT_SQL = f"INSERT INTO vision_ledger ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' * len(_COLUMNS))})"
+
+
+@contextmanager
+def ledger_context(**fields):
+    """为当前请求内的记录附加应用、设备等字段"""
+    token = _context.set({**_context.get(), **fields})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def diagnosis_answer():
+    """收集当前诊断实际给出结果的路径，诊断结束后通过返回对象的 outcome() 取得结果来源"""
+    answer = _DiagnosisAnswer()
+    token = _answer.set(answer)
+    try:
+        yield answer
+    finally:
+        _answer.reset(token)
+
+
+def mark_answer(source):
+    """诊断流程中给出结果（或确定没有结果）的路径调用，如 xml_rules / template / icon_locator / model"""
+    answer = _answer.get()
+    if answer is not None:
+        answer.source = source
+
+
+def mark_model_call():
+    """真正向模型服务发出请求时调用（结果缓存命中不算）"""
+    answer = _answer.get()
+    if answer is not None:
+        answer.model_called = True
+
+
+class _DiagnosisAnswer:
+    __slots__ = ('source', 'model_called')
+
+    def __init__(self):
+        self.source = None
+        self.model_called = False
+
+    def outcome(self):
+        """模型路径没有真正调用模型时（结果缓存命中）记为 vision_cache，没有任何路径给出结果时记为 no_answer"""
+        if self.source == 'model' and not self.model_called:
+            return 'vision_cache'
+        return self.source or 'no_answer'
+
+
+def estimate_image_tokens(width, height):
+    """按每 28x28 像素 1 个 token 估算图片 token 数"""
+    return math.ceil(width / 28) * math.ceil(height / 28)
+
+
+class CostLedger:
+    """只追加的调用账本，每个线程使用自己的数据库连接"""
+
+    # 缓存的记录达到该数量或距上次写入超过 FLUSH_SECONDS 时批量写入
+    FLUSH_EVERY = 50
+    FLUSH_SECONDS = 5
+    # 每写入多少批检查一次过期记录
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path=None, retention_days=None):
+        settings = get_settings()
+        self.db_path = db_path or settings.db_path
+        self.retention_days = retention_days if retention_days is not None else settings.vision_ledger_retention_days
+        self._local = threading.local()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._flushes = 0
+
+    @property
+    def conn(self):
+        # 连接不能跨线程与 fork 后的子进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS vision_ledger (
+                    ts REAL NOT NULL,
+                    kind TEXT NOT NULL,
+                    trace_id TEXT,
+                    app TEXT,
+                    device TEXT,
+                    model TEXT,
+                    prompt_variant TEXT,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    image_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency_ms REAL NOT NULL DEFAULT 0,
+                    outcome TEXT NOT NULL,
+                    estimated INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_vision_ledger_ts ON vision_ledger (ts)')
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _append(self, kind, model='', prompt_variant='', prompt_tokens=0, completion_tokens=0, image_tokens=0,
+                latency_ms=0.0, outcome='ok', estimated=False):
+        context = _context.get()
+        row = (time.time(), kind, trace.get_trace_id(), context.get('app', 'unknown'), context.get('device', ''),
+               model, prompt_variant, int(prompt_tokens or 0), int(completion_tokens or 0), int(image_tokens or 0),
+               round(latency_ms, 1), outcome, int(estimated))
+        with self._lock:
+            self._pending.append(row)
+            due = len(self._pending) >= self.FLUSH_EVERY or time.monotonic() - self._flushed_at >= self.FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def record_call(self, model, prompt_variant, prompt_tokens, completion_tokens, image_tokens, latency_ms,
+                    outcome, estimated=False):
+        """记录一次模型调用，outcome 为 ok / cache / http_<状态码> / error"""
+        self._append('call', model, prompt_variant, prompt_tokens, completion_tokens, image_tokens, latency_ms,
+                     outcome, estimated)
+
+    def record_diagnosis(self, outcome, latency_ms=0.0):
+        """记录一次诊断的结果来源：frame_cache / xml_rules / xml_fingerprint / template / popup_detector /
+        popup_classifier / icon_locator / model / vision_cache / no_answer / error"""
+        self._append('diagnosis', latency_ms=latency_ms, outcome=outcome)
+
+    def flush(self):
+        with self._lock:
+            rows, self._pending = self._pending, []
+            self._flushed_at = time.monotonic()
+        if not rows:
+            return
+        # 账本不可用时不影响诊断
+        try:
+            conn = self.conn
+            conn.executemany(_INSERT_SQL, rows)
+            conn.commit()
+            self._flushes += 1
+            if self._flushes % self.PURGE_EVERY == 0:
+                self.purge()
+        except Exception as e:
+            logger.warning(f"写入调用账本失败，丢弃 {len(rows)} 条记录: {e}")
+
+    def purge(self):
+        """删除超过保留天数的记录，返回删除的条数"""
+        if not self.retention_days:
+            return 0
+        conn = self.conn
+        deleted = conn.execute('DELETE FROM vision_ledger WHERE ts < ?',
+                               (time.time() - self.retention_days * 86400,)).rowcount
+        conn.commit()
+        return deleted
+
+    def summary(self, window_seconds=3600):
+        """最近 window_seconds 秒的汇总：token 速率、花费、每次诊断花费，以及按模型、按应用的明细"""
+        self.flush()
+        since = time.time() - window_seconds
+        calls = self.conn.execute('''
+            SELECT app, model, outcome, COUNT(*), SUM(prompt_tokens), SUM(completion_tokens), SUM(image_tokens),
+                   SUM(latency_ms), SUM(estimated), MIN(ts)
+            FROM vision_ledger WHERE kind = 'call' AND ts >= ? GROUP BY app, model, outcome
+        ''', (since,)).fetchall()
+        diagnoses = self.conn.execute('''
+            SELECT app, outcome, COUNT(*), MIN(ts) FROM vision_ledger
+            WHERE kind = 'diagnosis' AND ts >= ? GROUP BY app, outcome
+        ''', (since,)).fetchall()
+
+        total = _Totals()
+        by_model, by_app, by_outcome = {}, {}, {}
+        first_ts = min([row[-1] for row in calls + diagnoses], default=None)
+        for app, model, outcome, count, prompt_tokens, completion_tokens, image_tokens, latency_ms, estimated, _ \
+                in calls:
+            # 缓存命中不消耗 token，不计入调用次数
+            requests = 0 if outcome == 'cache' else count
+            cost = self._cost(model, prompt_tokens + completion_tokens)
+            for totals in (total, by_model.setdefault(model, _Totals()), by_app.setdefault(app, _Totals())):
+                totals.add_calls(requests, prompt_tokens, completion_tokens, image_tokens, latency_ms, estimated, cost)
+                if outcome == 'cache':
+                    totals.cache_hits += count
+        for app, outcome, count, _ in diagnoses:
+            by_outcome[outcome] = by_outcome.get(outcome, 0) + count
+            for totals in (total, by_app.setdefault(app, _Totals())):
+                totals.diagnoses += count
+                if outcome == 'model':
+                    totals.model_diagnoses += count
+
+        elapsed = min(window_seconds, time.time() - first_ts) if first_ts is not None else 0
+        report = total.as_dict()
+        report.update({
+            'window_seconds': window_seconds,
+            'tokens_per_second': round(total.tokens / elapsed, 2) if elapsed > 0 else 0,
+            'by_outcome': by_outcome,
+            'by_model': {model: totals.as_dict() for model, totals in sorted(by_model.items())},
+            'by_app': {app: totals.as_dict() for app, totals in sorted(by_app.items())},
+        })
+        return report
+
+    @staticmethod
+    def _cost(model, tokens):
+        settings = get_settings()
+        price = settings.vision_model_prices.get(model, settings.vision_price_per_million_tokens)
+        return tokens * price / 1_000_000
+
+
+class _Totals:
+    __slots__ = ('calls', 'cache_hits', 'diagnoses', 'model_diagnoses', 'prompt_tokens', 'completion_tokens',
+                 'image_tokens', 'latency_ms', 'estimated', 'cost')
+
+    def __init__(self):
+        self.calls = self.cache_hits = self.diagnoses = self.model_diagnoses = 0
+        self.prompt_tokens = self.completion_tokens = self.image_tokens = self.estimated = 0
+        self.latency_ms = self.cost = 0.0
+
+    @property
+    def tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def add_calls(self, calls, prompt_tokens, completion_tokens, image_tokens, latency_ms, estimated, cost):
+        self.calls += calls
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.image_tokens += image_tokens
+        self.latency_ms += latency_ms if calls else 0
+        self.estimated += estimated
+        self.cost += cost
+
+    def as_dict(self):
+        result = {
+            'calls': self.calls,
+            'cache_hits': self.cache_hits,
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'image_tokens': self.image_tokens,
+            'total_tokens': self.tokens,
+            'estimated_calls': self.estimated,
+            'avg_latency_ms': round(self.latency_ms / self.calls, 1) if self.calls else None,
+            'cost': round(self.cost, 6),
+        }
+        if self.diagnoses:
+            result.update({
+                'diagnoses': self.diagnoses,
+                'calls_per_diagnosis': round(self.calls / self.diagnoses, 4),
+                'cost_per_diagnosis': round(self.cost / self.diagnoses, 6),
+            })
+        if self.model_diagnoses:
+            # 模型花费只分摊到真正调用了模型的诊断上
+            result.update({
+                'model_diagnoses': self.model_diagnoses,
+                'cost_per_model_diagnosis': round(self.cost / self.model_diagnoses, 6),
+            })
+        return result
+
+
+_ledgers = {}
+_ledgers_lock = threading.Lock()
+
+
+def get_ledger():
+    """进程内按数据库路径共享的账本，未配置 DB_PATH 或关闭账本时返回 None"""
+    settings = get_settings()
+    if not settings.vision_ledger_enabled or not settings.db_path:
+        return None
+    with _ledgers_lock:
+        ledger = _ledgers.get(settings.db_path)
+        if ledger is None:
+            ledger = _ledgers[settings.db_path] = CostLedger(settings.db_path)
+    return ledger
+
+
+@atexit.register
+def _flush_all():
+    for ledger in list(_ledgers.values()):
+        ledger.flush()
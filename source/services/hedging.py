@@ -0,0 +1,120 @@
+"""
+对冲请求模块
+
+模块职责：
+- 主请求在延迟阈值（近期耗时的高百分位）内没有返回时，再发一个相同或备用的对冲请求，取先返回的成功结果
+- 对冲次数受比例上限约束（令牌桶：每个请求积累 max_rate 个令牌，对冲消耗 1 个），控制额外花费
+- 记录对冲率与对冲胜出率，见 /api/v1/metrics
+
+说明：requests 的同步调用无法中途中断，落败的请求只是被放弃（结果丢弃，不写缓存），
+其线程在请求超时前结束，线程池大小有上限。
+"""
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+__all__ = ['HedgeBudget', 'hedged_call', 'hedge_stats']
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+    return _executor
+
+
+class HedgeBudget:
+    """对冲比例上限：长期来看对冲次数不超过请求数的 max_rate，burst 为允许的突发次数"""
+
+    def __init__(self, max_rate, burst=2.0):
+        self.max_rate = max_rate
+        self.burst = burst
+        # 启动后第一个慢请求即可对冲
+        self._tokens = min(1.0, burst)
+        self._lock = threading.Lock()
+
+    def record_request(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+def hedged_call(primary, hedge, delay_seconds, budget, is_success, name='vision'):
+    """执行主请求，超过 delay_seconds 仍未返回时发出对冲请求
+
+    参数:
+        primary / hedge: 无参调用，返回结果或抛出异常
+        delay_seconds: 对冲延迟，None 表示不对冲
+        budget: HedgeBudget
+        is_success: is_success(结果) 为 True 时采用该结果
+
+    返回:
+        (结果, 'primary' 或 'hedge')；两个请求都失败时返回最后一个失败结果或抛出最后一个异常
+    """
+    budget.record_request()
+    metrics.increment(f'{name}_hedge', outcome='request')
+    executor = _get_executor()
+    # 在线程池中沿用调用方的上下文（trace span、账本的应用与设备字段）
+    pending = {executor.submit(contextvars.copy_context().run, primary): 'primary'}
+    hedged = False
+    if delay_seconds is not None:
+        done, _ = wait(pending, timeout=delay_seconds)
+        if not done:
+            if budget.try_spend():
+                metrics.increment(f'{name}_hedge', outcome='sent')
+                logger.info(f"主请求 {delay_seconds * 1000:.0f}ms 内未返回，发出对冲请求")
+                pending[executor.submit(contextvars.copy_context().run, hedge)] = 'hedge'
+                hedged = True
+            else:
+                metrics.increment(f'{name}_hedge', outcome='skipped_rate')
+
+    last_result, last_source, last_error = None, None, None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            source = pending.pop(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                last_error = e
+                continue
+            if is_success(result):
+                for other in pending:
+                    # 未开始的直接取消，已在进行的结果被丢弃
+                    other.cancel()
+                if hedged:
+                    metrics.increment(f'{name}_hedge_win', winner=source)
+                return result, source
+            last_result, last_source = result, source
+    if last_result is not None:
+        return last_result, last_source
+    raise last_error
+
+
+def hedge_stats(name='vision'):
+    """对冲率（对冲次数 / 请求数）与对冲胜出率（对冲先返回的次数 / 对冲次数）"""
+    requests_count = metrics.counter(f'{name}_hedge', outcome='request')
+    sent = metrics.counter(f'{name}_hedge', outcome='sent')
+    hedge_wins = metrics.counter(f'{name}_hedge_win', winner='hedge')
+    return {
+        'requests': requests_count,
+        'hedges': sent,
+        'skipped_rate_limit': metrics.counter(f'{name}_hedge', outcome='skipped_rate'),
+        'hedge_rate': round(sent / requests_count, 4) if requests_count else 0,
+        'hedge_win_rate': round(hedge_wins / sent, 4) if sent else 0,
+    }
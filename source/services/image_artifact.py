@@ -0,0 +1,64 @@
+"""
+图像编码复用模块（单次诊断内同一张图像只编码一次）
+
+模块职责：
+- 包装一次诊断中的截图（XML 方案的标记截图、分辨率方案的灰度截图），首次需要时编码为 JPEG 字节并保留
+- 发送给视觉模型的 base64 与保存到 SCREENSHOT_DIR 的文件使用同一份 JPEG 字节，base64 只在调用模型时才计算
+- 每次编码的 CPU 耗时计入 /api/v1/metrics 的 image_encode_cpu_ms
+"""
+import os
+import threading
+import time
+from base64 import b64encode
+from io import BytesIO
+
+from source.utils import trace
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+__all__ = ['ImageArtifact']
+
+
+class ImageArtifact:
+    """一张图像及其按需生成、只生成一次的 JPEG 字节与 base64 字符串，可在请求线程与保存线程间共享"""
+
+    def __init__(self, image, quality=None):
+        self.image = image
+        self.quality = quality if quality is not None else get_settings().image_jpeg_quality
+        self.encode_cpu_ms = 0.0
+        self._jpeg = None
+        self._base64 = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self):
+        return self.image.size
+
+    def jpeg(self):
+        """返回 JPEG 字节，首次调用时编码"""
+        with self._lock:
+            if self._jpeg is None:
+                image = self.image.convert('RGB') if self.image.mode not in ('RGB', 'L') else self.image
+                start = time.thread_time()
+                with trace.span('encode_jpeg'):
+                    byte_stream = BytesIO()
+                    image.save(byte_stream, format='JPEG', quality=self.quality)
+                self.encode_cpu_ms += (time.thread_time() - start) * 1000
+                metrics.observe('image_encode_cpu_ms', self.encode_cpu_ms)
+                self._jpeg = byte_stream.getvalue()
+            return self._jpeg
+
+    def base64(self):
+        """返回发送给视觉模型的 base64 字符串，首次调用时计算"""
+        jpeg = self.jpeg()
+        with self._lock:
+            if self._base64 is None:
+                self._base64 = b64encode(jpeg).decode('utf-8')
+            return self._base64
+
+    def save(self, path):
+        """把 JPEG 字节写入文件，图像尚未编码时先编码"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(self.jpeg())
+        return path
@@ -27,43 +27,38 @@ class ImageProcessor:
         """
         return image.convert('L')
 
-    def draw_element_borders(self, grayscale_image, clickable_elements_bounds_list, screenshot_id) -> tuple[
-        ImageDraw, ImageDraw]:
+    def draw_element_borders(self, grayscale_image, clickable_elements_bounds_list, screenshot_id, offset=(0, 0)) -> \
+            tuple[ImageDraw, ImageDraw]:
         """在图片上绘制元素的边框，并将不可点击部分改为单一色调（无框）
 
         参数:
             image: PIL Image 对象
             clickable_elements_bounds_list: 可点击元素边界信息列表，每个元素为 (bounds, element_id)
             screenshot_id: 截图 ID
-            directory_path: 保存路径
+            offset: 图片左上角在屏幕中的坐标（图片为裁剪后的弹窗区域时），边界按该偏移换算后绘制，
+                    数据库中仍保存屏幕坐标
 
         返回:
             marked_screenshot_path: 绘制边框后的图像路径
             single_color_screenshot_path: 单一色调后的图像路径
         """
+        offset_x, offset_y = offset
         # 创建一个彩色图层（RGB 模式）
         overlay = Image.new('RGBA', grayscale_image.size, (0, 0, 0, 0))
         overlay_draw = ImageDraw.Draw(overlay)
 
-        # 在灰度图基础上，再进行不可点击区域至灰色
-        non_clickable_area_image = grayscale_image.copy()
-        non_clickable_area_draw = ImageDraw.Draw(non_clickable_area_image)
         single_color = 192  # 灰色
         # self.logger.info(f"将不可点击部分改为单一色调，颜色：{single_color}")
 
-        # 在灰度图基础上，再进行不可点击区域至灰色
-        width, height = non_clickable_area_image.size
-        for x in range(width):
-            for y in range(height):
-                is_clickable = False
-                for bounds, _ in clickable_elements_bounds_list:
-                    matches = re.findall(r'\d+', bounds)
-                    x1, y1, x2, y2 = map(int, matches)
-                    if x1 <= x <= x2 and y1 <= y <= y2:
-                        is_clickable = True
-                        break
-                if not is_clickable:
-                    non_clickable_area_draw.point((x, y), fill=single_color)
+        # 在灰度图基础上，再进行不可点击区域至灰色：可点击区域（含边界）在掩码中填白，按掩码合成原图与灰色底图
+        clickable_mask = Image.new('L', grayscale_image.size, 0)
+        clickable_mask_draw = ImageDraw.Draw(clickable_mask)
+        for bounds, _ in clickable_elements_bounds_list:
+            x1, y1, x2, y2 = map(int, re.findall(r'\d+', bounds))
+            if x2 >= x1 and y2 >= y1:
+                clickable_mask_draw.rectangle([x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y], fill=255)
+        non_clickable_area_image = Image.composite(grayscale_image, Image.new('L', grayscale_image.size, single_color),
+                                                   clickable_mask)
 
         # self.logger.info(f"将不可点击部分改为单一色调，颜色：{single_color}")
 
@@ -76,6 +71,7 @@ class ImageProcessor:
 
             matches = re.findall(r'\d+', bounds)
             x1, y1, x2, y2 = map(int, matches)
+            x1, y1, x2, y2 = x1 - offset_x, y1 - offset_y, x2 - offset_x, y2 - offset_y
             color_groups = [
                 ["red", "maroon", "coral"],  # 红色组
                 ["green", "olive"],  # 绿色组
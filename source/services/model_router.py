@@ -0,0 +1,132 @@
+"""
+视觉模型分级路由模块
+
+模块职责：
+- 按从快到慢的顺序依次尝试多个模型（默认 7B → 32B → 72B），回答通过校验即返回
+- 回答未通过校验（坐标超出屏幕、数字标记不存在等）或调用失败时，才升级到更大的模型
+- 每个请求有耗时预算：剩余预算不足以覆盖下一个模型近期的 p50 耗时时不再升级
+- 路由结果与各模型耗时记录到进程内指标（/api/v1/metrics），用于调整模型顺序与预算
+"""
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['ModelRouter', 'validate_coordinates', 'validate_label', 'parse_screen_resolution']
+
+
+def parse_screen_resolution(screen_resolution):
+    """'(1080, 1920)' / '1080x1920' → (1080, 1920)，无法解析时返回 None"""
+    import re
+
+    numbers = re.findall(r'\d+', str(screen_resolution or ''))
+    if len(numbers) < 2:
+        return None
+    return int(numbers[0]), int(numbers[1])
+
+
+def validate_coordinates(screen_resolution, popup_detection=None):
+    """分辨率方案的校验：存在弹窗时坐标必须是屏幕内的数字
+
+    popup_detection: 本地检测到的弹窗（PopupDetection），给出时坐标还必须在弹窗边界框附近
+    （四周各放宽边界框的一半，关闭按钮常在卡片外侧）
+    """
+    size = parse_screen_resolution(screen_resolution)
+    near = None
+    if popup_detection is not None and popup_detection.box is not None:
+        x0, y0, x1, y1 = popup_detection.scaled_box(size)
+        margin_x, margin_y = (x1 - x0) / 2, (y1 - y0) / 2
+        near = (x0 - margin_x, y0 - margin_y, x1 + margin_x, y1 + margin_y)
+
+    def validate(result):
+        if not result.get('popup_exists', False):
+            return True, None
+        coordinates = result.get('button_coordinates')
+        if not isinstance(coordinates, dict):
+            return False, '缺少按钮坐标'
+        x, y = coordinates.get('x'), coordinates.get('y')
+        if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
+            return False, f'坐标不是数字: {coordinates}'
+        if size is not None and not (0 <= x < size[0] and 0 <= y < size[1]):
+            return False, f'坐标 ({x}, {y}) 超出屏幕 {size[0]}x{size[1]}'
+        if near is not None and not (near[0] <= x <= near[2] and near[1] <= y <= near[3]):
+            return False, f'坐标 ({x}, {y}) 远离本地检测到的弹窗 {popup_detection.box}'
+        return True, None
+
+    return validate
+
+
+def validate_label(labels):
+    """XML 方案的校验：存在弹窗时数字标记必须是截图上实际标注的数字之一（labels 为标记集合）"""
+
+    def validate(result):
+        if not result.get('popup_exists', False):
+            return True, None
+        label = result.get('popup_cancel_button')
+        if label is None:
+            # 存在弹窗但没有给出标记，沿用原有的“使用默认方法关闭”处理
+            return True, None
+        if not isinstance(label, int) or label not in labels:
+            return False, f'数字标记 {label} 不是截图上标注的可点击元素'
+        return True, None
+
+    return validate
+
+
+class ModelRouter:
+    """按模型顺序在耗时预算内尝试，直到回答通过校验"""
+
+    def __init__(self, models=None, budget_ms=None):
+        settings = get_settings()
+        self.models = models or settings.vision_model_tiers
+        self.budget_ms = budget_ms if budget_ms is not None else settings.vision_latency_budget_ms
+
+    def route(self, call, validate=None):
+        """依次调用模型
+
+        参数:
+            call: call(model, timeout_seconds) → 解析后的回答，失败时抛出异常
+            validate: validate(回答) → (是否通过, 原因)，为空时第一个成功的回答即返回
+
+        返回:
+            (回答, 模型)
+
+        异常:
+            所有可用模型都失败时抛出最后一个异常；都未通过校验时抛出 Exception
+        """
+        start = time.monotonic()
+        last_error, last_reason = None, None
+        for index, model in enumerate(self.models):
+            remaining_ms = self.budget_ms - (time.monotonic() - start) * 1000
+            expected_ms = metrics.percentile('vision_model_ms', 50, model=model)
+            if index > 0 and (remaining_ms <= 0 or (expected_ms is not None and expected_ms > remaining_ms)):
+                metrics.increment('vision_route', model=model, outcome='skipped_budget')
+                logger.info(f"剩余耗时预算 {remaining_ms:.0f}ms 不足以升级到模型 {model}（近期 p50 {expected_ms}ms）")
+                break
+            model_start = time.monotonic()
+            try:
+                result = call(model, max(1.0, remaining_ms / 1000))
+            except Exception as e:
+                metrics.increment('vision_route', model=model, outcome='error')
+                logger.warning(f"模型 {model} 调用失败，尝试升级: {e}")
+                last_error = e
+                continue
+            finally:
+                metrics.observe('vision_model_ms', (time.monotonic() - model_start) * 1000, model=model)
+            valid, reason = validate(result) if validate is not None else (True, None)
+            if valid:
+                metrics.increment('vision_route', model=model, outcome='accepted')
+                if index > 0:
+                    logger.info(f"升级到模型 {model} 后回答通过校验")
+                return result, model
+            metrics.increment('vision_route', model=model, outcome='invalid')
+            logger.warning(f"模型 {model} 的回答未通过校验（{reason}），尝试升级")
+            last_reason = reason
+        if last_reason is not None:
+            raise Exception(f"视觉模型回答未通过校验: {last_reason}")
+        if last_error is not None:
+            raise last_error
+        raise Exception("没有可用的视觉模型")
@@ -0,0 +1,285 @@
+"""
+本地弹窗分类器模块（分辨率方案调用视觉模型之前的 CPU 预判）
+
+模块职责：
+- 特征：整张灰度截图缩小到 16x32 的像素值，加上亮度均值、标准差、亮 / 暗像素占比与中心 - 四周亮度差，
+  单张截图提取特征约 1~2ms，逻辑回归推理为一次点积
+- 训练：NumPy 实现的带 L2 正则、按类别加权的逻辑回归（批量梯度下降），模型保存为 npz 文件，
+  训练入口见项目根目录的 train_classifier.py
+- 样本：template 表记录的弹窗截图为正样本；影子模式下每次视觉模型的判断结果连同特征写入
+  DB_PATH 数据库的 classifier_samples 表，是负样本（模型判断无弹窗）的主要来源
+- 模式（POPUP_CLASSIFIER_MODE）：off 关闭；shadow 只记录样本与和视觉模型的一致率，不影响诊断；
+  on 在预测为弹窗的概率不超过 POPUP_CLASSIFIER_NEGATIVE_THRESHOLD 时直接判定为无弹窗，不调用视觉模型
+"""
+import os
+import sqlite3
+import threading
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['PopupClassifier', 'SampleStore', 'extract_features', 'train_classifier', 'evaluate_classifier',
+           'classify_screenshot', 'record_outcome', 'get_popup_classifier', 'get_sample_store']
+
+# 获取当前脚本的绝对路径
+current_file_path = os.path.abspath(__file__)
+# 推导项目根目录（假设项目根目录是当前脚本的祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(current_file_path)))
+
+# 缩略图尺寸（宽, 高）
+FEATURE_SIZE = (16, 32)
+FEATURE_COUNT = FEATURE_SIZE[0] * FEATURE_SIZE[1] + 5
+
+
+def extract_features(image):
+    """灰度截图（PIL Image 或 numpy 数组）→ float32 特征向量"""
+    # OpenCV 导入较慢，首次使用时再导入
+    import cv2
+    import numpy as np
+
+    if not isinstance(image, np.ndarray):
+        image = np.asarray(image.convert('L'))
+    # 先隔行隔列采样再缩小，大分辨率截图的耗时与 720p 相当
+    step = max(1, image.shape[1] // 360)
+    small = cv2.resize(image[::step, ::step], FEATURE_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32) / 255
+    height, width = small.shape
+    center = small[height // 4:height * 3 // 4, width // 4:width * 3 // 4]
+    border_sum = small.sum() - center.sum()
+    border_mean = border_sum / (small.size - center.size)
+    extra = np.array([small.mean(), small.std(), (small > 0.96).mean(), (small < 0.25).mean(),
+                      center.mean() - border_mean], dtype=np.float32)
+    return np.concatenate([small.ravel(), extra])
+
+
+class PopupClassifier:
+    """标准化 + 逻辑回归"""
+
+    def __init__(self, weights, bias, mean, std, meta=None):
+        self.weights = weights
+        self.bias = float(bias)
+        self.mean = mean
+        self.std = std
+        self.meta = meta or {}
+
+    def predict_proba(self, features):
+        """返回截图存在弹窗的概率，features 可以是单个特征向量或按行堆叠的矩阵"""
+        import numpy as np
+
+        logits = ((features - self.mean) / self.std) @ self.weights + self.bias
+        return 1 / (1 + np.exp(-np.clip(logits, -30, 30)))
+
+    def save(self, path):
+        import json
+
+        import numpy as np
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # np.savez 会给没有 .npz 后缀的路径追加后缀，先写临时文件再替换，避免推理进程读到写了一半的模型
+        tmp_path = f'{path}.tmp.npz'
+        np.savez(tmp_path, weights=self.weights, bias=self.bias, mean=self.mean, std=self.std,
+                 meta=json.dumps(self.meta, ensure_ascii=False))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        import json
+
+        import numpy as np
+
+        with np.load(path) as data:
+            return cls(data['weights'], data['bias'], data['mean'], data['std'], json.loads(str(data['meta'])))
+
+
+def train_classifier(features, labels, epochs=500, learning_rate=0.5, l2=1e-3):
+    """批量梯度下降训练逻辑回归，正负样本按数量加权，返回 PopupClassifier"""
+    import numpy as np
+
+    features = np.asarray(features, dtype=np.float32)
+    labels = np.asarray(labels, dtype=np.float32)
+    if len(np.unique(labels)) < 2:
+        raise ValueError("训练数据必须同时包含弹窗与无弹窗样本")
+    mean = features.mean(axis=0)
+    std = features.std(axis=0) + 1e-3
+    x = (features - mean) / std
+    positives = labels.sum()
+    sample_weights = np.where(labels == 1, len(labels) / (2 * positives), len(labels) / (2 * (len(labels) - positives)))
+    weights = np.zeros(x.shape[1], dtype=np.float32)
+    bias = 0.0
+    for _ in range(epochs):
+        predictions = 1 / (1 + np.exp(-np.clip(x @ weights + bias, -30, 30)))
+        error = (predictions - labels) * sample_weights
+        weights -= learning_rate * (x.T @ error / len(labels) + l2 * weights)
+        bias -= learning_rate * float(error.mean())
+    return PopupClassifier(weights.astype(np.float32), bias, mean, std,
+                           {'samples': int(len(labels)), 'positives': int(positives),
+                            'trained_at': time.strftime('%Y-%m-%d %H:%M:%S')})
+
+
+def evaluate_classifier(classifier, features, labels, negative_threshold):
+    """在验证集上统计准确率，以及按阈值直接判定为无弹窗的比例与其中判错（实际有弹窗）的数量"""
+    import numpy as np
+
+    labels = np.asarray(labels)
+    probabilities = classifier.predict_proba(np.asarray(features, dtype=np.float32))
+    answered = probabilities <= negative_threshold
+    return {
+        'samples': int(len(labels)),
+        'accuracy': round(float(((probabilities >= 0.5) == (labels == 1)).mean()), 4) if len(labels) else None,
+        'answered_locally': int(answered.sum()),
+        'answered_rate': round(float(answered.mean()), 4) if len(labels) else None,
+        'missed_popups': int((answered & (labels == 1)).sum()),
+    }
+
+
+class SampleStore:
+    """影子模式的样本（特征 + 视觉模型的判断），每个线程使用自己的数据库连接"""
+
+    # 每写入多少条检查一次条数上限
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path=None, max_samples=None):
+        settings = get_settings()
+        self.db_path = db_path or settings.db_path
+        self.max_samples = max_samples if max_samples is not None else settings.popup_classifier_max_samples
+        self._local = threading.local()
+        self._puts = 0
+
+    @property
+    def conn(self):
+        # 连接不能跨线程与 fork 后的子进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS classifier_samples (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    ts REAL NOT NULL,
+                    label INTEGER NOT NULL,
+                    source TEXT NOT NULL,
+                    features BLOB NOT NULL
+                )
+            ''')
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def record(self, features, label, source='vision'):
+        import numpy as np
+
+        conn = self.conn
+        conn.execute('INSERT INTO classifier_samples (ts, label, source, features) VALUES (?, ?, ?, ?)',
+                     (time.time(), int(label), source, np.asarray(features, dtype=np.float32).tobytes()))
+        conn.commit()
+        self._puts += 1
+        if self.max_samples and self._puts % self.PURGE_EVERY == 0:
+            conn.execute('DELETE FROM classifier_samples WHERE id IN (SELECT id FROM classifier_samples '
+                         'ORDER BY id DESC LIMIT -1 OFFSET ?)', (self.max_samples,))
+            conn.commit()
+
+    def load(self):
+        """返回 (特征矩阵, 标签数组)，特征维度与当前版本不一致的旧样本会被跳过"""
+        import numpy as np
+
+        features, labels = [], []
+        for label, blob in self.conn.execute('SELECT label, features FROM classifier_samples ORDER BY id'):
+            vector = np.frombuffer(blob, dtype=np.float32)
+            if vector.size == FEATURE_COUNT:
+                features.append(vector)
+                labels.append(label)
+        return np.array(features, dtype=np.float32).reshape(-1, FEATURE_COUNT), np.array(labels, dtype=np.int64)
+
+
+class ClassifierVerdict:
+    """一次预判：features 为特征，probability 为弹窗概率（没有模型时为 None），skip 表示不再调用视觉模型"""
+
+    __slots__ = ('features', 'probability', 'skip')
+
+    def __init__(self, features, probability, skip):
+        self.features = features
+        self.probability = probability
+        self.skip = skip
+
+
+def classify_screenshot(grayscale_image):
+    """在调用视觉模型之前预判，关闭（POPUP_CLASSIFIER_MODE=off）时返回 None"""
+    settings = get_settings()
+    if settings.popup_classifier_mode not in ('shadow', 'on'):
+        return None
+    start = time.perf_counter()
+    features = extract_features(grayscale_image)
+    classifier = get_popup_classifier()
+    probability = float(classifier.predict_proba(features)) if classifier is not None else None
+    skip = settings.popup_classifier_mode == 'on' and probability is not None \
+        and probability <= settings.popup_classifier_negative_threshold
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    metrics.observe('popup_classifier_ms', elapsed_ms)
+    if probability is not None:
+        logger.info(f"本地分类器预测弹窗概率 {probability:.3f}，耗时 {elapsed_ms:.1f}ms"
+                    f"{'，判定为无弹窗，跳过视觉模型' if skip else ''}")
+    if skip:
+        metrics.increment('popup_classifier', outcome='negative')
+    return ClassifierVerdict(features, probability, skip)
+
+
+def record_outcome(verdict, popup_found):
+    """视觉模型给出结果后调用：记录与分类器的一致情况，并把特征与模型的判断保存为训练样本"""
+    if verdict is None or verdict.skip:
+        return
+    if verdict.probability is not None:
+        agree = (verdict.probability >= 0.5) == popup_found
+        metrics.increment('popup_classifier', outcome='agree' if agree else 'disagree')
+        if not agree:
+            logger.info(f"本地分类器与视觉模型不一致：分类器弹窗概率 {verdict.probability:.3f}，模型判断"
+                        f"{'有' if popup_found else '无'}弹窗")
+    store = get_sample_store()
+    if store is not None:
+        try:
+            store.record(verdict.features, popup_found)
+        except Exception as e:
+            logger.warning(f"保存分类器样本失败: {e}")
+
+
+_classifier = None
+_classifier_key = None
+_classifier_lock = threading.Lock()
+
+
+def get_popup_classifier():
+    """进程内共享的分类器，模型文件更新后重新加载，模型文件不存在或无法读取时返回 None"""
+    global _classifier, _classifier_key
+    path = os.path.join(project_root, get_settings().popup_classifier_path)
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+    with _classifier_lock:
+        if _classifier_key != key:
+            try:
+                _classifier = PopupClassifier.load(path)
+                logger.info(f"加载本地弹窗分类器: {path} {_classifier.meta}")
+            except Exception as e:
+                logger.warning(f"加载本地弹窗分类器失败: {e}")
+                _classifier = None
+            _classifier_key = key
+    return _classifier
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_sample_store():
+    """进程内按数据库路径共享的样本库，未配置 DB_PATH 时返回 None"""
+    db_path = get_settings().db_path
+    if not db_path:
+        return None
+    with _stores_lock:
+        store = _stores.get(db_path)
+        if store is None:
+            store = _stores[db_path] = SampleStore(db_path)
+    return store
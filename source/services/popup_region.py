@@ -0,0 +1,141 @@
+"""
+弹窗区域裁剪模块（XML 方案可点击元素过多时使用）
+
+模块职责：
+- 界面可点击元素超过上限时，不再直接放弃，而是找出最上层的弹窗子树，只保留其中的可点击元素
+- XML 优先：存在多个窗口时取最上层窗口；在其中按 resource-id / 类名（dialog、popup、modal 等）寻找绘制顺序
+  最靠后的弹窗容器，没有时使用窗口本身
+- 图像兜底：XML 中找不到弹窗容器时，用本地弹窗检测（遮罩 + 明亮卡片）得到的边界框筛选可点击元素
+- 返回的裁剪区域为弹窗容器与其中可点击元素边界的并集，向外留出少量边距，只把该区域发送给视觉模型
+"""
+import re
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+
+logger = setup_logger(__name__)
+
+__all__ = ['PopupRegion', 'find_popup_region']
+
+_BOUNDS_PATTERN = re.compile(r'\[(-?\d+),(-?\d+)\]\[(-?\d+),(-?\d+)\]')
+_CONTAINER_PATTERN = re.compile(r'dialog|popup|pop_|modal|alert|sheet|overlay|mask', re.IGNORECASE)
+
+# 弹窗容器面积占屏幕的比例范围
+MIN_CONTAINER_AREA, MAX_CONTAINER_AREA = 0.05, 0.95
+# 裁剪区域向外留出的边距（屏幕宽度的比例），关闭按钮常在卡片外侧
+REGION_MARGIN = 0.03
+# 图像兜底时边界框向外放宽的比例
+DETECTION_MARGIN = 0.15
+
+
+def _parse_bounds(bounds):
+    match = _BOUNDS_PATTERN.match(bounds or '')
+    return tuple(int(value) for value in match.groups()) if match else None
+
+
+class PopupRegion:
+    """裁剪区域：box 为屏幕坐标 (x0, y0, x1, y1)，elements 为区域内的可点击元素，source 为 xml / image"""
+
+    __slots__ = ('box', 'elements', 'source')
+
+    def __init__(self, box, elements, source):
+        self.box = box
+        self.elements = elements
+        self.source = source
+
+    def __repr__(self):
+        return f"PopupRegion({self.source}, box={self.box}, clickable={len(self.elements)})"
+
+
+def _screen_size(root, grayscale_image):
+    width, height = root.get('width'), root.get('height')
+    if width and height and width.isdigit() and height.isdigit():
+        return int(width), int(height)
+    return grayscale_image.size
+
+
+def _xml_container(root, screen_area):
+    """最上层窗口中绘制顺序最靠后的弹窗容器；单窗口且没有弹窗容器时返回 None"""
+    windows = [child for child in root if child.get('bounds')]
+    scope = windows[-1] if len(windows) > 1 else root
+    container = None
+    for node in scope.iter():
+        if not _CONTAINER_PATTERN.search(f"{node.get('resource-id', '')} {node.get('class', '')}"):
+            continue
+        bounds = _parse_bounds(node.get('bounds'))
+        if bounds is None:
+            continue
+        area = (bounds[2] - bounds[0]) * (bounds[3] - bounds[1])
+        if MIN_CONTAINER_AREA * screen_area <= area <= MAX_CONTAINER_AREA * screen_area:
+            container = node
+    if container is None and scope is not root:
+        container = scope
+    return container
+
+
+def _union(boxes):
+    return min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes)
+
+
+def _region(boxes, margin, screen_size, elements, source):
+    x0, y0, x1, y1 = _union(boxes)
+    width, height = screen_size
+    box = (max(0, x0 - margin), max(0, y0 - margin), min(width, x1 + margin), min(height, y1 + margin))
+    return PopupRegion(box, elements, source)
+
+
+def find_popup_region(clickable_elements, grayscale_image, limit):
+    """返回包含不超过 limit 个可点击元素的弹窗区域，找不到时返回 None"""
+    if not clickable_elements:
+        return None
+    root = clickable_elements[0].getroottree().getroot()
+    screen_size = _screen_size(root, grayscale_image)
+    screen_area = screen_size[0] * screen_size[1]
+    margin = round(REGION_MARGIN * screen_size[0])
+
+    region = None
+    container = _xml_container(root, screen_area)
+    if container is not None:
+        inside = {id(node) for node in container.iter()}
+        elements = [element for element in clickable_elements
+                    if id(element) in inside and _parse_bounds(element.get('bounds'))]
+        if 0 < len(elements) <= limit:
+            boxes = [_parse_bounds(element.get('bounds')) for element in elements]
+            container_bounds = _parse_bounds(container.get('bounds'))
+            container_area = (container_bounds[2] - container_bounds[0]) * (container_bounds[3] - container_bounds[1]) \
+                if container_bounds else screen_area
+            # 窗口铺满屏幕时（透明背景的弹窗窗口）只按可点击元素裁剪
+            if container_area <= MAX_CONTAINER_AREA * screen_area:
+                boxes.append(container_bounds)
+            region = _region(boxes, margin, screen_size, elements, 'xml')
+
+    if region is None:
+        region = _image_region(clickable_elements, grayscale_image, screen_size, margin, limit)
+
+    metrics.increment('popup_region', source=region.source if region is not None else 'none')
+    logger.info(f"可点击元素 {len(clickable_elements)} 个，弹窗区域: {region}")
+    return region
+
+
+def _image_region(clickable_elements, grayscale_image, screen_size, margin, limit):
+    """用本地弹窗检测的边界框筛选可点击元素"""
+    # 接口模块依赖本模块所在的包，首次兜底时再导入，避免循环导入
+    from source.api.utils.popup_detector import detect_popup
+
+    detection = detect_popup(grayscale_image)
+    if detection is None or detection.verdict != 'popup':
+        return None
+    x0, y0, x1, y1 = detection.scaled_box(screen_size)
+    dx, dy = DETECTION_MARGIN * (x1 - x0), DETECTION_MARGIN * (y1 - y0)
+    elements = []
+    for element in clickable_elements:
+        bounds = _parse_bounds(element.get('bounds'))
+        if bounds is None:
+            continue
+        # 遮罩下的背景元素通常比卡片宽，只保留完整落在放宽后边界框内的元素
+        if x0 - dx <= bounds[0] and bounds[2] <= x1 + dx and y0 - dy <= bounds[1] and bounds[3] <= y1 + dy:
+            elements.append(element)
+    if not 0 < len(elements) <= limit:
+        return None
+    boxes = [(x0, y0, x1, y1)] + [_parse_bounds(element.get('bounds')) for element in elements]
+    return _region(boxes, margin, screen_size, elements, 'image')
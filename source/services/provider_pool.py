@@ -0,0 +1,220 @@
+"""
+视觉模型 API Key 池模块
+
+模块职责：
+- 管理多个 API Key / 接口地址，每个 Key 有客户端侧的令牌桶：每分钟请求数（RPM）与每分钟 token 数（TPM）
+- 请求前先按预估 token 数从令牌桶扣除，选择余量最多的 Key；响应后按实际用量多退少补
+- 所有 Key 的令牌桶都用完时，请求在公平队列（先到先得）中短暂等待，而不是直接失败
+- 服务端仍返回速率限制时，该 Key 冷却一段时间
+"""
+import threading
+import time
+from collections import deque
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['TokenBucket', 'Provider', 'ProviderPool', 'PoolExhausted', 'get_provider_pool', 'pool_status']
+
+
+class PoolExhausted(Exception):
+    """等待超时，所有 Key 仍没有余量"""
+
+
+class TokenBucket:
+    """按每分钟速率连续补充的令牌桶，容量为一分钟的用量；rate_per_minute 为 0 表示不限制"""
+
+    def __init__(self, rate_per_minute, clock=time.monotonic):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = float(rate_per_minute)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+
+    @property
+    def unlimited(self):
+        return not self.rate_per_minute
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def available(self):
+        if self.unlimited:
+            return float('inf')
+        self._refill()
+        return self._tokens
+
+    def headroom(self):
+        """剩余比例（0~1）"""
+        return 1.0 if self.unlimited else self.available() / self.capacity
+
+    def consume(self, amount):
+        """扣除令牌（允许为负数，用于实际用量超出预估时补扣）"""
+        if not self.unlimited:
+            self._refill()
+            self._tokens -= amount
+
+    def wait_time(self, amount):
+        """余量达到 amount 还需等待的秒数"""
+        if self.unlimited:
+            return 0.0
+        missing = min(amount, self.capacity) - self.available()
+        return max(0.0, missing * 60 / self.rate_per_minute)
+
+
+class Provider:
+    """一个 API Key 及其接口地址"""
+
+    def __init__(self, name, api_url, api_key, rpm, tpm, clock=time.monotonic):
+        self.name = name
+        self.api_url = api_url
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm, clock)
+        self.tokens = TokenBucket(tpm, clock)
+        self.cooldown_until = 0.0
+        self._clock = clock
+
+    def _tokens_needed(self, tokens):
+        return tokens if self.tokens.unlimited else min(tokens, self.tokens.capacity)
+
+    def can_serve(self, tokens):
+        return (self._clock() >= self.cooldown_until and self.requests.available() >= 1
+                and self.tokens.available() >= self._tokens_needed(tokens))
+
+    def headroom(self):
+        return min(self.requests.headroom(), self.tokens.headroom())
+
+    def wait_time(self, tokens):
+        return max(self.cooldown_until - self._clock(), self.requests.wait_time(1),
+                   self.tokens.wait_time(self._tokens_needed(tokens)))
+
+
+class Lease:
+    """一次请求占用的 Key 与预扣的 token 数"""
+
+    __slots__ = ('provider', 'estimated_tokens')
+
+    def __init__(self, provider, estimated_tokens):
+        self.provider = provider
+        self.estimated_tokens = estimated_tokens
+
+
+class ProviderPool:
+    """多 Key 调度：余量最多优先，全部用完时先到先得地排队等待"""
+
+    # 服务端返回速率限制后，该 Key 的冷却时间（秒）
+    COOLDOWN_SECONDS = 10
+
+    def __init__(self, providers, max_wait_seconds, clock=time.monotonic):
+        if not providers:
+            raise ValueError("未配置视觉模型API的密钥")
+        self.providers = providers
+        self.max_wait_seconds = max_wait_seconds
+        self._clock = clock
+        self._cond = threading.Condition()
+        self._queue = deque()
+
+    def _pick(self, tokens, avoid):
+        candidates = [provider for provider in self.providers if provider.can_serve(tokens)]
+        if not candidates:
+            return None
+        # 对冲等场景优先选择另一个 Key
+        preferred = [provider for provider in candidates if provider is not avoid] or candidates
+        return max(preferred, key=lambda provider: provider.headroom())
+
+    def acquire(self, estimated_tokens, avoid=None, timeout=None):
+        """占用一个有余量的 Key，等待超过 timeout（默认 max_wait_seconds）时抛出 PoolExhausted"""
+        start = self._clock()
+        deadline = start + (self.max_wait_seconds if timeout is None else timeout)
+        ticket = object()
+        with self._cond:
+            self._queue.append(ticket)
+            try:
+                while True:
+                    wait = None
+                    if self._queue[0] is ticket:
+                        provider = self._pick(estimated_tokens, avoid)
+                        if provider is not None:
+                            provider.requests.consume(1)
+                            provider.tokens.consume(estimated_tokens)
+                            waited_ms = (self._clock() - start) * 1000
+                            metrics.observe('vision_pool_wait_ms', waited_ms)
+                            if waited_ms > 1:
+                                logger.info(f"等待 {waited_ms:.0f}ms 后获得 API Key {provider.name}")
+                            return Lease(provider, estimated_tokens)
+                        wait = min(provider.wait_time(estimated_tokens) for provider in self.providers)
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        metrics.increment('vision_pool_exhausted')
+                        raise PoolExhausted(f"所有 API Key 均已达到速率限制，等待 {self.max_wait_seconds}s 后仍无余量")
+                    # 队首按最早恢复时间等待，其他请求等待队首出队的通知
+                    self._cond.wait(remaining if wait is None else min(max(wait, 0.01), remaining))
+            finally:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+
+    def release(self, lease, used_tokens=None):
+        """按实际 token 用量多退少补"""
+        if used_tokens is None:
+            return
+        with self._cond:
+            lease.provider.tokens.consume(used_tokens - lease.estimated_tokens)
+            self._cond.notify_all()
+
+    def penalize(self, lease):
+        """服务端返回速率限制时，让该 Key 冷却一段时间"""
+        with self._cond:
+            lease.provider.cooldown_until = self._clock() + self.COOLDOWN_SECONDS
+        metrics.increment('vision_pool_rate_limited', key=lease.provider.name)
+        logger.warning(f"API Key {lease.provider.name} 被服务端限流，冷却 {self.COOLDOWN_SECONDS}s")
+
+    def status(self):
+        with self._cond:
+            return [{
+                'key': provider.name,
+                'api_url': provider.api_url,
+                'rpm_available': round(provider.requests.available(), 2),
+                'tpm_available': round(provider.tokens.available(), 2),
+                'cooling': self._clock() < provider.cooldown_until,
+            } for provider in self.providers]
+
+
+_pool = None
+_pool_settings = None
+_pool_lock = threading.Lock()
+
+
+def _build_pool(settings):
+    keys = settings.vision_model_api_keys or ([settings.vision_model_api_key] if settings.vision_model_api_key else [])
+    urls = settings.vision_model_api_urls or ([settings.vision_model_api_url] if settings.vision_model_api_url else [])
+    if not urls:
+        raise ValueError("未配置视觉模型API的URL")
+    if len(urls) not in (1, len(keys)):
+        raise ValueError("VISION_MODEL_API_URLS 的数量必须为 1 或与 VISION_MODEL_API_KEYS 相同")
+    providers = [Provider(f'key{index}:{key[-4:]}', urls[index] if len(urls) > 1 else urls[0], key,
+                          settings.vision_key_rpm, settings.vision_key_tpm)
+                 for index, key in enumerate(keys)]
+    return ProviderPool(providers, settings.vision_pool_max_wait_seconds)
+
+
+def get_provider_pool():
+    """进程内共享的 Key 池，配置重新加载后重建"""
+    global _pool, _pool_settings
+    settings = get_settings()
+    with _pool_lock:
+        if _pool is None or _pool_settings is not settings:
+            _pool, _pool_settings = _build_pool(settings), settings
+    return _pool
+
+
+def pool_status():
+    """各 Key 的剩余额度，未配置密钥时返回空列表"""
+    try:
+        return get_provider_pool().status()
+    except ValueError:
+        return []
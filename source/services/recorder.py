@@ -1,18 +1,23 @@
 import sqlite3
 import re
 import os
-from dotenv import load_dotenv
+import threading
+import time
 from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
 
 
-load_dotenv()
-
 __all__ = ['Recorder']
 
+# 已完成表结构迁移的数据库路径，每个进程只检查一次
+_migrated_paths = set()
+_migrate_lock = threading.Lock()
+
 
 class Recorder:
     def __init__(self):
-        self.conn = sqlite3.connect(os.getenv('DB_PATH'))
+        self.db_path = get_settings().db_path
+        self.conn = sqlite3.connect(self.db_path)
         self.cursor = self.conn.cursor()
         self.cursor.execute('''
             CREATE TABLE IF NOT EXISTS elements (
@@ -25,7 +30,8 @@ class Recorder:
                 center_x INTEGER,
                 center_y INTEGER,
                 screenshot_id TEXT NOT NULL,
-                element_id INTEGER NOT NULL
+                element_id INTEGER NOT NULL,
+                created_at INTEGER
             )
         ''')
 
@@ -34,16 +40,41 @@ class Recorder:
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         skip_center_x INTEGER,
                         skip_center_y INTEGER,
-                        template_id TEXT NOT NULL
+                        template_id TEXT NOT NULL,
+                        created_at INTEGER
                     )
                 ''')
 
         self.conn.commit()
         self.logger = setup_logger(__name__)
+        self._migrate()
+
+    def _migrate(self):
+        """为旧数据库补充 created_at 列与查询索引，旧数据的 created_at 记为迁移时间"""
+        db_path = os.path.abspath(self.db_path)
+        if db_path in _migrated_paths:
+            return
+        with _migrate_lock:
+            if db_path in _migrated_paths:
+                return
+            now = int(time.time())
+            for table in ('elements', 'template'):
+                columns = [row[1] for row in self.cursor.execute(f'PRAGMA table_info({table})')]
+                if 'created_at' not in columns:
+                    self.cursor.execute(f'ALTER TABLE {table} ADD COLUMN created_at INTEGER')
+                    self.cursor.execute(f'UPDATE {table} SET created_at = ? WHERE created_at IS NULL', (now,))
+                    self.logger.info(f"数据表 {table} 已添加 created_at 列")
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_elements_screenshot '
+                                'ON elements (screenshot_id, element_id)')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_elements_created_at ON elements (created_at)')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_template_template_id ON template (template_id)')
+            self.conn.commit()
+            _migrated_paths.add(db_path)
 
     def save_template(self, template_id, skip_center_x, skip_center_y):
-        self.cursor.execute('INSERT INTO template (template_id, skip_center_x, skip_center_y) VALUES (?, ?, ?)',
-                            (template_id, skip_center_x, skip_center_y))
+        self.cursor.execute('INSERT INTO template (template_id, skip_center_x, skip_center_y, created_at) '
+                            'VALUES (?, ?, ?, ?)',
+                            (template_id, skip_center_x, skip_center_y, int(time.time())))
         self.conn.commit()
 
     def get_template_center_point(self, template_id):
@@ -61,8 +92,9 @@ class Recorder:
         center_x = (x1 + x2) // 2
         center_y = (y1 + y2) // 2
         self.cursor.execute(
-            'INSERT INTO elements (bounds, x1, y1, x2, y2,center_x,center_y, screenshot_id, element_id) VALUES (?,?,?, ?, ?, ?, ?, ?, ?)',
-            (bounds, x1, y1, x2, y2, center_x, center_y, screenshot_id, element_id))
+            'INSERT INTO elements (bounds, x1, y1, x2, y2,center_x,center_y, screenshot_id, element_id, created_at) '
+            'VALUES (?,?,?, ?, ?, ?, ?, ?, ?, ?)',
+            (bounds, x1, y1, x2, y2, center_x, center_y, screenshot_id, element_id, int(time.time())))
         self.conn.commit()
 
     def is_record_exist(self, bounds, screenshot_id):
@@ -70,7 +102,7 @@ class Recorder:
         return self.cursor.fetchone() is not None
 
     def generate_markdown(self):
-        with open(os.getenv('MD_FILE_PATH'), 'w') as md_file:
+        with open(get_settings().md_file_path, 'w') as md_file:
             md_file.write("# Elements Bounds Data\n\n")
             md_file.write("| ID | Bounds | X1 | Y1 | X2 | Y2 | Center_X | Center_Y | ScreenShot_ID | Element_ID |\n")
             md_file.write("|----|--------|----|----|----|----|----|----|----|----|\n")
@@ -80,5 +112,36 @@ class Recorder:
                 md_file.write(
                     f"| {row[0]} | {row[1]} | {row[2]} | {row[3]} | {row[4]} | {row[5]} | {row[6]} | {row[7]} | {row[8]} | {row[9]} |\n")
 
+    def delete_stale_elements(self, max_age_seconds, batch_size=5000):
+        """分批删除超过保留时间的元素记录，每批单独提交，避免长时间持有写锁
+
+        返回:
+            删除的行数
+        """
+        cutoff = int(time.time()) - max_age_seconds
+        deleted = 0
+        while True:
+            self.cursor.execute('DELETE FROM elements WHERE id IN '
+                                '(SELECT id FROM elements WHERE created_at < ? LIMIT ?)', (cutoff, batch_size))
+            self.conn.commit()
+            deleted += self.cursor.rowcount
+            if self.cursor.rowcount < batch_size:
+                return deleted
+
+    def delete_templates(self, template_ids, batch_size=500):
+        """删除模版记录（模版文件被清理时调用）"""
+        template_ids = list(template_ids)
+        for i in range(0, len(template_ids), batch_size):
+            batch = template_ids[i:i + batch_size]
+            self.cursor.execute(f"DELETE FROM template WHERE template_id IN ({','.join('?' * len(batch))})", batch)
+        self.conn.commit()
+
+    def optimize(self, vacuum=False):
+        """更新查询统计信息，必要时整理数据库文件以回收已删除行占用的空间"""
+        self.cursor.execute('ANALYZE')
+        self.conn.commit()
+        if vacuum:
+            self.cursor.execute('VACUUM')
+
     def close(self):
         self.conn.close()
@@ -0,0 +1,107 @@
+"""
+视觉模型结果缓存模块
+
+模块职责：
+- 以发送给模型的图片与提示词的哈希为键缓存解析后的模型结果，相同截图不再重复调用模型
+- 缓存存放在 SQLite 数据库文件中（WAL 模式），多个工作进程共享同一份缓存
+- 按 TTL 过期，超过条数上限时淘汰最旧的记录
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['VisionCache']
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+class VisionCache:
+    """跨进程共享的模型结果缓存，每个线程使用自己的数据库连接"""
+
+    # 每写入多少条检查一次过期与容量
+    PURGE_EVERY = 100
+
+    def __init__(self, db_path=None, ttl_seconds=None, max_entries=None):
+        settings = get_settings()
+        self.db_path = db_path or settings.db_path
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else settings.vision_cache_ttl_seconds
+        self.max_entries = max_entries if max_entries is not None else settings.vision_cache_max_entries
+        self._local = threading.local()
+        self._puts = 0
+
+    @classmethod
+    def shared(cls):
+        """进程内按数据库路径共享的实例，复用各线程的连接"""
+        db_path = get_settings().db_path
+        with _shared_lock:
+            cache = _shared.get(db_path)
+            if cache is None:
+                cache = _shared[db_path] = cls(db_path)
+        return cache
+
+    @property
+    def conn(self):
+        # 连接不能跨线程与 fork 后的子进程复用
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=5)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS vision_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    created_at INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_vision_cache_created_at ON vision_cache (created_at)')
+            conn.commit()
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    @staticmethod
+    def make_key(*parts):
+        """由模型名、提示词与 base64 图片等生成缓存键"""
+        digest = hashlib.sha1()
+        for part in parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\x00')
+        return digest.hexdigest()
+
+    def get(self, key):
+        row = self.conn.execute('SELECT result, created_at FROM vision_cache WHERE cache_key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        if self.ttl_seconds and time.time() - row[1] > self.ttl_seconds:
+            return None
+        return json.loads(row[0])
+
+    def put(self, key, result):
+        conn = self.conn
+        conn.execute('INSERT OR REPLACE INTO vision_cache (cache_key, result, created_at) VALUES (?, ?, ?)',
+                     (key, json.dumps(result, ensure_ascii=False), int(time.time())))
+        conn.commit()
+        self._puts += 1
+        if self._puts % self.PURGE_EVERY == 0:
+            self.purge()
+
+    def purge(self):
+        """删除过期记录，并把条数控制在上限以内，返回删除的条数"""
+        conn = self.conn
+        deleted = 0
+        if self.ttl_seconds:
+            deleted += conn.execute('DELETE FROM vision_cache WHERE created_at < ?',
+                                    (int(time.time() - self.ttl_seconds),)).rowcount
+        if self.max_entries:
+            deleted += conn.execute('DELETE FROM vision_cache WHERE cache_key IN (SELECT cache_key FROM vision_cache '
+                                    'ORDER BY created_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,)).rowcount
+        conn.commit()
+        return deleted
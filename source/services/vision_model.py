@@ -1,53 +1,64 @@
 import json
-import os
+import logging
+import random
+import threading
+import time
 from io import BytesIO
 
-import requests
 from base64 import b64encode
 
 from PIL import Image
-from dotenv import load_dotenv
 from typing import Dict, Any
+from source.utils import trace
 from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+from source.services.hedging import HedgeBudget, hedged_call
+from source.services.model_router import ModelRouter
+from source.services.provider_pool import get_provider_pool
+from source.services.cost_ledger import get_ledger, estimate_image_tokens, mark_model_call
+from source.services.image_artifact import ImageArtifact
+from source.services.vision_stream import IncrementalJsonObject, iter_sse_events, extract_json
+from source.services.vision_cache import VisionCache
 
-load_dotenv()
+
+_budget = None
+_budget_lock = threading.Lock()
+
+
+def _hedge_budget():
+    """进程内共享的对冲比例上限"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = HedgeBudget(get_settings().vision_hedge_max_rate)
+    return _budget
 
 
 class VisionModelService:
     """用于与视觉模型API交互，分析截图的工具类。"""
 
-    # 常量
-    MAX_RETRIES = 1
-    RETRY_DELAY = 1  # 重试延迟，单位：秒
+    # 常量（失败时不再重试同一模型，而是由 ModelRouter 升级到下一个模型）
+    # 近期耗时样本少于该数量时，对冲延迟使用 VISION_HEDGE_DELAY_MS
+    HEDGE_MIN_SAMPLES = 20
     # DEFAULT_MODEL = "deepseek-ai/deepseek-vl2"
     # DEFAULT_MODEL = "Qwen/Qwen2.5-VL-32B-Instruct"
 
     # DEFAULT_MODEL = "Qwen/Qwen2.5-VL-72B-Instruct"
     DEFAULT_MODEL = "Pro/Qwen/Qwen2.5-VL-7B-Instruct"
+    # 实际使用的模型顺序由 VISION_MODEL_TIERS 配置，未配置时只使用 DEFAULT_MODEL
 
     def __init__(self, screen_resolution=""):
         """初始化视觉模型服务，配置API信息。"""
 
-        self.api_url = self._get_api_url()
-        self.api_key = self._get_api_key()
+        # 校验 API 地址与密钥配置，请求时从 Key 池中选择余量最多的密钥
+        get_provider_pool()
         self.logger = setup_logger(__name__)
         self.screen_resolution = screen_resolution
-
-    @staticmethod
-    def _get_api_url() -> str:
-        """从环境变量中获取视觉模型API的URL。"""
-        url = os.getenv('VISION_MODEL_API_URL')
-        if not url:
-            raise ValueError("未配置视觉模型API的URL")
-        return url
-
-    @staticmethod
-    def _get_api_key() -> str:
-        """从环境变量中获取视觉模型API的密钥。"""
-        key = os.getenv('VISION_MODEL_API_KEY')
-        if not key:
-            raise ValueError("未配置视觉模型API的密钥")
-        return key
+        # 发送给模型的图片估算的 token 数，写入调用账本
+        self._image_tokens = 0
+        # 完整响应内容的日志采样比例，逐次打印会占用请求线程
+        self.log_sample_rate = get_settings().vision_log_sample_rate
 
     def _handle_response_errors(self, response_json: Dict) -> None:
         """处理视觉模型API返回的错误。
@@ -73,11 +84,14 @@ class VisionModelService:
             self.logger.error(f"达到速率限制: {error_message}")
             raise Exception(f"请求被拒绝，达到速率限制: {error_message}")
 
-    def analyze_screenshot(self, marked_screenshot_image):
+    def analyze_screenshot(self, marked_screenshot_image, validate=None):
         """使用视觉模型API分析截图。
 
+        按 VISION_MODEL_TIERS 从快到慢尝试模型，回答未通过 validate 校验时在耗时预算内升级到更大的模型。
+
         Args:
-            marked_screenshot_image: 截图文件路径或PIL.Image对象。
+            marked_screenshot_image: 截图文件路径、PIL.Image对象或 ImageArtifact（同一张图像只编码一次）。
+            validate: 回答校验函数，返回 (是否通过, 原因)，见 model_router。
 
         Returns:
             包含分析结果的字典。
@@ -85,54 +99,189 @@ class VisionModelService:
         Raises:
             Exception: 如果分析失败或无法解析响应。
         """
-        for attempt in range(self.MAX_RETRIES):
-            try:
-                # 将截图转换为Base64编码
+        try:
+            # 将截图转换为Base64编码
+            with trace.span('encode_base64'):
                 marked_screenshot_base64 = self.convert_image_to_base64(marked_screenshot_image)
-                # raise Exception("analyze_screenshot 方法中发生意外错误")
+            self._image_tokens = estimate_image_tokens(*marked_screenshot_image.size)
+
+            router = ModelRouter(models=get_settings().vision_model_tiers or [self.DEFAULT_MODEL])
+            result, model = router.route(
+                lambda model, timeout: self._analyze_with_model(model, marked_screenshot_base64, timeout), validate)
+            # 只缓存通过校验的回答
+            if get_settings().vision_cache_enabled:
+                self._cache_put(self._cache_key(model, marked_screenshot_base64), result)
+            return result
+        except Exception as e:
+            self.logger.error(f"所有模型均未给出可用回答: {str(e)}")
+            raise Exception(f"分析截图失败: {str(e)}")
+
+    def _cache_key(self, model, marked_screenshot_base64):
+        return VisionCache.make_key(model, self.screen_resolution, marked_screenshot_base64)
+
+    def _analyze_with_model(self, model, marked_screenshot_base64, timeout=None):
+        """调用指定模型分析截图，返回解析后的回答"""
+        # 相同截图（含分辨率方案的提示词）直接复用之前的模型结果，缓存在各工作进程间共享
+        if get_settings().vision_cache_enabled:
+            cached_result = self._cache_get(self._cache_key(model, marked_screenshot_base64))
+            if cached_result is not None:
+                self.logger.info(f"命中视觉模型结果缓存: {cached_result}")
+                self._record_call({'model': model}, 0.0, 'cache')
+                return cached_result
+
+        # 构建请求负载
+        payload = self._build_payload(marked_screenshot_base64, model)
+        with trace.span('vision_request', model=model):
+            status_code, response_json, source = self._post_hedged(model, payload, timeout)
+        if source == 'hedge':
+            self.logger.info(f"模型 {model} 的对冲请求先返回")
+        self._log_response(status_code, response_json)
+        # 处理响应
+        if status_code != 200:
+            self._handle_response_errors(response_json)
+            raise Exception(f"视觉模型API返回状态码 {status_code}")
+        if response_json.get("content") == "":
+            raise Exception("视觉模型返回空结果")
+        return self._process_response(response_json)
+
+    def _post(self, payload, timeout, avoid=None, chosen=None):
+        """从 Key 池占用一个密钥发送一次请求，返回 (状态码, 响应 JSON)，并记录该模型的原始耗时（对冲延迟据此计算）
+
+        avoid: 优先不使用的密钥（对冲请求避开主请求的密钥）；chosen: 传入列表时追加本次使用的密钥
+        """
+        # requests 只在模版未命中时使用，首次调用时再导入
+        import requests
+
+        pool = get_provider_pool()
+        with trace.span('vision_pool_wait'):
+            lease = pool.acquire(get_settings().vision_tokens_per_request, avoid=avoid)
+        if chosen is not None:
+            chosen.append(lease.provider)
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {lease.provider.api_key}'
+        }
+        start = time.monotonic()
+        stream = payload.get('stream', False)
+        try:
+            response = requests.post(lease.provider.api_url, json=payload, headers=headers, timeout=timeout,
+                                     stream=stream)
+            try:
+                # 只解析一次响应；流式响应在回答的 JSON 完整后即关闭连接
+                response_json = self._read_stream(response) if stream and response.status_code == 200 \
+                    else response.json()
+            finally:
+                response.close()
+        except Exception:
+            self._record_call(payload, (time.monotonic() - start) * 1000, 'error')
+            raise
+        elapsed_ms = (time.monotonic() - start) * 1000
+        metrics.observe('vision_http_ms', elapsed_ms, model=payload['model'])
+        usage = response_json.get('usage') or {}
+        pool.release(lease, usage.get('total_tokens'))
+        if response.status_code == 429 or "rate limiting" in str(response_json.get('message', '')):
+            pool.penalize(lease)
+        self._record_call(payload, elapsed_ms, 'ok' if response.status_code == 200 else f'http_{response.status_code}',
+                          usage, response_json)
+        return response.status_code, response_json
+
+    def _record_call(self, payload, latency_ms, outcome, usage=None, response_json=None):
+        """写入调用账本；没有服务商返回的 usage（流式提前关闭）时按图片尺寸与文本长度估算"""
+        if outcome != 'cache':
+            mark_model_call()
+        ledger = get_ledger()
+        if ledger is None:
+            return
+        prompt_variant = 'xml' if self.screen_resolution == '' else 'resolution'
+        image_tokens = self._image_tokens if outcome != 'cache' else 0
+        prompt_tokens, completion_tokens, estimated = 0, 0, False
+        if usage:
+            prompt_tokens, completion_tokens = usage.get('prompt_tokens'), usage.get('completion_tokens')
+        elif outcome == 'ok':
+            prompt_text = payload['messages'][0]['content'][1]['text']
+            content = response_json['choices'][0]['message']['content'] if response_json.get('choices') else ''
+            prompt_tokens, completion_tokens, estimated = image_tokens + len(prompt_text) // 2, len(content) // 2, True
+        ledger.record_call(payload['model'], prompt_variant, prompt_tokens, completion_tokens, image_tokens,
+                           latency_ms, outcome, estimated)
 
-                headers = {
-                    'Content-Type': 'application/json',
-                    'Authorization': f'Bearer {self.api_key}'
-                }
-                # 构建请求负载
-                payload = self._build_payload(marked_screenshot_base64)
-                # 打印格式化请求内容
-                # self.logger.info("发送请求到视觉模型API:")
-                # self.logger.info(f"URL: {self.api_url}")
-                # self.logger.info(f"Headers: {json.dumps(headers, indent=2)}")
-                # self.logger.info(f"Payload: {json.dumps(payload, indent=2, ensure_ascii=False)}")
-                response = requests.post(self.api_url, json=payload, headers=headers)
-                # 打印格式化响应内容
-                self.logger.info(f"收到视觉模型API响应:{json.dumps(response.json(), indent=2, ensure_ascii=False)}")
-                # self.logger.info(f"Status Code: {response.status_code}")
-                # 处理响应
-                if response.status_code == 200:
-                    if response.json().get("content") == "":
-                        raise Exception("视觉模型返回空结果")
-                    return self._process_response(response.json())
-
-                self.logger.warning(f"第 {attempt + 1} 次尝试失败，状态码: {response.status_code}")
-
-            except Exception as e:
-                self.logger.warning(f"第 {attempt + 1} 次尝试失败: {str(e)}")
-                if attempt == self.MAX_RETRIES - 1:
-                    self.logger.error("所有尝试均失败")
-                    raise Exception(f"分析截图失败，尝试 {self.MAX_RETRIES} 次后仍未成功: {str(e)}")
-
-        raise Exception("analyze_screenshot 方法中发生意外错误")
+    @staticmethod
+    def _read_stream(response):
+        """读取 SSE 流，回答中第一个 JSON 对象完整时停止读取，返回与非流式响应相同结构的 JSON"""
+        parser = IncrementalJsonObject()
+        usage = None
+        for event in iter_sse_events(response.iter_lines()):
+            if 'choices' not in event and ('code' in event or 'message' in event):
+                # 流中返回的错误，交给 _handle_response_errors 处理
+                return event
+            usage = event.get('usage') or usage
+            for choice in event.get('choices') or []:
+                delta = (choice.get('delta') or {}).get('content')
+                if delta and parser.feed(delta) is not None:
+                    metrics.increment('vision_stream', outcome='early_close')
+                    return {'choices': [{'message': {'role': 'assistant', 'content': parser.text}}],
+                            'usage': usage}
+        metrics.increment('vision_stream', outcome='completed')
+        return {'choices': [{'message': {'role': 'assistant', 'content': parser.text}}], 'usage': usage}
+
+    def _hedge_delay(self, model):
+        """对冲延迟：该模型近期耗时的 VISION_HEDGE_PERCENTILE 分位，样本不足时使用默认值"""
+        settings = get_settings()
+        if metrics.observations('vision_http_ms', model=model) < self.HEDGE_MIN_SAMPLES:
+            delay_ms = settings.vision_hedge_delay_ms
+        else:
+            delay_ms = metrics.percentile('vision_http_ms', settings.vision_hedge_percentile, model=model)
+        return max(delay_ms, settings.vision_hedge_min_delay_ms) / 1000
+
+    def _post_hedged(self, model, payload, timeout):
+        """发送请求，超过对冲延迟仍未返回时用另一个密钥（及备用模型）发出对冲请求，返回 (状态码, 响应 JSON, 来源)"""
+        settings = get_settings()
+        if not settings.vision_hedge_enabled:
+            return (*self._post(payload, timeout), 'primary')
+        hedge_payload = dict(payload, model=settings.vision_hedge_model or model)
+        chosen = []
+        (status_code, response_json), source = hedged_call(
+            lambda: self._post(payload, timeout, chosen=chosen),
+            lambda: self._post(hedge_payload, timeout, avoid=chosen[0] if chosen else None),
+            self._hedge_delay(model), _hedge_budget(), lambda result: result[0] == 200)
+        return status_code, response_json, source
+
+    def _cache_get(self, cache_key):
+        # 缓存不可用时不影响诊断
+        try:
+            with trace.span('vision_cache'):
+                return VisionCache.shared().get(cache_key)
+        except Exception as e:
+            self.logger.warning(f"读取视觉模型结果缓存失败: {e}")
+            return None
+
+    def _cache_put(self, cache_key, result):
+        try:
+            VisionCache.shared().put(cache_key, result)
+        except Exception as e:
+            self.logger.warning(f"写入视觉模型结果缓存失败: {e}")
+
+    def _log_response(self, status_code, response_json):
+        """记录模型响应：摘要每次记录，完整内容按比例采样，失败响应总是完整记录"""
+        usage = response_json.get('usage') or {}
+        self.logger.info(f"收到视觉模型API响应: 状态码 {status_code}, tokens {usage.get('total_tokens')}")
+        if status_code != 200 or (self.logger.isEnabledFor(logging.INFO)
+                                  and random.random() < self.log_sample_rate):
+            # 不再缩进排版，减少格式化与写入的数据量
+            self.logger.info(f"视觉模型API响应内容: {json.dumps(response_json, ensure_ascii=False)}")
 
     @staticmethod
     def convert_image_to_base64(marked_screenshot_image, quality=80) -> str:
         """将截图转换为Base64编码，并降低图像质量以减小数据大小。
 
         Args:
-            marked_screenshot_image: 截图文件路径或PIL.Image对象。
+            marked_screenshot_image: PIL.Image对象，或已编码过的 ImageArtifact（直接复用其编码结果）。
             quality: 图像质量，范围是 1-100，默认值为 50。
 
         Returns:
             Base64编码的字符串。
         """
+        if isinstance(marked_screenshot_image, ImageArtifact):
+            return marked_screenshot_image.base64()
 
         # 创建字节流对象
         byte_stream = BytesIO()
@@ -157,17 +306,18 @@ class VisionModelService:
 
         return base64_str
 
-    def _build_payload(self, marked_screenshot_base64) -> Dict:
+    def _build_payload(self, marked_screenshot_base64, model=None) -> Dict:
         """构建API请求负载。
 
         Args:
             marked_screenshot_base64: Base64编码的截图。
+            model: 模型名称，默认为 DEFAULT_MODEL。
 
         Returns:
             请求负载的字典。
         """
         return {
-            "model": self.DEFAULT_MODEL,
+            "model": model or self.DEFAULT_MODEL,
             "messages": [
                 {
                     "role": "user",
@@ -186,7 +336,8 @@ class VisionModelService:
                     ]
                 }
             ],
-            "stream": False
+            # 流式返回时，回答的 JSON 完整后即停止读取，不等待模型输出的多余文本
+            "stream": get_settings().vision_stream_enabled
         }
 
     @staticmethod
@@ -274,13 +425,9 @@ class VisionModelService:
             content = choice.get('message', {}).get('content', {})
             if isinstance(content, str):
                 try:
-                    if content.startswith('```json'):
-                        content = content[7:]
-                        if content.endswith('```'):
-                            content = content[:-3]
-                            return json.loads(content)
-                    return json.loads(content)  # 假设响应内容直接是JSON字符串
-                except json.JSONDecodeError as e:
+                    # 兼容 ```json 代码块与前后多余文本
+                    return extract_json(content)
+                except ValueError as e:
                     raise Exception(f"无效的JSON格式: {str(e)}")
             else:
                 raise Exception("未在响应中找到预期的JSON内容")
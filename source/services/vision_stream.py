@@ -0,0 +1,79 @@
+"""
+视觉模型流式响应解析模块
+
+模块职责：
+- 解析 chat-completions 的 SSE 流（data: {...} 行），逐段取出 delta 内容
+- 增量扫描模型输出，第一个完整的顶层 JSON 对象闭合时即返回，不必等待模型输出的多余文本
+- extract_json 从完整文本中提取 JSON（兼容 ```json 代码块、前后多余文本），非流式响应也使用
+"""
+import json
+
+__all__ = ['IncrementalJsonObject', 'iter_sse_events', 'extract_json']
+
+
+class IncrementalJsonObject:
+    """逐段喂入文本，第一个顶层 {...} 闭合时 feed 返回解析结果"""
+
+    def __init__(self):
+        self.text = ''
+        self._start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._scanned = 0
+
+    def feed(self, chunk):
+        """追加一段文本，对象已完整时返回 dict，否则返回 None"""
+        self.text += chunk
+        text = self.text
+        for index in range(self._scanned, len(text)):
+            char = text[index]
+            if self._start is None:
+                if char == '{':
+                    self._start, self._depth = index, 1
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._scanned = index + 1
+                    return json.loads(text[self._start:index + 1])
+        self._scanned = len(text)
+        return None
+
+
+def iter_sse_events(lines):
+    """从 SSE 行中依次取出 data 事件的 JSON，遇到 [DONE] 结束"""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        if data:
+            yield json.loads(data)
+
+
+def extract_json(content):
+    """从模型输出中提取第一个 JSON 对象
+
+    Raises:
+        ValueError: 没有完整的 JSON 对象（json.JSONDecodeError 为其子类）
+    """
+    parser = IncrementalJsonObject()
+    result = parser.feed(content)
+    if result is None:
+        raise ValueError("模型输出中没有完整的JSON对象")
+    return result
@@ -0,0 +1,194 @@
+"""
+Appium 会话池模块
+
+模块职责：
+- 每台设备保持一个 Appium 会话，多轮“截图 → 诊断 → 点击”复用同一会话，
+  避免每轮重新创建会话（首次创建可能需要安装 UiAutomator2 服务，耗时可达数分钟）
+- 会话按创建时的应用（app_package、app_activity）复用；同一设备换成其他应用时关闭原会话并重新创建
+  （同一设备同时只保留一个 UiAutomator2 会话）
+- 空闲超过 APPIUM_HEALTH_CHECK_SECONDS 的会话在复用前做一次健康检查，失效时重新创建
+- 使用过程中出错时立即检查会话，失效的会话被丢弃，下一轮自动重连
+- 空闲超过 APPIUM_SESSION_IDLE_SECONDS 的会话被关闭；进程退出时关闭所有会话
+- 会话复用率与创建耗时计入 /api/v1/metrics（appium_session 计数与 appium_session_setup_ms 分布）
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+
+from source.utils.log_config import setup_logger
+from source.utils.metrics import metrics
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['DriverSession', 'DriverSessionPool', 'get_session_pool']
+
+
+def _create_driver(device_name, app_package, app_activity, device_resolution):
+    # appium_Inspector 会加载 Appium / Selenium，首次创建会话时再导入
+    from source.appium_Inspector import AppiumInspector
+
+    return AppiumInspector(device_name, app_package, app_activity, device_resolution).init_driver()
+
+
+class DriverSession:
+    """一台设备的会话：driver 为 Appium 驱动，app 为创建会话时的 (app_package, app_activity)，uses 为被复用的轮数"""
+
+    __slots__ = ('device_name', 'driver', 'app', 'created_at', 'last_used', 'uses', 'lock')
+
+    def __init__(self, device_name, driver, app=None):
+        self.device_name = device_name
+        self.driver = driver
+        self.app = app
+        self.created_at = self.last_used = time.monotonic()
+        self.uses = 0
+        self.lock = threading.Lock()
+
+
+class DriverSessionPool:
+    """按设备名保存的 Appium 会话，同一设备同一时间只有一个使用者"""
+
+    def __init__(self, factory=None, health_check_seconds=None, idle_seconds=None):
+        settings = get_settings()
+        self.factory = factory or _create_driver
+        self.health_check_seconds = health_check_seconds if health_check_seconds is not None \
+            else settings.appium_health_check_seconds
+        self.idle_seconds = idle_seconds if idle_seconds is not None else settings.appium_session_idle_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stats = {'created': 0, 'reused': 0, 'reconnected': 0, 'replaced': 0, 'setup_ms': []}
+
+    @contextmanager
+    def acquire(self, device_name, app_package, app_activity, device_resolution):
+        """取得设备上指定应用的驱动，上下文结束后会话保留在池中供下一轮使用"""
+        self.close_idle()
+        with self._lock:
+            session = self._sessions.get(device_name)
+            if session is None:
+                session = self._sessions[device_name] = DriverSession(device_name, None)
+        with session.lock:
+            if session.driver is not None and session.app != (app_package, app_activity):
+                # 会话的 appPackage / appActivity 在创建时确定，换应用时重新创建
+                logger.info(f"设备 {device_name} 的 Appium 会话属于应用 {session.app}，"
+                            f"为 {app_package}/{app_activity} 重新创建")
+                self._quit(session)
+                self._count('replaced')
+            if session.driver is not None and time.monotonic() - session.last_used > self.health_check_seconds \
+                    and not self._healthy(session.driver):
+                logger.warning(f"设备 {device_name} 的 Appium 会话已失效，重新创建")
+                self._quit(session)
+                self._count('reconnected')
+            if session.driver is None:
+                self._create(session, app_package, app_activity, device_resolution)
+            else:
+                session.uses += 1
+                self._count('reused')
+            try:
+                yield session.driver
+            except Exception:
+                # 出错可能是会话断开（设备重启、UiAutomator2 崩溃），失效时丢弃，下一轮重连
+                if not self._healthy(session.driver):
+                    logger.warning(f"设备 {device_name} 的 Appium 会话在使用中失效，已丢弃")
+                    self._quit(session)
+                raise
+            finally:
+                session.last_used = time.monotonic()
+
+    def _create(self, session, app_package, app_activity, device_resolution):
+        start = time.perf_counter()
+        session.driver = self.factory(session.device_name, app_package, app_activity, device_resolution)
+        session.app = (app_package, app_activity)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        session.created_at = time.monotonic()
+        session.uses = 0
+        self._count('created')
+        with self._lock:
+            self._stats['setup_ms'].append(elapsed_ms)
+        metrics.observe('appium_session_setup_ms', elapsed_ms)
+        logger.info(f"设备 {session.device_name} 创建 Appium 会话，耗时 {elapsed_ms:.0f}ms")
+
+    def _count(self, outcome):
+        # 不同设备的会话在各自的锁内使用，计数需要加锁
+        with self._lock:
+            self._stats[outcome] += 1
+        metrics.increment('appium_session', outcome=outcome)
+
+    @staticmethod
+    def _healthy(driver):
+        """轻量命令能正常返回即视为会话可用"""
+        if driver is None:
+            return False
+        try:
+            driver.get_window_size()
+            return True
+        except Exception as e:
+            logger.info(f"Appium 会话健康检查失败: {e}")
+            return False
+
+    @staticmethod
+    def _quit(session):
+        driver, session.driver = session.driver, None
+        if driver is None:
+            return
+        try:
+            driver.quit()
+        except Exception as e:
+            logger.info(f"关闭 Appium 会话失败: {e}")
+
+    def close_idle(self):
+        """关闭空闲超过 APPIUM_SESSION_IDLE_SECONDS 的会话，返回关闭的数量"""
+        if not self.idle_seconds:
+            return 0
+        now = time.monotonic()
+        with self._lock:
+            idle = [session for session in self._sessions.values()
+                    if session.driver is not None and now - session.last_used > self.idle_seconds]
+        closed = 0
+        for session in idle:
+            # 正在使用的会话不关闭
+            if session.lock.acquire(blocking=False):
+                try:
+                    self._quit(session)
+                    closed += 1
+                finally:
+                    session.lock.release()
+        if closed:
+            logger.info(f"关闭 {closed} 个空闲的 Appium 会话")
+        return closed
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            with session.lock:
+                self._quit(session)
+
+    def stats(self):
+        """会话创建次数、复用次数、复用率与创建耗时"""
+        created, reused = self._stats['created'], self._stats['reused']
+        setup_ms = sorted(self._stats['setup_ms'])
+        return {
+            'created': created,
+            'reused': reused,
+            'reconnected': self._stats['reconnected'],
+            'replaced': self._stats['replaced'],
+            'reuse_rate': round(reused / (created + reused), 4) if created + reused else None,
+            'setup_ms_median': round(setup_ms[len(setup_ms) // 2], 1) if setup_ms else None,
+            'setup_ms_max': round(setup_ms[-1], 1) if setup_ms else None,
+        }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_session_pool():
+    """进程内共享的会话池，进程退出时关闭所有会话"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = DriverSessionPool()
+            atexit.register(_pool.close_all)
+    return _pool
@@ -0,0 +1,104 @@
+import os
+
+from source.benchmark.synthetic import make_screen
+from source.services.artifact_store import ArtifactStore, resolve_screenshot
+from source.services.image_artifact import ImageArtifact
+from source.utils.settings import reload_settings
+
+
+def _store(tmp_path, **kwargs):
+    return ArtifactStore(str(tmp_path / 'artifacts'), str(tmp_path / 'digger.db'), **kwargs)
+
+
+def test_identical_frames_are_stored_once_in_fanned_out_directories(tmp_path):
+    store = _store(tmp_path)
+    first = store.put('dev_20250101_000000_marked_screenshot', b'frame', 'jpeg')
+    second = store.put('dev_20250101_000005_marked_screenshot', b'frame', 'jpeg')
+    assert first == second
+    digest = os.path.splitext(os.path.basename(first))[0]
+    assert os.path.dirname(first) == str(tmp_path / 'artifacts' / digest[:2] / digest[2:4])
+    assert store.resolve('dev_20250101_000005_marked_screenshot') == first
+    assert store.resolve('missing') is None
+
+
+def test_prune_keeps_blobs_still_referenced(tmp_path):
+    store = _store(tmp_path)
+    shared = store.put('old', b'same', 'jpeg')
+    store.put('new', b'same', 'jpeg')
+    only_old = store.put('old_only', b'other', 'jpeg')
+    store.conn.execute("UPDATE artifact_index SET created_at = created_at - 5 * 86400 WHERE name LIKE 'old%'")
+    store.conn.commit()
+
+    assert store.prune(max_age_days=3) == (1, len(b'other'))
+    assert os.path.exists(shared) and not os.path.exists(only_old)
+    assert store.resolve('old') is None and store.resolve('new') == shared
+
+
+def test_prune_by_total_size_removes_least_recent_content(tmp_path):
+    store = _store(tmp_path)
+    mb = 1024 * 1024
+    for index in range(3):
+        store.put(f'shot{index}', bytes([index]) * mb, 'jpeg')
+        store.conn.execute('UPDATE artifact_index SET created_at = ? WHERE name = ?', (index, f'shot{index}'))
+    store.conn.commit()
+    assert store.prune(max_total_mb=2) == (1, mb)
+    assert store.resolve('shot0') is None and store.resolve('shot2') is not None
+
+
+def test_overwritten_name_releases_previous_content(tmp_path):
+    store = _store(tmp_path)
+    previous = store.put('shot', b'first', 'jpeg')
+    store.put('shot', b'second', 'jpeg')
+    assert not os.path.exists(previous)
+
+
+def test_diagnosis_screenshots_go_through_the_store(tmp_path, monkeypatch):
+    from source.api.services.diagnosis_service import store_screenshot
+
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'digger.db'))
+    monkeypatch.setenv('ARTIFACT_DIR', str(tmp_path / 'artifacts'))
+    reload_settings()
+    artifact = ImageArtifact(make_screen(360, 640).convert('L'))
+    path = store_screenshot(artifact, str(tmp_path / 'screenshots' / 'dev'), 'dev_1_2_grayscale_image')
+    with open(path, 'rb') as f:
+        assert f.read() == artifact.jpeg()
+    assert resolve_screenshot(str(tmp_path / 'screenshots'), 'dev', 'dev_1_2_grayscale_image') == path
+    assert not (tmp_path / 'screenshots').exists()
+
+    # WebP 格式重新编码保存
+    store = _store(tmp_path, image_format='webp')
+    assert store.put_image('webp_shot', artifact).endswith('.webp')
+
+    monkeypatch.setenv('ARTIFACT_STORE_ENABLED', 'False')
+    reload_settings()
+    path = store_screenshot(artifact, str(tmp_path / 'screenshots' / 'dev'), 'dev_1_3_grayscale_image')
+    assert path == str(tmp_path / 'screenshots' / 'dev' / 'dev_1_3_grayscale_image.jpeg')
+    assert resolve_screenshot(str(tmp_path / 'screenshots'), 'dev', 'dev_1_3_grayscale_image') == path
+
+
+def test_blob_removed_by_concurrent_prune_is_rewritten(tmp_path, monkeypatch):
+    store = _store(tmp_path)
+    path = store.put('old', b'frame', 'jpeg')
+    store.conn.execute("UPDATE artifact_index SET created_at = created_at - 5 * 86400 WHERE name = 'old'")
+    store.conn.commit()
+
+    real_exists = os.path.exists
+    checks = []
+
+    def exists(candidate):
+        # 模拟在去重检查之后、put 返回之前，另一个进程的清理删除了旧记录与文件
+        if candidate == path and not checks:
+            checks.append(candidate)
+            result = real_exists(candidate)
+            store.conn.execute("DELETE FROM artifact_index WHERE name = 'old'")
+            store.conn.commit()
+            os.remove(candidate)
+            return result
+        return real_exists(candidate)
+
+    monkeypatch.setattr(os.path, 'exists', exists)
+    assert store.put('new', b'frame', 'jpeg') == path
+    monkeypatch.undo()
+    assert os.path.exists(path) and store.resolve('new') == path
+    # 新记录提交后，清理不会再删除仍被引用的内容
+    assert store.prune(max_age_days=3) == (0, 0) and os.path.exists(path)
@@ -0,0 +1,76 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from source.benchmark.run import summarize, compare_results
+from source.benchmark.synthetic import parse_resolution, make_screen, add_popup_overlay, make_hierarchy_xml
+
+
+def _clickable_nodes(xml):
+    root = ET.fromstring(xml.split('?>', 1)[1])
+    return [node for node in root.iter() if node.get('clickable') == 'true']
+
+
+def test_parse_resolution():
+    assert parse_resolution('1080x2400') == (1080, 2400)
+    assert parse_resolution('720X1280') == (720, 1280)
+    with pytest.raises(ValueError):
+        parse_resolution('1080*2400')
+
+
+def test_summarize():
+    result = summarize([5.0, 1.0, 3.0, 2.0, 4.0])
+    assert result['count'] == 5
+    assert result['min_ms'] == 1.0
+    assert result['max_ms'] == 5.0
+    assert result['median_ms'] == 3.0
+    assert result['mean_ms'] == 3.0
+    assert result['p95_ms'] == 5.0
+
+
+def test_summarize_single_sample():
+    result = summarize([7.5])
+    assert result['min_ms'] == result['median_ms'] == result['p95_ms'] == result['max_ms'] == 7.5
+
+
+def test_compare_results_matches_stage_and_params():
+    baseline = {'results': [
+        {'stage': 'match', 'params': {'templates': 10, 'resolution': '720x1280'}, 'median_ms': 10.0},
+        {'stage': 'match', 'params': {'templates': 50, 'resolution': '720x1280'}, 'median_ms': 40.0},
+        {'stage': 'draw', 'params': {'clickable': 4}, 'median_ms': 0.0},
+    ]}
+    current = {'results': [
+        # 参数顺序不同也应视为同一项
+        {'stage': 'match', 'params': {'resolution': '720x1280', 'templates': 10}, 'median_ms': 5.0},
+        {'stage': 'draw', 'params': {'clickable': 4}, 'median_ms': 1.0},
+        {'stage': 'new_stage', 'params': {}, 'median_ms': 1.0},
+    ]}
+    rows = compare_results(current, baseline)
+    assert len(rows) == 2
+    stage, params, old, new, ratio = rows[0]
+    assert (stage, old, new, ratio) == ('match', 10.0, 5.0, 0.5)
+    assert rows[1][4] == float('inf')
+
+
+def test_make_hierarchy_xml_clickable_count():
+    xml = make_hierarchy_xml(720, 1280, node_count=40, clickable_count=6)
+    assert len(_clickable_nodes(xml)) == 6
+
+
+def test_make_hierarchy_xml_with_popup_adds_two_clickables():
+    screen, popup = add_popup_overlay(make_screen(360, 640, seed=1), seed=1)
+    assert screen.size == (360, 640)
+    xml = make_hierarchy_xml(360, 640, node_count=30, clickable_count=4, popup=popup)
+    clickable = _clickable_nodes(xml)
+    assert len(clickable) == 4 + 2
+    # 弹窗的关闭按钮位于末尾，bounds 与弹窗信息一致
+    x1, y1, x2, y2 = popup['close_bounds']
+    assert clickable[-1].get('bounds') == f'[{x1},{y1}][{x2},{y2}]'
+
+
+def test_make_hierarchy_xml_bounds_are_drawable():
+    # 节点多、分辨率小时也要保证 y2 > y1，否则绘制边框会失败
+    xml = make_hierarchy_xml(360, 640, node_count=80, clickable_count=80)
+    for node in _clickable_nodes(xml):
+        x1, y1, x2, y2 = map(int, node.get('bounds').replace('][', ',').strip('[]').split(','))
+        assert x2 - x1 > 10 and y2 - y1 > 10
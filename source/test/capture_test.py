@@ -0,0 +1,105 @@
+import asyncio
+import socket
+import struct
+import threading
+
+import pytest
+
+from source.tools.capture import (AdbSocketBackend, AsyncAdbClient, AdbProtocolError, parse_raw_screencap,
+                                  strip_dump_output, get_capture_backend)
+
+
+def _raw_frame(width, height, header_size=16):
+    header = struct.pack('<III', width, height, 1) + b'\x00' * (header_size - 12)
+    # 每个像素 RGBA = (10, 20, 30, 255)
+    return header + bytes([10, 20, 30, 255]) * (width * height)
+
+
+class FakeAdbServer:
+    """按 ADB 主机协议应答：校验 transport 与 exec 请求后返回预设输出"""
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+        self.requests = []
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    @staticmethod
+    def _read_request(conn):
+        length = int(conn.recv(4), 16)
+        data = b''
+        while len(data) < length:
+            data += conn.recv(length - len(data))
+        return data.decode('utf-8')
+
+    def _serve(self):
+        while True:
+            conn, _ = self.sock.accept()
+            with conn:
+                transport = self._read_request(conn)
+                self.requests.append(transport)
+                if transport == 'host:devices':
+                    listing = b'dev1\tdevice\nemulator-5556\toffline\n'
+                    conn.sendall(b'OKAY' + b'%04x' % len(listing) + listing)
+                    continue
+                if transport != 'host:transport:dev1':
+                    message = b'device not found'
+                    conn.sendall(b'FAIL' + b'%04x' % len(message) + message)
+                    continue
+                conn.sendall(b'OKAY')
+                command = self._read_request(conn)
+                self.requests.append(command)
+                conn.sendall(b'OKAY' + self.outputs[command])
+
+
+def test_parse_raw_screencap_handles_both_header_sizes():
+    for header_size in (12, 16):
+        image = parse_raw_screencap(_raw_frame(4, 3, header_size))
+        assert image.size == (4, 3)
+        assert image.mode == 'RGB'
+        assert image.getpixel((0, 0)) == (10, 20, 30)
+    with pytest.raises(ValueError):
+        parse_raw_screencap(_raw_frame(4, 3)[:-1])
+
+
+def test_strip_dump_output():
+    text = '<?xml version="1.0" ?><hierarchy rotation="0"><node /></hierarchy>UI hierchary dumped to: /dev/tty\n'
+    assert strip_dump_output(text) == '<?xml version="1.0" ?><hierarchy rotation="0"><node /></hierarchy>'
+    with pytest.raises(ValueError):
+        strip_dump_output('ERROR: could not get idle state.')
+
+
+def test_adb_socket_backend_speaks_host_protocol():
+    xml = '<hierarchy rotation="0"><node /></hierarchy>'
+    server = FakeAdbServer({
+        'exec:screencap': _raw_frame(5, 2),
+        'exec:uiautomator dump /dev/tty': (xml + 'UI hierchary dumped to: /dev/tty').encode('utf-8'),
+    })
+    backend = AdbSocketBackend(host='127.0.0.1', port=server.port)
+    assert backend.screenshot('dev1').size == (5, 2)
+    assert backend.dump_xml('dev1') == xml
+    assert server.requests[:2] == ['host:transport:dev1', 'exec:screencap']
+    with pytest.raises(AdbProtocolError, match='device not found'):
+        backend.screenshot('dev2')
+
+
+def test_async_adb_client_lists_devices_and_captures():
+    server = FakeAdbServer({'exec:screencap': _raw_frame(5, 2), 'exec:input tap 3 4': b''})
+    client = AsyncAdbClient(host='127.0.0.1', port=server.port)
+
+    async def run():
+        return await client.devices(), await client.screenshot('dev1'), await client.tap('dev1', 3.2, 4)
+
+    devices, (data, width, height), _ = asyncio.run(run())
+    assert devices == ['dev1']
+    assert (width, height, len(data)) == (5, 2, 16 + 5 * 2 * 4)
+    assert server.requests[-1] == 'exec:input tap 3 4'
+
+
+def test_get_capture_backend_rejects_unknown_name():
+    assert get_capture_backend('adb') is get_capture_backend('adb')
+    with pytest.raises(ValueError):
+        get_capture_backend('missing')
@@ -0,0 +1,13 @@
+import pytest
+
+from source.utils.settings import reload_settings
+
+# 以下为需要真机或运行中服务的手工脚本，不参与 pytest 收集
+collect_ignore = ['api_test.py', 'uiautomator_test.py', 'parser_utils.py']
+
+
+@pytest.fixture(autouse=True)
+def _restore_settings():
+    # 在 monkeypatch 恢复环境变量之后执行，避免测试修改的配置影响后续测试
+    yield
+    reload_settings()
@@ -0,0 +1,108 @@
+import pytest
+
+from source.api import api as api_module
+from source.services.cost_ledger import CostLedger, estimate_image_tokens, get_ledger, ledger_context
+from source.services.vision_model import VisionModelService
+from source.utils.settings import reload_settings
+
+
+@pytest.fixture
+def ledger_env(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'elements.db'))
+    monkeypatch.setenv('VISION_PRICE_PER_MILLION_TOKENS', '1.0')
+    monkeypatch.setenv('VISION_MODEL_PRICES', 'large=4.0')
+    reload_settings()
+    return tmp_path
+
+
+def test_summary_aggregates_calls_and_diagnoses(ledger_env):
+    ledger = CostLedger()
+    with ledger_context(app='com.demo', device='emulator-5554'):
+        ledger.record_call('fast', 'resolution', 900, 100, 700, 1200, 'ok')
+        ledger.record_call('large', 'resolution', 900, 100, 700, 3000, 'ok')
+        ledger.record_diagnosis('model')
+    with ledger_context(app='com.other'):
+        ledger.record_call('fast', 'xml', 0, 0, 0, 0, 'cache')
+        ledger.record_diagnosis('model')
+        ledger.record_diagnosis('frame_cache')
+
+    report = ledger.summary(3600)
+    assert report['calls'] == 2 and report['cache_hits'] == 1 and report['diagnoses'] == 3
+    assert report['total_tokens'] == 2000 and report['image_tokens'] == 1400
+    # fast 1 元 / 百万 token，large 4 元 / 百万 token
+    assert report['cost'] == pytest.approx(0.005)
+    assert report['cost_per_diagnosis'] == pytest.approx(0.005 / 3, abs=1e-6)
+    assert report['by_outcome'] == {'model': 2, 'frame_cache': 1}
+    assert report['by_model']['large']['avg_latency_ms'] == 3000
+    assert report['by_app']['com.demo']['calls_per_diagnosis'] == 2
+    assert report['by_app']['com.other']['calls'] == 0
+
+
+def test_rows_are_buffered_until_flush(ledger_env):
+    ledger = CostLedger()
+    ledger.record_call('fast', 'xml', 10, 1, 5, 100, 'ok')
+    assert ledger.conn.execute('SELECT COUNT(*) FROM vision_ledger').fetchone()[0] == 0
+    ledger.flush()
+    assert ledger.conn.execute('SELECT COUNT(*) FROM vision_ledger').fetchone()[0] == 1
+
+
+def test_vision_calls_and_endpoint(ledger_env, monkeypatch):
+    class Response:
+        status_code = 200
+
+        def json(self):
+            return {'choices': [{'message': {'content': '{"popup_exists": false, "popup_cancel_button": null}'}}],
+                    'usage': {'prompt_tokens': 1500, 'completion_tokens': 20, 'total_tokens': 1520}}
+
+        def close(self):
+            pass
+
+    import requests
+    monkeypatch.setattr(requests, 'post', lambda *args, **kwargs: Response())
+    monkeypatch.setenv('VISION_MODEL_API_URL', 'http://127.0.0.1:1/v1/chat/completions')
+    monkeypatch.setenv('VISION_MODEL_API_KEY', 'test')
+    monkeypatch.setenv('VISION_MODEL_TIERS', 'fast')
+    monkeypatch.setenv('VISION_STREAM_ENABLED', 'False')
+    monkeypatch.setenv('VISION_HEDGE_ENABLED', 'False')
+    monkeypatch.setenv('VISION_CACHE_ENABLED', 'False')
+    reload_settings()
+
+    from PIL import Image
+    with ledger_context(app='com.demo'):
+        VisionModelService().analyze_screenshot(Image.new('RGB', (280, 560)))
+
+    response = api_module.app.test_client().get('/api/v1/ledger?window=600')
+    assert response.status_code == 200
+    assert response.json['by_model']['fast']['prompt_tokens'] == 1500
+    assert response.json['by_app']['com.demo']['image_tokens'] == estimate_image_tokens(280, 560) == 200
+    assert get_ledger().summary(600)['by_model']['fast']['calls'] == 1
+
+
+def test_diagnosis_outcome_is_the_path_that_answered(ledger_env):
+    from source.services.cost_ledger import diagnosis_answer, mark_answer, mark_model_call
+
+    with diagnosis_answer() as answer:
+        mark_answer('xml_rules')
+    assert answer.outcome() == 'xml_rules'
+    with diagnosis_answer() as answer:
+        mark_answer('model')
+    # 模型路径只命中了结果缓存，没有真正调用模型
+    assert answer.outcome() == 'vision_cache'
+    with diagnosis_answer() as answer:
+        mark_answer('model')
+        mark_model_call()
+    assert answer.outcome() == 'model'
+    with diagnosis_answer() as answer:
+        pass
+    assert answer.outcome() == 'no_answer'
+    # 诊断之外的标记被忽略
+    mark_answer('template')
+
+    ledger = CostLedger()
+    ledger.record_call('fast', 'xml', 900, 100, 700, 1200, 'ok')
+    for outcome in ('model', 'xml_rules', 'icon_locator', 'template'):
+        ledger.record_diagnosis(outcome)
+    report = ledger.summary(3600)
+    # 花费只分摊到真正调用了模型的诊断上
+    assert report['model_diagnoses'] == 1 and report['cost_per_model_diagnosis'] == pytest.approx(0.001)
+    assert report['cost_per_diagnosis'] == pytest.approx(0.00025)
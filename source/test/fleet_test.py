@@ -0,0 +1,77 @@
+import asyncio
+import struct
+import threading
+
+from source.fleet import FleetRunner
+
+
+class FakeClient:
+    """模拟 AsyncAdbClient：固定设备列表，截图返回纯色原始帧"""
+
+    def __init__(self, serials, delay=0.01):
+        self.serials = serials
+        self.delay = delay
+        self.taps = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def devices(self):
+        return list(self.serials)
+
+    async def screenshot(self, serial):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return struct.pack('<IIII', 4, 8, 1, 0) + b'\x80' * (4 * 8 * 4), 4, 8
+
+    async def tap(self, serial, x, y):
+        self.taps.append((serial, x, y))
+
+
+class FakeRunner(FleetRunner):
+    def __init__(self, **kwargs):
+        super().__init__(mode='api', **kwargs)
+        self.diagnosed = []
+        self.threads = set()
+        self.feedbacks = []
+
+    def diagnose(self, serial, screenshot_bytes, resolution):
+        self.threads.add(threading.get_ident())
+        self.diagnosed.append((serial, resolution))
+        # 只有 dev0 有弹窗
+        return (10, 20) if serial == 'dev0' else None
+
+    def feedback(self, serial):
+        self.feedbacks.append(serial)
+
+
+def test_fleet_runner_inspects_all_devices_with_bounded_concurrency():
+    client = FakeClient([f'dev{i}' for i in range(12)])
+    runner = FakeRunner(interval=0.05, capture_concurrency=2, diagnose_concurrency=2, client=client)
+    report = asyncio.run(runner.run(duration=0.6))
+
+    assert sorted(report) == sorted(client.serials)
+    assert all(summary['loops'] >= 2 for summary in report.values())
+    assert client.max_in_flight <= 2
+    # 诊断线程数受线程池大小限制，与设备数无关
+    assert len(runner.threads) <= 4
+    assert {serial for serial, _, _ in client.taps} == {'dev0'}
+    assert report['dev0']['taps'] == len(client.taps) == len(runner.feedbacks)
+    assert runner.diagnosed[0][1] == '(4, 8)'
+
+
+def test_fleet_runner_filters_devices_and_counts_errors():
+    client = FakeClient(['dev0', 'dev1'])
+
+    async def broken(serial):
+        raise ConnectionError('offline')
+
+    client.screenshot = broken
+    runner = FakeRunner(interval=0.05, devices=['dev1'], client=client, dry_run=True)
+    report = asyncio.run(runner.run(duration=0.3))
+    assert list(report) == ['dev1']
+    assert report['dev1']['errors'] >= 1
+    assert report['dev1']['last_error'] == 'offline'
@@ -0,0 +1,81 @@
+import base64
+import io
+import time
+
+from PIL import Image, ImageDraw
+
+from source.api import api as api_module
+from source.api.utils.frame_cache import FrameCache, frame_fingerprint, frame_difference
+
+
+def _screen(popup=False, noise=0):
+    image = Image.new('RGB', (360, 640), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 360, 60), fill=(30, 90, 200))
+    if noise:
+        # 状态栏时间等小区域变化
+        draw.rectangle((300, 10, 300 + noise, 20), fill=(0, 0, 0))
+    if popup:
+        draw.rectangle((40, 200, 320, 440), fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def test_fingerprint_ignores_small_changes_and_detects_popup():
+    size, base = frame_fingerprint(_screen())
+    assert size == (360, 640)
+    assert frame_difference(base, frame_fingerprint(_screen(noise=6))[1]) <= 0.01
+    assert frame_difference(base, frame_fingerprint(_screen(popup=True))[1]) > 0.1
+
+
+def test_frame_cache_rules():
+    cache = FrameCache(threshold=0.01, ttl_seconds=30, max_hits=2)
+    size, fingerprint = frame_fingerprint(_screen(popup=True))
+    result = (100, 200, None)
+    cache.store('dev1', 'resolution', size, fingerprint, result)
+
+    assert cache.lookup('dev1', 'xml', size, fingerprint) is None
+    assert cache.lookup('dev1', 'resolution', (720, 1280), fingerprint) is None
+    assert cache.lookup('dev1', 'resolution', size, frame_fingerprint(_screen())[1]) is None
+    assert cache.lookup('dev2', 'resolution', size, fingerprint) is None
+    # 达到复用次数上限后失效
+    assert cache.lookup('dev1', 'resolution', size, fingerprint) == result
+    assert cache.lookup('dev1', 'resolution', size, fingerprint) == result
+    assert cache.lookup('dev1', 'resolution', size, fingerprint) is None
+
+    cache.store('dev1', 'resolution', size, fingerprint, result)
+    assert cache.invalidate('dev1') is True
+    assert cache.lookup('dev1', 'resolution', size, fingerprint) is None
+
+    cache = FrameCache(threshold=0.01, ttl_seconds=0.01, max_hits=0)
+    cache.store('dev1', 'resolution', size, fingerprint, result)
+    time.sleep(0.02)
+    assert cache.lookup('dev1', 'resolution', size, fingerprint) is None
+
+
+def test_diagnose_reuses_result_until_feedback(monkeypatch):
+    calls = []
+
+    def fake_lvm_analysis(screenshot_bytes, resolution, device_name):
+        calls.append(device_name)
+        return 100, 200, None
+
+    monkeypatch.setattr(api_module, 'lvm_analysis', fake_lvm_analysis)
+    cache = FrameCache(threshold=0.01, ttl_seconds=30, max_hits=3)
+    monkeypatch.setattr(api_module, 'get_frame_cache', lambda: cache)
+    client = api_module.app.test_client()
+    payload = {'screenshot': base64.b64encode(_screen(popup=True)).decode('utf-8'), 'devices_name': 'dev1',
+               'resolution': '(360, 640)'}
+
+    first = client.post('/api/v1/diagnose', json=payload)
+    second = client.post('/api/v1/diagnose', json=payload)
+    assert first.status_code == second.status_code == 200
+    assert first.json['cached'] is False and second.json['cached'] is True
+    assert second.json['center'] == [100, 200]
+    assert len(calls) == 1
+
+    assert client.post('/api/v1/feedback', json={'devices_name': 'dev1'}).json['invalidated'] is True
+    client.post('/api/v1/diagnose', json=payload)
+    client.post('/api/v1/diagnose', json=dict(payload, force=True))
+    assert len(calls) == 3
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from source.services.hedging import HedgeBudget, hedged_call, hedge_stats
+from source.utils.metrics import metrics
+
+
+def _slow(value, seconds, calls=None):
+    def call():
+        if calls is not None:
+            calls.append(value)
+        time.sleep(seconds)
+        return value
+
+    return call
+
+
+def test_fast_primary_is_not_hedged():
+    metrics.reset()
+    calls = []
+    result, source = hedged_call(_slow('primary', 0), _slow('hedge', 0, calls), 0.5, HedgeBudget(1.0),
+                                 lambda result: True)
+    assert (result, source) == ('primary', 'primary')
+    assert calls == []
+    assert hedge_stats()['hedges'] == 0
+
+
+def test_slow_primary_is_hedged_and_hedge_wins():
+    metrics.reset()
+    result, source = hedged_call(_slow('primary', 0.5), _slow('hedge', 0), 0.05, HedgeBudget(1.0),
+                                 lambda result: True)
+    assert (result, source) == ('hedge', 'hedge')
+    stats = hedge_stats()
+    assert stats['hedge_rate'] == 1 and stats['hedge_win_rate'] == 1
+
+
+def test_failed_answer_waits_for_the_other_request():
+    metrics.reset()
+    result, source = hedged_call(_slow('primary', 0.2), _slow('bad', 0.06), 0.05, HedgeBudget(1.0),
+                                 lambda result: result != 'bad')
+    assert (result, source) == ('primary', 'primary')
+    assert metrics.counter('vision_hedge_win', winner='primary') == 1
+
+
+def test_hedge_rate_is_capped():
+    metrics.reset()
+    budget = HedgeBudget(0.25, burst=1)
+    for _ in range(8):
+        hedged_call(_slow('primary', 0.03), _slow('hedge', 0.03), 0.001, budget, lambda result: True)
+    stats = hedge_stats()
+    # 首个请求可对冲，之后每 4 个请求积累 1 次
+    assert stats['requests'] == 8
+    assert 2 <= stats['hedges'] <= 3
+    assert stats['skipped_rate_limit'] == 8 - stats['hedges']
+
+
+def test_budget_is_thread_safe():
+    budget = HedgeBudget(0.5, burst=100)
+    threads = [threading.Thread(target=lambda: [budget.record_request() for _ in range(100)]) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    spent = sum(budget.try_spend() for _ in range(1000))
+    assert spent == 100
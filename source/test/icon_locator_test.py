@@ -0,0 +1,75 @@
+from PIL import Image
+
+from source.api.utils.icon_locator import IconLibrary, IconLocator
+from source.api.utils.popup_detector import PopupDetector
+from source.benchmark.synthetic import add_popup_overlay, make_screen
+
+
+def _popup(width, height, seed):
+    screen, popup = add_popup_overlay(make_screen(width, height, seed=seed), seed=seed)
+    return screen.convert('L'), popup
+
+
+def _library(tmp_path, width=1080, height=1920):
+    library = IconLibrary(icon_dir=str(tmp_path / 'icons'), max_icons=5)
+    image, popup = _popup(width, height, seed=0)
+    assert library.add(image, *popup['close_button'], 'close_x')
+    return library
+
+
+def test_learned_icon_is_found_on_new_popups(tmp_path):
+    locator = IconLocator(_library(tmp_path), threshold=0.8)
+    for seed in (101, 102, 103):
+        image, popup = _popup(1080, 1920, seed)
+        x0, y0, x1, y1 = popup['close_bounds']
+        # 有无弹窗边界框都能定位
+        for region in (PopupDetector().detect(image).box, None):
+            match = locator.locate(image, region)
+            assert match is not None and x0 <= match.x <= x1 and y0 <= match.y <= y1
+
+
+def test_plain_screens_are_not_matched(tmp_path):
+    locator = IconLocator(_library(tmp_path), threshold=0.8)
+    for seed in (201, 202, 203):
+        assert locator.locate(make_screen(1080, 1920, seed=seed).convert('L')) is None
+
+
+def test_library_rejects_flat_and_duplicate_icons_and_evicts_oldest(tmp_path):
+    library = _library(tmp_path)
+    image, popup = _popup(1080, 1920, seed=1)
+    assert not library.add(image, *popup['close_button'], 'duplicate')
+    assert not library.add(image, 5, 5, 'out_of_bounds')
+    assert not library.add(Image.new('L', (1080, 1920), 200), 540, 960, 'flat')
+
+    library.max_icons = 1
+    screen = make_screen(1080, 1920, seed=7).convert('L')
+    assert library.add(screen, 540, 60, 'status_bar')
+    assert [name for name, _ in library.icons()] == ['status_bar.png']
+
+
+def test_locator_is_skipped_when_detector_is_uncertain(tmp_path, monkeypatch):
+    from source.api.services import diagnosis_service
+    from source.api.utils.popup_detector import PopupDetection
+    from source.utils.settings import reload_settings
+
+    class Matcher:
+        def match_known_popups(self, image):
+            return False, None
+
+    def locator():
+        raise AssertionError('检测器不确定时不应整屏搜索图标')
+
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'elements.db'))
+    reload_settings()
+    detections = []
+    monkeypatch.setattr(diagnosis_service, 'TemplateMatcher', Matcher)
+    monkeypatch.setattr(diagnosis_service, 'detect_popup', lambda image: detections[-1])
+    monkeypatch.setattr(diagnosis_service, 'classify_screenshot', lambda image: None)
+    monkeypatch.setattr(diagnosis_service, 'get_icon_locator', locator)
+    monkeypatch.setattr(diagnosis_service, 'diagnose_and_handle_lvm', lambda *args, **kwargs: (None, None))
+
+    import io
+    screenshot = io.BytesIO()
+    make_screen(360, 640).save(screenshot, format='PNG')
+    detections.append(PopupDetection('uncertain', 0.5, None, (360, 640), 1.0))
+    assert diagnosis_service.lvm_analysis(screenshot.getvalue(), '360x640', 'dev') == (None, None, None)
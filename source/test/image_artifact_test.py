@@ -0,0 +1,31 @@
+from base64 import b64decode
+
+from PIL import Image
+
+from source.benchmark.synthetic import make_screen
+from source.services.image_artifact import ImageArtifact
+from source.services.vision_model import VisionModelService
+from source.utils.metrics import metrics
+
+
+def test_model_payload_and_saved_file_share_one_encode(tmp_path):
+    from source.api.services.diagnosis_service import save_screenshot
+
+    image = make_screen(360, 640, seed=1)
+    artifact = ImageArtifact(image)
+    encodes = metrics.observations('image_encode_cpu_ms')
+
+    payload = VisionModelService.convert_image_to_base64(artifact)
+    path = save_screenshot(artifact, str(tmp_path / 'device'), 'shot_marked_screenshot')
+
+    assert metrics.observations('image_encode_cpu_ms') == encodes + 1
+    with open(path, 'rb') as f:
+        assert f.read() == b64decode(payload) == artifact.jpeg()
+    # 与直接编码 PIL 图像的结果一致，视觉模型结果缓存的键不受影响
+    assert payload == VisionModelService.convert_image_to_base64(image, quality=artifact.quality)
+    assert artifact.size == image.size and artifact.encode_cpu_ms >= 0
+
+
+def test_rgba_images_are_encoded_as_rgb():
+    artifact = ImageArtifact(Image.new('RGBA', (64, 64), (200, 10, 10, 128)), quality=70)
+    assert artifact.jpeg()[:2] == b'\xff\xd8'
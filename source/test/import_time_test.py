@@ -0,0 +1,30 @@
+import subprocess
+import sys
+
+from source.benchmark.import_time import HEAVY_PACKAGES, parse_importtime, summarize_imports, project_root
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2000 |       5000 | flask
+import time:      3000 |       3000 |   flask.app
+import time:       400 |        400 |     lxml.etree
+"""
+
+
+def test_parse_importtime():
+    rows = parse_importtime(SAMPLE)
+    assert rows[0] == ('_io', 120, 120, 1)
+    assert rows[2] == ('flask.app', 3000, 3000, 1)
+    assert rows[3][3] == 2
+    summary = summarize_imports(rows, top=1)
+    assert summary['modules'] == 4
+    assert summary['top_packages'] == [('flask', 5.0)]
+    assert summary['heavy_loaded'] == ['lxml']
+
+
+def test_api_run_does_not_load_heavy_packages():
+    code = ('import sys, api_run; '
+            f'print(",".join(p for p in {HEAVY_PACKAGES!r} if p in sys.modules))')
+    result = subprocess.run([sys.executable, '-c', code], cwd=project_root, stdout=subprocess.PIPE, text=True,
+                            check=True)
+    assert result.stdout.strip() == ''
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import time
+
+from source.job import prune_directory, run_maintenance
+from source.services.recorder import Recorder
+from source.utils.settings import reload_settings
+
+
+def _write(path, size, age_days):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'x' * size)
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+
+
+def test_prune_directory_by_age(tmp_path):
+    _write(tmp_path / 'dev1' / 'old.jpeg', 10, age_days=5)
+    _write(tmp_path / 'dev1' / 'new.jpeg', 10, age_days=1)
+    deleted, freed = prune_directory(str(tmp_path), max_age_days=3)
+    assert [os.path.basename(path) for path in deleted] == ['old.jpeg']
+    assert freed == 10
+    assert (tmp_path / 'dev1' / 'new.jpeg').exists()
+
+
+def test_prune_directory_by_total_size_removes_oldest(tmp_path):
+    mb = 1024 * 1024
+    _write(tmp_path / 'a.jpeg', mb, age_days=3)
+    _write(tmp_path / 'b' / 'b.jpeg', mb, age_days=2)
+    _write(tmp_path / 'c.jpeg', mb, age_days=1)
+    deleted, _ = prune_directory(str(tmp_path), max_total_mb=2)
+    assert [os.path.basename(path) for path in deleted] == ['a.jpeg']
+    assert prune_directory(str(tmp_path / 'missing'), max_age_days=1) == ([], 0)
+
+
+def test_recorder_migrates_legacy_database(tmp_path, monkeypatch):
+    db_path = tmp_path / 'legacy.db'
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE template (id INTEGER PRIMARY KEY AUTOINCREMENT, skip_center_x INTEGER, '
+                 'skip_center_y INTEGER, template_id TEXT NOT NULL)')
+    conn.execute("INSERT INTO template (skip_center_x, skip_center_y, template_id) VALUES (1, 2, 'old')")
+    conn.commit()
+    conn.close()
+    monkeypatch.setenv('DB_PATH', str(db_path))
+    reload_settings()
+    recorder = Recorder()
+    columns = [row[1] for row in recorder.cursor.execute('PRAGMA table_info(template)')]
+    assert 'created_at' in columns
+    assert recorder.get_template_center_point('old') == (1, 2)
+    indexes = {row[1] for row in recorder.cursor.execute("SELECT * FROM sqlite_master WHERE type = 'index'")}
+    assert {'idx_elements_screenshot', 'idx_template_template_id'} <= indexes
+    recorder.close()
+
+
+def test_maintenance_prunes_elements_and_template_rows(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'elements.db'))
+    for name in ('TMP_DIR', 'SCREENSHOT_DIR'):
+        monkeypatch.setenv(name, str(tmp_path / name.lower()))
+    monkeypatch.setenv('TEMPLATE_DIR', str(tmp_path / 'template'))
+    monkeypatch.setenv('TEMPLATE_RETENTION_DAYS', '30')
+    reload_settings()
+    recorder = Recorder()
+    for element_id in range(7):
+        recorder.save_bound('[0,0][10,10]', 'screen', element_id)
+    # 3 条记录早于保留时间
+    recorder.cursor.execute('UPDATE elements SET created_at = created_at - 7200 WHERE element_id < 3')
+    recorder.save_template('expired', 5, 5)
+    recorder.save_template('fresh', 6, 6)
+    recorder.conn.commit()
+    assert recorder.delete_stale_elements(3600, batch_size=2) == 3
+    recorder.close()
+
+    _write(tmp_path / 'template' / 'expired.jpeg', 10, age_days=40)
+    _write(tmp_path / 'template' / 'fresh.jpeg', 10, age_days=1)
+    run_maintenance(vacuum=True)
+
+    recorder = Recorder()
+    assert recorder.get_template_center_point('expired') == (None, None)
+    assert recorder.get_template_center_point('fresh') == (6, 6)
+    assert recorder.cursor.execute('SELECT COUNT(*) FROM elements').fetchone()[0] == 4
+    recorder.close()
+    assert not (tmp_path / 'template' / 'expired.jpeg').exists()
@@ -0,0 +1,39 @@
+import logging
+import threading
+from logging.handlers import QueueHandler
+
+from source.utils import trace
+from source.utils.log_config import TraceIdFilter, setup_logger
+
+
+def _trace_id():
+    record = logging.LogRecord('test', logging.INFO, __file__, 1, 'message', None, None)
+    TraceIdFilter().filter(record)
+    return record.trace_id
+
+
+def test_trace_id_is_stable_per_thread():
+    first, second = _trace_id(), _trace_id()
+    assert first == second and first.startswith('子线程：')
+    other = []
+    thread = threading.Thread(target=lambda: other.append(_trace_id()))
+    thread.start()
+    thread.join()
+    assert other[0] != first
+
+
+def test_trace_id_prefers_request_trace():
+    _, token = trace.start_trace('trace-log', 'request')
+    try:
+        assert _trace_id() == 'trace-log'
+    finally:
+        trace.end_trace(token)
+
+
+def test_setup_logger_uses_shared_queue_handler(tmp_path):
+    first = setup_logger('log_config_test.a', log_dir=str(tmp_path))
+    second = setup_logger('log_config_test.b', log_dir=str(tmp_path))
+    assert len(first.handlers) == 1 and isinstance(first.handlers[0], QueueHandler)
+    # 同一日志文件的记录器共用一个队列与写入线程
+    assert first.handlers[0] is second.handlers[0]
+    assert any(isinstance(f, TraceIdFilter) for f in first.handlers[0].filters)
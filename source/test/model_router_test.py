@@ -0,0 +1,78 @@
+import pytest
+from PIL import Image
+
+from source.api import api as api_module
+from source.services.model_router import ModelRouter, validate_coordinates, validate_label
+from source.services.vision_model import VisionModelService
+from source.utils.metrics import metrics
+from source.utils.settings import reload_settings
+
+
+def _answer(x, y):
+    return {'popup_exists': True, 'button_coordinates': {'x': x, 'y': y}}
+
+
+def test_validators():
+    validate = validate_coordinates('(1080, 1920)')
+    assert validate(_answer(540, 1800))[0] is True
+    assert validate(_answer(1500, 100))[0] is False
+    assert validate({'popup_exists': True, 'button_coordinates': None})[0] is False
+    assert validate({'popup_exists': False})[0] is True
+
+    validate = validate_label({3, 9, 10})
+    assert validate({'popup_exists': True, 'popup_cancel_button': 3})[0] is True
+    # 裁剪后未标注的元素编号不是有效回答
+    assert validate({'popup_exists': True, 'popup_cancel_button': 4})[0] is False
+    assert validate({'popup_exists': True, 'popup_cancel_button': 70})[0] is False
+    assert validate({'popup_exists': True, 'popup_cancel_button': None})[0] is True
+
+
+def test_router_escalates_until_answer_is_valid():
+    metrics.reset()
+    answers = {'fast': _answer(5000, 10), 'medium': RuntimeError('overloaded'), 'large': _answer(100, 200)}
+    called = []
+
+    def call(model, timeout):
+        called.append(model)
+        answer = answers[model]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    router = ModelRouter(models=['fast', 'medium', 'large'], budget_ms=10000)
+    result, model = router.route(call, validate_coordinates('(1080, 1920)'))
+    assert (result, model) == (_answer(100, 200), 'large')
+    assert called == ['fast', 'medium', 'large']
+    assert metrics.counter('vision_route', model='fast', outcome='invalid') == 1
+    assert metrics.counter('vision_route', model='medium', outcome='error') == 1
+    assert metrics.counter('vision_route', model='large', outcome='accepted') == 1
+
+
+def test_router_respects_latency_budget():
+    metrics.reset()
+    # 大模型近期 p50 为 5 秒，预算 1 秒内不会升级
+    metrics.observe('vision_model_ms', 5000, model='large')
+    router = ModelRouter(models=['fast', 'large'], budget_ms=1000)
+    with pytest.raises(Exception, match='未通过校验'):
+        router.route(lambda model, timeout: _answer(-1, -1), validate_coordinates('(1080, 1920)'))
+    assert metrics.counter('vision_route', model='large', outcome='skipped_budget') == 1
+
+
+def test_vision_model_service_routes_and_exposes_metrics(monkeypatch):
+    metrics.reset()
+    monkeypatch.setenv('VISION_MODEL_API_URL', 'http://127.0.0.1:1/v1/chat/completions')
+    monkeypatch.setenv('VISION_MODEL_API_KEY', 'test')
+    monkeypatch.setenv('VISION_MODEL_TIERS', 'fast,large')
+    monkeypatch.setenv('VISION_CACHE_ENABLED', 'False')
+    reload_settings()
+    answers = {'fast': _answer(2000, 10), 'large': _answer(100, 200)}
+    monkeypatch.setattr(VisionModelService, '_analyze_with_model',
+                        lambda self, model, image_base64, timeout=None: answers[model])
+
+    service = VisionModelService(screen_resolution='(1080, 1920)')
+    image = Image.new('L', (108, 192))
+    assert service.analyze_screenshot(image, validate=validate_coordinates('(1080, 1920)')) == _answer(100, 200)
+
+    snapshot = api_module.app.test_client().get('/api/v1/metrics').json
+    assert snapshot['counters']['vision_route{model=fast,outcome=invalid}'] == 1
+    assert snapshot['distributions']['vision_model_ms{model=large}']['count'] == 1
@@ -0,0 +1,102 @@
+import time
+
+import numpy as np
+import pytest
+
+from source.benchmark.synthetic import add_popup_overlay, make_screen
+from source.services.popup_classifier import (SampleStore, classify_screenshot, evaluate_classifier,
+                                              extract_features, get_popup_classifier, record_outcome,
+                                              train_classifier)
+from source.utils.settings import reload_settings
+
+
+def _dataset(seeds, size=(540, 960)):
+    features, labels = [], []
+    for seed in seeds:
+        screen = make_screen(*size, seed=seed)
+        features.append(extract_features(screen.convert('L')))
+        labels.append(0)
+        popup, _ = add_popup_overlay(screen, seed=seed)
+        features.append(extract_features(popup.convert('L')))
+        labels.append(1)
+    return np.array(features), np.array(labels)
+
+
+@pytest.fixture(scope='module')
+def classifier():
+    features, labels = _dataset(range(20))
+    return train_classifier(features, labels)
+
+
+def test_classifier_separates_popups_from_plain_screens(classifier):
+    features, labels = _dataset(range(100, 110))
+    report = evaluate_classifier(classifier, features, labels, 0.05)
+    assert report['accuracy'] == 1.0
+    # 高置信度的无弹窗判定中不能有弹窗截图
+    assert report['answered_locally'] > 0 and report['missed_popups'] == 0
+
+
+def test_training_requires_both_classes():
+    with pytest.raises(ValueError):
+        train_classifier(np.zeros((4, 10)), np.ones(4))
+
+
+def test_inference_stays_within_budget(classifier):
+    image = make_screen(1080, 2400, seed=3).convert('L')
+    extract_features(image)
+    timings = []
+    for _ in range(10):
+        start = time.perf_counter()
+        classifier.predict_proba(extract_features(image))
+        timings.append((time.perf_counter() - start) * 1000)
+    assert sorted(timings)[len(timings) // 2] < 10
+
+
+def test_saved_model_is_reloaded_when_file_changes(classifier, tmp_path, monkeypatch):
+    path = tmp_path / 'models' / 'popup_classifier.npz'
+    monkeypatch.setenv('POPUP_CLASSIFIER_PATH', str(path))
+    reload_settings()
+    assert get_popup_classifier() is None
+
+    classifier.save(str(path))
+    loaded = get_popup_classifier()
+    features, _ = _dataset([7])
+    assert np.allclose(loaded.predict_proba(features), classifier.predict_proba(features))
+    assert get_popup_classifier() is loaded
+
+
+def test_on_mode_skips_confident_negatives_and_shadow_mode_records_samples(classifier, tmp_path, monkeypatch):
+    path = tmp_path / 'popup_classifier.npz'
+    classifier.save(str(path))
+    monkeypatch.setenv('POPUP_CLASSIFIER_PATH', str(path))
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'digger.db'))
+    plain = make_screen(540, 960, seed=200).convert('L')
+
+    monkeypatch.setenv('POPUP_CLASSIFIER_MODE', 'on')
+    reload_settings()
+    assert classify_screenshot(plain).skip is True
+
+    monkeypatch.setenv('POPUP_CLASSIFIER_MODE', 'shadow')
+    reload_settings()
+    verdict = classify_screenshot(plain)
+    assert verdict.skip is False and verdict.probability < 0.5
+    record_outcome(verdict, False)
+    features, labels = SampleStore(str(tmp_path / 'digger.db')).load()
+    assert features.shape == (1, verdict.features.size) and labels.tolist() == [0]
+
+    monkeypatch.setenv('POPUP_CLASSIFIER_MODE', 'off')
+    reload_settings()
+    assert classify_screenshot(plain) is None
+
+
+def test_sample_store_keeps_newest_samples(tmp_path):
+    store = SampleStore(str(tmp_path / 'digger.db'), max_samples=150)
+    features = extract_features(make_screen(360, 640).convert('L'))
+    for index in range(200):
+        store.record(features, index % 2)
+    loaded, labels = store.load()
+    assert len(labels) == 150
+    # 旧版本特征维度不同的样本被跳过
+    store.conn.execute("INSERT INTO classifier_samples (ts, label, source, features) VALUES (0, 1, 'old', ?)",
+                       (np.zeros(3, dtype=np.float32).tobytes(),))
+    assert len(store.load()[1]) == 150
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from source.api.utils.popup_detector import PopupDetector
+from source.services.model_router import validate_coordinates
+
+
+def _page():
+    """浅色列表页：白色背景上的若干卡片与图片"""
+    image = Image.new('L', (1080, 1920), 245)
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([0, 0, 1080, 80], fill=60)
+    for index in range(12):
+        y = 150 + index * 140
+        draw.rectangle([40, y, 1040, y + 110], fill=252)
+        draw.rectangle([60, y + 20, 300, y + 90], fill=60 + index * 10)
+    return image
+
+
+def _popup(page):
+    """整屏压暗的遮罩上的明亮卡片"""
+    image = Image.fromarray((np.asarray(page) * 0.35).astype('uint8'))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle([140, 640, 940, 1240], fill=250)
+    draw.rectangle([200, 1100, 880, 1200], fill=90)
+    return image
+
+
+def test_plain_page_is_answered_locally():
+    assert PopupDetector().detect(_page()).verdict == 'no_popup'
+
+
+def test_scrim_with_card_is_a_popup_with_bounding_box():
+    detection = PopupDetector().detect(_popup(_page()))
+    assert detection.verdict == 'popup'
+    x0, y0, x1, y1 = detection.box
+    assert abs(x0 - 140) < 20 and abs(y0 - 640) < 20 and abs(x1 - 940) < 20 and abs(y1 - 1240) < 20
+    # 截图为屏幕的一半尺寸时，边界框按分辨率换算
+    assert detection.scaled_box((2160, 3840))[2] == pytest.approx(2 * x1, abs=2)
+
+
+def test_dark_screen_is_left_to_the_model():
+    dark = Image.fromarray((np.asarray(_page()) * 0.2).astype('uint8'))
+    assert PopupDetector().detect(dark).verdict == 'uncertain'
+
+
+@pytest.mark.parametrize('name', ['test-1.jpeg', 'test-2.png', 'test-3.jpeg', 'test-4.jpg'])
+def test_real_popups_are_never_answered_as_no_popup(name):
+    import os
+
+    image = Image.open(os.path.join(os.path.dirname(__file__), name))
+    assert PopupDetector().detect(image).verdict != 'no_popup'
+
+
+def test_coordinates_far_from_detected_popup_are_invalid():
+    detection = PopupDetector().detect(_popup(_page()))
+    validate = validate_coordinates('(1080, 1920)', detection)
+    answer = {'popup_exists': True, 'button_coordinates': {'x': 540, 'y': 1300}}
+    assert validate(answer)[0] is True
+    answer['button_coordinates'] = {'x': 540, 'y': 50}
+    assert validate(answer)[0] is False
@@ -0,0 +1,75 @@
+from lxml import etree
+
+from source.appium_Inspector import capture_and_mark_elements
+from source.benchmark.synthetic import add_popup_overlay, make_hierarchy_xml, make_screen
+from source.services.popup_region import find_popup_region
+from source.utils.settings import reload_settings
+
+
+def _busy_screen(popup=True, seed=4):
+    screen = make_screen(1080, 1920, seed=seed)
+    info = None
+    if popup:
+        screen, info = add_popup_overlay(screen, seed=seed)
+    xml = make_hierarchy_xml(1080, 1920, node_count=40, clickable_count=30, popup=info)
+    root = etree.fromstring(xml.encode('utf-8'))
+    return screen.convert('L'), root.xpath(".//*[@clickable='true']"), info
+
+
+def _single_window(clickable_elements):
+    """把弹窗节点移到页面窗口中，并去掉 dialog 之类的容器标识，只能依靠图像定位弹窗"""
+    root = clickable_elements[0].getroottree().getroot()
+    page, popup_window = list(root)
+    for node in popup_window.iter():
+        node.set('resource-id', node.get('resource-id').replace('dialog', 'content'))
+    page.extend(popup_window[0])
+    root.remove(popup_window)
+    return root.xpath(".//*[@clickable='true']")
+
+
+def test_top_window_subtree_is_kept():
+    grayscale, clickable_elements, popup = _busy_screen()
+    region = find_popup_region(clickable_elements, grayscale, 12)
+    assert region.source == 'xml'
+    assert [element.get('resource-id').rsplit('/', 1)[1] for element in region.elements] == \
+        ['dialog_confirm', 'iv_close']
+    x0, y0, x1, y1 = region.box
+    card = popup['card']
+    assert x0 <= card[0] and y0 <= card[1] and x1 >= card[2] and y1 >= card[3]
+
+
+def test_image_fallback_when_xml_has_no_dialog():
+    grayscale, clickable_elements, popup = _busy_screen()
+    region = find_popup_region(_single_window(clickable_elements), grayscale, 12)
+    assert region is not None and region.source == 'image'
+    assert 'com.example.app:id/iv_close' in [element.get('resource-id') for element in region.elements]
+
+
+def test_busy_screen_without_popup_is_skipped():
+    grayscale, clickable_elements, _ = _busy_screen(popup=False)
+    assert find_popup_region(clickable_elements, grayscale, 12) is None
+
+
+def test_busy_screen_is_marked_on_cropped_popup(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'elements.db'))
+    reload_settings()
+    grayscale, clickable_elements, popup = _busy_screen()
+    screenshot_id, skipped, marked, non_clickable, labels = capture_and_mark_elements(
+        grayscale.convert('RGB'), 'emulator-5554', 'api', clickable_elements)
+    assert not skipped
+    region = find_popup_region(clickable_elements, grayscale, 12)
+    # 只有弹窗子树中的元素被标注
+    assert labels == {clickable_elements.index(element) + 1 for element in region.elements}
+    assert len(labels) < len(clickable_elements)
+    assert marked.size == non_clickable.size == (region.box[2] - region.box[0], region.box[3] - region.box[1])
+
+    from source.services import ElementManager
+    from source.services.recorder import Recorder
+
+    # 元素编号沿用整屏的编号，坐标为屏幕坐标
+    label = clickable_elements.index(region.elements[-1]) + 1
+    recorder = Recorder()
+    try:
+        assert ElementManager(recorder).element_center(label, screenshot_id) == popup['close_button']
+    finally:
+        recorder.close()
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from source.services.provider_pool import Provider, ProviderPool, PoolExhausted, TokenBucket, get_provider_pool
+from source.utils.settings import reload_settings
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_per_minute():
+    clock = FakeClock()
+    bucket = TokenBucket(60, clock)
+    bucket.consume(60)
+    assert bucket.available() == 0
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    clock.now = 30
+    assert bucket.available() == pytest.approx(30)
+    clock.now = 600
+    assert bucket.available() == 60
+    assert TokenBucket(0, clock).available() == float('inf')
+
+
+def test_requests_go_to_the_key_with_most_headroom():
+    clock = FakeClock()
+    busy = Provider('busy', 'http://a', 'k1', rpm=10, tpm=10000, clock=clock)
+    idle = Provider('idle', 'http://b', 'k2', rpm=10, tpm=10000, clock=clock)
+    busy.requests.consume(5)
+    pool = ProviderPool([busy, idle], max_wait_seconds=0, clock=clock)
+    assert pool.acquire(6000).provider is idle
+    # TPM 用量也计入余量：idle 预扣 6000 后剩 40%，busy 的 RPM 剩 50%
+    lease = pool.acquire(100)
+    assert lease.provider is busy
+    # 实际用量多于预估时补扣
+    pool.release(lease, 1000)
+    assert busy.tokens.available() == pytest.approx(9000)
+    assert pool.acquire(100, avoid=busy).provider is idle
+
+
+def test_penalized_key_cools_down():
+    clock = FakeClock()
+    first = Provider('first', 'http://a', 'k1', rpm=10, tpm=0, clock=clock)
+    second = Provider('second', 'http://a', 'k2', rpm=1, tpm=0, clock=clock)
+    pool = ProviderPool([first, second], max_wait_seconds=0, clock=clock)
+    pool.penalize(pool.acquire(1))
+    assert pool.acquire(1).provider is second
+    with pytest.raises(PoolExhausted):
+        pool.acquire(1)
+    clock.now = ProviderPool.COOLDOWN_SECONDS
+    assert pool.acquire(1).provider is first
+
+
+def test_waiters_are_served_in_arrival_order():
+    # 每分钟 600 次，即每 0.1 秒补充一次
+    provider = Provider('only', 'http://a', 'k', rpm=600, tpm=0)
+    provider.requests.consume(600)
+    pool = ProviderPool([provider], max_wait_seconds=5)
+    served = []
+
+    def worker(index):
+        pool.acquire(1)
+        served.append(index)
+
+    threads = []
+    for index in range(3):
+        thread = threading.Thread(target=worker, args=(index,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    assert served == [0, 1, 2]
+
+
+def test_pool_from_settings(monkeypatch):
+    monkeypatch.setenv('VISION_MODEL_API_URL', 'http://default/v1/chat/completions')
+    monkeypatch.setenv('VISION_MODEL_API_KEYS', 'aaaa1111,bbbb2222')
+    monkeypatch.setenv('VISION_MODEL_API_URLS', '')
+    reload_settings()
+    pool = get_provider_pool()
+    assert [provider.api_key for provider in pool.providers] == ['aaaa1111', 'bbbb2222']
+    assert {provider.api_url for provider in pool.providers} == {'http://default/v1/chat/completions'}
+
+    monkeypatch.setenv('VISION_MODEL_API_URLS', 'http://a,http://b,http://c')
+    reload_settings()
+    with pytest.raises(ValueError):
+        get_provider_pool()
@@ -0,0 +1,35 @@
+import os
+
+from source.benchmark.replay import corpus_entries, screen_id_of, sweep_hit_rates
+
+
+def test_screen_id_of_saved_files():
+    assert screen_id_of('emulator-5554_20250101_120000_api_marked_screenshot.jpeg') == \
+        'emulator-5554_20250101_120000_api'
+    assert screen_id_of('dev_20250101_120000_grayscale_image.jpeg') == 'dev_20250101_120000'
+    assert screen_id_of('/a/b/plain.png') == 'plain'
+
+
+def test_corpus_entries_pairs_xml_and_orders_by_mtime(tmp_path):
+    for index, name in enumerate(['b.jpeg', 'a.png', 'notes.txt']):
+        path = tmp_path / name
+        path.write_bytes(b'x')
+        os.utime(path, (1000 + index, 1000 + index))
+    (tmp_path / 'a.xml').write_text('<hierarchy/>', encoding='utf-8')
+    entries = corpus_entries(str(tmp_path))
+    assert [os.path.basename(entry['image']) for entry in entries] == ['b.jpeg', 'a.png']
+    assert entries[0]['xml'] is None
+    assert entries[1]['xml'].endswith('a.xml')
+
+
+def test_sweep_hit_rates_by_threshold_and_library_size():
+    score_rows = [
+        [0.95, 0.1, None],
+        [0.2, 0.85, 0.5],
+        [None, None, 0.75],
+        [0.1, 0.1, 0.1],
+    ]
+    rows = sweep_hit_rates(score_rows, [0.7, 0.9], [1, None])
+    table = {(row['library_size'], row['threshold']): row['hits'] for row in rows}
+    assert table == {(1, 0.7): 1, (1, 0.9): 1, ('all', 0.7): 3, ('all', 0.9): 1}
+    assert rows[2]['hit_rate'] == 0.75
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from source.session_pool import DriverSessionPool
+
+
+class FakeDriver:
+    def __init__(self):
+        self.alive = True
+        self.quit_calls = 0
+
+    def get_window_size(self):
+        if not self.alive:
+            raise RuntimeError('session is gone')
+        return {'width': 1080, 'height': 2400}
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+@pytest.fixture
+def created():
+    return []
+
+
+@pytest.fixture
+def pool(created):
+    def factory(device_name, app_package, app_activity, device_resolution):
+        created.append(FakeDriver())
+        return created[-1]
+
+    return DriverSessionPool(factory, health_check_seconds=0, idle_seconds=0)
+
+
+def test_session_is_reused_across_cycles(pool, created):
+    for _ in range(3):
+        with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400') as driver:
+            assert driver is created[0]
+    with pool.acquire('emulator-5556', 'com.app', '.Main', '1080x2400'):
+        pass
+    stats = pool.stats()
+    assert stats['created'] == 2 and stats['reused'] == 2 and stats['reuse_rate'] == 0.5
+    assert stats['setup_ms_median'] is not None
+
+
+def test_dead_session_is_reconnected(pool, created):
+    with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400'):
+        pass
+    created[0].alive = False
+    with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400') as driver:
+        assert driver is created[1]
+    assert created[0].quit_calls == 1 and pool.stats()['reconnected'] == 1
+
+
+def test_session_failing_during_use_is_dropped(pool, created):
+    with pytest.raises(ValueError):
+        with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400') as driver:
+            driver.alive = False
+            raise ValueError('tap failed')
+    # 会话仍可用时出错不影响复用
+    with pytest.raises(ValueError):
+        with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400'):
+            raise ValueError('model failed')
+    assert len(created) == 2 and created[0].quit_calls == 1
+
+
+def test_idle_sessions_are_closed(created):
+    pool = DriverSessionPool(lambda *args: created.append(FakeDriver()) or created[-1], idle_seconds=0.01)
+    with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400'):
+        pass
+    time.sleep(0.02)
+    assert pool.close_idle() == 1 and created[0].quit_calls == 1
+    pool.close_all()
+
+
+def test_session_is_recreated_for_another_app(pool, created):
+    with pool.acquire('emulator-5554', 'com.app', '.Main', '1080x2400'):
+        pass
+    with pool.acquire('emulator-5554', 'com.other', '.Main', '1080x2400') as driver:
+        assert driver is created[1]
+    with pool.acquire('emulator-5554', 'com.other', '.Splash', '1080x2400') as driver:
+        assert driver is created[2]
+    with pool.acquire('emulator-5554', 'com.other', '.Splash', '1080x2400') as driver:
+        assert driver is created[2]
+    assert created[0].quit_calls == created[1].quit_calls == 1
+    assert pool.stats()['replaced'] == 2 and pool.stats()['reused'] == 1
@@ -0,0 +1,100 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+from source.api.utils.template_matcher import TemplateMatcher
+from source.api.utils.template_pack import TemplatePack, pack_path_for
+from source.services.vision_cache import VisionCache
+from source.utils.settings import reload_settings
+
+
+def _gray(value, shape=(20, 30)):
+    image = np.full(shape, value, dtype=np.uint8)
+    image[5:10, 5:15] = 255 - value
+    return image
+
+
+def test_pack_build_append_and_refresh_across_readers(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    cv2.imwrite(str(template_dir / 'a.png'), _gray(10))
+    path = pack_path_for(str(template_dir))
+    assert TemplatePack.build(path, str(template_dir)) == 1
+
+    writer, reader = TemplatePack(path), TemplatePack(path)
+    entries = reader.refresh()
+    assert [name for name, _ in entries] == ['a.png']
+    assert np.array_equal(entries[0][1], _gray(10))
+
+    # 另一个进程学到新模版后，读取方只增量加载新记录
+    writer.append('b.png', _gray(20, shape=(8, 12)))
+    entries = reader.refresh()
+    assert [name for name, _ in entries] == ['a.png', 'b.png']
+    assert entries[1][1].shape == (8, 12)
+    assert reader.refresh() is entries
+
+
+def test_pack_rebuild_is_detected(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    cv2.imwrite(str(template_dir / 'a.png'), _gray(10))
+    cv2.imwrite(str(template_dir / 'b.png'), _gray(20))
+    path = pack_path_for(str(template_dir))
+    TemplatePack.build(path, str(template_dir))
+    reader = TemplatePack(path)
+    assert len(reader.refresh()) == 2
+
+    os.remove(template_dir / 'a.png')
+    TemplatePack.build(path, str(template_dir))
+    assert [name for name, _ in reader.refresh()] == ['b.png']
+
+
+def test_matcher_reads_templates_from_pack(tmp_path, monkeypatch):
+    monkeypatch.setenv('TEMPLATE_PACK', 'True')
+    reload_settings()
+    template_dir = tmp_path / 'templates'
+    image = _gray(10, shape=(40, 60))
+    matcher = TemplateMatcher(template_dir=str(template_dir))
+    assert matcher.match_known_popups(image) == (False, None)
+
+    cv2.imwrite(str(template_dir / 'popup.png'), image[10:30, 10:40])
+    matcher.add_template(str(template_dir / 'popup.png'))
+    # 新建的匹配器（其他请求）也能直接从打包文件看到新模版
+    assert TemplateMatcher(template_dir=str(template_dir)).match_known_popups(image) == (True, 'popup.png')
+
+
+def test_vision_cache_get_put_and_purge(tmp_path):
+    cache = VisionCache(str(tmp_path / 'cache.db'), ttl_seconds=60, max_entries=2)
+    key = VisionCache.make_key('model', '(1080, 1920)', 'base64')
+    assert cache.get(key) is None
+    cache.put(key, {'is_popup': True, 'close_button_center': [1, 2]})
+    assert cache.get(key) == {'is_popup': True, 'close_button_center': [1, 2]}
+
+    cache.put('k2', {'is_popup': False})
+    cache.put('k3', {'is_popup': False})
+    cache.conn.execute('UPDATE vision_cache SET created_at = ? WHERE cache_key = ?', (int(time.time()) - 3600, 'k3'))
+    cache.conn.commit()
+    assert cache.get('k3') is None
+    # 过期的 k3 被删除，剩余两条未超过上限
+    assert cache.purge() == 1
+    assert cache.get(key) is not None and cache.get('k2') is not None
+
+
+def test_pack_growth_keeps_a_single_mapping(tmp_path):
+    template_dir = tmp_path / 'templates'
+    template_dir.mkdir()
+    cv2.imwrite(str(template_dir / 'a.png'), _gray(10))
+    path = pack_path_for(str(template_dir))
+    TemplatePack.build(path, str(template_dir))
+    writer, reader = TemplatePack(path), TemplatePack(path)
+    reader.refresh()
+    first_map = reader._mmap
+
+    writer.append('b.png', _gray(20))
+    entries = reader.refresh()
+    # 之前加载的模版也指向新的映射，被替代的映射已关闭
+    assert first_map.closed and not reader._mmap.closed
+    assert [name for name, _ in entries] == ['a.png', 'b.png']
+    assert np.array_equal(entries[0][1], _gray(10))
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+
+from source.utils import trace
+from source.utils.profiler import RequestProfiler
+
+
+def _busy(ms):
+    end = time.perf_counter() + ms / 1000
+    while time.perf_counter() < end:
+        sum(range(100))
+
+
+def test_nested_spans_build_tree():
+    request_trace, token = trace.start_trace('trace-1', 'request')
+    with trace.span('outer', size=3):
+        with trace.span('inner'):
+            pass
+    with trace.span('second'):
+        pass
+    trace.end_trace(token)
+
+    root = request_trace.root
+    assert [child.name for child in root.children] == ['outer', 'second']
+    outer = root.children[0]
+    assert outer.tags == {'size': 3}
+    assert [child.name for child in outer.children] == ['inner']
+    assert root.end is not None and outer.end is not None
+    rendered = request_trace.render()
+    assert '- request:' in rendered and '    - inner:' in rendered
+
+
+def test_end_trace_restores_context():
+    assert trace.get_trace_id() is None
+    _, token = trace.start_trace('trace-2', 'request')
+    assert trace.get_trace_id() == 'trace-2'
+    trace.end_trace(token)
+    assert trace.get_trace_id() is None
+    # 不在追踪上下文中时 span 不做任何事
+    with trace.span('noop') as node:
+        assert node is None
+
+
+def test_start_thread_carries_trace_id():
+    seen = {}
+    request_trace, token = trace.start_trace('trace-3', 'request')
+
+    def work():
+        seen['trace_id'] = trace.get_trace_id()
+        with trace.span('child_stage'):
+            pass
+
+    thread = trace.start_thread(work, name='worker')
+    thread.join()
+    trace.end_trace(token)
+
+    assert seen['trace_id'] == 'trace-3'
+    worker_span = request_trace.root.children[0]
+    assert worker_span.name == 'worker'
+    assert worker_span.thread_name == 'worker'
+    assert [child.name for child in worker_span.children] == ['child_stage']
+
+
+def test_on_complete_waits_for_threads():
+    completed = []
+    release = threading.Event()
+    request_trace, token = trace.start_trace('trace-4', 'request')
+    thread = trace.start_thread(release.wait, name='slow_save')
+    trace.end_trace(token, on_complete=completed.append)
+    # 请求已结束但子线程未结束，此时不应输出
+    assert completed == []
+    release.set()
+    thread.join()
+    assert completed == [request_trace]
+    assert '（未结束）' not in request_trace.render()
+
+
+def test_profiler_disabled_returns_none():
+    assert RequestProfiler(sample_rate=0).start('trace-5') is None
+
+
+def test_profiler_writes_prof_and_collapsed(tmp_path):
+    profiler = RequestProfiler(sample_rate=1, slow_ms=0, output_dir=str(tmp_path), interval_ms=1)
+    session = profiler.start('trace-6')
+    assert session is not None
+    # 同一时间只允许分析一个请求
+    assert profiler.start('trace-7') is None
+    _busy(50)
+    paths = profiler.finish(session, duration_ms=50)
+    assert sorted(os.path.splitext(path)[1] for path in paths) == ['.collapsed', '.prof']
+    assert all(os.path.getsize(path) > 0 for path in paths)
+    # 名额释放后可以再次采样
+    session = profiler.start('trace-8')
+    assert session is not None
+    profiler.finish(session, duration_ms=0)
+
+
+def test_profiler_fast_request_writes_nothing(tmp_path):
+    profiler = RequestProfiler(sample_rate=1, slow_ms=10_000, output_dir=str(tmp_path), interval_ms=1)
+    session = profiler.start('trace-9')
+    assert profiler.finish(session, duration_ms=5) == []
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,54 @@
+import threading
+
+import pytest
+from PIL import Image
+from werkzeug.serving import make_server
+
+from source.benchmark.vision_stub import StubConfig, create_app
+from source.services.vision_model import VisionModelService
+from source.services.vision_stream import IncrementalJsonObject, extract_json, iter_sse_events
+from source.utils.metrics import metrics
+from source.utils.settings import reload_settings
+
+
+def test_extract_json_tolerates_fences_and_trailing_text():
+    answer = {'popup_exists': True, 'button_coordinates': {'x': 1, 'y': 2}}
+    assert extract_json('{"popup_exists": true, "button_coordinates": {"x": 1, "y": 2}}') == answer
+    assert extract_json('```json\n{"popup_exists": true, "button_coordinates": {"x": 1, "y": 2}}\n```\n以上为分析结果。') \
+        == answer
+    with pytest.raises(ValueError):
+        extract_json('{"popup_exists": tr')
+
+
+def test_incremental_parser_ignores_braces_in_strings():
+    parser = IncrementalJsonObject()
+    chunks = ['说明 ', '{"note": "a}\\"', '{b", "popup_exists": fal', 'se}', ' 多余文本']
+    results = [parser.feed(chunk) for chunk in chunks[:4]]
+    assert results[:3] == [None, None, None]
+    assert results[3] == {'note': 'a}"{b', 'popup_exists': False}
+
+
+def test_iter_sse_events_stops_at_done():
+    lines = [b'data: {"a": 1}', b'', b': keep-alive', b'data: [DONE]', b'data: {"b": 2}']
+    assert list(iter_sse_events(lines)) == [{'a': 1}]
+
+
+def test_service_reads_stream_until_json_is_complete(monkeypatch):
+    metrics.reset()
+    server = make_server('127.0.0.1', 0, create_app(StubConfig(popup_rate=1, latency_ms=0, fenced=True, seed=1)),
+                         threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        monkeypatch.setenv('VISION_MODEL_API_URL', f'http://127.0.0.1:{server.server_port}/v1/chat/completions')
+        monkeypatch.setenv('VISION_MODEL_API_KEY', 'test')
+        monkeypatch.setenv('VISION_MODEL_TIERS', 'stub')
+        monkeypatch.setenv('VISION_STREAM_ENABLED', 'True')
+        monkeypatch.setenv('VISION_HEDGE_ENABLED', 'False')
+        monkeypatch.setenv('VISION_CACHE_ENABLED', 'False')
+        reload_settings()
+        result = VisionModelService(screen_resolution='(1080, 1920)').analyze_screenshot(Image.new('L', (108, 192)))
+    finally:
+        server.shutdown()
+    assert result['popup_exists'] is True
+    assert set(result['button_coordinates']) == {'x', 'y'}
+    assert metrics.counter('vision_stream', outcome='early_close') == 1
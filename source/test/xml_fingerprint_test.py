@@ -0,0 +1,84 @@
+import pytest
+from lxml import etree
+
+from source.api import api as api_module
+from source.api.utils.xml_fingerprint import (XmlFingerprintCache, element_action, get_xml_fingerprint_cache,
+                                              resolve_action, structural_fingerprint)
+from source.benchmark.synthetic import add_popup_overlay, make_hierarchy_xml, make_screen
+from source.utils.settings import reload_settings
+
+
+def _root(seed=1, offset=0, title='限时福利', page_seed=0):
+    _, popup = add_popup_overlay(make_screen(1080, 1920, seed=seed), seed=seed)
+    popup = {name: tuple(value + offset for value in bounds) for name, bounds in popup.items()}
+    xml = make_hierarchy_xml(1080, 1920, popup=popup, seed=page_seed).replace('限时福利', title)
+    return etree.fromstring(xml.encode('utf-8')), popup
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return XmlFingerprintCache(str(tmp_path / 'elements.db'), max_entries=2, max_hits=3)
+
+
+def test_fingerprint_ignores_offsets_counters_and_background():
+    root, _ = _root()
+    assert structural_fingerprint(root) != structural_fingerprint(_root(title='限时福利 23:59')[0])
+    assert structural_fingerprint(_root(title='剩余 3 天')[0]) == structural_fingerprint(_root(title='剩余 12 天')[0])
+    # 小幅偏移与背景页面变化不影响最上层窗口的指纹
+    assert structural_fingerprint(_root(offset=6)[0]) == structural_fingerprint(_root(page_seed=5)[0]) \
+        == structural_fingerprint(root)
+    # 文案不同的弹窗指纹不同
+    assert structural_fingerprint(_root(title='新人专享')[0]) != structural_fingerprint(root)
+
+
+def test_action_resolves_to_element_in_new_layout():
+    root, popup = _root()
+    action = element_action(root, *popup['close_button'])
+    assert action['path'] is not None
+    shifted, shifted_popup = _root(offset=6)
+    assert resolve_action(shifted, action) == shifted_popup['close_button']
+
+
+def test_lookup_streak_invalidation_and_eviction(cache):
+    cache.store('a', {'path': [0], 'x': 0.5, 'y': 0.5}, 'dev1')
+    assert cache.lookup('a', 'dev1') is not None
+    # 同一设备第 3 次连续命中说明点击没有生效，之后重新诊断
+    assert cache.lookup('a', 'dev1') is not None
+    assert cache.lookup('a', 'dev1') is None
+
+    cache.store('b', {'path': None, 'x': 0.1, 'y': 0.1}, 'dev2')
+    assert cache.invalidate('dev2') and cache.lookup('b', 'dev2') is None
+
+    for key in ('c', 'd', 'e'):
+        cache.store(key, {'path': None, 'x': 0, 'y': 0}, 'dev3')
+    cache.lookup('c', 'dev4')
+    assert cache.purge() == 1
+    assert cache.lookup('d', 'dev4') is None and cache.lookup('c', 'dev4') is not None
+
+
+def test_recurring_popup_closed_in_between_is_kept(cache):
+    cache.store('a', {'path': [0], 'x': 0.5, 'y': 0.5}, 'dev1')
+    # 命中 → 点击生效进入其他界面 → 弹窗再次出现，不算连续命中
+    for _ in range(3):
+        assert cache.lookup('a', 'dev1') is not None
+        assert cache.lookup('other', 'dev1') is None
+    # 距上次命中过久也重新计数
+    assert cache.lookup('a', 'dev1') is not None
+    cache.conn.execute("UPDATE xml_fingerprint_cache SET last_used = last_used - 3600 WHERE fingerprint = 'a'")
+    cache.conn.commit()
+    assert cache.lookup('a', 'dev1') is not None
+    # 紧接着的重复仍然使其失效
+    assert cache.lookup('a', 'dev1') is not None
+    assert cache.lookup('a', 'dev1') is not None
+    assert cache.lookup('a', 'dev1') is None
+
+
+def test_feedback_invalidates_fingerprint(tmp_path, monkeypatch):
+    monkeypatch.setenv('DB_PATH', str(tmp_path / 'elements.db'))
+    reload_settings()
+    get_xml_fingerprint_cache().store('a', {'path': None, 'x': 0, 'y': 0}, 'dev1')
+    client = api_module.app.test_client()
+    response = client.post('/api/v1/feedback', json={'devices_name': 'dev1'})
+    assert response.json['fingerprint_invalidated'] is False
+    response = client.post('/api/v1/feedback', json={'devices_name': 'dev1', 'success': False})
+    assert response.json['fingerprint_invalidated'] is True
@@ -0,0 +1,92 @@
+import os
+
+from lxml import etree
+
+from source.api.utils.xml_rules import XmlRuleEngine, get_rule_engine
+from source.benchmark.synthetic import add_popup_overlay, make_hierarchy_xml, make_screen
+from source.utils.settings import reload_settings
+
+
+def _engine():
+    return XmlRuleEngine(id_keywords=['close', 'cancel', 'skip'], texts=['关闭', '以后再说'], min_confidence=0.85)
+
+
+def _node(resource_id='', text='', content_desc='', node_class='android.widget.Button', bounds='[900,300][980,380]',
+          clickable='true'):
+    return (f'<node text="{text}" resource-id="{resource_id}" class="{node_class}" content-desc="{content_desc}" '
+            f'clickable="{clickable}" bounds="{bounds}" />')
+
+
+def _page(*nodes):
+    xml = ('<hierarchy rotation="0" width="1080" height="1920">'
+           '<node class="android.widget.FrameLayout" clickable="false" bounds="[0,0][1080,1920]">'
+           f'{"".join(nodes)}</node></hierarchy>')
+    return etree.fromstring(xml.encode('utf-8'))
+
+
+def _dialog(*nodes):
+    """单窗口页面中对话框大小的卡片"""
+    return _page('<node class="android.widget.LinearLayout" clickable="false" bounds="[100,250][1000,1200]">'
+                 f'{"".join(nodes)}</node>')
+
+
+def test_real_dump_close_button():
+    with open(os.path.join(os.path.dirname(__file__), 'hierarchy-3.xml'), 'rb') as f:
+        match = _engine().match(etree.fromstring(f.read()))
+    assert (match.x, match.y) == (540, 1805)
+    assert match.resource_id.endswith('spread_close')
+
+
+def test_synthetic_popup_in_top_window():
+    _, popup = add_popup_overlay(make_screen(1080, 1920, seed=1), seed=1)
+    root = etree.fromstring(make_hierarchy_xml(1080, 1920, popup=popup).encode('utf-8'))
+    match = _engine().match(root)
+    assert (match.x, match.y) == popup['close_button']
+    assert match.confidence == 1.0
+    # 没有弹窗的页面不命中
+    assert _engine().match(etree.fromstring(make_hierarchy_xml(1080, 1920).encode('utf-8'))) is None
+
+
+def test_id_keywords_and_texts():
+    engine = _engine()
+    assert engine.match(_dialog(_node(resource_id='com.demo:id/btnClose'))) is not None
+    assert engine.match(_dialog(_node(resource_id='com.demo:id/skip_ad'))) is not None
+    assert engine.match(_dialog(_node(resource_id='com.demo:id/enclosed_list'))) is None
+    assert engine.match(_dialog(_node(text='以后再说'))).rules == ['text']
+    # 不可点击（且祖先也不可点击）的节点不命中
+    assert engine.match(_dialog(_node(content_desc='关闭', clickable='false'))) is None
+
+
+def test_id_and_text_rules_need_popup_context():
+    engine = XmlRuleEngine(id_keywords=['close', 'cancel'], texts=['取消', '关闭'], min_confidence=0.85)
+    # 普通页面顶部搜索栏中的“取消”与关闭图标不是弹窗按钮
+    search_bar = ('<node class="android.widget.LinearLayout" clickable="false" bounds="[0,80][1080,230]">'
+                  '<node class="android.widget.EditText" clickable="true" bounds="[30,100][880,210]" />'
+                  + _node(text='取消', bounds='[900,100][1050,210]')
+                  + _node(resource_id='com.demo:id/iv_search_close', node_class='android.widget.ImageView',
+                          bounds='[800,120][860,190]') + '</node>')
+    assert engine.match(_page(search_bar)) is None
+    assert engine.match(_page(_node(text='关闭'))) is None
+    # 同样的按钮位于最上层的对话框窗口中时命中
+    xml = ('<hierarchy rotation="0" width="1080" height="1920">'
+           '<node class="android.widget.FrameLayout" clickable="false" bounds="[0,0][1080,1920]" />'
+           '<node class="android.widget.FrameLayout" clickable="false" bounds="[0,0][1080,1920]">'
+           + _node(text='取消', bounds='[900,100][1050,210]') + '</node></hierarchy>')
+    assert engine.match(etree.fromstring(xml.encode('utf-8'))).rules == ['text']
+
+
+def test_corner_icon_alone_is_not_confident():
+    card = ('<node class="android.widget.LinearLayout" clickable="false" bounds="[140,600][940,1300]">'
+            + _node(node_class='android.widget.ImageView', bounds='[860,620][920,680]') + '</node>')
+    assert _engine().match(_page(card)) is None
+    assert XmlRuleEngine(id_keywords=[], texts=[], min_confidence=0.5).match(_page(card)).rules == ['corner_icon']
+
+
+def test_engine_follows_settings(monkeypatch):
+    monkeypatch.setenv('XML_RULES_ENABLED', 'False')
+    reload_settings()
+    assert get_rule_engine() is None
+    monkeypatch.setenv('XML_RULES_ENABLED', 'True')
+    monkeypatch.setenv('XML_RULE_TEXTS', '稍后')
+    reload_settings()
+    assert get_rule_engine().match(_dialog(_node(text='稍后'))) is not None
@@ -1,3 +1,4 @@
 from .adb import AdbHelper
+from .capture import get_capture_backend, register_capture_backend
 
-__all__ = ['AdbHelper']
\ No newline at end of file
+__all__ = ['AdbHelper', 'get_capture_backend', 'register_capture_backend']
@@ -1,11 +1,10 @@
 import subprocess
 import time
 
-from dotenv import load_dotenv
+from source.tools.capture import get_capture_backend
 from source.utils.log_config import setup_logger
 
 logger = setup_logger(__name__)
-load_dotenv()
 __all__ = ['AdbHelper']
 
 
@@ -99,64 +98,39 @@ class AdbHelper:
             raise
 
     @staticmethod
-    def get_screenshot_base64(device_name):
+    def get_screenshot_base64(device_name, backend=None):
         """
         获取设备屏幕截图并以 base64 格式返回
         :param device_name: 设备名称
-        :return: 屏幕截图的 base64 字符串
+        :param backend: 采集后端名称，默认使用 CAPTURE_BACKEND 配置
+        :return: 屏幕截图（PNG）的 base64 字符串
         """
+        import base64
+
         try:
-            # 使用 adb shell screencap 命令获取屏幕截图
-            result = subprocess.run(
-                ['adb', '-s', device_name, 'shell', 'screencap', '-p'],
-                stdout=subprocess.PIPE, check=True
-            )
-            # 将截图数据转换为 base64 编码
-            import base64
-            screenshot_base64 = base64.b64encode(result.stdout).decode('utf-8')
-            logger.info(f"成功获取设备 {device_name} 的屏幕截图")
+            start_time = time.perf_counter()
+            png = get_capture_backend(backend).screenshot_png(device_name)
+            screenshot_base64 = base64.b64encode(png).decode('utf-8')
+            logger.info(f"成功获取设备 {device_name} 的屏幕截图，耗时 {(time.perf_counter() - start_time) * 1000:.0f}ms")
             return screenshot_base64
-        except subprocess.CalledProcessError as e:
+        except Exception as e:
             logger.error(f"获取设备 {device_name} 的屏幕截图失败: {str(e)}")
             raise
 
     @staticmethod
-    def get_screen_xml(device_name):
+    def get_screen_xml(device_name, backend=None):
         """
-        获取设备当前屏幕的 XML 布局
+        获取设备当前屏幕的 XML 布局（直接从标准输出读取，不在设备与本机落临时文件）
         :param device_name: 设备名称
+        :param backend: 采集后端名称，默认使用 CAPTURE_BACKEND 配置
         :return: 屏幕的 XML 布局字符串
         """
         try:
-            start_time = time.time()
-            start_time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(start_time))
-            print(f"开始dump-UI-Tree：{start_time_str}")
-            command = f"adb -s {device_name} shell  uiautomator dump /sdcard/ui_tree.xml"
-            result = subprocess.run(command, shell=True, check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-            if result.returncode != 0:
-                logger.error(f"获取设备 {device_name} 的屏幕 XML 布局失败: {result.stderr.decode('utf-8')}")
-                raise Exception(f"获取设备 {device_name} 的屏幕 XML 布局失败: {result.stderr.decode('utf-8')}")
-
-            end_time = time.time()
-            end_time_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(end_time))
-            print(f"完成dump-UI-Tree：{end_time_str}")
-            elapsed_time = end_time - start_time
-            print(f"耗时：{elapsed_time:.3f} 秒")
-            # 将 XML 文件从设备拉取到本地
-            subprocess.run(
-                ['adb', '-s', device_name, 'pull', '/sdcard/ui_tree.xml', './ui_tree.xml'],
-                check=True
-            )
-
-            # 读取并返回 XML 内容
-            with open('./ui_tree.xml', 'r', encoding='utf-8') as file:
-                xml_content = file.read()
-
-            logger.info(f"成功获取设备 {device_name} 的屏幕 XML 布局")
+            start_time = time.perf_counter()
+            xml_content = get_capture_backend(backend).dump_xml(device_name)
+            logger.info(f"成功获取设备 {device_name} 的屏幕 XML 布局，耗时 {(time.perf_counter() - start_time) * 1000:.0f}ms")
             return xml_content
-
-        except subprocess.CalledProcessError as e:
+        except Exception as e:
             logger.error(f"获取设备 {device_name} 的屏幕 XML 布局失败: {str(e)}")
             raise
 
@@ -0,0 +1,281 @@
+"""
+设备截图与界面 XML 采集后端
+
+模块职责：
+- adb：直接通过套接字与本机 adb server 通信（ADB 主机协议），以 exec 服务（等同 adb exec-out，无 PTY）获取
+  原始帧缓冲或 PNG 截图、以 uiautomator dump /dev/tty 获取 XML，不再为每次采集启动 adb 进程，也不落临时文件
+- adb-cli：使用 adb exec-out 子进程，适用于 adb server 不在本机默认端口等无法直连的场景
+- uiautomator2：使用 uiautomator2 库（可选依赖）常驻设备端的服务采集，截图与 dump 速度更快
+- 后端通过 CAPTURE_BACKEND 配置选择，也可以用 register_capture_backend 注册新的实现
+"""
+import asyncio
+import io
+import socket
+import struct
+import subprocess
+import threading
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+
+__all__ = ['CaptureBackend', 'AdbSocketBackend', 'AdbCliBackend', 'Uiautomator2Backend', 'AsyncAdbClient', 'AdbProtocolError',
+           'parse_raw_screencap', 'strip_dump_output', 'register_capture_backend', 'get_capture_backend',
+           'CAPTURE_BACKENDS']
+
+class AdbProtocolError(Exception):
+    """adb server 返回 FAIL 或连接异常"""
+
+
+def parse_raw_screencap(data):
+    """解析 screencap（不带 -p）输出的原始帧缓冲，返回 RGB 的 PIL Image
+
+    头部为宽、高、像素格式（u32 小端），Android 9 起额外带一个色彩空间字段，按数据长度判断头部大小。
+    """
+    from PIL import Image
+
+    if len(data) < 12:
+        raise ValueError(f"原始截图数据过短: {len(data)} 字节")
+    width, height, pixel_format = struct.unpack_from('<III', data)
+    pixels = width * height * 4
+    for header_size in (16, 12):
+        if len(data) - header_size == pixels:
+            break
+    else:
+        raise ValueError(f"原始截图数据长度与分辨率 {width}x{height} 不符: {len(data)} 字节")
+    if pixel_format != 1:
+        # 1 为 RGBA_8888，其他格式（如 RGBX）按相同的 4 字节布局读取
+        logger.debug(f"原始截图像素格式为 {pixel_format}，按 RGBA 解析")
+    image = Image.frombuffer('RGBA', (width, height), data[header_size:], 'raw', 'RGBA', 0, 1)
+    return image.convert('RGB')
+
+
+def strip_dump_output(text):
+    """去掉 uiautomator dump /dev/tty 在 XML 之后输出的提示信息"""
+    end = text.rfind('>')
+    if end == -1 or '<hierarchy' not in text:
+        raise ValueError(f"uiautomator dump 输出中没有 XML: {text.strip()[:200]}")
+    return text[text.find('<'):end + 1]
+
+
+class CaptureBackend:
+    """采集后端接口，子类实现 screenshot 与 dump_xml"""
+
+    name = None
+
+    def screenshot(self, device_name):
+        """返回设备当前屏幕的 PIL Image"""
+        raise NotImplementedError
+
+    def screenshot_png(self, device_name):
+        """返回 PNG 字节，默认在本机编码（压缩等级低，速度优先）"""
+        buffer = io.BytesIO()
+        self.screenshot(device_name).save(buffer, format='PNG', compress_level=1)
+        return buffer.getvalue()
+
+    def dump_xml(self, device_name):
+        """返回设备当前界面的 XML 布局字符串"""
+        raise NotImplementedError
+
+
+class AdbSocketBackend(CaptureBackend):
+    """通过 ADB 主机协议直连 adb server
+
+    adb server 的每个服务请求独占一个连接，这里省掉的是每次采集启动 adb 客户端进程的开销。
+    raw=True 时传输未编码的帧缓冲，由本机解码，避免在手机上编码 PNG（通常是截图耗时的大头）。
+    """
+
+    name = 'adb'
+
+    def __init__(self, host=None, port=None, raw=True, timeout=30):
+        settings = get_settings()
+        self.host = host or settings.adb_server_host
+        self.port = port or settings.adb_server_port
+        self.raw = raw
+        self.timeout = timeout
+
+    @staticmethod
+    def _send(sock, request):
+        payload = request.encode('utf-8')
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = AdbSocketBackend._recv_exact(sock, 4)
+        if status != b'OKAY':
+            length = int(AdbSocketBackend._recv_exact(sock, 4), 16)
+            message = AdbSocketBackend._recv_exact(sock, length).decode('utf-8', 'replace')
+            raise AdbProtocolError(f"adb server 拒绝请求 {request}: {message}")
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbProtocolError("adb server 提前关闭了连接")
+            data.extend(chunk)
+        return bytes(data)
+
+    def exec_out(self, device_name, command):
+        """在设备上执行命令并返回标准输出的原始字节（等同 adb -s <device> exec-out <command>）"""
+        try:
+            with socket.create_connection((self.host, self.port), timeout=self.timeout) as sock:
+                self._send(sock, f'host:transport:{device_name}')
+                self._send(sock, f'exec:{command}')
+                chunks = []
+                while True:
+                    chunk = sock.recv(1 << 20)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+        except OSError as e:
+            raise AdbProtocolError(f"连接 adb server {self.host}:{self.port} 失败: {e}") from e
+        return b''.join(chunks)
+
+    def screenshot(self, device_name):
+        from PIL import Image
+
+        if self.raw:
+            return parse_raw_screencap(self.exec_out(device_name, 'screencap'))
+        return Image.open(io.BytesIO(self.exec_out(device_name, 'screencap -p'))).convert('RGB')
+
+    def screenshot_png(self, device_name):
+        if self.raw:
+            return super().screenshot_png(device_name)
+        return self.exec_out(device_name, 'screencap -p')
+
+    def dump_xml(self, device_name):
+        output = self.exec_out(device_name, 'uiautomator dump /dev/tty')
+        return strip_dump_output(output.decode('utf-8'))
+
+
+class AdbCliBackend(AdbSocketBackend):
+    """使用 adb exec-out 子进程采集（输出不经过 PTY，二进制数据不会被改写）"""
+
+    name = 'adb-cli'
+
+    def exec_out(self, device_name, command):
+        result = subprocess.run(['adb', '-s', device_name, 'exec-out', *command.split()],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=self.timeout)
+        if result.returncode != 0:
+            raise AdbProtocolError(f"adb exec-out {command} 失败: {result.stderr.decode('utf-8', 'replace')}")
+        return result.stdout
+
+
+class Uiautomator2Backend(CaptureBackend):
+    """使用 uiautomator2 采集，每台设备复用一个连接"""
+
+    name = 'uiautomator2'
+
+    def __init__(self):
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    def device(self, device_name):
+        with self._lock:
+            device = self._devices.get(device_name)
+            if device is None:
+                try:
+                    import uiautomator2
+                except ImportError as e:
+                    raise ImportError("uiautomator2 采集后端需要安装 uiautomator2: pip install uiautomator2") from e
+                device = self._devices[device_name] = uiautomator2.connect(device_name)
+        return device
+
+    def screenshot(self, device_name):
+        return self.device(device_name).screenshot().convert('RGB')
+
+    def dump_xml(self, device_name):
+        return self.device(device_name).dump_hierarchy()
+
+
+class AsyncAdbClient:
+    """ADB 主机协议的 asyncio 实现，供多设备巡检在单线程内并发采集，不为每台设备占用线程或 adb 进程"""
+
+    def __init__(self, host=None, port=None, timeout=30):
+        settings = get_settings()
+        self.host = host or settings.adb_server_host
+        self.port = port or settings.adb_server_port
+        self.timeout = timeout
+
+    @staticmethod
+    async def _send(reader, writer, request):
+        payload = request.encode('utf-8')
+        writer.write(b'%04x' % len(payload) + payload)
+        await writer.drain()
+        try:
+            status = await reader.readexactly(4)
+            if status != b'OKAY':
+                length = int(await reader.readexactly(4), 16)
+                message = (await reader.readexactly(length)).decode('utf-8', 'replace')
+                raise AdbProtocolError(f"adb server 拒绝请求 {request}: {message}")
+        except asyncio.IncompleteReadError as e:
+            raise AdbProtocolError("adb server 提前关闭了连接") from e
+
+    async def _request(self, services, read):
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+        except OSError as e:
+            raise AdbProtocolError(f"连接 adb server {self.host}:{self.port} 失败: {e}") from e
+        try:
+            for request in services:
+                await self._send(reader, writer, request)
+            return await asyncio.wait_for(read(reader), self.timeout)
+        finally:
+            writer.close()
+
+    async def devices(self):
+        """返回状态为 device 的设备序列号列表（等同 adb devices）"""
+
+        async def read(reader):
+            length = int(await reader.readexactly(4), 16)
+            return (await reader.readexactly(length)).decode('utf-8')
+
+        text = await self._request(['host:devices'], read)
+        return [line.split('\t')[0] for line in text.splitlines() if line.endswith('\tdevice')]
+
+    async def exec_out(self, device_name, command):
+        """在设备上执行命令并返回标准输出的原始字节"""
+
+        async def read(reader):
+            return await reader.read()
+
+        return await self._request([f'host:transport:{device_name}', f'exec:{command}'], read)
+
+    async def screenshot(self, device_name):
+        """返回 (原始帧缓冲字节, 宽, 高)，解码交给调用方在线程池中完成"""
+        data = await self.exec_out(device_name, 'screencap')
+        if len(data) < 12:
+            raise AdbProtocolError(f"设备 {device_name} 截图失败: {data[:200]!r}")
+        width, height = struct.unpack_from('<II', data)
+        return data, width, height
+
+    async def tap(self, device_name, x, y):
+        await self.exec_out(device_name, f'input tap {int(x)} {int(y)}')
+
+
+CAPTURE_BACKENDS = {
+    AdbSocketBackend.name: AdbSocketBackend,
+    AdbCliBackend.name: AdbCliBackend,
+    Uiautomator2Backend.name: Uiautomator2Backend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def register_capture_backend(name, backend_class):
+    """注册自定义采集后端，之后可通过 CAPTURE_BACKEND=<name> 使用"""
+    CAPTURE_BACKENDS[name] = backend_class
+
+
+def get_capture_backend(name=None):
+    """获取采集后端实例（进程内按名称共享），默认使用 CAPTURE_BACKEND 配置"""
+    name = name or get_settings().capture_backend
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            if name not in CAPTURE_BACKENDS:
+                raise ValueError(f"未知的采集后端: {name}，可选 {sorted(CAPTURE_BACKENDS)}")
+            backend = _instances[name] = CAPTURE_BACKENDS[name]()
+    return backend
+
@@ -1,24 +1,51 @@
+import atexit
 import os
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import threading
 import uuid
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 
-from flask import g
+from source.utils.settings import get_settings
+from source.utils.trace import get_trace_id
+
+__all__ = ['TraceIdFilter', 'setup_logger', 'stop_log_listeners', 'reinit_after_fork']
+
+# 每个日志文件对应一个队列与后台写入线程，多个模块的记录器共用，避免同一文件被多个处理器轮转
+_queue_handlers = {}
+_listeners = []
+_listeners_lock = threading.Lock()
+_thread_ids = threading.local()
+
+
+def _thread_trace_id():
+    """非请求线程的 trace_id，同一线程内保持不变，避免每条日志都生成 uuid"""
+    trace_id = getattr(_thread_ids, 'trace_id', None)
+    if trace_id is None:
+        trace_id = _thread_ids.trace_id = "子线程：" + uuid.uuid4().hex[:12]
+    return trace_id
 
 
 class TraceIdFilter(logging.Filter):
     """
     自定义日志过滤器，用于添加 trace_id
+
+    必须在产生日志的线程上执行（挂在 QueueHandler 上），写入线程无法获取请求上下文。
     """
 
     def filter(self, record):
         if not hasattr(record, 'trace_id'):
+            # 优先使用链路上下文中的 trace_id，子线程也能沿用请求的 trace_id
+            trace_id = get_trace_id()
+            if trace_id is not None:
+                record.trace_id = trace_id
+                return True
             try:
                 from flask import g
                 record.trace_id = g.trace_id
             except (RuntimeError, AttributeError):
-                # 如果没有 Flask 上下文，使用默认的 trace_id
-                record.trace_id = "子线程：" + str(uuid.uuid4())
+                # 如果没有 Flask 上下文，使用当前线程固定的 trace_id
+                record.trace_id = _thread_trace_id()
         return True
 
 
@@ -46,9 +73,67 @@ def _create_console_handler(log_format):
     """
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(logging.Formatter(log_format))
+    console_handler.addFilter(TraceIdFilter())
     return console_handler
 
 
+def _create_queue_handler(log_file_path, log_format, enable_console):
+    """
+    创建（或复用）写入指定日志文件的队列处理器
+
+    请求线程只负责把日志记录放入队列，格式化后的文件与终端输出由 QueueListener 后台线程完成。
+    """
+    key = (log_file_path, log_format, enable_console)
+    with _listeners_lock:
+        queue_handler = _queue_handlers.get(key)
+        if queue_handler is not None:
+            return queue_handler
+        handlers = [_create_file_handler(log_file_path, log_format)]
+        if enable_console:
+            handlers.append(_create_console_handler(log_format))
+        log_queue = queue.SimpleQueue()
+        queue_handler = QueueHandler(log_queue)
+        queue_handler.addFilter(TraceIdFilter())
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _queue_handlers[key] = queue_handler
+        _listeners.append(listener)
+        return queue_handler
+
+
+def stop_log_listeners():
+    """停止所有后台写入线程，并写完队列中剩余的日志（进程退出时自动调用）"""
+    with _listeners_lock:
+        listeners = list(_listeners)
+        _listeners.clear()
+        _queue_handlers.clear()
+    for listener in listeners:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def reinit_after_fork(suffix):
+    """fork 出的工作进程中调用：后台写入线程不会随 fork 复制，需要重新启动
+
+    多个进程按时间轮转同一个文件会互相覆盖，工作进程写入带后缀的独立文件（如 app.worker1.log）。
+    """
+    global _listeners
+    with _listeners_lock:
+        _listeners = []
+        for (log_file_path, log_format, enable_console), queue_handler in _queue_handlers.items():
+            root, ext = os.path.splitext(log_file_path)
+            handlers = [_create_file_handler(f'{root}.{suffix}{ext}', log_format)]
+            if enable_console:
+                handlers.append(_create_console_handler(log_format))
+            listener = QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+            listener.start()
+            _listeners.append(listener)
+
+
+atexit.register(stop_log_listeners)
+
+
 def setup_logger(name, log_dir="logs", log_file="app.log", level=logging.INFO, enable_console=True, log_format=None):
     """
     配置日志记录器
@@ -62,7 +147,7 @@ def setup_logger(name, log_dir="logs", log_file="app.log", level=logging.INFO, e
     """
     # 确保日志目录存在
     os.makedirs(log_dir, exist_ok=True)
-    log_file_path = os.path.join(log_dir, log_file)
+    log_file_path = os.path.abspath(os.path.join(log_dir, log_file))
 
     # 创建日志记录器
     logger = logging.getLogger(name)
@@ -79,6 +164,12 @@ def setup_logger(name, log_dir="logs", log_file="app.log", level=logging.INFO, e
     if log_format is None:
         log_format = '%(asctime)s - %(name)s - %(levelname)s - %(trace_id)s - %(lineno)d - %(message)s'
 
+    if get_settings().log_async:
+        # 异步写入：请求线程只入队，文件与终端 I/O 在后台线程完成
+        logger.addHandler(_create_queue_handler(log_file_path, log_format, enable_console))
+        return logger
+
+    # 同步写入（调试或排查日志丢失时使用）
     # 添加文件处理器
     file_handler = _create_file_handler(log_file_path, log_format)
     logger.addHandler(file_handler)
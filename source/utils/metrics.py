@@ -0,0 +1,108 @@
+"""
+进程内运行指标模块
+
+模块职责：
+- 计数器（increment）与耗时分布（observe），按指标名 + 标签区分序列
+- 耗时分布只保留最近 window 个样本，用于计算 p50 / p95，内存占用固定
+- snapshot 返回可直接 JSON 序列化的快照，供 /api/v1/metrics 接口与调参使用
+- 指标保存在进程内，多进程模式下各工作进程分别统计
+"""
+import threading
+from collections import deque
+
+__all__ = ['Metrics', 'metrics']
+
+
+def _series_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_key(key):
+    name, labels = key
+    if not labels:
+        return name
+    return f"{name}{{{','.join(f'{k}={v}' for k, v in labels)}}}"
+
+
+class _Distribution:
+    __slots__ = ('count', 'total', 'samples')
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.samples.append(value)
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count, 2) if self.count else None,
+            'p50': round(self.percentile(50), 2) if self.samples else None,
+            'p95': round(self.percentile(95), 2) if self.samples else None,
+        }
+
+
+class Metrics:
+    """线程安全的计数器与耗时分布集合"""
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._counters = {}
+        self._distributions = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = _series_key(name, labels)
+        with self._lock:
+            distribution = self._distributions.get(key)
+            if distribution is None:
+                distribution = self._distributions[key] = _Distribution(self.window)
+            distribution.add(value)
+
+    def percentile(self, name, q, **labels):
+        """某个序列最近样本的百分位数，没有样本时返回 None"""
+        with self._lock:
+            distribution = self._distributions.get(_series_key(name, labels))
+            return distribution.percentile(q) if distribution is not None else None
+
+    def observations(self, name, **labels):
+        """某个序列累计的样本数"""
+        with self._lock:
+            distribution = self._distributions.get(_series_key(name, labels))
+            return distribution.count if distribution is not None else 0
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self._counters.get(_series_key(name, labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': {_format_key(key): value for key, value in sorted(self._counters.items())},
+                'distributions': {_format_key(key): distribution.summary()
+                                  for key, distribution in sorted(self._distributions.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._distributions.clear()
+
+
+# 进程内共享的指标集合
+metrics = Metrics()
@@ -0,0 +1,129 @@
+"""
+采样性能分析模块
+
+模块职责：
+- 按配置的比例对请求开启 cProfile 与调用栈采样
+- 对慢请求输出 .prof（cProfile）与 .collapsed（折叠调用栈，可直接生成火焰图）文件
+"""
+import cProfile
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+logger = setup_logger(__name__)
+# 推导项目根目录（当前脚本的曾祖父目录）
+project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+__all__ = ['RequestProfiler', 'ProfileSession']
+
+# 同一时间只分析一个请求：cProfile 与调用栈采样都有额外开销，并发分析也会互相干扰
+_profile_slot = threading.Semaphore(1)
+
+
+class ProfileSession:
+    """单个请求的性能分析会话，需要在请求线程中创建和结束
+
+    启动 cProfile 失败（如已有其他分析工具）时抛出 ValueError。
+    """
+
+    def __init__(self, trace_id, output_dir, slow_ms, interval_ms):
+        self.trace_id = trace_id
+        self.output_dir = output_dir
+        self.slow_ms = slow_ms
+        self.interval = interval_ms / 1000
+        self.thread_id = threading.get_ident()
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self._sampler = threading.Thread(target=self._sample, name='stack-sampler', daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        """定时抓取请求线程的调用栈，累计为折叠格式"""
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self, duration_ms):
+        """结束分析，请求耗时超过阈值时写出结果文件
+
+        返回:
+            写出的文件路径列表，未超过阈值时为空列表
+        """
+        self.profile.disable()
+        self._stop_event.set()
+        self._sampler.join()
+
+        if duration_ms < self.slow_ms:
+            return []
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        file_prefix = os.path.join(self.output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{self.trace_id}")
+        self.profile.dump_stats(file_prefix + '.prof')
+        paths = [file_prefix + '.prof']
+        if self.stacks:
+            with open(file_prefix + '.collapsed', 'w', encoding='utf-8') as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            paths.append(file_prefix + '.collapsed')
+        logger.info(f"慢请求耗时 {duration_ms:.1f}ms，性能分析结果已保存: {paths}")
+        return paths
+
+
+class RequestProfiler:
+    """按比例采样请求的性能分析器，sample_rate 为 0 时完全关闭
+
+    同一时间最多分析一个请求，命中采样但已有请求在分析时跳过本次采样。
+    """
+
+    def __init__(self, sample_rate=0.0, slow_ms=3000, output_dir='profiles', interval_ms=5):
+        self.sample_rate = sample_rate
+        self.slow_ms = slow_ms
+        self.output_dir = output_dir
+        self.interval_ms = interval_ms
+
+    @classmethod
+    def from_env(cls):
+        settings = get_settings()
+        return cls(
+            sample_rate=settings.profile_sample_rate,
+            slow_ms=settings.profile_slow_ms,
+            output_dir=os.path.join(project_root, settings.profile_dir),
+            interval_ms=settings.profile_interval_ms,
+        )
+
+    def start(self, trace_id):
+        """命中采样时返回 ProfileSession，否则返回 None"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not _profile_slot.acquire(blocking=False):
+            logger.debug("已有请求正在进行性能分析，跳过本次采样")
+            return None
+        try:
+            return ProfileSession(trace_id, self.output_dir, self.slow_ms, self.interval_ms)
+        except ValueError as e:
+            _profile_slot.release()
+            logger.warning(f"cProfile 启动失败，跳过本次采样: {e}")
+            return None
+
+    @staticmethod
+    def finish(session, duration_ms):
+        """结束会话并释放分析名额，返回写出的文件路径列表"""
+        try:
+            return session.stop(duration_ms)
+        finally:
+            _profile_slot.release()
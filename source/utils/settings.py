@@ -0,0 +1,185 @@
+"""
+全局配置模块
+
+模块职责：
+- 进程内只加载一次 .env（已存在的环境变量优先，不会被 .env 覆盖）
+- 以属性形式提供类型化的配置项，业务模块不再各自调用 load_dotenv / os.getenv
+- 运行中修改了环境变量（测试、基准测试）后，调用 reload_settings 重新读取
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+__all__ = ['Settings', 'get_settings', 'reload_settings']
+
+_settings = None
+_lock = threading.Lock()
+_dotenv_loaded = False
+
+
+def _bool(value, default):
+    if value is None:
+        return default
+    return value == 'True'
+
+
+class Settings:
+    """从环境变量读取的配置快照"""
+
+    def __init__(self, environ=None):
+        env = os.environ if environ is None else environ
+
+        # Appium 自动化测试配置
+        self.platform_name = env.get('PLATFORM_NAME')
+        self.platform_version = env.get('PLATFORM_VERSION')
+        self.app_wait_activity = env.get('APP_WAIT_ACTIVITY')
+        self.app_wait_duration = int(env.get('APP_WAIT_DURATION', '30000'))
+        self.appium_server_url = env.get('APPIUM_SERVER_URL')
+        self.automation_name = env.get('AUTOMATION_NAME')
+        self.uiautomator2_server_install_timeout = int(env.get('UIAUTOMATOR2_SERVER_INSTALL_TIMEOUT', '200000'))
+        self.no_reset = _bool(env.get('NO_RESET'), False)
+        self.language = env.get('LANGUAGE')
+        # Appium 会话池：空闲超过该秒数的会话复用前先做健康检查；空闲超过 APPIUM_SESSION_IDLE_SECONDS 时关闭
+        self.appium_health_check_seconds = float(env.get('APPIUM_HEALTH_CHECK_SECONDS', '30'))
+        self.appium_session_idle_seconds = float(env.get('APPIUM_SESSION_IDLE_SECONDS', '600'))
+
+        # 设备截图与 XML 采集（adb / adb-cli / uiautomator2）
+        self.capture_backend = env.get('CAPTURE_BACKEND', 'adb')
+        self.adb_server_host = env.get('ADB_SERVER_HOST', '127.0.0.1')
+        self.adb_server_port = int(env.get('ADB_SERVER_PORT', env.get('ANDROID_ADB_SERVER_PORT', '5037')))
+
+        # 多设备巡检
+        self.fleet_mode = env.get('FLEET_MODE', 'api')
+        self.fleet_api_url = env.get('FLEET_API_URL', 'http://127.0.0.1:5000/api/v1/diagnose')
+        self.fleet_interval_seconds = float(env.get('FLEET_INTERVAL_SECONDS', '5'))
+        self.fleet_capture_concurrency = int(env.get('FLEET_CAPTURE_CONCURRENCY', '4'))
+        self.fleet_diagnose_concurrency = int(env.get('FLEET_DIAGNOSE_CONCURRENCY', '2'))
+
+        # 数据存储（目录为相对项目根目录的路径）
+        self.db_path = env.get('DB_PATH')
+        self.md_file_path = env.get('MD_FILE_PATH')
+        self.screenshot_dir = env.get('SCREENSHOT_DIR')
+        self.template_dir = env.get('TEMPLATE_DIR')
+        self.tmp_dir = env.get('TMP_DIR')
+        # 发送给视觉模型与保存到截图目录的 JPEG 质量（同一份编码结果同时用于两处）
+        self.image_jpeg_quality = int(env.get('IMAGE_JPEG_QUALITY', '80'))
+        # 内容寻址的截图存储：按内容哈希分目录保存并去重，截图名 → 文件的索引存放在 DB_PATH 数据库
+        self.artifact_store_enabled = _bool(env.get('ARTIFACT_STORE_ENABLED'), True)
+        self.artifact_dir = env.get('ARTIFACT_DIR', 'artifacts')
+        self.artifact_store_format = env.get('ARTIFACT_STORE_FORMAT', 'jpeg').strip().lower()
+
+        # 视觉模型
+        self.vision_model_api_url = env.get('VISION_MODEL_API_URL')
+        self.vision_model_api_key = env.get('VISION_MODEL_API_KEY')
+        # 多个 API Key（及对应地址）组成的池，每个 Key 有客户端侧的 RPM / TPM 令牌桶
+        self.vision_model_api_keys = [key.strip() for key in env.get('VISION_MODEL_API_KEYS', '').split(',')
+                                      if key.strip()]
+        self.vision_model_api_urls = [url.strip() for url in env.get('VISION_MODEL_API_URLS', '').split(',')
+                                      if url.strip()]
+        self.vision_key_rpm = float(env.get('VISION_KEY_RPM', '60'))
+        self.vision_key_tpm = float(env.get('VISION_KEY_TPM', '100000'))
+        self.vision_tokens_per_request = int(env.get('VISION_TOKENS_PER_REQUEST', '2100'))
+        self.vision_pool_max_wait_seconds = float(env.get('VISION_POOL_MAX_WAIT_SECONDS', '10'))
+        self.vision_log_sample_rate = float(env.get('VISION_LOG_SAMPLE_RATE', '0.1'))
+        # 流式读取模型回答，JSON 完整后即关闭连接
+        self.vision_stream_enabled = _bool(env.get('VISION_STREAM_ENABLED'), True)
+        # 从快到慢依次尝试的模型，回答未通过校验时在耗时预算内升级；默认不配置，只使用视觉模型的默认模型
+        self.vision_model_tiers = [model.strip() for model in env.get('VISION_MODEL_TIERS', '').split(',')
+                                   if model.strip()]
+        self.vision_latency_budget_ms = float(env.get('VISION_LATENCY_BUDGET_MS', '30000'))
+        # 对冲请求：主请求超过近期耗时的高分位仍未返回时，再用池中另一个 Key 发一个请求；会增加调用费用，默认关闭
+        self.vision_hedge_enabled = _bool(env.get('VISION_HEDGE_ENABLED'), False)
+        self.vision_hedge_percentile = float(env.get('VISION_HEDGE_PERCENTILE', '95'))
+        self.vision_hedge_delay_ms = float(env.get('VISION_HEDGE_DELAY_MS', '8000'))
+        self.vision_hedge_min_delay_ms = float(env.get('VISION_HEDGE_MIN_DELAY_MS', '2000'))
+        self.vision_hedge_max_rate = float(env.get('VISION_HEDGE_MAX_RATE', '0.1'))
+        self.vision_hedge_model = env.get('VISION_HEDGE_MODEL', '')
+        # 调用账本：每次模型调用的 token、耗时与结果，价格单位为元 / 百万 token
+        self.vision_ledger_enabled = _bool(env.get('VISION_LEDGER_ENABLED'), True)
+        self.vision_ledger_retention_days = float(env.get('VISION_LEDGER_RETENTION_DAYS', '30'))
+        self.vision_price_per_million_tokens = float(env.get('VISION_PRICE_PER_MILLION_TOKENS', '1.0'))
+        self.vision_model_prices = {model.strip(): float(price) for model, price in (
+            item.rsplit('=', 1) for item in env.get('VISION_MODEL_PRICES', '').split(',') if '=' in item)}
+        self.vision_cache_enabled = _bool(env.get('VISION_CACHE_ENABLED'), True)
+        self.vision_cache_ttl_seconds = int(env.get('VISION_CACHE_TTL_SECONDS', '86400'))
+        self.vision_cache_max_entries = int(env.get('VISION_CACHE_MAX_ENTRIES', '10000'))
+
+        # 分辨率方案调用视觉模型前的本地弹窗检测（遮罩 + 明亮卡片），确定没有弹窗时不调用模型
+        self.popup_detector_enabled = _bool(env.get('POPUP_DETECTOR_ENABLED'), True)
+        # 关闭按钮图标库：在弹窗四角与下方多尺度匹配以往点击过的按钮图标，命中时不调用模型
+        self.icon_locator_enabled = _bool(env.get('ICON_LOCATOR_ENABLED'), True)
+        self.icon_dir = env.get('ICON_DIR', 'icons')
+        self.icon_match_threshold = float(env.get('ICON_MATCH_THRESHOLD', '0.8'))
+        self.icon_max_count = int(env.get('ICON_MAX_COUNT', '30'))
+        # 本地弹窗分类器：off 关闭，shadow 只记录样本与一致率，on 对高置信度的无弹窗截图不调用模型
+        self.popup_classifier_mode = env.get('POPUP_CLASSIFIER_MODE', 'shadow').strip().lower()
+        self.popup_classifier_path = env.get('POPUP_CLASSIFIER_PATH', 'models/popup_classifier.npz')
+        self.popup_classifier_negative_threshold = float(env.get('POPUP_CLASSIFIER_NEGATIVE_THRESHOLD', '0.05'))
+        self.popup_classifier_max_samples = int(env.get('POPUP_CLASSIFIER_MAX_SAMPLES', '20000'))
+
+        # XML 方案调用视觉模型前的规则引擎（resource-id 关键词、关闭文案、弹窗角落的小图标）
+        self.xml_rules_enabled = _bool(env.get('XML_RULES_ENABLED'), True)
+        self.xml_rule_id_keywords = [keyword.strip() for keyword in env.get(
+            'XML_RULE_ID_KEYWORDS', 'close,cancel,skip,dismiss').split(',') if keyword.strip()]
+        self.xml_rule_texts = [text.strip() for text in env.get(
+            'XML_RULE_TEXTS', '关闭,取消,跳过,以后再说,暂不,暂不需要,我知道了,知道了,残忍拒绝,不再提示,close,cancel,skip'
+        ).split(',') if text.strip()]
+        self.xml_rule_min_confidence = float(env.get('XML_RULE_MIN_CONFIDENCE', '0.85'))
+
+        # XML 结构指纹缓存（同一弹窗的界面结构相同，按上次的点击动作直接返回）
+        self.xml_fingerprint_cache_enabled = _bool(env.get('XML_FINGERPRINT_CACHE_ENABLED'), True)
+        self.xml_fingerprint_cache_max_entries = int(env.get('XML_FINGERPRINT_CACHE_MAX_ENTRIES', '5000'))
+        self.xml_fingerprint_cache_max_hits = int(env.get('XML_FINGERPRINT_CACHE_MAX_HITS', '3'))
+
+        # 模版匹配
+        self.template_match_threshold = float(env.get('TEMPLATE_MATCH_THRESHOLD', '0.8'))
+        self.template_pack = _bool(env.get('TEMPLATE_PACK'), False)
+
+        # 画面变化检测（同一设备画面未变化时复用上次诊断结果）
+        self.frame_cache_enabled = _bool(env.get('FRAME_CACHE_ENABLED'), True)
+        self.frame_change_threshold = float(env.get('FRAME_CHANGE_THRESHOLD', '0.01'))
+        self.frame_cache_ttl_seconds = float(env.get('FRAME_CACHE_TTL_SECONDS', '30'))
+        self.frame_cache_max_hits = int(env.get('FRAME_CACHE_MAX_HITS', '3'))
+
+        # 接口、日志、链路追踪与性能分析
+        self.api_debug = _bool(env.get('API_DEBUG'), True)
+        self.api_workers = int(env.get('API_WORKERS', '1'))
+        self.log_async = _bool(env.get('LOG_ASYNC'), True)
+        self.trace_log_spans = _bool(env.get('TRACE_LOG_SPANS'), True)
+        self.profile_sample_rate = float(env.get('PROFILE_SAMPLE_RATE', '0'))
+        self.profile_slow_ms = float(env.get('PROFILE_SLOW_MS', '3000'))
+        self.profile_interval_ms = float(env.get('PROFILE_INTERVAL_MS', '5'))
+        self.profile_dir = env.get('PROFILE_DIR', 'profiles')
+
+        # 数据保留与维护
+        self.maintenance_interval_minutes = float(env.get('MAINTENANCE_INTERVAL_MINUTES', '60'))
+        self.db_vacuum_at = env.get('DB_VACUUM_AT', '01:00')
+        self.tmp_retention_days = float(env.get('TMP_RETENTION_DAYS', '1'))
+        self.tmp_max_mb = float(env.get('TMP_MAX_MB', '512'))
+        self.screenshot_retention_days = float(env.get('SCREENSHOT_RETENTION_DAYS', '3'))
+        self.screenshot_max_mb = float(env.get('SCREENSHOT_MAX_MB', '2048'))
+        self.template_retention_days = float(env.get('TEMPLATE_RETENTION_DAYS', '0'))
+        self.template_max_mb = float(env.get('TEMPLATE_MAX_MB', '1024'))
+        self.elements_retention_hours = float(env.get('ELEMENTS_RETENTION_HOURS', '24'))
+
+
+def get_settings():
+    """获取全局配置，首次调用时加载 .env"""
+    global _settings, _dotenv_loaded
+    if _settings is None:
+        with _lock:
+            if _settings is None:
+                if not _dotenv_loaded:
+                    load_dotenv()
+                    _dotenv_loaded = True
+                _settings = Settings()
+    return _settings
+
+
+def reload_settings():
+    """环境变量变化后重新读取配置"""
+    global _settings
+    with _lock:
+        _settings = None
+    return get_settings()
@@ -0,0 +1,162 @@
+"""
+请求链路追踪模块
+
+模块职责：
+- 维护当前请求的 trace_id（基于 contextvars，可传递到子线程）
+- 记录每个请求的 span 树及各阶段耗时
+- 为后台线程（如异步保存图像）传递 trace 上下文
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+__all__ = ['Span', 'Trace', 'start_trace', 'end_trace', 'get_trace_id', 'span', 'start_thread']
+
+_current_trace = contextvars.ContextVar('smartdigger_trace', default=None)
+_current_span = contextvars.ContextVar('smartdigger_span', default=None)
+
+
+class Span:
+    """一次耗时记录，可嵌套形成 span 树"""
+
+    __slots__ = ('name', 'tags', 'thread_name', 'start', 'end', 'children')
+
+    def __init__(self, name, tags=None):
+        self.name = name
+        self.tags = tags or {}
+        self.thread_name = threading.current_thread().name
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def duration_ms(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class Trace:
+    """单个请求的追踪信息，root span 为请求本身
+
+    请求本身与通过 start_thread 启动的子线程各持有一个引用，全部结束后才调用 on_complete，
+    保证输出的 span 树包含子线程的完整耗时。
+    """
+
+    def __init__(self, trace_id, name):
+        self.trace_id = trace_id
+        self.root = Span(name)
+        self.on_complete = None
+        self._pending = 1
+        self._lock = threading.Lock()
+
+    def attach(self, parent, child):
+        # 子线程与请求线程可能同时追加 span，需要加锁
+        with self._lock:
+            (parent or self.root).children.append(child)
+
+    def hold(self):
+        with self._lock:
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+            completed = self._pending == 0
+        if completed and self.on_complete is not None:
+            self.on_complete(self)
+
+    def render(self):
+        """将 span 树渲染为便于阅读的多行文本"""
+        lines = []
+
+        def walk(node, depth):
+            running = '' if node.end is not None else '（未结束）'
+            thread = '' if node.thread_name == self.root.thread_name else f' [{node.thread_name}]'
+            tags = ''.join(f' {k}={v}' for k, v in node.tags.items())
+            lines.append(f"{'  ' * depth}- {node.name}: {node.duration_ms:.1f}ms{running}{thread}{tags}")
+            for child in list(node.children):
+                walk(child, depth + 1)
+
+        walk(self.root, 0)
+        return '\n'.join(lines)
+
+
+def start_trace(trace_id, name):
+    """开始一次请求追踪
+
+    返回:
+        (trace, token)，token 用于 end_trace 恢复上下文
+    """
+    trace = Trace(trace_id, name)
+    token = (_current_trace.set(trace), _current_span.set(trace.root))
+    return trace, token
+
+
+def end_trace(token, on_complete=None):
+    """结束请求追踪并恢复上下文
+
+    参数:
+        on_complete: 请求与其子线程全部结束后调用，参数为 Trace
+    """
+    trace = _current_trace.get()
+    trace_token, span_token = token
+    _current_span.reset(span_token)
+    _current_trace.reset(trace_token)
+    if trace is not None:
+        trace.root.finish()
+        trace.on_complete = on_complete
+        trace.release()
+    return trace
+
+
+def get_trace_id():
+    """获取当前上下文中的 trace_id，不在请求链路中时返回 None"""
+    trace = _current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+
+@contextmanager
+def span(name, **tags):
+    """记录一个阶段的耗时，没有处于追踪上下文时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _current_span.get()
+    node = Span(name, tags)
+    trace.attach(parent, node)
+    token = _current_span.set(node)
+    try:
+        yield node
+    finally:
+        node.finish()
+        _current_span.reset(token)
+
+
+def start_thread(target, *args, name=None, daemon=None, **kwargs):
+    """启动子线程，并将当前 trace 上下文传递进去
+
+    子线程中的日志沿用请求的 trace_id，子线程整体耗时作为一个 span 挂在当前 span 下。
+    """
+    ctx = contextvars.copy_context()
+    span_name = name or getattr(target, '__name__', 'thread')
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.hold()
+
+    def run():
+        try:
+            with span(span_name):
+                target(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.release()
+
+    thread = threading.Thread(target=ctx.run, args=(run,), name=name, daemon=daemon)
+    thread.start()
+    return thread
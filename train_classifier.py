@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import sqlite3
+import time
+
+from source.services.artifact_store import resolve_screenshot
+from source.services.popup_classifier import (FEATURE_COUNT, SampleStore, evaluate_classifier, extract_features,
+                                              project_root, train_classifier)
+from source.utils.log_config import setup_logger
+from source.utils.settings import get_settings
+
+# 配置日志
+logger = setup_logger(__name__)
+
+IMAGE_SUFFIXES = ('.jpeg', '.jpg', '.png')
+
+
+def parse_args(argv=None):
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description='SmartDigger 本地弹窗分类器训练')
+    parser.add_argument('--db-path', default=None, help='历史记录与影子模式样本所在数据库，默认为 DB_PATH')
+    parser.add_argument('--screenshot-dir', default=None, help='历史灰度截图目录，默认为 SCREENSHOT_DIR')
+    parser.add_argument('--positives', default=None, help='额外的弹窗截图目录')
+    parser.add_argument('--negatives', default=None, help='额外的无弹窗截图目录')
+    parser.add_argument('--output', default=None, help=f'模型保存路径，默认为 POPUP_CLASSIFIER_PATH'
+                                                        f'（{settings.popup_classifier_path}）')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='评估用的无弹窗判定阈值，默认为 POPUP_CLASSIFIER_NEGATIVE_THRESHOLD')
+    parser.add_argument('--holdout', type=float, default=0.2, help='验证集比例')
+    parser.add_argument('--epochs', type=int, default=500, help='训练轮数')
+    parser.add_argument('--seed', type=int, default=0, help='划分验证集的随机种子')
+    parser.add_argument('--json', action='store_true', help='输出 JSON')
+    return parser.parse_args(argv)
+
+
+def _image_features(path):
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return extract_features(image)
+
+
+def history_positives(db_path, screenshot_dir):
+    """template 表记录的诊断成功的截图（分辨率方案保存的灰度截图）"""
+    if not db_path or not os.path.exists(db_path):
+        return []
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute('SELECT template_id FROM template').fetchall()
+    except sqlite3.OperationalError:
+        rows = []
+    finally:
+        conn.close()
+    features = []
+    for (template_id,) in rows:
+        # 截图 ID 为 {设备名}_{日期}_{时间}
+        device_name = template_id.rsplit('_', 2)[0]
+        path = resolve_screenshot(screenshot_dir, device_name, f'{template_id}_grayscale_image')
+        if path is not None:
+            features.append(_image_features(path))
+    return features
+
+
+def directory_features(directory):
+    if not directory:
+        return []
+    return [_image_features(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+            if name.lower().endswith(IMAGE_SUFFIXES)]
+
+
+def build_dataset(args):
+    """返回 (特征矩阵, 标签数组, 各来源样本数)"""
+    import numpy as np
+
+    settings = get_settings()
+    db_path = args.db_path or settings.db_path
+    screenshot_dir = args.screenshot_dir or (
+        os.path.join(project_root, settings.screenshot_dir) if settings.screenshot_dir else None)
+    history = history_positives(db_path, screenshot_dir)
+    positives = directory_features(args.positives)
+    negatives = directory_features(args.negatives)
+    shadow_features, shadow_labels = SampleStore(db_path).load() if db_path else (
+        np.empty((0, FEATURE_COUNT), dtype=np.float32), np.empty(0, dtype=np.int64))
+
+    features = np.concatenate([np.array(history + positives + negatives, dtype=np.float32).reshape(-1, FEATURE_COUNT),
+                               shadow_features])
+    labels = np.concatenate([np.ones(len(history) + len(positives), dtype=np.int64),
+                             np.zeros(len(negatives), dtype=np.int64), shadow_labels])
+    counts = {'history': len(history), 'positives': len(positives), 'negatives': len(negatives),
+              'shadow_popup': int(shadow_labels.sum()), 'shadow_no_popup': int(len(shadow_labels) - shadow_labels.sum())}
+    return features, labels, counts
+
+
+def main(argv=None):
+    import numpy as np
+
+    args = parse_args(argv)
+    settings = get_settings()
+    threshold = args.threshold if args.threshold is not None else settings.popup_classifier_negative_threshold
+    output = args.output or os.path.join(project_root, settings.popup_classifier_path)
+
+    features, labels, counts = build_dataset(args)
+    logger.info(f"训练样本: {counts}")
+    order = np.random.default_rng(args.seed).permutation(len(labels))
+    holdout = int(len(labels) * args.holdout)
+    test_index, train_index = order[:holdout], order[holdout:]
+    classifier = train_classifier(features[train_index], labels[train_index], epochs=args.epochs)
+    classifier.meta['sources'] = counts
+
+    report = {'samples': counts, 'threshold': threshold,
+              'train': evaluate_classifier(classifier, features[train_index], labels[train_index], threshold),
+              'holdout': evaluate_classifier(classifier, features[test_index], labels[test_index], threshold)}
+    # 推理耗时：单张截图的特征提取 + 预测
+    if args.negatives or args.positives:
+        directory = args.negatives or args.positives
+        names = [name for name in sorted(os.listdir(directory)) if name.lower().endswith(IMAGE_SUFFIXES)]
+        from PIL import Image
+
+        with Image.open(os.path.join(directory, names[0])) as image:
+            image = image.convert('L')
+            start = time.perf_counter()
+            for _ in range(20):
+                classifier.predict_proba(extract_features(image))
+            report['inference_ms'] = round((time.perf_counter() - start) * 1000 / 20, 3)
+    classifier.meta['holdout'] = report['holdout']
+    classifier.save(output)
+    report['output'] = output
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    else:
+        holdout_report = report['holdout']
+        print(f"样本: {json.dumps(counts, ensure_ascii=False)}")
+        print(f"训练集准确率 {report['train']['accuracy']}，验证集准确率 {holdout_report['accuracy']}")
+        print(f"验证集中弹窗概率 ≤ {threshold} 的截图 {holdout_report['answered_locally']} 张"
+              f"（{holdout_report['answered_rate']}），其中实际有弹窗 {holdout_report['missed_popups']} 张")
+        if 'inference_ms' in report:
+            print(f"单张推理耗时 {report['inference_ms']}ms")
+        print(f"模型已保存: {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -5,9 +5,7 @@ import re
 from PIL import Image, ImageDraw
 import os
 
-from dotenv import load_dotenv
-
-load_dotenv()
+from source.utils.settings import get_settings
 
 
 def diagnose(screenshot_file, xml_file, devices_name, resolution):
@@ -68,7 +66,7 @@ def diagnose(screenshot_file, xml_file, devices_name, resolution):
         template_image = None
         if result.get("template_file_name") is not None:
             template_file_name = result.get("template_file_name")
-            template_dir = os.getenv('TEMPLATE_DIR')
+            template_dir = get_settings().template_dir
             template_path = os.path.join(template_dir, template_file_name)
             if os.path.exists(template_path):
                 template_image = Image.open(template_path)